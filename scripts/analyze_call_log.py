@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+调用日志汇总
+
+读取 GEMINI_CALL_LOG 写出的 JSONL 调用日志（含轮转出的 .gz 文件），按函数汇总吞吐、
+各阶段延迟分位数、错误率和 token 用量。
+
+用法：
+    python scripts/analyze_call_log.py logs/calls.jsonl
+    python scripts/analyze_call_log.py logs/calls.jsonl --since 3600 --json
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.calllog import iter_entries  # noqa: E402
+
+QUANTILES = (0.5, 0.9, 0.99)
+PHASES = ("queue", "ttfb", "download", "write", "total")
+
+
+def quantile(sorted_values: list, q: float) -> float:
+    """最近秩法分位数"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values), max(1, math.ceil(q * len(sorted_values)))) - 1
+    return sorted_values[index]
+
+
+def summarize(entries: list) -> dict:
+    """按函数汇总；另有 "all" 汇总全部记录"""
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry.get("function", "unknown")].append(entry)
+        groups["all"].append(entry)
+
+    summary = {}
+    for function, group in sorted(groups.items()):
+        started = [e["ts"] for e in group if "ts" in e]
+        ended = [e["ts"] + e.get("phases", {}).get("total", 0) / 1000 for e in group if "ts" in e]
+        span = max(ended) - min(started) if started else 0
+        successes = sum(1 for e in group if e.get("success"))
+        errors = Counter(e.get("error_code") or "UNKNOWN" for e in group if not e.get("success"))
+
+        latency = {}
+        for phase in PHASES:
+            values = sorted(e["phases"][phase] for e in group if phase in e.get("phases", {}))
+            if values:
+                latency[phase] = {f"p{int(q * 100)}": quantile(values, q) for q in QUANTILES}
+
+        summary[function] = {
+            "calls": len(group),
+            "success": successes,
+            "error_rate": round(1 - successes / len(group), 4),
+            "throughput_per_s": round(len(group) / span, 3) if span > 0 else None,
+            "retries": sum(e.get("retries", 0) for e in group),
+            "request_mb": round(sum(e.get("request_bytes", 0) for e in group) / 1024 / 1024, 2),
+            "response_mb": round(sum(e.get("response_bytes", 0) for e in group) / 1024 / 1024, 2),
+            "tokens": sum((e.get("usage") or {}).get("total_tokens", 0) for e in group),
+            "errors": dict(errors.most_common()),
+            "models": dict(Counter(e.get("model") for e in group if e.get("model")).most_common()),
+            "latency_ms": latency,
+        }
+    return summary
+
+
+def print_summary(summary: dict) -> None:
+    for function, stats in summary.items():
+        throughput = stats["throughput_per_s"]
+        print(f"== {function} ==")
+        print(f"调用 {stats['calls']}，成功 {stats['success']}，错误率 {stats['error_rate']:.2%}，"
+              f"吞吐 {throughput if throughput is not None else '-'} 次/s，重发 {stats['retries']} 次")
+        print(f"请求 {stats['request_mb']} MB，响应 {stats['response_mb']} MB，token {stats['tokens']}，"
+              f"模型 {stats['models']}")
+        if stats["errors"]:
+            print("错误码: " + "，".join(f"{code} × {count}" for code, count in stats["errors"].items()))
+        print(f"{'阶段':<10}" + "".join(f"{f'p{int(q * 100)}':>10}" for q in QUANTILES))
+        for phase, values in stats["latency_ms"].items():
+            print(f"{phase:<12}" + "".join(f"{values[f'p{int(q * 100)}']:>10.1f}" for q in QUANTILES))
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="调用日志汇总")
+    parser.add_argument("path", help="调用日志路径（GEMINI_CALL_LOG），自动包含轮转出的 .gz 文件")
+    parser.add_argument("--since", type=float, help="只统计最近 N 秒内开始的调用")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    entries = list(iter_entries(args.path))
+    if args.since is not None:
+        cutoff = time.time() - args.since
+        entries = [e for e in entries if e.get("ts", 0) >= cutoff]
+    if not entries:
+        print("没有调用记录")
+        return 1
+
+    summary = summarize(entries)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+响应解码吞吐基准
+
+对比多线程并发解码 generateContent 响应体时，在调用方线程中解码（受 GIL 限制）
+与交给解码进程池（src/offload.py）的吞吐。
+
+用法：
+    python scripts/benchmark_decode.py --threads 8 --calls 64 --image-mb 4 --processes 4
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.offload import DecodePool  # noqa: E402
+
+
+def make_body(image_mb: float) -> bytes:
+    """构造一个包含 image_mb MB 随机图像的响应体"""
+    image = os.urandom(int(image_mb * 1024 * 1024))
+    return json.dumps({"candidates": [{"content": {"parts": [
+        {"text": "好的"},
+        {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(image).decode('ascii')}},
+    ]}}]}).encode('utf-8')
+
+
+def decode_inline(body: bytes) -> int:
+    """与 main._decode_response 的本线程路径相同：JSON 解析 + base64 解码"""
+    content = json.loads(body)["candidates"][0]["content"]
+    inline_data = next(part["inlineData"] for part in content["parts"] if "inlineData" in part)
+    return len(base64.b64decode(inline_data["data"]))
+
+
+def run(label: str, decode, body: bytes, threads: int, calls: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        sizes = list(executor.map(lambda _: decode(body), range(calls)))
+    elapsed = time.perf_counter() - started
+    assert len(set(sizes)) == 1
+    throughput = len(body) * calls / elapsed / 1024 / 1024
+    print(f"{label:<12} {elapsed:8.2f} s  {calls / elapsed:8.1f} 次/s  {throughput:8.1f} MB/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应解码吞吐基准")
+    parser.add_argument("--threads", type=int, default=8, help="并发调用线程数")
+    parser.add_argument("--calls", type=int, default=64, help="解码次数")
+    parser.add_argument("--image-mb", type=float, default=4, help="单张图像大小（MB）")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="解码进程数")
+    args = parser.parse_args()
+
+    body = make_body(args.image_mb)
+    print(f"响应体 {len(body) / 1024 / 1024:.1f} MB，{args.threads} 线程，{args.calls} 次，"
+          f"{args.processes} 个解码进程，CPU 核数 {os.cpu_count()}\n")
+
+    inline = run("本线程解码", decode_inline, body, args.threads, args.calls)
+
+    pool = DecodePool(args.processes)
+    try:
+        # 预热：spawn 启动工作进程的耗时不计入
+        with ThreadPoolExecutor(args.processes) as executor:
+            list(executor.map(lambda _: pool.decode(body), range(args.processes)))
+        offloaded = run("进程池解码", lambda b: len(pool.decode(b)[0]), body, args.threads, args.calls)
+    finally:
+        pool.shutdown()
+
+    print(f"\n加速比: {inline / offloaded:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
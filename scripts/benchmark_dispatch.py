@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+调用分发开销基准
+
+对比三种方式处理同一次网关调用的耗时（不发起上游请求，函数实现替换为空函数）：
+- 直接调用：不做任何校验
+- 逐次解释：每次调用都遍历 manifest 中的参数声明做检查
+- 预编译分发：src/dispatch.py 中预先编译并缓存的校验函数 + 按名路由
+
+用法：
+    python scripts/benchmark_dispatch.py --calls 200000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.dispatch import MANIFEST_PATH, Dispatcher  # noqa: E402
+
+TYPES = {"string": str, "number": (int, float), "integer": int, "boolean": bool, "array": list, "object": dict}
+
+CALLS = {
+    "text_to_image": {"prompt": "一只可爱的猫咪坐在窗边", "stream": False, "deadline": 30, "request_id": "r-1"},
+    "edit_image": {"prompt": "把背景改成蓝天白云", "deadline": 30, "region": [0, 0, 256, 256], "tile_size": 512},
+}
+
+
+def validate_interpreted(manifest: dict, function: str, arguments: dict) -> bool:
+    """每次调用都重新查找函数声明并逐项解释检查"""
+    spec = next(f for f in manifest["functions"] if f["name"] == function)
+    declared = {param["name"]: param for param in spec.get("parameters", [])}
+    if any(name not in declared for name in arguments):
+        return False
+    for name, param in declared.items():
+        value = arguments.get(name)
+        if value is None:
+            if param.get("required"):
+                return False
+            continue
+        if not isinstance(value, TYPES[param["type"]]) or (param["type"] != "boolean" and isinstance(value, bool)):
+            return False
+        if param["type"] == "array" and not all(isinstance(item, TYPES[param["items"]["type"]]) for item in value):
+            return False
+    for key, group in spec.get("files", {}).items():
+        if group["items"]["type"] == "InputFile":
+            directory = Path("data/inputs") / key
+            count = sum(1 for path in directory.iterdir() if path.is_file()) if directory.is_dir() else 0
+            if count > group.get("maxItems", count):
+                return False
+    return True
+
+
+def run(label: str, call, function: str, calls: int) -> float:
+    arguments = CALLS[function]
+    started = time.perf_counter()
+    for _ in range(calls):
+        call(function, arguments)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<12} {function:<14} {elapsed / calls * 1e6:8.2f} µs/次")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="调用分发开销基准")
+    parser.add_argument("--calls", type=int, default=200000, help="每种方式的调用次数")
+    args = parser.parse_args()
+
+    manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    functions = {name: (lambda **kwargs: {"success": True}) for name in CALLS}
+    dispatcher = Dispatcher(functions=functions)
+
+    # edit_image 的文件约束需要输入目录
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            inputs = Path("data/inputs/input_image")
+            inputs.mkdir(parents=True)
+            (inputs / "input.png").write_bytes(b"image")
+
+            for function in CALLS:
+                direct = run("直接调用", lambda name, arguments: functions[name](**arguments), function, args.calls)
+                interpreted = run(
+                    "逐次解释",
+                    lambda name, arguments: validate_interpreted(manifest, name, arguments) and functions[name](
+                        **arguments
+                    ),
+                    function, args.calls,
+                )
+                compiled = run("预编译分发", dispatcher.dispatch, function, args.calls)
+                print(f"{'':<12} {function:<14} 校验开销 {(compiled - direct) / args.calls * 1e6:6.2f} µs/次，"
+                      f"比逐次解释快 {interpreted / compiled:.2f}x\n")
+        finally:
+            os.chdir(original_cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+数据集生成
+
+读取提示词文件（每行一条，空行忽略），每条生成若干变体，写入分片数据集目录（见 src/dataset.py）。
+中断后以相同参数重新运行即可续跑。
+
+用法：
+    python scripts/generate_dataset.py prompts.txt datasets/cats --variants 4
+    python scripts/generate_dataset.py prompts.txt datasets/cats --variants 4 --layout tar --shard-size 5000
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.dataset import DEFAULT_CONCURRENCY, DEFAULT_SHARD_SIZE, LAYOUTS, generate_dataset  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据集生成")
+    parser.add_argument("prompts", help="提示词文件，每行一条")
+    parser.add_argument("directory", help="数据集目录")
+    parser.add_argument("--variants", type=int, default=1, help="每条提示词的变体数")
+    parser.add_argument("--layout", choices=LAYOUTS, default="dir", help="分片布局")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="每个分片的图像数")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="并发生成数")
+    parser.add_argument("--deadline", type=float, help="单次生成的超时（秒）")
+    args = parser.parse_args()
+
+    prompts = [line.strip() for line in Path(args.prompts).read_text(encoding="utf-8").splitlines() if line.strip()]
+    if not prompts:
+        print("提示词文件为空")
+        return 1
+
+    def progress(event):
+        mark = "✓" if event["success"] else f"✗ {event['error_code']}"
+        print(f"[{event['done']}/{event['total']}] {event['p']}-{event['v']} {mark}", file=sys.stderr)
+
+    try:
+        summary = generate_dataset(
+            prompts, args.directory, variants=args.variants, layout=args.layout, shard_size=args.shard_size,
+            concurrency=args.concurrency, deadline=args.deadline, on_progress=progress
+        )
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 1
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+在途字节预算与准入控制
+
+预制件的运行环境只有 512Mi 内存（见 prefab-manifest.json 的 execution_environment），
+而单次调用的峰值内存主要来自图像的多份拷贝：
+- 请求：原始输入 + base64 字符串 + 序列化后的 JSON 请求体 ≈ 输入 × 3.7
+- 响应：响应体 + 解析出的 base64 字符串 + 解码后的图像 ≈ 输出 × 3.7
+
+每次调用前按输入大小和预期输出大小估算峰值，从全局预算中预留对应字节；
+预算不足时排队等待（先到先得，避免大请求被饿死），超过等待时间则拒绝。
+单个请求的估算值超过整个预算时，在没有其他在途请求时单独放行。
+
+分块、逐帧编辑先为整次操作预留原图和解码后画布的字节，各分块的调用再各自预留。分块的预留发生在
+整次操作的预留之内（嵌套预留）：不参与先到先得排队，且除所在操作已预留的字节外没有其他在途请求时单独放行，
+避免已放行的操作被排在其后的请求或自身的预留卡住。
+
+配置：
+- GEMINI_MEMORY_BUDGET_BYTES：全局预算，默认 384MiB（为解释器和依赖库留出余量）
+- GEMINI_EXPECTED_OUTPUT_BYTES：预期输出图像大小，默认 4MiB
+- GEMINI_ADMISSION_TIMEOUT：排队等待上限（秒），默认 30
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+DEFAULT_BUDGET_BYTES = 384 * 1024 * 1024
+DEFAULT_EXPECTED_OUTPUT_BYTES = 4 * 1024 * 1024
+DEFAULT_ADMISSION_TIMEOUT = 30.0
+
+# 原始字节 + base64（4/3）+ JSON 文本（4/3）
+COPY_FACTOR = 1 + 4 / 3 + 4 / 3
+BASE_OVERHEAD_BYTES = 1024 * 1024
+# 解码后的 RGBA 画布每像素 4 字节
+CANVAS_BYTES_PER_PIXEL = 4
+
+# 当前上下文所在的外层预留已占用的字节（嵌套预留时非零）
+_held = contextvars.ContextVar("admission_held", default=0)
+
+
+def estimate_peak_bytes(input_bytes: int = 0, output_bytes: Optional[int] = None) -> int:
+    """估算一次调用的峰值内存（字节）"""
+    if output_bytes is None:
+        output_bytes = int(os.environ.get('GEMINI_EXPECTED_OUTPUT_BYTES', DEFAULT_EXPECTED_OUTPUT_BYTES))
+    return int((input_bytes + output_bytes) * COPY_FACTOR) + BASE_OVERHEAD_BYTES
+
+
+def estimate_canvas_bytes(input_bytes: int, width: int, height: int, canvases: int = 2) -> int:
+    """
+    估算分块、逐帧编辑整次操作常驻的内存（字节）
+
+    Args:
+        input_bytes: 原图字节数（编码后的结果按与原图等大估算）
+        width: 画布宽度（像素）
+        height: 画布高度（像素）
+        canvases: 同时存在的解码画布数量（如解码后的原图与拼接结果各一份）
+    """
+    return 2 * input_bytes + width * height * CANVAS_BYTES_PER_PIXEL * canvases + BASE_OVERHEAD_BYTES
+
+
+class ByteBudget:
+    """全局在途字节预算（线程安全，FIFO 排队）"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.peak = 0
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    def _fits(self, nbytes: int, held: int = 0) -> bool:
+        return self.in_use + nbytes <= self.capacity or self.in_use <= held
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None) -> bool:
+        """
+        预留 nbytes 字节，预算不足时排队等待
+
+        Args:
+            nbytes: 预留字节数
+            timeout: 最长等待时间（秒），None 表示一直等待
+
+        Returns:
+            是否预留成功（超时返回 False）
+        """
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        held = _held.get()
+
+        with self._cond:
+            self._waiters.append(ticket)
+            try:
+                # 嵌套预留不排队：所在操作已被放行，等待排在后面的请求会互相卡住
+                while (not held and self._waiters[0] is not ticket) or not self._fits(nbytes, held):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self._cond.wait(remaining)
+
+                self.in_use += nbytes
+                self.admitted += 1
+                self.peak = max(self.peak, self.in_use)
+                return True
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self, nbytes: int) -> None:
+        """归还预留的字节"""
+        with self._cond:
+            self.in_use = max(0, self.in_use - nbytes)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: Optional[float] = None):
+        """
+        以上下文管理器形式预留字节，产出是否预留成功；成功时退出上下文自动归还。
+        上下文内（包括复制了当前上下文的线程）的再次预留视为嵌套预留。
+        """
+        admitted = self.acquire(nbytes, timeout)
+        token = _held.set(_held.get() + nbytes) if admitted else None
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                _held.reset(token)
+                self.release(nbytes)
+
+    def usage(self) -> dict:
+        """返回当前预算使用情况"""
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                "in_use": self.in_use,
+                "available": max(0, self.capacity - self.in_use),
+                "utilization": round(self.in_use / self.capacity, 4) if self.capacity else 0.0,
+                "waiting": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "peak": self.peak,
+            }
+
+
+_budget = None
+_budget_capacity = None
+_budget_lock = threading.Lock()
+
+
+def get_budget() -> ByteBudget:
+    """返回进程内共享的字节预算；GEMINI_MEMORY_BUDGET_BYTES 变化后自动重建"""
+    global _budget, _budget_capacity
+
+    capacity = int(os.environ.get('GEMINI_MEMORY_BUDGET_BYTES', DEFAULT_BUDGET_BYTES))
+    with _budget_lock:
+        if _budget is None or capacity != _budget_capacity:
+            _budget = ByteBudget(capacity)
+            _budget_capacity = capacity
+        return _budget
+
+
+def admission_timeout() -> float:
+    """排队等待上限（秒）"""
+    return float(os.environ.get('GEMINI_ADMISSION_TIMEOUT', DEFAULT_ADMISSION_TIMEOUT))
@@ -0,0 +1,409 @@
+"""
+离线批处理任务
+
+大批量、非交互的生成任务用同步 generateContent 调用时，并发额度都耗在等待上游上。批处理模式把许多
+text_to_image / edit_image 请求打包为一个上游批处理任务（batchGenerateContent，内联请求）提交，
+之后客户端只需定期轮询，几乎不占用本地资源：
+- 轮询间隔从 GEMINI_BATCH_POLL_INTERVAL 开始按 POLL_BACKOFF 倍增，至多 GEMINI_BATCH_POLL_MAX；
+  有新结果时回到初始间隔。查询遇到网络错误、429 或 5xx 时按同样的退避继续轮询
+- 每次轮询把新完成的结果立即写入任务目录并追加到 results.jsonl，按调用方的 request_id 对应
+  （服务端返回的 metadata.key 即 request_id；没有 key 时按提交顺序对应）
+- 任务信息保存在 job.json，进程重启后用 BatchJob.load(目录) 继续轮询，已写出的结果不会重复处理
+
+任务目录：
+    job.json        任务名、端点、密钥指纹（不保存密钥本身）、模型、各请求的 request_id 与函数
+    results.jsonl   每个请求一行：request_id、function、success，成功时另有 file、bytes、sha256、mime、
+                    usage、model，失败时另有 error、error_code
+    <request_id>.png 等输出图像（request_id 中不能用于文件名的字符替换为 _ 并附加短哈希）
+
+每个结果的 error_code：API_REQUEST_FAILED（上游对该请求返回错误）、NO_IMAGE_DATA（响应中没有图像）、
+BATCH_FAILED（任务以失败、取消或过期结束，该请求没有结果）。
+
+配置：
+- GEMINI_BATCH_POLL_INTERVAL：初始轮询间隔（秒），默认 10
+- GEMINI_BATCH_POLL_MAX：最大轮询间隔（秒），默认 300
+
+用法：
+    job = batch.submit([
+        {"request_id": "a1", "function": "text_to_image", "prompt": "一只猫"},
+        {"request_id": "b7", "function": "edit_image", "prompt": "换成夜景", "input_path": "photos/7.jpg"},
+    ], "data/batches/run-1")
+    summary = job.wait(on_result=lambda record: print(record["request_id"], record["success"]))
+"""
+
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from . import transport
+from .contents import EDIT_PROMPT, first_inline_data, inline_part, read_input_image
+from .main import GEMINI_API_BASE
+from .models import get_policy
+from .routing import get_router, load_pool
+from .usage import current_tenant, get_usage_tracker, key_fingerprint, parse_usage
+
+FUNCTIONS = ("text_to_image", "edit_image")
+DEFAULT_POLL_INTERVAL = 10.0
+DEFAULT_MAX_POLL_INTERVAL = 300.0
+POLL_BACKOFF = 1.5
+REQUEST_TIMEOUT = 60.0
+# 上游对内联批处理请求体大小的限制
+MAX_INLINE_BYTES = 20 * 1024 * 1024
+TERMINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELLED", "EXPIRED")
+
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+
+
+class BatchError(Exception):
+    """提交、查询或取消批处理任务失败"""
+
+    def __init__(self, message: str, error_code: str = "API_REQUEST_FAILED", status_code: Optional[int] = None):
+        super().__init__(message)
+        self.error_code = error_code
+        self.status_code = status_code
+
+
+def _output_name(request_id: str, mime_type: str) -> str:
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', request_id)
+    if safe != request_id or safe.startswith("."):
+        safe = f"{safe}-{hashlib.sha256(request_id.encode('utf-8')).hexdigest()[:8]}"
+    return f"{safe}.{EXTENSIONS.get(mime_type, 'bin')}"
+
+
+def _build_request(entry: dict) -> dict:
+    """
+    把一条批处理请求转换为 GenerateContentRequest
+
+    Raises:
+        ValueError: 请求参数无效或读取输入图像失败
+    """
+    function, prompt = entry.get("function"), entry.get("prompt")
+    if function not in FUNCTIONS:
+        raise ValueError(f"未知的函数: {function}，可选值: {', '.join(FUNCTIONS)}")
+    if not prompt or not isinstance(prompt, str):
+        raise ValueError(f"请求 {entry['request_id']} 的 prompt 必须是非空字符串")
+
+    if function == "text_to_image":
+        parts = [{"text": prompt}]
+    else:
+        input_path = entry.get("input_path")
+        if input_path is not None:
+            path = Path(input_path)
+            if not path.is_file():
+                raise ValueError(f"请求 {entry['request_id']} 的输入图像不存在: {input_path}")
+            image = (path.read_bytes(), mimetypes.guess_type(path.name)[0] or "image/png")
+        else:
+            image, error = read_input_image()
+            if error is not None:
+                raise ValueError(f"请求 {entry['request_id']}: {error['error']}")
+        parts = [{"text": EDIT_PROMPT.format(prompt=prompt)}, inline_part(*image)]
+    return {"contents": [{"role": "user", "parts": parts}]}
+
+
+def _inlined_responses(operation: dict) -> list:
+    """取出操作中已有的内联结果（完成时在 response 中，部分服务在运行中通过 metadata.output 提供）"""
+    for container in (operation.get("response"), (operation.get("metadata") or {}).get("output")):
+        inlined = (container or {}).get("inlinedResponses")
+        if isinstance(inlined, dict):
+            inlined = inlined.get("inlinedResponses")
+        if inlined:
+            return inlined
+    return []
+
+
+class BatchJob:
+    """
+    已提交的批处理任务，结果写入任务目录
+
+    通常由 submit() 创建，进程重启后用 BatchJob.load(目录) 恢复。
+    """
+
+    def __init__(self, directory, info: dict, api_key: str):
+        self.directory = Path(directory)
+        self.info = info
+        self.name = info["name"]
+        self.endpoint = info["endpoint"]
+        self.api_key = api_key
+        self.state = info.get("state")
+        self.done = False
+        self.poll_errors = 0
+        self.request_ids = [entry["request_id"] for entry in info["requests"]]
+        self.functions = {entry["request_id"]: entry["function"] for entry in info["requests"]}
+        self.completed: Dict[str, dict] = {}
+
+        results_path = self.directory / "results.jsonl"
+        if results_path.exists():
+            with open(results_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写入中断留下的不完整末行，对应的结果下次轮询时重新写出
+                        continue
+                    self.completed[record["request_id"]] = record
+
+    @classmethod
+    def load(cls, directory) -> "BatchJob":
+        """
+        从任务目录恢复任务，使用当前成员池中提交该任务的密钥
+
+        Raises:
+            ValueError: 目录中没有任务，或当前配置中找不到提交该任务的密钥
+        """
+        job_path = Path(directory) / "job.json"
+        if not job_path.exists():
+            raise ValueError(f"{directory} 中没有批处理任务")
+        info = json.loads(job_path.read_text(encoding="utf-8"))
+        for member in load_pool(GEMINI_API_BASE):
+            if member.endpoint == info["endpoint"] and key_fingerprint(member.api_key) == info["key"]:
+                return cls(directory, info, member.api_key)
+        raise ValueError(f"当前配置中找不到提交任务 {info['name']} 的密钥（指纹 {info['key']}）")
+
+    def _headers(self) -> dict:
+        return {"x-goog-api-key": self.api_key, "Content-Type": "application/json"}
+
+    def poll(self) -> List[dict]:
+        """
+        查询一次任务状态，写出新完成的结果；任务结束时为没有结果的请求记录 BATCH_FAILED
+
+        Returns:
+            本次新写出的结果记录
+
+        Raises:
+            BatchError: 查询失败
+            requests.exceptions.RequestException: 网络错误
+        """
+        response = transport.get(f"{self.endpoint}/{self.name}", headers=self._headers(), timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            raise BatchError(
+                f"查询批处理任务失败: {response.status_code} - {response.text}", status_code=response.status_code
+            )
+        operation = response.json()
+        self.state = (operation.get("metadata") or {}).get("state") or self.state
+        self.done = bool(operation.get("done")) or str(self.state).endswith(TERMINAL_STATES)
+
+        new = []
+        for position, item in enumerate(_inlined_responses(operation)):
+            request_id = (item.get("metadata") or {}).get("key")
+            if request_id is None and position < len(self.request_ids):
+                request_id = self.request_ids[position]
+            if request_id in self.functions and request_id not in self.completed:
+                new.append(self._complete(request_id, item))
+
+        if self.done:
+            error = (operation.get("error") or {}).get("message") or f"批处理任务以 {self.state} 结束"
+            for request_id in self.request_ids:
+                if request_id not in self.completed:
+                    new.append(self._save({
+                        "request_id": request_id, "function": self.functions[request_id], "success": False,
+                        "error": f"批处理任务没有返回该请求的结果: {error}", "error_code": "BATCH_FAILED",
+                    }))
+        return new
+
+    def _complete(self, request_id: str, item: dict) -> dict:
+        record = {"request_id": request_id, "function": self.functions[request_id]}
+        if "error" in item:
+            error = item["error"] or {}
+            return self._save({
+                **record, "success": False, "error_code": "API_REQUEST_FAILED",
+                "error": f"API 请求失败: {error.get('code')} - {error.get('message')}",
+            })
+
+        response = item.get("response") or {}
+        try:
+            inline_data = first_inline_data(response["candidates"][0]["content"])
+        except (KeyError, IndexError, TypeError):
+            return self._save({
+                **record, "success": False, "error": "API 响应中没有生成的图像数据", "error_code": "NO_IMAGE_DATA"
+            })
+
+        image_bytes = base64.b64decode(inline_data["data"])
+        mime_type = inline_data.get("mimeType", "image/png")
+        name = _output_name(request_id, mime_type)
+        temp = self.directory / f".{name}.part"
+        temp.write_bytes(image_bytes)
+        os.replace(temp, self.directory / name)
+
+        usage = parse_usage(response.get("usageMetadata"))
+        get_usage_tracker().record(self.api_key, current_tenant(), usage)
+        return self._save({
+            **record, "success": True, "file": name, "bytes": len(image_bytes),
+            "sha256": hashlib.sha256(image_bytes).hexdigest(), "mime": mime_type, "usage": usage,
+            "model": self.info.get("model"),
+        })
+
+    def _save(self, record: dict) -> dict:
+        with open(self.directory / "results.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.completed[record["request_id"]] = record
+        return record
+
+    def wait(
+        self,
+        timeout: Optional[float] = None,
+        on_result: Optional[Callable[[dict], None]] = None,
+        poll_interval: Optional[float] = None,
+        max_poll_interval: Optional[float] = None,
+    ) -> dict:
+        """
+        按退避间隔轮询直到任务结束（或超时），每个结果写出后立即交给 on_result
+
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等到任务结束；超时后任务仍在上游运行，可稍后再次 wait
+            on_result: 结果回调，参数为 results.jsonl 中的一条记录
+            poll_interval: 初始轮询间隔（秒），默认读取 GEMINI_BATCH_POLL_INTERVAL
+            max_poll_interval: 最大轮询间隔（秒），默认读取 GEMINI_BATCH_POLL_MAX
+
+        Returns:
+            summary() 的结果
+
+        Raises:
+            BatchError: 查询失败且不可重试（如 4xx）
+        """
+        initial = poll_interval or float(os.environ.get('GEMINI_BATCH_POLL_INTERVAL') or DEFAULT_POLL_INTERVAL)
+        maximum = max_poll_interval or float(os.environ.get('GEMINI_BATCH_POLL_MAX') or DEFAULT_MAX_POLL_INTERVAL)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        interval = initial
+
+        while True:
+            try:
+                new = self.poll()
+            except (requests.exceptions.RequestException, BatchError) as e:
+                status = getattr(e, "status_code", None)
+                if isinstance(e, BatchError) and status is not None and status < 500 and status != 429:
+                    raise
+                self.poll_errors += 1
+                new = []
+
+            if on_result is not None:
+                for record in new:
+                    on_result(record)
+            if self.done:
+                return self.summary()
+
+            # 先确定本次等待的间隔再睡眠：有新结果时回到初始间隔，否则沿用当前退避间隔
+            delay = initial if new else interval
+            remaining = deadline - time.monotonic() if deadline is not None else delay
+            if remaining <= 0:
+                return self.summary()
+            time.sleep(min(delay, remaining))
+            interval = min(delay * POLL_BACKOFF, maximum)
+
+    def cancel(self) -> None:
+        """
+        请求上游取消任务；已完成的结果仍可通过下一次轮询取回
+
+        Raises:
+            BatchError: 取消请求失败
+        """
+        response = transport.post(
+            f"{self.endpoint}/{self.name}:cancel", headers=self._headers(), json={}, timeout=REQUEST_TIMEOUT
+        )
+        if response.status_code != 200:
+            raise BatchError(
+                f"取消批处理任务失败: {response.status_code} - {response.text}", status_code=response.status_code
+            )
+
+    def results(self) -> Dict[str, dict]:
+        """已写出的结果 {request_id: 记录}"""
+        return dict(self.completed)
+
+    def summary(self) -> dict:
+        succeeded = sum(1 for record in self.completed.values() if record["success"])
+        return {
+            "name": self.name,
+            "state": self.state,
+            "done": self.done,
+            "total": len(self.request_ids),
+            "succeeded": succeeded,
+            "failed": len(self.completed) - succeeded,
+            "pending": len(self.request_ids) - len(self.completed),
+            "poll_errors": self.poll_errors,
+            "directory": str(self.directory),
+        }
+
+
+def submit(entries: List[dict], directory, display_name: Optional[str] = None) -> BatchJob:
+    """
+    把多条请求打包为一个上游批处理任务提交
+
+    Args:
+        entries: 请求列表，每条为 {"request_id": 调用方的请求 ID（唯一）, "function": "text_to_image" 或
+            "edit_image", "prompt": 提示词, "input_path": 输入图像路径（edit_image 可选，默认读取
+            data/inputs/input_image/ 中的图像）}
+        directory: 任务目录（不能已有任务）
+        display_name: 任务显示名，默认为目录名
+
+    Returns:
+        BatchJob，调用 wait() 轮询并取回结果
+
+    Raises:
+        ValueError: 请求参数无效、请求体超过内联大小限制、未配置密钥，或目录中已有任务
+        BatchError: 提交失败
+        requests.exceptions.RequestException: 网络错误
+    """
+    directory = Path(directory)
+    if (directory / "job.json").exists():
+        raise ValueError(f"{directory} 中已有批处理任务，请使用 BatchJob.load 继续")
+    if not entries:
+        raise ValueError("批处理请求列表为空")
+
+    request_ids = [entry.get("request_id") for entry in entries]
+    if not all(isinstance(request_id, str) and request_id for request_id in request_ids):
+        raise ValueError("每条请求都必须带有非空字符串 request_id")
+    if len(set(request_ids)) != len(request_ids):
+        raise ValueError("request_id 不能重复")
+
+    router = get_router(GEMINI_API_BASE)
+    if router is None:
+        raise ValueError("未配置 GEMINI_API_KEY，请在平台上配置该密钥")
+
+    model = get_policy().primary.name
+    body = json.dumps({"batch": {
+        "displayName": display_name or directory.name,
+        "inputConfig": {"requests": {"requests": [
+            {"request": _build_request(entry), "metadata": {"key": entry["request_id"]}} for entry in entries
+        ]}},
+    }}).encode('utf-8')
+    if len(body) > MAX_INLINE_BYTES:
+        raise ValueError(
+            f"批处理请求体 {len(body) / 1024 / 1024:.1f} MiB 超过内联限制 {MAX_INLINE_BYTES // 1024 // 1024} MiB，"
+            "请拆分为多个任务"
+        )
+
+    member = router.acquire()
+    started = time.monotonic()
+    status_code = None
+    try:
+        response = transport.post(
+            f"{member.endpoint}/models/{model}:batchGenerateContent",
+            headers={"x-goog-api-key": member.api_key, "Content-Type": "application/json"},
+            data=body, timeout=REQUEST_TIMEOUT,
+        )
+        status_code = response.status_code
+    finally:
+        router.release(member, time.monotonic() - started, status_code)
+    if status_code != 200:
+        raise BatchError(f"提交批处理任务失败: {status_code} - {response.text}", status_code=status_code)
+
+    operation = response.json()
+    info = {
+        "name": operation["name"],
+        "endpoint": member.endpoint,
+        "key": key_fingerprint(member.api_key),
+        "model": model,
+        "submitted": round(time.time(), 3),
+        "state": (operation.get("metadata") or {}).get("state"),
+        "requests": [{"request_id": entry["request_id"], "function": entry["function"]} for entry in entries],
+    }
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / "job.json").write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+    return BatchJob(directory, info, member.api_key)
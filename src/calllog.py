@@ -0,0 +1,348 @@
+"""
+结构化调用日志
+
+失败目前只体现为返回字典中的 error 字符串，事后无从分析。开启后每次 text_to_image / edit_image 调用
+结束时追加一条 JSON 记录（JSONL），用于容量规划和故障分析：
+
+    ts              调用开始的 Unix 时间
+    function        text_to_image / edit_image
+    request_id      调用方的请求 ID（未传时为 null）
+    prompt_sha256   提示词的 SHA-256（不记录提示词原文）
+    success / error_code / http_status / model
+    usage           响应 usageMetadata 中的 token 用量（没有时为 null），用于按请求核算成本
+    retries         同一调用内重发请求的次数（如上传文件失效后改为内联重发、分块或画面重试）
+    request_bytes   发出的序列化请求体字节数之和（含重发和各分块）
+    response_bytes  解码后的输出图像字节数
+    phases          各阶段耗时（毫秒）：queue（等待内存预算）、ttfb（发出请求到首字节）、
+                    download（首字节到图像解码完成）、write（写出）、total
+
+分块和动画模式下各分块的事件（带 piece）同样经过记录器：queue 为整次操作等待内存预算的时间，
+ttfb 从第一个分块请求发出到第一个首字节，download 到拼接结果解码完成；http_status 为分块请求中
+出现过的非 200 状态（全部为 200 时为 200）。
+
+记录由后台线程写入，调用线程只把记录放入有界队列，队列满时丢弃并计数，不会阻塞调用；提示词哈希也在
+后台线程中计算。请求体大小取自实际发送的序列化字节，记录器不重新序列化请求，也不要求计算图像哈希。
+文件超过 GEMINI_CALL_LOG_MAX_BYTES 时轮转：当前文件压缩为 <路径>.1.gz，旧的依次后移，
+最多保留 GEMINI_CALL_LOG_BACKUPS 个。
+
+配置：
+- GEMINI_CALL_LOG：日志路径（如 logs/calls.jsonl），未配置时不记录
+- GEMINI_CALL_LOG_MAX_BYTES：单个文件的轮转阈值，默认 64MiB
+- GEMINI_CALL_LOG_BACKUPS：保留的压缩文件数，默认 5
+
+汇总分析见 scripts/analyze_call_log.py。
+"""
+
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from .events import NULL_EMITTER, EventEmitter
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+QUEUE_SIZE = 10000
+
+
+class _Deferred:
+    """在后台写入线程序列化记录时才计算的字段值（如提示词哈希）"""
+
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn: Callable, *args):
+        self.fn = fn
+        self.args = args
+
+
+def _resolve(value):
+    if isinstance(value, _Deferred):
+        return value.fn(*value.args)
+    raise TypeError(f"无法序列化的字段值: {type(value).__name__}")
+
+
+def _prompt_sha256(prompt) -> str:
+    return hashlib.sha256(str(prompt).encode('utf-8')).hexdigest()
+
+
+class CallLog:
+    """
+    后台写入的 JSONL 调用日志（线程安全）
+
+    Args:
+        path: 日志文件路径
+        max_bytes: 轮转阈值（字节）
+        backups: 保留的压缩文件数
+    """
+
+    def __init__(self, path, max_bytes: int = DEFAULT_MAX_BYTES, backups: int = DEFAULT_BACKUPS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="call-log", daemon=True)
+        self._thread.start()
+
+    def write(self, entry: dict) -> None:
+        """把记录放入写入队列；队列已满时丢弃"""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def flush(self) -> None:
+        """等待已入队的记录全部写入"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """写完已入队的记录后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            batch = [self._queue.get()]
+            # 一次取走队列中已有的全部记录，合并为一次写入
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            entries = [entry for entry in batch if entry is not None]
+            try:
+                if entries:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.writelines(
+                            json.dumps(entry, ensure_ascii=False, default=_resolve) + "\n" for entry in entries
+                        )
+                    with self._lock:
+                        self.written += len(entries)
+                    if self.path.stat().st_size >= self.max_bytes:
+                        self._rotate()
+            except OSError:
+                with self._lock:
+                    self.dropped += len(entries)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _rotate(self) -> None:
+        """<路径> → <路径>.1.gz，<路径>.N.gz → <路径>.N+1.gz，超出 backups 的删除"""
+        for index in range(self.backups, 0, -1):
+            source = _backup_path(self.path, index)
+            if not source.exists():
+                continue
+            if index == self.backups:
+                source.unlink()
+            else:
+                source.replace(_backup_path(self.path, index + 1))
+
+        if self.backups > 0:
+            with open(self.path, "rb") as src, gzip.open(_backup_path(self.path, 1), "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        self.path.unlink()
+        self.rotations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "rotations": self.rotations,
+                "pending": self._queue.qsize(),
+            }
+
+
+def _backup_path(path: Path, index: int) -> Path:
+    return path.with_name(f"{path.name}.{index}.gz")
+
+
+def iter_entries(path) -> Iterator[dict]:
+    """
+    按时间顺序读取日志及其轮转出的压缩文件中的全部记录，跳过无法解析的行（如写入中断的末行）
+    """
+    path = Path(path)
+    backups = sorted(path.parent.glob(f"{path.name}.*.gz"), key=lambda p: -int(p.name.split(".")[-2]))
+    for file in backups + ([path] if path.exists() else []):
+        opener = gzip.open if file.suffix == ".gz" else open
+        with opener(file, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class CallRecorder:
+    """
+    从一次调用的进度事件中收集计时与大小，调用结束时生成日志记录
+
+    Args:
+        function: 函数名
+        prompt: 提示词
+        request_id: 调用方的请求 ID
+        downstream: 调用方原本的 events.EventEmitter，事件会原样转发给它
+    """
+
+    def __init__(self, function: str, prompt, request_id: Optional[str] = None, downstream=NULL_EMITTER):
+        self.entry = {
+            "ts": round(time.time(), 3),
+            "function": function,
+            "request_id": request_id,
+            "prompt_sha256": _Deferred(_prompt_sha256, prompt),
+            "request_bytes": 0,
+            "response_bytes": 0,
+            "retries": 0,
+            "http_status": None,
+            "model": None,
+        }
+        self._marks = {}
+        self._sent = set()
+        self._downstream = downstream
+        self._lock = threading.Lock()
+        # 日志不需要图像哈希，只在下游消费方需要时计算
+        self.emitter = EventEmitter(self._on_event, digests=downstream.digests)
+
+    def _on_event(self, event) -> None:
+        # 分块模式下各分块的事件在工作线程中并发到达
+        with self._lock:
+            if "piece" in event.data:
+                self._on_piece_event(event)
+            else:
+                self._on_call_event(event)
+
+        if self._downstream.enabled:
+            self._downstream.callback(event)
+
+    def _on_call_event(self, event) -> None:
+        self._marks[event.type] = event.elapsed_ms
+        if event.type == "admitted":
+            self.entry["queue_ms"] = event.data.get("wait_ms")
+        elif event.type == "request_sent":
+            self._on_request_sent(event, None)
+            self._marks["sent_ms"] = event.elapsed_ms
+        elif event.type == "first_byte":
+            self.entry["http_status"] = event.data.get("status_code")
+        elif event.type == "image_decoded":
+            self.entry["response_bytes"] += event.data.get("bytes", 0)
+
+    def _on_piece_event(self, event) -> None:
+        """分块的事件：计入请求字节数和重发次数，首个请求和首字节作为整次调用的计时点"""
+        if event.type == "request_sent":
+            self._on_request_sent(event, event.data["piece"])
+            self._marks.setdefault("sent_ms", event.elapsed_ms)
+        elif event.type == "first_byte":
+            self._marks.setdefault("first_byte", event.elapsed_ms)
+            status = event.data.get("status_code")
+            if self.entry["http_status"] in (None, 200):
+                self.entry["http_status"] = status
+
+    def _on_request_sent(self, event, piece) -> None:
+        if piece in self._sent:
+            self.entry["retries"] += 1
+        self._sent.add(piece)
+        self.entry["request_bytes"] += event.data.get("bytes", 0)
+        self.entry["model"] = event.data.get("model")
+
+    def finish(self, result: dict) -> dict:
+        """根据调用结果补全记录并返回"""
+        marks = self._marks
+        total_ms = round((time.monotonic() - self.emitter.started) * 1000, 1)
+
+        def span(start, end):
+            if start in marks and end in marks:
+                return round(marks[end] - marks[start], 1)
+            return None
+
+        phases = {
+            "queue": self.entry.pop("queue_ms", None),
+            "ttfb": span("sent_ms", "first_byte"),
+            "download": span("first_byte", "image_decoded"),
+            "write": span("image_decoded", "written"),
+            "total": total_ms,
+        }
+        return {
+            **self.entry,
+            "success": bool(result.get("success")),
+            "error_code": result.get("error_code"),
+            "model": result.get("model") or self.entry["model"],
+            "usage": result.get("usage"),
+            "phases": {name: value for name, value in phases.items() if value is not None},
+        }
+
+
+def logged(function: str):
+    """
+    装饰 main 中 text_to_image / edit_image 的实现：开启调用日志时收集本次调用的事件并写入一条记录
+
+    被装饰函数的第一个参数为 prompt，可以接收 request_id 和 emit 关键字参数。
+    """
+
+    def decorator(impl):
+        signature = inspect.signature(impl)
+
+        @functools.wraps(impl)
+        def wrapper(*args, **kwargs):
+            call_log = get_call_log()
+            if call_log is None:
+                return impl(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            recorder = CallRecorder(
+                function, bound.arguments.get("prompt"), bound.arguments.get("request_id"), bound.arguments["emit"]
+            )
+            bound.arguments["emit"] = recorder.emitter
+            result = impl(*bound.args, **bound.kwargs)
+            call_log.write(recorder.finish(result))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+_call_log = None
+_call_log_config = None
+_call_log_lock = threading.Lock()
+
+
+def get_call_log() -> Optional[CallLog]:
+    """返回进程内共享的调用日志；GEMINI_CALL_LOG 未配置时返回 None"""
+    global _call_log, _call_log_config
+
+    config = (
+        os.environ.get('GEMINI_CALL_LOG'),
+        os.environ.get('GEMINI_CALL_LOG_MAX_BYTES'),
+        os.environ.get('GEMINI_CALL_LOG_BACKUPS'),
+    )
+    with _call_log_lock:
+        if config != _call_log_config:
+            if _call_log is not None:
+                _call_log.close()
+            _call_log = None
+            if config[0]:
+                _call_log = CallLog(
+                    config[0],
+                    max_bytes=int(config[1] or DEFAULT_MAX_BYTES),
+                    backups=int(config[2] or DEFAULT_BACKUPS),
+                )
+            _call_log_config = config
+        return _call_log
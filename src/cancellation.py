@@ -0,0 +1,195 @@
+"""
+在途生成请求的协作式取消
+
+调用 text_to_image / edit_image 时传入 request_id，即可在其他线程中调用
+cancel(request_id) 取消该请求：
+- 等待响应头期间：调用方立即返回 CANCELLED，发起请求的辅助线程在响应到达后直接关闭连接，
+  不读取响应体
+- 读取响应体或流式分块期间：关闭响应，中断传输
+- 已取消的请求不再解码图像、不写输出文件
+
+在调用开始之前（例如仍在调度器队列中）取消的 request_id 会被暂存 PENDING_TTL 秒，
+调用一开始就会被取消。
+"""
+
+import contextvars
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+from . import profiling
+
+PENDING_TTL = 300.0
+
+
+class RequestCancelled(Exception):
+    """请求已被取消"""
+
+
+class CancelToken:
+    """取消令牌：cancel() 后依次调用已注册的回调（线程安全）"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """注册取消回调；令牌已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise RequestCancelled()
+
+
+def call_cancellable(fn: Callable, token: Optional[CancelToken], cleanup: Optional[Callable] = None):
+    """
+    在辅助线程中执行阻塞调用，取消时调用方立即返回
+
+    Args:
+        fn: 无参数的阻塞调用（如 requests.post）
+        token: 取消令牌，为 None 时直接在当前线程执行 fn
+        cleanup: 取消后对 fn 的返回值执行的清理（如关闭响应）
+
+    Raises:
+        RequestCancelled: 调用完成前令牌被取消
+    """
+    if token is None:
+        return fn()
+
+    token.raise_if_cancelled()
+    done = threading.Event()
+    lock = threading.Lock()
+    state = {}
+
+    def target():
+        profiling.track_thread()
+        try:
+            state["result"] = fn()
+        except BaseException as e:
+            state["error"] = e
+        with lock:
+            state["finished"] = True
+            abandoned = state.get("abandoned", False)
+        done.set()
+        if abandoned and "result" in state and cleanup is not None:
+            cleanup(state["result"])
+
+    # 在调用方上下文的副本中执行，保留上下文变量（如正在进行的性能剖析）
+    threading.Thread(
+        target=contextvars.copy_context().run, args=(target,), name="imagen-cancellable-call", daemon=True
+    ).start()
+    token.add_callback(done.set)
+    done.wait()
+    token.remove_callback(done.set)
+
+    with lock:
+        if token.cancelled:
+            state["abandoned"] = True
+            finished = state.get("finished", False)
+        else:
+            finished = True
+
+    if token.cancelled:
+        if finished and "result" in state and cleanup is not None:
+            cleanup(state["result"])
+        raise RequestCancelled()
+    if "error" in state:
+        raise state["error"]
+    return state["result"]
+
+
+def _response_socket(response) -> Optional[socket.socket]:
+    """取出 requests 响应底层的 socket，取不到时返回 None"""
+    raw = getattr(response, "raw", None)
+    sock = getattr(getattr(raw, "connection", None), "sock", None)
+    if sock is None:
+        # 响应声明 Connection: close 时 http.client 会把 socket 移交给响应对象
+        fp = getattr(getattr(raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    return sock if isinstance(sock, socket.socket) else None
+
+
+def abort_response(response) -> None:
+    """
+    中断响应传输：先关闭底层 socket 的读写，唤醒阻塞在读取上的线程，再关闭响应
+
+    仅关闭响应对象无法唤醒另一个线程中阻塞的 recv。
+    """
+    sock = _response_socket(response)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+_tokens = {}
+_pending = {}
+_registry_lock = threading.Lock()
+
+
+def register(request_id: str) -> CancelToken:
+    """为 request_id 创建令牌；该 ID 已被提前取消时返回已取消的令牌"""
+    token = CancelToken()
+    now = time.monotonic()
+    with _registry_lock:
+        for expired in [rid for rid, at in _pending.items() if now - at > PENDING_TTL]:
+            del _pending[expired]
+        _tokens[request_id] = token
+        pre_cancelled = _pending.pop(request_id, None) is not None
+    if pre_cancelled:
+        token.cancel()
+    return token
+
+
+def unregister(request_id: str, token: CancelToken) -> None:
+    """调用结束后注销令牌"""
+    with _registry_lock:
+        if _tokens.get(request_id) is token:
+            del _tokens[request_id]
+
+
+def cancel(request_id: str) -> bool:
+    """
+    取消指定请求
+
+    Returns:
+        请求正在执行时返回 True；尚未开始时返回 False（会在开始时被取消）
+    """
+    with _registry_lock:
+        token = _tokens.get(request_id)
+        if token is None:
+            _pending[request_id] = time.monotonic()
+    if token is None:
+        return False
+    token.cancel()
+    return True
@@ -0,0 +1,330 @@
+"""
+生成结果目录（SQLite）
+
+输出文件与产生它的提示词之间没有任何记录，找回以前的结果只能翻目录。开启后每次成功的
+text_to_image / edit_image 调用为每张写出的图像记录一行：
+
+    ts              调用开始的 Unix 时间
+    function        text_to_image / edit_image
+    request_id / session_id
+    prompt          提示词原文
+    prompt_sha256   提示词的 SHA-256
+    input_sha256    输入图像文件的 SHA-256（text_to_image 与会话续编时为 null）
+    output_sha256   输出图像的 SHA-256
+    path            输出路径（写入输出目标时为对象 URI）
+    bytes / mime / model
+
+按 prompt_sha256、input_sha256、output_sha256 和 ts 建索引。查询接口 find() 不调用上游即可返回
+某个提示词（及输入图像）已有的结果。
+
+数据库使用 WAL 模式，多个 worker 进程可以同时读写同一个文件：调用线程只把记录放入有界队列
+（队列满时丢弃并计数），由后台线程把队列中已有的记录合并为一个事务批量写入；
+写锁被其他进程占用时等待至多 BUSY_TIMEOUT 秒。读取各线程使用各自的只读连接，不阻塞写入。
+
+配置：
+- GEMINI_CATALOG：数据库路径（如 data/catalog.db），未配置时不记录
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from .events import NULL_EMITTER, EventEmitter
+
+QUEUE_SIZE = 10000
+BUSY_TIMEOUT = 30.0
+DEFAULT_LIMIT = 20
+
+COLUMNS = (
+    "ts", "function", "request_id", "session_id", "prompt", "prompt_sha256", "input_sha256", "output_sha256",
+    "path", "bytes", "mime", "model",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    function TEXT NOT NULL,
+    request_id TEXT,
+    session_id TEXT,
+    prompt TEXT,
+    prompt_sha256 TEXT NOT NULL,
+    input_sha256 TEXT,
+    output_sha256 TEXT,
+    path TEXT,
+    bytes INTEGER,
+    mime TEXT,
+    model TEXT
+);
+CREATE INDEX IF NOT EXISTS assets_prompt ON assets (prompt_sha256, ts);
+CREATE INDEX IF NOT EXISTS assets_input ON assets (input_sha256, ts);
+CREATE INDEX IF NOT EXISTS assets_output ON assets (output_sha256);
+CREATE INDEX IF NOT EXISTS assets_ts ON assets (ts);
+"""
+
+INSERT = f"INSERT INTO assets ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def sha256_hex(data) -> str:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    connection = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+class Catalog:
+    """
+    后台批量写入的 SQLite 结果目录（线程安全，可多进程共享同一文件）
+
+    Args:
+        path: 数据库文件路径
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self._writer = _connect(self.path)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.executescript(SCHEMA)
+
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="catalog", daemon=True)
+        self._thread.start()
+
+    def add(self, entry: dict) -> None:
+        """把一行记录放入写入队列；队列已满时丢弃"""
+        try:
+            self._queue.put_nowait(tuple(entry.get(column) for column in COLUMNS))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def flush(self) -> None:
+        """等待已入队的记录全部写入"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """写完已入队的记录后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join()
+        self._writer.close()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # 一次取走队列中已有的全部记录，合并为一个事务
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    with self._writer:
+                        self._writer.execute("BEGIN IMMEDIATE")
+                        self._writer.executemany(INSERT, rows)
+                    with self._lock:
+                        self.written += len(rows)
+                        self.batches += 1
+            except sqlite3.Error:
+                with self._lock:
+                    self.dropped += len(rows)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = _connect(self.path)
+            connection.execute("PRAGMA query_only=ON")
+            self._local.connection = connection
+        return connection
+
+    def _query(self, where: str, params: tuple, limit: int) -> List[dict]:
+        rows = self._reader().execute(
+            f"SELECT id, {', '.join(COLUMNS)} FROM assets WHERE {where} ORDER BY ts DESC, id DESC LIMIT ?",
+            params + (limit,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find(
+        self,
+        prompt: str,
+        input_image: bytes = None,
+        function: str = None,
+        limit: int = DEFAULT_LIMIT,
+    ) -> List[dict]:
+        """
+        返回某个提示词已有的结果，按时间从新到旧
+
+        Args:
+            prompt: 提示词（按 SHA-256 匹配）
+            input_image: 输入图像字节；传入时只返回以该图像为输入的结果
+            function: 只返回该函数（text_to_image / edit_image）的结果
+            limit: 最多返回的行数
+
+        Returns:
+            记录字典列表，字段见模块说明
+        """
+        where, params = "prompt_sha256 = ?", (sha256_hex(prompt),)
+        if input_image is not None:
+            where, params = where + " AND input_sha256 = ?", params + (sha256_hex(input_image),)
+        if function is not None:
+            where, params = where + " AND function = ?", params + (function,)
+        return self._query(where, params, limit)
+
+    def by_input(self, input_sha256: str, limit: int = DEFAULT_LIMIT) -> List[dict]:
+        """返回以某张输入图像生成的结果，按时间从新到旧"""
+        return self._query("input_sha256 = ?", (input_sha256,), limit)
+
+    def by_output(self, output_sha256: str) -> List[dict]:
+        """返回产生了某张输出图像（按 SHA-256）的记录"""
+        return self._query("output_sha256 = ?", (output_sha256,), -1)
+
+    def between(self, since: float = None, until: float = None, limit: int = DEFAULT_LIMIT) -> List[dict]:
+        """返回 [since, until) 时间范围内的记录，按时间从新到旧"""
+        since = since if since is not None else 0.0
+        until = until if until is not None else time.time() + 1
+        return self._query("ts >= ? AND ts < ?", (since, until), limit)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "pending": self._queue.qsize(),
+            }
+
+
+class AssetRecorder:
+    """
+    从一次调用的进度事件中收集输入、输出哈希，调用成功时生成目录记录
+
+    Args:
+        function: 函数名
+        arguments: 调用参数（prompt、request_id、session_id）
+        downstream: 调用方原本的 events.EventEmitter，事件会原样转发给它
+    """
+
+    def __init__(self, function: str, arguments: dict, downstream=NULL_EMITTER):
+        prompt = arguments.get("prompt")
+        self.entry = {
+            "ts": round(time.time(), 3),
+            "function": function,
+            "request_id": arguments.get("request_id"),
+            "session_id": arguments.get("session_id"),
+            "prompt": prompt if isinstance(prompt, str) else None,
+            "prompt_sha256": sha256_hex(str(prompt)),
+            "input_sha256": None,
+        }
+        self.outputs = []
+        self._mime = None
+        self._downstream = downstream
+        self.emitter = EventEmitter(self._on_event)
+
+    def _on_event(self, event) -> None:
+        if event.type == "input_read":
+            self.entry["input_sha256"] = event.data.get("sha256")
+        elif event.type == "image_decoded":
+            self._mime = event.data.get("mime_type")
+        elif event.type == "written":
+            self.outputs.append({
+                "output_sha256": event.data.get("sha256"),
+                "path": event.data.get("path"),
+                "bytes": event.data.get("bytes"),
+                "mime": self._mime,
+            })
+
+        if self._downstream.enabled:
+            self._downstream.callback(event)
+
+    def finish(self, result: dict) -> List[dict]:
+        """调用成功时返回每张输出图像一行记录，否则返回空列表"""
+        if not result.get("success"):
+            return []
+        base = {**self.entry, "model": result.get("model")}
+        return [{**base, **output} for output in self.outputs]
+
+
+def cataloged(function: str):
+    """
+    装饰 main 中 text_to_image / edit_image 的实现：开启结果目录时为本次调用写出的每张图像记录一行
+
+    被装饰函数的第一个参数为 prompt，可以接收 request_id、session_id 和 emit 关键字参数。
+    """
+
+    def decorator(impl):
+        signature = inspect.signature(impl)
+
+        @functools.wraps(impl)
+        def wrapper(*args, **kwargs):
+            catalog = get_catalog()
+            if catalog is None:
+                return impl(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            recorder = AssetRecorder(function, bound.arguments, bound.arguments["emit"])
+            bound.arguments["emit"] = recorder.emitter
+            result = impl(*bound.args, **bound.kwargs)
+            for entry in recorder.finish(result):
+                catalog.add(entry)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+_catalog = None
+_catalog_config = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Optional[Catalog]:
+    """返回进程内共享的结果目录；GEMINI_CATALOG 未配置时返回 None"""
+    global _catalog, _catalog_config
+
+    config = os.environ.get('GEMINI_CATALOG')
+    with _catalog_lock:
+        if config != _catalog_config:
+            if _catalog is not None:
+                _catalog.close()
+            _catalog = Catalog(config) if config else None
+            _catalog_config = config
+        return _catalog
+
+
+def find(prompt: str, input_image: bytes = None, function: str = None, limit: int = DEFAULT_LIMIT) -> List[dict]:
+    """
+    在进程共享的结果目录中查找某个提示词已有的结果（参数见 Catalog.find）；未开启结果目录时返回空列表
+    """
+    catalog = get_catalog()
+    if catalog is None:
+        return []
+    return catalog.find(prompt, input_image, function, limit)
@@ -0,0 +1,107 @@
+"""
+Gemini 请求内容的构造与响应解析
+
+同步调用（main）与离线批处理（batch）共用同一套请求构造和响应解析：
+- 读取 data/inputs/input_image/ 中的输入图像
+- 构造编辑提示词和内联图像 part，把请求体序列化为要发送的字节
+- 从响应 content 中取出第一个图像 part
+"""
+
+import base64
+import json
+import os
+from pathlib import Path
+
+DATA_INPUTS_IMAGE = Path("data/inputs/input_image")
+
+EDIT_PROMPT = "基于这张图片，生成一个新版本：{prompt}"
+
+MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+
+def inline_part(image_bytes: bytes, mime_type: str) -> dict:
+    """构造内联图像 part"""
+    return {
+        "inline_data": {
+            "mime_type": mime_type,
+            "data": base64.b64encode(image_bytes).decode('utf-8')
+        }
+    }
+
+
+def encode_body(data: dict) -> bytes:
+    """序列化请求体（与 requests 的 json= 参数相同的规则），发送的就是这份字节"""
+    return json.dumps(data, allow_nan=False).encode('utf-8')
+
+
+class ResponseFormatError(KeyError):
+    """响应体无法解析（不是合法 JSON 或图像数据不是合法 base64），与缺少字段同样按响应格式错误处理"""
+
+    def __str__(self) -> str:
+        return str(self.args[0]) if self.args else ""
+
+
+def first_inline_data(content: dict) -> dict:
+    """
+    返回 content 中第一个图像 part 的 inlineData（模型可能在图像前返回文本）
+
+    Raises:
+        KeyError: content 中没有图像 part
+    """
+    for part in content["parts"]:
+        if "inlineData" in part:
+            return part["inlineData"]
+    raise KeyError("inlineData")
+
+
+def is_hidden(name: str) -> bool:
+    """.DS_Store 等隐藏文件不算输入文件"""
+    return name.startswith(".")
+
+
+def input_files(directory) -> list:
+    """
+    目录中的输入文件（跳过子目录和隐藏文件），按文件名排序
+
+    scandir 的 is_file 直接使用目录项类型，不对每个文件做 stat；目录不存在时返回空列表。
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return sorted(Path(entry.path) for entry in entries if entry.is_file() and not is_hidden(entry.name))
+    except FileNotFoundError:
+        return []
+
+
+def read_input_image() -> tuple:
+    """
+    读取 data/inputs/input_image/ 中的输入图像
+
+    Returns:
+        ((图像字节, MIME 类型), None)，或失败时 (None, 错误字典)
+    """
+    candidates = [path for path in DATA_INPUTS_IMAGE.glob("*") if not is_hidden(path.name)]
+    if not candidates:
+        return None, {
+            "success": False,
+            "error": "未找到输入图像文件",
+            "error_code": "NO_INPUT_FILE"
+        }
+
+    input_path = candidates[0]
+
+    if not input_path.is_file():
+        return None, {
+            "success": False,
+            "error": "输入路径不是有效的文件",
+            "error_code": "INVALID_INPUT_FILE"
+        }
+
+    mime_type = MIME_TYPES.get(input_path.suffix.lower(), 'image/png')
+
+    return (input_path.read_bytes(), mime_type), None
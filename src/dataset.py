@@ -0,0 +1,353 @@
+"""
+数据集生成：分片输出与索引
+
+用 text_to_image 构建训练/评测图像集时（提示词 × 每条若干变体），百万级小文件平铺在 data/outputs/ 中无法管理。
+数据集模式并发生成全部 (提示词, 变体)，输出到独立的数据集目录：
+
+    <目录>/dataset.json     元数据：布局、每条提示词的变体数、分片大小、提示词列表的 SHA-256
+    <目录>/prompts.jsonl    提示词，第 i 行为第 i 条
+    <目录>/index.jsonl      索引，每张图像一行（见下），只追加
+    <目录>/shards/          分片：dir 布局为 00000/、00001/ 等子目录；tar 布局为 00000.tar、00001.tar 等
+
+索引记录使用短字段名以保持紧凑：
+    p / v        提示词序号 / 变体序号
+    shard        分片序号
+    name         图像文件名（dir 布局下的文件名，tar 布局下的成员名）
+    offset       tar 布局下图像数据在分片中的字节偏移，可直接 seek 读取，不必解析 tar
+    bytes / sha256 / mime / model
+    seed         请求的 generationConfig.seed，由提示词和变体序号确定：同一提示词的各变体互不相同，重新生成可复现
+    ms           本次生成耗时（毫秒）
+
+写入顺序为「图像 → 索引行」，索引是唯一的完成依据：中断后以相同参数重新运行，已在索引中的图像跳过，
+其余继续生成（未进入索引的 tar 尾部数据会被截掉）。生成失败的图像不写入索引，重新运行时会再次尝试。
+写入失败（磁盘写满等）时不再领取新任务，结果中 aborted 为错误信息，修复后以相同参数续跑。
+
+命令行入口见 scripts/generate_dataset.py。
+"""
+
+import hashlib
+import json
+import os
+import tarfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+LAYOUTS = ("dir", "tar")
+DEFAULT_SHARD_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+TAR_BLOCK = 512
+MAX_REPORTED_FAILURES = 100
+
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp", "image/gif": "gif"}
+
+
+def _prompts_digest(prompts: List[str]) -> str:
+    digest = hashlib.sha256()
+    for prompt in prompts:
+        digest.update(json.dumps(prompt, ensure_ascii=False).encode('utf-8') + b"\n")
+    return digest.hexdigest()
+
+
+def _variant_seed(prompt: str, variant: int) -> int:
+    """变体的生成种子（非负 int32）"""
+    digest = hashlib.sha256(json.dumps([prompt, variant], ensure_ascii=False).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF
+
+
+def _padded(size: int) -> int:
+    return (size + TAR_BLOCK - 1) // TAR_BLOCK * TAR_BLOCK
+
+
+def _read_index(path: Path) -> List[dict]:
+    """读取索引；写入中断留下的不完整末行会被截掉"""
+    if not path.exists():
+        return []
+    data = path.read_bytes()
+    end = data.rfind(b"\n") + 1
+    if end != len(data):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+    return [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+
+
+class DatasetWriter:
+    """
+    数据集目录的写入端（线程安全，写入串行化）
+
+    Args:
+        directory: 数据集目录
+        prompts: 提示词列表
+        variants: 每条提示词的变体数
+        layout: dir 或 tar
+        shard_size: 每个分片的图像数
+
+    Raises:
+        ValueError: 参数无效，或目录中已有参数不同的数据集
+    """
+
+    def __init__(
+        self,
+        directory,
+        prompts: List[str],
+        variants: int,
+        layout: str = "dir",
+        shard_size: int = DEFAULT_SHARD_SIZE,
+    ):
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知的分片布局: {layout}，可选值: {', '.join(LAYOUTS)}")
+        if variants < 1 or shard_size < 1:
+            raise ValueError("variants 和 shard_size 必须是正整数")
+
+        self.directory = Path(directory)
+        self.layout = layout
+        self.shard_size = shard_size
+        self.meta = {
+            "layout": layout,
+            "variants": variants,
+            "shard_size": shard_size,
+            "prompts": len(prompts),
+            "prompts_sha256": _prompts_digest(prompts),
+        }
+        self._lock = threading.Lock()
+        self._tar = None
+
+        meta_path = self.directory / "dataset.json"
+        if meta_path.exists():
+            existing = json.loads(meta_path.read_text(encoding="utf-8"))
+            if existing != self.meta:
+                raise ValueError(f"{self.directory} 中已有参数不同的数据集，请换一个目录或使用相同参数续跑")
+        else:
+            (self.directory / "shards").mkdir(parents=True, exist_ok=True)
+            with open(self.directory / "prompts.jsonl", "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(prompt, ensure_ascii=False) + "\n" for prompt in prompts)
+            meta_path.write_text(json.dumps(self.meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        records = _read_index(self.directory / "index.jsonl")
+        self.completed = {(r["p"], r["v"]) for r in records}
+        self.count = len(records)
+        self._ends = {}
+        for r in records:
+            if "offset" in r:
+                self._ends[r["shard"]] = max(self._ends.get(r["shard"], 0), r["offset"] + _padded(r["bytes"]))
+        self._index = open(self.directory / "index.jsonl", "a", encoding="utf-8")
+
+    def _shard_path(self, shard: int) -> Path:
+        suffix = ".tar" if self.layout == "tar" else ""
+        return self.directory / "shards" / f"{shard:05d}{suffix}"
+
+    def _open_tar(self, shard: int):
+        """打开（续跑时截断到索引记录的末尾）当前 tar 分片，并封闭上一个分片"""
+        if self._tar is not None:
+            self._tar[1].close()
+        if shard > 0:
+            self._seal(shard - 1)
+        path = self._shard_path(shard)
+        f = open(path, "r+b" if path.exists() else "wb")
+        f.truncate(self._ends.get(shard, 0))
+        f.seek(0, os.SEEK_END)
+        self._tar = (shard, f)
+        return f
+
+    def _seal(self, shard: int) -> None:
+        """在 tar 分片末尾写入结束块（幂等；续跑时打开分片会先截掉结束块）"""
+        path = self._shard_path(shard)
+        if not path.exists():
+            return
+        with open(path, "r+b") as f:
+            f.truncate(self._ends.get(shard, 0))
+            f.seek(0, os.SEEK_END)
+            f.write(b"\0" * TAR_BLOCK * 2)
+
+    def add(self, prompt_index: int, variant: int, image: bytes, mime_type: str, **extra) -> dict:
+        """写入一张图像并追加索引行，返回索引记录"""
+        with self._lock:
+            shard = self.count // self.shard_size
+            name = f"{prompt_index:08d}-{variant:03d}.{EXTENSIONS.get(mime_type, 'bin')}"
+            record = {"p": prompt_index, "v": variant, "shard": shard, "name": name}
+
+            if self.layout == "tar":
+                f = self._tar[1] if self._tar is not None and self._tar[0] == shard else self._open_tar(shard)
+                info = tarfile.TarInfo(name)
+                info.size = len(image)
+                info.mtime = int(time.time())
+                f.write(info.tobuf(format=tarfile.USTAR_FORMAT))
+                record["offset"] = f.tell()
+                f.write(image + b"\0" * (_padded(len(image)) - len(image)))
+                f.flush()
+                self._ends[shard] = record["offset"] + _padded(len(image))
+            else:
+                path = self._shard_path(shard) / name
+                path.parent.mkdir(parents=True, exist_ok=True)
+                temp = path.with_name(f".{name}.part")
+                temp.write_bytes(image)
+                os.replace(temp, path)
+
+            record.update(
+                bytes=len(image), sha256=hashlib.sha256(image).hexdigest(), mime=mime_type,
+                **{k: v for k, v in extra.items() if v is not None}
+            )
+            self._index.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._index.flush()
+            self.completed.add((prompt_index, variant))
+            self.count += 1
+            return record
+
+    def close(self) -> None:
+        with self._lock:
+            if self._tar is not None:
+                self._tar[1].close()
+                self._seal(self._tar[0])
+                self._tar = None
+            self._index.close()
+
+
+class DatasetReader:
+    """
+    按 (提示词序号, 变体序号) 随机读取数据集中的图像
+
+    Args:
+        directory: 数据集目录
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.meta = json.loads((self.directory / "dataset.json").read_text(encoding="utf-8"))
+        self.records: Dict[Tuple[int, int], dict] = {
+            (r["p"], r["v"]): r for r in _read_index(self.directory / "index.jsonl")
+        }
+        self._prompts = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def keys(self) -> List[Tuple[int, int]]:
+        return sorted(self.records)
+
+    def prompt(self, prompt_index: int) -> str:
+        if self._prompts is None:
+            with open(self.directory / "prompts.jsonl", encoding="utf-8") as f:
+                self._prompts = [json.loads(line) for line in f]
+        return self._prompts[prompt_index]
+
+    def read(self, prompt_index: int, variant: int) -> bytes:
+        """
+        Raises:
+            KeyError: 数据集中没有该图像
+        """
+        record = self.records[(prompt_index, variant)]
+        if "offset" in record:
+            with open(self.directory / "shards" / f"{record['shard']:05d}.tar", "rb") as f:
+                f.seek(record["offset"])
+                return f.read(record["bytes"])
+        return (self.directory / "shards" / f"{record['shard']:05d}" / record["name"]).read_bytes()
+
+
+def _pending(prompts: List[str], variants: int, completed: set) -> Iterator[Tuple[int, int]]:
+    for prompt_index in range(len(prompts)):
+        for variant in range(variants):
+            if (prompt_index, variant) not in completed:
+                yield prompt_index, variant
+
+
+def generate_dataset(
+    prompts: List[str],
+    directory,
+    variants: int = 1,
+    layout: str = "dir",
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline: Optional[float] = None,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    并发生成 prompts × variants 张图像写入数据集目录；目录中已有相同参数的数据集时续跑
+
+    Args:
+        prompts: 提示词列表
+        directory: 数据集目录
+        variants: 每条提示词的变体数
+        layout: 分片布局，dir（子目录）或 tar
+        shard_size: 每个分片的图像数
+        concurrency: 并发生成数
+        deadline: 单次生成的超时（秒），见 text_to_image
+        on_progress: 每完成（或失败）一张调用一次，参数为 {"p", "v", "success", "error_code", "done", "total"}
+
+    Returns:
+        {"total": 总数, "skipped": 续跑时已完成的数量, "generated": 本次生成数, "failed": 失败数,
+        "errors": {error_code: 次数}, "failures": [{"p", "v", "error_code", "error"}, ...]（最多 100 条）,
+        "aborted": 写入失败而提前停止时的错误信息，否则为 None, "elapsed_ms": 耗时}
+        写入失败的图像计入 failed，error_code 为 WRITE_FAILED
+
+    Raises:
+        ValueError: 参数无效，或目录中已有参数不同的数据集
+    """
+    from .main import _text_to_image
+
+    writer = DatasetWriter(directory, prompts, variants, layout, shard_size)
+    total = len(prompts) * variants
+    summary = {"total": total, "skipped": len(writer.completed), "generated": 0, "failed": 0, "aborted": None}
+    errors = Counter()
+    failures = []
+    jobs = _pending(prompts, variants, set(writer.completed))
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def worker():
+        while True:
+            with lock:
+                job = next(jobs, None) if summary["aborted"] is None else None
+            if job is None:
+                return
+            prompt_index, variant = job
+            seed = _variant_seed(prompts[prompt_index], variant)
+            captured = []
+            call_started = time.monotonic()
+            result = _text_to_image(
+                prompts[prompt_index], deadline=deadline, seed=seed,
+                capture=lambda image, mime_type: captured.append((image, mime_type))
+            )
+            if result["success"]:
+                try:
+                    writer.add(
+                        prompt_index, variant, *captured[0], seed=seed,
+                        ms=round((time.monotonic() - call_started) * 1000, 1), model=result.get("model")
+                    )
+                except Exception as e:
+                    result = {"success": False, "error": f"写入数据集失败: {e}", "error_code": "WRITE_FAILED"}
+                    with lock:
+                        summary["aborted"] = summary["aborted"] or result["error"]
+            with lock:
+                if result["success"]:
+                    summary["generated"] += 1
+                else:
+                    summary["failed"] += 1
+                    errors[result.get("error_code")] += 1
+                    if len(failures) < MAX_REPORTED_FAILURES:
+                        failures.append({
+                            "p": prompt_index, "v": variant,
+                            "error_code": result.get("error_code"), "error": result.get("error")
+                        })
+                done = summary["skipped"] + summary["generated"] + summary["failed"]
+            if on_progress is not None:
+                on_progress({
+                    "p": prompt_index, "v": variant, "success": result["success"],
+                    "error_code": result.get("error_code"), "done": done, "total": total
+                })
+
+    threads = [threading.Thread(target=worker, name=f"dataset-{i}", daemon=True) for i in range(max(1, concurrency))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        writer.close()
+
+    summary.update(
+        errors=dict(errors.most_common()), failures=failures,
+        elapsed_ms=round((time.monotonic() - started) * 1000, 1)
+    )
+    return summary
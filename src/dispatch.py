@@ -0,0 +1,224 @@
+"""
+按 manifest 分发调用（网关入口）
+
+网关按函数名和参数字典发起调用。分发器只在创建时读取一次 prefab-manifest.json，把每个函数的参数和
+输入文件约束编译为校验函数并缓存，之后每次调用只执行这些预先生成的检查：
+
+- 参数：未声明的参数、缺少必需参数、类型不符（string / number / integer / boolean / array / object，
+  array 还检查 items 类型与 minItems / maxItems）返回 INVALID_PARAMETER
+- 输入文件：data/inputs/<文件组>/ 中的文件数少于 minItems 返回 NO_INPUT_FILE，多于 maxItems 返回
+  INVALID_INPUT_FILE；子目录和 .DS_Store 等隐藏文件不计入（与 main 读取输入时一致）
+
+校验通过后按函数名路由到实现。取值范围等语义检查（deadline 为正数、session_id 格式等）仍由各函数完成，
+直接调用 text_to_image / edit_image 时行为不变。
+
+配置：
+- GEMINI_MANIFEST：manifest 路径，默认为仓库根目录的 prefab-manifest.json
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from .contents import input_files
+from .events import EventEmitter
+
+MANIFEST_PATH = Path(__file__).resolve().parent.parent / "prefab-manifest.json"
+DATA_INPUTS = Path("data/inputs")
+
+# 文件组 → 传入该参数时可省略（会话已有输出时 edit_image 不需要输入图像）
+OPTIONAL_FILES = {("edit_image", "input_image"): "session_id"}
+
+TYPE_NAMES = {
+    "string": "字符串",
+    "number": "数字",
+    "integer": "整数",
+    "boolean": "布尔值",
+    "array": "数组",
+    "object": "对象",
+}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_integer(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+TYPE_CHECKS = {
+    "string": lambda value: isinstance(value, str),
+    "number": _is_number,
+    "integer": _is_integer,
+    "boolean": lambda value: isinstance(value, bool),
+    "object": lambda value: isinstance(value, dict),
+}
+
+
+def _invalid(error: str, error_code: str = "INVALID_PARAMETER") -> dict:
+    return {"success": False, "error": error, "error_code": error_code}
+
+
+def _type_check(spec: dict) -> Callable[[object], bool]:
+    """把一个参数（或 items）的类型声明编译为检查函数"""
+    if spec.get("type") != "array":
+        return TYPE_CHECKS.get(spec.get("type"), lambda value: True)
+
+    item_check = _type_check(spec["items"]) if "items" in spec else None
+    min_items = spec.get("minItems", 0)
+    max_items = spec.get("maxItems")
+
+    def check(value) -> bool:
+        if not isinstance(value, (list, tuple)) or len(value) < min_items:
+            return False
+        if max_items is not None and len(value) > max_items:
+            return False
+        return item_check is None or all(item_check(item) for item in value)
+
+    return check
+
+
+def _type_message(name: str, spec: dict) -> str:
+    message = f"{name} 参数必须是{TYPE_NAMES.get(spec['type'], spec['type'])}"
+    if spec["type"] == "array":
+        if "items" in spec:
+            message += f"，元素为{TYPE_NAMES.get(spec['items']['type'], spec['items']['type'])}"
+        if "minItems" in spec and spec["minItems"] == spec.get("maxItems"):
+            message += f"，长度 {spec['minItems']}"
+        elif "minItems" in spec or "maxItems" in spec:
+            message += f"，长度 {spec.get('minItems', 0)}~{spec.get('maxItems', '不限')}"
+    return message
+
+
+def compile_validator(function: dict) -> Callable[[dict], Optional[dict]]:
+    """
+    把 manifest 中一个函数的声明编译为校验函数
+
+    Args:
+        function: manifest 的 functions 数组中的一项
+
+    Returns:
+        校验函数：参数字典合法时返回 None，否则返回错误字典
+    """
+    name = function["name"]
+    allowed = frozenset(param["name"] for param in function.get("parameters", []))
+    params = tuple(
+        (param["name"], _type_check(param), param.get("required", False), _type_message(param["name"], param))
+        for param in function.get("parameters", [])
+    )
+    files = tuple(
+        (str(DATA_INPUTS / key), key, spec.get("minItems", 0), spec.get("maxItems"), OPTIONAL_FILES.get((name, key)))
+        for key, spec in function.get("files", {}).items()
+        if spec.get("items", {}).get("type") == "InputFile"
+    )
+
+    def validate(arguments: dict) -> Optional[dict]:
+        unknown = arguments.keys() - allowed
+        if unknown:
+            return _invalid(f"{name} 不支持参数: {', '.join(sorted(unknown))}")
+        for param, check, required, message in params:
+            value = arguments.get(param)
+            if value is None:
+                if required:
+                    return _invalid(f"缺少必需参数: {param}")
+            elif not check(value):
+                return _invalid(message)
+        for directory, key, min_items, max_items, optional_with in files:
+            count = len(input_files(directory))
+            if count < min_items and arguments.get(optional_with) is None:
+                return _invalid(f"{key} 至少需要 {min_items} 个文件，实际 {count} 个", "NO_INPUT_FILE")
+            if max_items is not None and count > max_items:
+                return _invalid(f"{key} 最多 {max_items} 个文件，实际 {count} 个", "INVALID_INPUT_FILE")
+        return None
+
+    return validate
+
+
+def _functions() -> dict:
+    # 延迟导入，避免与 main 循环导入
+    from .main import _edit_image, _text_to_image
+
+    return {"text_to_image": _text_to_image, "edit_image": _edit_image}
+
+
+class Dispatcher:
+    """
+    按函数名分发调用，调用前用预编译的校验函数检查参数和输入文件
+
+    Args:
+        manifest_path: manifest 路径
+        functions: {函数名: 实现}，默认为 main 中的实现
+    """
+
+    def __init__(self, manifest_path=MANIFEST_PATH, functions: Dict[str, Callable] = None):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.functions = functions if functions is not None else _functions()
+        self.validators = {
+            function["name"]: compile_validator(function)
+            for function in manifest["functions"]
+            if function["name"] in self.functions
+        }
+
+    def validate(self, function: str, arguments: dict) -> Optional[dict]:
+        """
+        校验一次调用的参数和输入文件
+
+        Returns:
+            合法时返回 None，否则返回错误字典
+
+        Raises:
+            ValueError: 未知的函数名
+        """
+        validator = self.validators.get(function)
+        if validator is None:
+            raise ValueError(f"未知的函数: {function}，可选值: {', '.join(self.validators)}")
+        return validator(arguments)
+
+    def dispatch(self, function: str, arguments: dict, on_event=None) -> dict:
+        """
+        校验后执行一次调用
+
+        Args:
+            function: 函数名（text_to_image / edit_image）
+            arguments: 参数字典
+            on_event: 可选的事件回调（见 events.run）
+
+        Returns:
+            校验失败时返回错误字典，否则返回对应函数的结果字典
+
+        Raises:
+            ValueError: 未知的函数名
+        """
+        error = self.validate(function, arguments)
+        if error is not None:
+            return error
+        if on_event is not None:
+            emitter = EventEmitter(on_event)
+            return emitter.finish(self.functions[function](**arguments, emit=emitter))
+        return self.functions[function](**arguments)
+
+
+_dispatcher = None
+_dispatcher_config = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> Dispatcher:
+    """返回进程内共享的分发器（manifest 只在 GEMINI_MANIFEST 变化时重新加载）"""
+    global _dispatcher, _dispatcher_config
+
+    config = os.environ.get('GEMINI_MANIFEST') or str(MANIFEST_PATH)
+    with _dispatcher_lock:
+        if config != _dispatcher_config:
+            _dispatcher = Dispatcher(config)
+            _dispatcher_config = config
+        return _dispatcher
+
+
+def dispatch(function: str, arguments: dict, on_event=None) -> dict:
+    """用进程共享的分发器执行一次调用（参数见 Dispatcher.dispatch）"""
+    return get_dispatcher().dispatch(function, arguments, on_event)
@@ -0,0 +1,179 @@
+"""
+事件流进度接口
+
+text_to_image / edit_image 只在结束时返回一个字典，编排方无法让下游工作与上游等待重叠。
+本模块提供两种事件化的调用方式，调用过程中依次产出带时间戳和大小的类型化事件：
+
+    input_read     已读取输入图像          bytes, sha256（edit_image，会话续编时没有）
+    queued         进入内存预算队列        function, input_bytes, reserved_bytes
+    admitted       通过准入控制            wait_ms
+    request_sent   请求已发出（每次尝试）  model, endpoint, stream, bytes（序列化后的请求体）
+    first_byte     收到响应头/首个分块     status_code
+    text           收到文本（流式模式）    text
+    tile           分块完成/重试/失败      index, status, attempt, completed, total（分块模式，工作线程中发送）
+    frame          动画画面完成/重试/失败  index, status, attempt, completed, total（动画输入，工作线程中发送）
+    image_decoded  图像已解码              bytes, mime_type
+    written        图像已写入输出目录      path, bytes, sha256
+    done / error   调用结束（二者必居其一）result / error_code, error
+
+分块和动画模式下，各分块（画面）调用的 queued / admitted / request_sent / first_byte / image_decoded
+在工作线程中发送，并带有 piece（分块或画面序号）；不带 piece 的 queued / admitted 为整次操作的内存预留，
+不带 piece 的 image_decoded 为拼接（组装）后的结果。
+
+回调方式：
+    result = events.run("edit_image", on_event=handle, prompt="...")
+
+生成器方式（在后台线程执行调用，消费方提前停止迭代且传入了 request_id 时取消该调用）：
+    for event in events.iter_events("text_to_image", prompt="..."):
+        if event.type == "written":
+            start_thumbnail(event.data["path"])
+
+原有的 text_to_image / edit_image 是不发送事件的薄封装。
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from . import cancellation
+
+EVENT_TYPES = (
+    "input_read", "queued", "admitted", "request_sent", "first_byte", "text", "tile", "frame", "image_decoded",
+    "written", "done", "error",
+)
+TERMINAL_EVENTS = ("done", "error")
+
+
+class Event:
+    """单个进度事件"""
+
+    __slots__ = ("type", "timestamp", "elapsed_ms", "data")
+
+    def __init__(self, type: str, timestamp: float, elapsed_ms: float, data: dict):
+        self.type = type
+        self.timestamp = timestamp
+        self.elapsed_ms = elapsed_ms
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return {"type": self.type, "timestamp": self.timestamp, "elapsed_ms": self.elapsed_ms, **self.data}
+
+    def __repr__(self) -> str:
+        return f"Event({self.type!r}, elapsed_ms={self.elapsed_ms}, data={self.data!r})"
+
+
+class EventEmitter:
+    """
+    把进度事件交给回调；callback 为 None 时不做任何事
+
+    Args:
+        callback: 事件回调，在执行调用的线程中同步调用，抛出的异常会使调用以 UNEXPECTED_ERROR 结束
+        digests: 回调是否需要 input_read / written 事件中的 sha256；为 False 时调用方不计算哈希，该字段为 None
+    """
+
+    def __init__(self, callback: Optional[Callable[[Event], None]] = None, digests: bool = True):
+        self.callback = callback
+        self.digests = callback is not None and digests
+        self.started = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.callback is not None
+
+    def __call__(self, type: str, **data) -> None:
+        if self.callback is None:
+            return
+        if type not in EVENT_TYPES:
+            raise ValueError(f"未知的事件类型: {type}")
+        elapsed_ms = round((time.monotonic() - self.started) * 1000, 1)
+        self.callback(Event(type, time.time(), elapsed_ms, data))
+
+    def tagged(self, **tags) -> "EventEmitter":
+        """返回把 tags 附加到每个事件上、交给同一回调的发射器（elapsed_ms 仍从本发射器开始计时）"""
+        if self.callback is None:
+            return self
+        callback = self.callback
+        child = EventEmitter(
+            lambda event: callback(Event(event.type, event.timestamp, event.elapsed_ms, {**event.data, **tags})),
+            digests=self.digests,
+        )
+        child.started = self.started
+        return child
+
+    def finish(self, result: dict) -> dict:
+        """根据结果发送 done 或 error 事件，原样返回结果"""
+        if result.get("success"):
+            self("done", result=result)
+        else:
+            self("error", error_code=result.get("error_code"), error=result.get("error"))
+        return result
+
+
+NULL_EMITTER = EventEmitter()
+
+
+def _functions() -> dict:
+    # 延迟导入，避免与 main 循环导入
+    from .main import _edit_image, _text_to_image
+
+    return {"text_to_image": _text_to_image, "edit_image": _edit_image}
+
+
+def run(function: str, on_event: Callable[[Event], None], **kwargs) -> dict:
+    """
+    执行一次调用，过程中把事件交给 on_event
+
+    Args:
+        function: 函数名（text_to_image / edit_image）
+        on_event: 事件回调
+        **kwargs: 传给函数的参数
+
+    Returns:
+        与对应函数相同的结果字典
+
+    Raises:
+        ValueError: 未知的函数名
+    """
+    functions = _functions()
+    if function not in functions:
+        raise ValueError(f"未知的函数: {function}，可选值: {', '.join(functions)}")
+    emitter = EventEmitter(on_event)
+    return emitter.finish(functions[function](**kwargs, emit=emitter))
+
+
+def iter_events(function: str, **kwargs) -> Iterator[Event]:
+    """
+    在后台线程执行调用，按发生顺序产出事件，最后一个事件为 done 或 error
+
+    消费方提前停止迭代时，若 kwargs 中带有 request_id 则取消该调用。
+
+    Raises:
+        ValueError: 未知的函数名
+    """
+    if function not in _functions():
+        raise ValueError(f"未知的函数: {function}，可选值: {', '.join(_functions())}")
+
+    events = queue.Queue()
+
+    def target():
+        try:
+            run(function, events.put, **kwargs)
+        except Exception as e:
+            # 参数错误等在进入函数之前抛出的异常
+            events.put(Event("error", time.time(), 0.0, {"error_code": "UNEXPECTED_ERROR", "error": str(e)}))
+
+    thread = threading.Thread(target=target, name=f"imagen-events-{function}", daemon=True)
+    thread.start()
+
+    finished = False
+    try:
+        while True:
+            event = events.get()
+            yield event
+            if event.type in TERMINAL_EVENTS:
+                finished = True
+                return
+    finally:
+        if not finished and kwargs.get("request_id"):
+            cancellation.cancel(kwargs["request_id"])
@@ -0,0 +1,165 @@
+"""
+输入图像上传复用（Files API）
+
+对同一张图片连续编辑时，首次把图片上传到 files 接口，之后的请求用
+file_data.file_uri 引用该文件，不再在请求体中内联整张图片的 base64。
+
+- 缓存键：(端点, API 密钥指纹, 图片内容 SHA-256)，文件只对上传它的密钥可见
+- 按服务端返回的 expirationTime 过期（提前 EXPIRY_MARGIN 秒失效），
+  未返回时按 DEFAULT_TTL 处理
+- 缓存条目数超过上限时淘汰最久未使用的条目
+
+设置环境变量 GEMINI_UPLOAD_INPUTS=1 开启；仅对不小于 GEMINI_UPLOAD_MIN_BYTES
+（默认 256KB）的图片生效，更小的图片内联反而更快。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+from . import transport
+
+DEFAULT_TTL = 47 * 3600
+EXPIRY_MARGIN = 300
+DEFAULT_MIN_BYTES = 256 * 1024
+
+
+class FileRef:
+    """已上传文件的引用"""
+
+    def __init__(self, uri: str, mime_type: str, expires_at: float):
+        self.uri = uri
+        self.mime_type = mime_type
+        self.expires_at = expires_at
+
+    def is_valid(self, now: float) -> bool:
+        return now < self.expires_at - EXPIRY_MARGIN
+
+    def to_part(self) -> dict:
+        """转换为请求体中的 file_data part"""
+        return {"file_data": {"mime_type": self.mime_type, "file_uri": self.uri}}
+
+
+class FileCache:
+    """按内容哈希缓存 FileRef 的 LRU 缓存（线程安全）"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[FileRef]:
+        with self._lock:
+            ref = self._entries.get(key)
+            if ref is None:
+                return None
+            if not ref.is_valid(time.time()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return ref
+
+    def put(self, key: tuple, ref: FileRef) -> None:
+        with self._lock:
+            self._entries[key] = ref
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: tuple) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def upload_url(endpoint: str) -> str:
+    """由 API 端点推导上传地址：https://host/v1beta → https://host/upload/v1beta/files"""
+    parts = urlsplit(endpoint)
+    return f"{parts.scheme}://{parts.netloc}/upload{parts.path}/files"
+
+
+def _parse_expiration(value: Optional[str]) -> float:
+    if value:
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            pass
+    return time.time() + DEFAULT_TTL
+
+
+def upload_file(endpoint: str, api_key: str, data: bytes, mime_type: str, timeout) -> FileRef:
+    """
+    上传文件并返回引用
+
+    Raises:
+        requests.exceptions.RequestException: 网络错误或上传失败
+        KeyError: 响应中缺少 file.uri
+    """
+    response = transport.post(
+        upload_url(endpoint),
+        headers={
+            "x-goog-api-key": api_key,
+            "X-Goog-Upload-Protocol": "raw",
+            "Content-Type": mime_type,
+        },
+        data=data,
+        timeout=timeout,
+    )
+    response.raise_for_status()
+
+    file_info = response.json()["file"]
+    return FileRef(
+        file_info["uri"],
+        file_info.get("mimeType") or mime_type,
+        _parse_expiration(file_info.get("expirationTime")),
+    )
+
+
+def cache_key(endpoint: str, api_key: str, data: bytes) -> tuple:
+    """缓存键：端点 + 密钥指纹 + 内容哈希（不在内存中保留明文密钥）"""
+    key_fingerprint = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    return (endpoint, key_fingerprint, hashlib.sha256(data).hexdigest())
+
+
+def uploads_enabled(size_bytes: int) -> bool:
+    """是否对该大小的输入启用上传复用"""
+    if os.environ.get('GEMINI_UPLOAD_INPUTS', '0') != '1':
+        return False
+    return size_bytes >= int(os.environ.get('GEMINI_UPLOAD_MIN_BYTES', DEFAULT_MIN_BYTES))
+
+
+_cache = FileCache()
+
+
+def get_file_cache() -> FileCache:
+    """返回进程内共享的文件引用缓存"""
+    return _cache
+
+
+def get_or_upload(endpoint: str, api_key: str, data: bytes, mime_type: str, timeout) -> Tuple[FileRef, bool]:
+    """
+    返回内容对应的文件引用，缓存未命中时上传
+
+    Returns:
+        (文件引用, 本次是否发生了上传)
+    """
+    key = cache_key(endpoint, api_key, data)
+    ref = _cache.get(key)
+    if ref is not None:
+        return ref, False
+
+    ref = upload_file(endpoint, api_key, data, mime_type, timeout)
+    _cache.put(key, ref)
+    return ref, True
@@ -0,0 +1,145 @@
+"""
+动画（多帧）输入的逐帧并行编辑
+
+动画 GIF 以及 APNG、动画 WebP 作为一个整体发送时，上游只返回一张静态图。多帧模式下：
+- 输入解码为完整画面的帧序列（处理好各帧的叠加与透明），记录每帧的显示时长和循环次数
+- 像素完全相同的帧只编辑一次（动画中常见的停顿帧、往返循环）
+- 不同的画面由有界线程池并发发送（GEMINI_FRAME_CONCURRENCY，默认 4），失败的帧单独重试
+  （重试次数与分块模式共用 GEMINI_TILE_ATTEMPTS）
+- 返回的帧缩放回原尺寸后按原顺序和原时长重新组装，输出格式与输入相同
+
+不同画面数超过 GEMINI_MAX_FRAMES（默认 120）时拒绝处理，避免一次调用产生过多上游请求。
+
+依赖 Pillow（可选依赖，pip install "imagen[region]"）。
+"""
+
+import hashlib
+import io
+import os
+from typing import Dict, List, Tuple
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError:  # pragma: no cover - 取决于运行环境
+    Image = None
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_FRAMES = 120
+DEFAULT_DURATION = 100
+
+# 输入格式 → (输出 MIME 类型, 输出扩展名)
+FORMATS = {
+    "GIF": ("image/gif", "gif"),
+    "PNG": ("image/png", "png"),
+    "WEBP": ("image/webp", "webp"),
+}
+
+FRAME_PROMPT = (
+    "这是一段动画中的一帧（第 {index}/{total} 个不同画面），请保持构图、视角和尺寸不变，"
+    "对每一帧做一致的修改，使动画连贯：{prompt}"
+)
+
+
+def frame_concurrency() -> int:
+    return int(os.environ.get('GEMINI_FRAME_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+
+def max_frames() -> int:
+    return int(os.environ.get('GEMINI_MAX_FRAMES', DEFAULT_MAX_FRAMES))
+
+
+def is_animated(image_bytes: bytes) -> bool:
+    """输入是否为多帧动画（无法解析或未安装 Pillow 时返回 False）"""
+    if Image is None:
+        return False
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.format in FORMATS and getattr(image, "n_frames", 1) > 1
+    except Exception:
+        return False
+
+
+class AnimatedImage:
+    """
+    把动画解码为去重后的画面，并把编辑后的画面按原时序组装回动画
+
+    Args:
+        image_bytes: 动画字节
+
+    Raises:
+        ValueError: 动画无法解析
+    """
+
+    def __init__(self, image_bytes: bytes):
+        try:
+            source = Image.open(io.BytesIO(image_bytes))
+            self.format = source.format
+            # 原动画没有循环次数时保持缺省（GIF 只播放一次），而不是改成无限循环
+            self.loop = source.info.get("loop")
+            self.size = source.size
+            frames = []
+            self.durations = []
+            for frame in ImageSequence.Iterator(source):
+                # convert 得到叠加了此前各帧（按 disposal 处理后）的完整画面
+                frames.append(frame.convert("RGBA"))
+                self.durations.append(frame.info.get("duration", source.info.get("duration", DEFAULT_DURATION)))
+        except Exception as e:
+            raise ValueError(f"动画无法解析: {e}") from e
+
+        # 像素相同的帧映射到同一个画面
+        self.unique: List = []
+        self.order: List[int] = []
+        seen = {}
+        for frame in frames:
+            digest = hashlib.sha256(frame.tobytes()).digest()
+            if digest not in seen:
+                seen[digest] = len(self.unique)
+                self.unique.append(frame)
+            self.order.append(seen[digest])
+
+    @property
+    def mime_type(self) -> str:
+        return FORMATS.get(self.format, FORMATS["GIF"])[0]
+
+    @property
+    def extension(self) -> str:
+        return FORMATS.get(self.format, FORMATS["GIF"])[1]
+
+    def frame(self, index: int) -> Tuple[bytes, str]:
+        """返回第 index 个不同画面的 (PNG 字节, "image/png")"""
+        buffer = io.BytesIO()
+        self.unique[index].save(buffer, format="PNG")
+        return buffer.getvalue(), "image/png"
+
+    def assemble(self, patches: Dict[int, bytes]) -> bytes:
+        """
+        按原帧顺序和时长组装动画
+
+        Args:
+            patches: {画面序号: 图像字节}，缺失的画面保留原帧
+
+        Returns:
+            与输入格式相同的动画字节
+        """
+        edited = []
+        for index, original in enumerate(self.unique):
+            if index not in patches:
+                edited.append(original)
+                continue
+            patch = Image.open(io.BytesIO(patches[index])).convert("RGBA")
+            if patch.size != self.size:
+                patch = patch.resize(self.size, Image.LANCZOS)
+            edited.append(patch)
+
+        frames = [edited[index] for index in self.order]
+        options = {"save_all": True, "append_images": frames[1:], "duration": self.durations}
+        if self.loop is not None:
+            options["loop"] = self.loop
+        if self.format == "GIF":
+            # 每帧都是完整画面，显示下一帧前恢复背景，避免透明区域残留上一帧
+            options["disposal"] = 2
+        elif self.format == "WEBP":
+            options["lossless"] = True
+        buffer = io.BytesIO()
+        frames[0].save(buffer, format=self.format if self.format in FORMATS else "GIF", **options)
+        return buffer.getvalue()
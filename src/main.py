@@ -14,106 +14,920 @@ Gemini 图像生成工具 (NanoBanana2)
 - Gateway 自动下载文件到 inputs，自动上传 outputs 中的文件
 
 API 端点: https://gemini.visualize.top/v1beta/models/gemini-3-pro-image-preview:generateContent
-模型: gemini-3-pro-image-preview
+流式端点: https://gemini.visualize.top/v1beta/models/gemini-3-pro-image-preview:streamGenerateContent?alt=sse
+模型: gemini-3-pro-image-preview（主模型延迟超出目标时可降级到 gemini-2.5-flash-image，见 models 模块）
 """
 
 import base64
+import contextlib
+import functools
+import hashlib
+import math
 import os
+import time
+import uuid
 from pathlib import Path
 
 import requests
 
+from . import transport
+from .admission import admission_timeout, estimate_canvas_bytes, estimate_peak_bytes, get_budget
+from .calllog import logged
+from .cancellation import RequestCancelled, abort_response, call_cancellable, register, unregister
+from .catalog import cataloged
+from .contents import (
+    EDIT_PROMPT,
+    ResponseFormatError,
+    encode_body,
+    first_inline_data,
+    inline_part,
+    input_files,
+    read_input_image,
+)
+from .events import NULL_EMITTER
+from .files import cache_key, get_file_cache, get_or_upload, uploads_enabled
+from .frames import FRAME_PROMPT, AnimatedImage, frame_concurrency, is_animated, max_frames
+from .models import DEFAULT_MODEL, get_policy
+from .offload import get_decode_pool, offload_min_bytes
+from .output_store import get_output_store
+from .profiling import profiled
+from .regions import REGION_PROMPT, RegionEdit, parse_region, pillow_available
+from .routing import get_router, parse_retry_after
+from .sessions import SESSION_ID_PATTERN, get_session_store
+from .sinks import get_sink
+from .streaming import stream_generate_content
+from .tiles import TILE_PROMPT, TiledImage, is_retryable, process_tiles
+from .timeouts import NO_DEADLINE, Deadline, DeadlineExceeded, get_timeouts, latency_key
+from .usage import current_tenant, get_usage_tracker, merge_usage, parse_usage
+
 # 固定路径常量
 DATA_OUTPUTS = Path("data/outputs")
-DATA_INPUTS_IMAGE = Path("data/inputs/input_image")
+DATA_INPUTS_MASK = Path("data/inputs/mask_image")
+
+# API 配置（配置 GEMINI_API_POOL 后端点与密钥由 routing 模块按成员池分配）
+GEMINI_API_BASE = "https://gemini.visualize.top/v1beta"
+GEMINI_MODEL = DEFAULT_MODEL
+GEMINI_API_URL = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent"
+GEMINI_STREAM_API_URL = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+
+
+def _is_positive_number(value) -> bool:
+    """判断是否为正数（排除 bool）"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
 
-# API 配置
-GEMINI_API_URL = "https://gemini.visualize.top/v1beta/models/gemini-3-pro-image-preview:generateContent"
+def _api_url(endpoint: str, model: str, stream: bool) -> str:
+    """拼接指定端点、模型的 generateContent / streamGenerateContent 地址"""
+    if stream:
+        return f"{endpoint}/models/{model}:streamGenerateContent?alt=sse"
+    return f"{endpoint}/models/{model}:generateContent"
 
 
-def text_to_image(prompt: str) -> dict:
+def _image_part(member, image_bytes: bytes, mime_type: str, timeout) -> dict:
     """
-    根据文本提示词生成图像
+    构造输入图像 part：开启上传复用时引用已上传文件，否则（或上传失败时）内联
+    """
+    if uploads_enabled(len(image_bytes)):
+        try:
+            ref, _ = get_or_upload(member.endpoint, member.api_key, image_bytes, mime_type, timeout)
+            return ref.to_part()
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            pass
+    return inline_part(image_bytes, mime_type)
 
-    使用 Gemini API 根据用户提供的文本描述生成图像。
-    生成的图像会自动保存到输出目录，由平台自动上传。
+
+def _history_bytes(history: list) -> int:
+    """估算历史 contents 中内联图像的 base64 字节数"""
+    total = 0
+    for content in history or []:
+        for part in content.get("parts", []):
+            inline = part.get("inline_data") or part.get("inlineData") or {}
+            total += len(inline.get("data", ""))
+    return total
+
+
+def _generate(
+    router,
+    function: str,
+    parts: list,
+    output_filename: str,
+    stream: bool,
+    deadline: Deadline = NO_DEADLINE,
+    image: tuple = None,
+    history: list = None,
+    on_content=None,
+    cancel_token=None,
+    request_id: str = None,
+    emit=NULL_EMITTER,
+    postprocess=None,
+    keep_status: bool = False,
+    generation_config: dict = None,
+) -> dict:
+    """
+    在全局字节预算内调用 Gemini API：先按输入大小预留内存，预算不足时排队，超时则拒绝
 
     Args:
-        prompt: 图像生成提示词，描述想要生成的图像内容
+        router: routing.Router 实例
+        function: 调用方函数名（text_to_image / edit_image），用于确定超时时间
+        parts: 请求的文本 parts
+        output_filename: 输出文件名；为 None 时不写出（由 postprocess 取走图像，仅非流式模式）
+        stream: 是否使用 streamGenerateContent 流式接口
+        deadline: 整次调用的截止时间（timeouts.Deadline），准入排队、限流等待和请求超时都不超过剩余时间
+        image: 输入图像 (字节, MIME 类型)，追加在 parts 之后；其大小也用于按大小分桶统计延迟
+        history: 多轮会话的历史 contents，放在本次用户轮之前
+        on_content: 成功时的回调 (用户轮, 模型返回的 content, 图像字节, 图像 MIME 类型)，仅非流式模式
+        cancel_token: cancellation.CancelToken，取消后中断传输并抛出 RequestCancelled
+        request_id: 调用方的请求 ID，作为输出存储中的引用名
+        emit: events.EventEmitter，发送进度事件
+        postprocess: 写出前对图像的后处理 (图像字节, MIME 类型) -> (图像字节, MIME 类型)，仅非流式模式
+        keep_status: HTTP 失败的结果是否保留 status_code（分块模式据此判断是否重试）
+        generation_config: 请求体的 generationConfig（如数据集模式按变体设置的 seed），为 None 时不发送
 
     Returns:
-        包含生成结果的字典，包含以下字段：
-            - success: 操作是否成功
-            - prompt: 使用的提示词（成功时）
-            - message: 操作消息（成功时）
-            - error: 错误信息（失败时）
-            - error_code: 错误代码（失败时）
+        与 _call_gemini 相同，成功时附带实际使用的 model
 
-    Examples:
-        >>> text_to_image(prompt="一只可爱的猫咪坐在窗边")
-        {'success': True, 'prompt': '一只可爱的猫咪坐在窗边', 'message': '图像生成成功'}
+    Raises:
+        RequestCancelled: 请求被取消
+        DeadlineExceeded: 等待或请求期间 deadline 耗尽
+    """
+    deadline.check()
+    tenant = current_tenant()
+    if tenant is not None:
+        wait = get_usage_tracker().throttle(
+            tenant_name=tenant, cancel_token=cancel_token, max_wait=deadline.remaining()
+        )
+        if wait is not None:
+            deadline.check()
+            return _quota_exceeded(f"租户 {tenant}", wait)
+
+    input_bytes = (len(image[0]) if image else 0) + _history_bytes(history)
+    reserved_bytes = estimate_peak_bytes(input_bytes)
+    emit("queued", function=function, input_bytes=input_bytes, reserved_bytes=reserved_bytes)
+    queued_at = time.monotonic()
+
+    with get_budget().reserve(reserved_bytes, deadline.bound(admission_timeout())) as admitted:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        if not admitted:
+            deadline.check()
+            return _server_busy()
+
+        emit("admitted", wait_ms=round((time.monotonic() - queued_at) * 1000, 1))
+        return _route_and_call(
+            router, function, parts, output_filename, stream, deadline, image, history, on_content, cancel_token,
+            request_id, emit, postprocess, keep_status, generation_config
+        )
+
+
+def _route_and_call(
+    router,
+    function: str,
+    parts: list,
+    output_filename: str,
+    stream: bool,
+    deadline: Deadline = NO_DEADLINE,
+    image: tuple = None,
+    history: list = None,
+    on_content=None,
+    cancel_token=None,
+    request_id: str = None,
+    emit=NULL_EMITTER,
+    postprocess=None,
+    keep_status: bool = False,
+    generation_config: dict = None,
+) -> dict:
+    """
+    按降级策略选择模型、按路由器选择成员调用 Gemini API，并把本次结果反馈给各统计组件
+
+    参数与返回值见 _generate。
+    """
+    member, wait = _acquire_within_quota(router, cancel_token, deadline)
+    if member is None:
+        deadline.check()
+        return _quota_exceeded("所有 API 密钥", wait)
+
+    policy = get_policy()
+    spec = policy.choose(function)
+    timeouts = get_timeouts()
+    key = latency_key(function, len(image[0]) if image else None)
+
+    timeout = functools.partial(_request_timeout, key, spec.timeout_for(function), deadline)
+
+    status_code = None
+    retry_after = None
+    timed_out = False
+    cancelled = False
+    started = time.monotonic()
+
+    try:
+        image_part = _image_part(member, *image, timeout()) if image else None
+        started = time.monotonic()
+        user_turn = {"role": "user", "parts": (parts + [image_part]) if image_part else parts}
+        data = {"contents": (history or []) + [user_turn]}
+        if generation_config:
+            data["generationConfig"] = generation_config
+        result = _call_gemini(
+            member.endpoint, member.api_key, spec.name, data, output_filename, timeout(), stream, on_content,
+            cancel_token, request_id, emit, postprocess, deadline
+        )
+
+        # 上传的文件已失效（被删除或过期）时作废缓存，改为内联重发一次
+        if image_part and "file_data" in image_part and result.get("status_code") in (400, 403, 404):
+            get_file_cache().invalidate(cache_key(member.endpoint, member.api_key, image[0]))
+            user_turn["parts"][-1] = inline_part(*image)
+            result = _call_gemini(
+                member.endpoint, member.api_key, spec.name, data, output_filename, timeout(), stream, on_content,
+                cancel_token, request_id, emit, postprocess, deadline
+            )
+
+        status_code = result.pop("status_code", 200)
+        retry_after = result.pop("retry_after", None)
+        if keep_status and status_code != 200:
+            result["status_code"] = status_code
+        if result["success"]:
+            result["model"] = spec.name
+            get_usage_tracker().record(member.api_key, current_tenant(), result.get("usage"))
+        return result
+    except DeadlineExceeded:
+        # 调用方的预算耗尽，不代表成员故障或模型变慢，不计入失败次数和延迟样本
+        cancelled = True
+        raise
+    except requests.exceptions.Timeout:
+        # 读超时被 deadline 截短时同样是调用方的预算耗尽
+        cancelled = deadline.expired()
+        timed_out = not cancelled
+        raise
+    except RequestCancelled:
+        cancelled = True
+        raise
+    finally:
+        latency = time.monotonic() - started
+        router.release(member, latency, status_code, retry_after, cancelled=cancelled)
+        # 只用成功请求和超时请求衡量模型延迟，快速失败的请求不代表模型速度
+        if status_code == 200 or timed_out:
+            policy.record(spec.name, function, latency)
+            timeouts.record(key, latency)
+
+
+def _request_timeout(key: str, ceiling: float, deadline: Deadline) -> tuple:
+    """
+    下一个请求的 (连接超时, 读超时)：每次发请求前按剩余时间重新计算，上传等前序步骤的耗时会被扣除
+
+    Raises:
+        DeadlineExceeded: deadline 已耗尽
+    """
+    deadline.check()
+    return get_timeouts().timeout_for(key, ceiling, deadline.remaining())
+
+
+def _acquire_within_quota(router, cancel_token=None, deadline: Deadline = NO_DEADLINE) -> tuple:
+    """
+    选出 token 用量未超出预算的成员：超出预算的成员按预计恢复时间暂时摘除，流量转到其他成员；
+    所有成员都超出时按 GEMINI_USAGE_MAX_WAIT 等待最先恢复的成员（不超过 deadline 的剩余时间）
+
+    Returns:
+        (成员, None)；等待上限内仍没有可用成员时为 (None, 建议的重试等待秒数)
+
+    Raises:
+        RequestCancelled: 等待期间请求被取消
+    """
+    tracker = get_usage_tracker()
+    if tracker.key_budget is None:
+        return router.acquire(), None
+
+    for _ in range(len(router.members)):
+        member = router.acquire()
+        wait = tracker.exceeded(api_key=member.api_key)
+        if wait is None:
+            return member, None
+        router.release(member, 0.0, cancelled=True)
+        router.suspend(member, wait)
+
+    member = router.acquire()
+    try:
+        wait = tracker.throttle(api_key=member.api_key, cancel_token=cancel_token, max_wait=deadline.remaining())
+    except RequestCancelled:
+        router.release(member, 0.0, cancelled=True)
+        raise
+    if wait is None:
+        return member, None
+    router.release(member, 0.0, cancelled=True)
+    return None, wait
+
+
+def _server_busy() -> dict:
+    return {
+        "success": False,
+        "error": "服务繁忙：当前在途请求已占满内存预算，请稍后重试",
+        "error_code": "SERVER_BUSY"
+    }
+
+
+def _quota_exceeded(subject: str, wait: float) -> dict:
+    return {
+        "success": False,
+        "error": f"{subject}的 token 用量即将超出窗口预算，请约 {math.ceil(wait)} 秒后重试",
+        "error_code": "QUOTA_EXCEEDED"
+    }
+
+
+def _call_gemini(
+    endpoint: str,
+    api_key: str,
+    model: str,
+    data: dict,
+    output_filename: str,
+    timeout: float,
+    stream: bool,
+    on_content=None,
+    cancel_token=None,
+    request_id: str = None,
+    emit=NULL_EMITTER,
+    postprocess=None,
+    deadline: Deadline = NO_DEADLINE,
+) -> dict:
+    """
+    调用 Gemini API 并把返回的图像写入输出目录
+
+    Args:
+        endpoint: API 端点（不含 /models/...）
+        api_key: Gemini API 密钥
+        model: 模型名称
+        data: 请求体
+        output_filename: 输出文件名
+        timeout: 请求超时时间（秒，或 (连接超时, 读超时) 元组）
+        stream: 是否使用 streamGenerateContent 流式接口
+        on_content: 见 _generate
+        cancel_token: 见 _generate
+        request_id: 见 _generate
+        emit: 见 _generate
+        postprocess: 见 _generate
+        deadline: 见 _generate，流式模式下分块之间检查，超过后按超时结束（已写出的图像作为部分结果）
+
+    Returns:
+        成功时为 {"success": True, ...}（流式模式附带 images/text/partial，
+        开启输出存储的非流式模式附带 sha256/deduplicated，响应带 usageMetadata 时附带 usage），
+        失败时为带 error/error_code 的字典；HTTP 失败时附带 status_code/retry_after
+    """
+    headers = {
+        "x-goog-api-key": api_key,
+        "Content-Type": "application/json"
+    }
+    # 请求体只序列化一次，发送的就是这份字节，request_sent 直接取其长度
+    body = encode_body(data)
+    emit("request_sent", model=model, endpoint=endpoint, stream=stream, bytes=len(body))
+
+    if stream:
+        # 未配置输出存储和输出目标时由流式模块原子写入输出目录
+        write_image = None
+        if get_output_store() is not None or get_sink()[0] is not None:
+            write_image = functools.partial(_write_output, request_id=request_id, emit=emit)
+
+        return stream_generate_content(
+            _api_url(endpoint, model, stream=True), headers, body, DATA_OUTPUTS, output_filename, timeout,
+            cancel_token=cancel_token, write_image=write_image, emit=emit, deadline=deadline
+        )
+
+    if cancel_token is None and not emit.enabled:
+        response = transport.post(_api_url(endpoint, model, stream=False), headers=headers, data=body, timeout=timeout)
+        return _handle_response(
+            response, data, output_filename, on_content, request_id=request_id, postprocess=postprocess
+        )
+
+    # 可取消或需要发送事件的调用按流式读取响应体：收到响应头即可发送 first_byte；
+    # 等待响应头期间取消则立即返回，读取响应体期间取消则关闭响应、中断传输
+    response = call_cancellable(
+        lambda: transport.post(
+            _api_url(endpoint, model, stream=False), headers=headers, data=body, timeout=timeout, stream=True
+        ),
+        cancel_token,
+        cleanup=abort_response,
+    )
+    emit("first_byte", status_code=response.status_code)
+    abort = functools.partial(abort_response, response)
+    if cancel_token is not None:
+        cancel_token.add_callback(abort)
+    try:
+        return _handle_response(
+            response, data, output_filename, on_content, cancel_token, request_id, emit, postprocess
+        )
+    except Exception:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        raise
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(abort)
+        response.close()
+
+
+def _handle_response(
+    response,
+    data: dict,
+    output_filename: str,
+    on_content=None,
+    cancel_token=None,
+    request_id: str = None,
+    emit=NULL_EMITTER,
+    postprocess=None,
+) -> dict:
+    """
+    解析 generateContent 响应并写出图像；已取消的请求不解码、不写盘
+
+    参数与返回值见 _call_gemini。
+    """
+    if response.status_code != 200:
+        return {
+            "success": False,
+            "error": f"API 请求失败: {response.status_code} - {response.text}",
+            "error_code": "API_REQUEST_FAILED",
+            "status_code": response.status_code,
+            "retry_after": parse_retry_after(response.headers.get("Retry-After"))
+        }
+
+    decoded = _decode_response(response, cancel_token, offload=on_content is None)
+    if decoded is None:
+        return {
+            "success": False,
+            "error": "API 响应中没有生成的图像数据",
+            "error_code": "NO_IMAGE_DATA"
+        }
+
+    content, image_bytes, mime_type, usage = decoded
+    emit("image_decoded", bytes=len(image_bytes), mime_type=mime_type)
+    if postprocess is not None:
+        image_bytes, mime_type = postprocess(image_bytes, mime_type)
+
+    stored = _write_output(output_filename, image_bytes, request_id, emit, mime_type) if output_filename else {}
+
+    if on_content is not None:
+        on_content(data["contents"][-1], content, image_bytes, mime_type)
+
+    result = {"success": True, **stored}
+    if usage is not None:
+        result["usage"] = usage
+    return result
+
+
+def _decode_response(response, cancel_token=None, offload: bool = True):
+    """
+    解析 generateContent 响应体并解码第一张图像；配置了解码进程池且响应体足够大时交给进程池
+
+    Args:
+        response: requests 响应
+        cancel_token: 见 _generate，已取消时不再解码
+        offload: 是否允许交给进程池（进程池不返回完整的 content）
+
+    Returns:
+        (content, 图像字节, MIME 类型, usage)，进程池解码时 content 为 None，响应中没有 usageMetadata 时
+        usage 为 None；响应中没有 candidates 时返回 None
+
+    Raises:
+        KeyError: 响应中没有图像 part；响应体不是合法 JSON 或 base64 时为 contents.ResponseFormatError
+            （进程池与本线程解码的错误一致，均按 INVALID_RESPONSE_FORMAT 返回）
+    """
+    pool = get_decode_pool() if offload else None
+    try:
+        if pool is not None and len(response.content) >= offload_min_bytes():
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            decoded = pool.decode(response.content)
+            if decoded is None:
+                return None
+            image_bytes, mime_type, usage_metadata = decoded
+            return None, image_bytes, mime_type, parse_usage(usage_metadata)
+
+        result = response.json()
+        if "candidates" not in result or not result["candidates"]:
+            return None
+
+        content = result["candidates"][0]["content"]
+        inline_data = first_inline_data(content)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return (
+            content, base64.b64decode(inline_data["data"]), inline_data.get("mimeType", "image/png"),
+            parse_usage(result.get("usageMetadata"))
+        )
+    except ValueError as e:
+        # requests 的 JSONDecodeError 同时是 RequestException，不转换会被当作网络错误
+        raise ResponseFormatError(f"响应体无法解析: {e}") from e
+
+
+def _event_sha256(emit, image_bytes: bytes):
+    """input_read / written 事件中的图像哈希：只在事件消费方需要时计算（见 EventEmitter.digests）"""
+    return hashlib.sha256(image_bytes).hexdigest() if emit.digests else None
+
+
+def _write_output(
+    filename: str, image_bytes: bytes, request_id: str = None, emit=NULL_EMITTER, mime_type: str = "image/png"
+) -> dict:
+    """
+    写出图像：
+    - 配置了输出目标（sinks）时写入该目标，开启异步上传时入队后立即返回
+    - 否则写入输出目录；配置了输出存储时按内容去重，输出文件为指向 blob 的硬链接
+
+    传入 request_id 时以 request_id/文件名 作为对象名，避免不同请求互相覆盖；存储引用总是带唯一前缀
+    （request_id，未传时为随机键），未传 request_id 的调用不会释放彼此仍在使用的 blob。
+
+    Returns:
+        写入输出目标时为 {"uri": ...}；开启输出存储时为 {"sha256": ..., "deduplicated": ...}；否则为空字典
+    """
+    name = f"{request_id}/{filename}" if request_id else filename
+    sink, upload_queue = get_sink()
+    if sink is not None:
+        if upload_queue is not None:
+            upload_queue.submit(name, image_bytes, mime_type)
+            stored = {"uri": sink.uri(name)}
+        else:
+            stored = {"uri": sink.write(name, image_bytes, mime_type)}
+        emit(
+            "written", path=stored["uri"], bytes=len(image_bytes), sha256=_event_sha256(emit, image_bytes),
+            queued=upload_queue is not None
+        )
+        return stored
+
+    output_path = DATA_OUTPUTS / filename
+    store = get_output_store()
+    if store is None:
+        # 先写临时文件再替换：输出文件可能是此前开启存储时留下的 blob 硬链接，原地写入会改坏 blob
+        DATA_OUTPUTS.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex}.part")
+        tmp_path.write_bytes(image_bytes)
+        os.replace(tmp_path, output_path)
+        stored = {}
+    else:
+        stored = store.put(image_bytes, output_path, f"{request_id or uuid.uuid4().hex}/{filename}")
+    digest = stored.get("sha256") or _event_sha256(emit, image_bytes)
+    emit("written", path=str(output_path), bytes=len(image_bytes), **{**stored, "sha256": digest})
+    return stored
+
+
+def _prepare_region(region, image_bytes: bytes) -> tuple:
+    """
+    按 region 参数和 data/inputs/mask_image/ 中的蒙版准备局部编辑
+
+    Returns:
+        (regions.RegionEdit, None)，或失败时 (None, 错误字典)
+    """
+    mask_files = input_files(DATA_INPUTS_MASK)
+    try:
+        return RegionEdit(
+            image_bytes,
+            parse_region(region) if region is not None else None,
+            mask_files[0].read_bytes() if mask_files else None,
+        ), None
+    except ValueError as e:
+        return None, {
+            "success": False,
+            "error": str(e),
+            "error_code": "INVALID_REGION"
+        }
+
+
+def _edit_input_image(
+    router,
+    prompt: str,
+    input_image: tuple,
+    stream: bool,
+    deadline: Deadline = NO_DEADLINE,
+    session=None,
+    region: list = None,
+    region_mode: bool = False,
+    cancel_token=None,
+    request_id: str = None,
+    emit=NULL_EMITTER,
+) -> dict:
+    """
+    编辑输入图像（整张，或 region_mode 时只编辑 region / 蒙版区域）；session 不为 None 时记录为会话首轮
+
+    Returns:
+        与 _generate 相同，局部编辑成功时附带 region
+    """
+    instruction = EDIT_PROMPT.format(prompt=prompt)
+    region_edit = None
+    if region_mode:
+        region_edit, error = _prepare_region(region, input_image[0])
+        if error is not None:
+            return error
+        # 只发送区域及其上下文边距，返回的局部图像混合回原图后再写出
+        input_image = region_edit.crop()
+        instruction = REGION_PROMPT.format(prompt=prompt)
+
+    result = _generate(
+        router, "edit_image", [{"text": instruction}], "edited_image.png",
+        stream=stream and region_edit is None, deadline=deadline, image=input_image,
+        on_content=session.record if session is not None else None, cancel_token=cancel_token,
+        request_id=request_id, emit=emit,
+        postprocess=region_edit.composite if region_edit is not None else None
+    )
+    if result["success"] and region_edit is not None:
+        result["region"] = region_edit.region
+    return result
+
+
+def _capture_into(captured: list, image_bytes: bytes, mime_type: str) -> tuple:
+    """postprocess：把图像放入 captured 而不修改"""
+    captured.append(image_bytes)
+    return image_bytes, mime_type
+
+
+def _forward_capture(capture, image_bytes: bytes, mime_type: str) -> tuple:
+    """postprocess：把图像交给调用方的 capture 回调而不修改"""
+    capture(image_bytes, mime_type)
+    return image_bytes, mime_type
+
+
+def _edit_piece(
+    router, instruction: str, image: tuple, deadline: Deadline = NO_DEADLINE, cancel_token=None, request_id=None,
+    emit=NULL_EMITTER
+) -> dict:
+    """
+    编辑分块或动画帧中的一块：不写出，成功时把返回的图像字节放在结果的 image 字段
+
+    单块的请求错误转换为失败结果（HTTP 失败附带 status_code），由 tiles.process_tiles 判断是否单独重试；
+    所有分块及其重试共用整次调用的 deadline，事件经由整次调用的 emit 发送（由调用方附加 piece）。
+
+    Raises:
+        RequestCancelled: 请求被取消
+    """
+    captured = []
+    try:
+        result = _generate(
+            router, "edit_image", [{"text": instruction}], None, stream=False, deadline=deadline, image=image,
+            cancel_token=cancel_token, request_id=request_id, emit=emit,
+            postprocess=functools.partial(_capture_into, captured), keep_status=True
+        )
+    except requests.exceptions.Timeout:
+        return {"success": False, "error": "API 请求超时", "error_code": "REQUEST_TIMEOUT"}
+    except requests.exceptions.RequestException as e:
+        return {"success": False, "error": f"网络请求错误: {str(e)}", "error_code": "NETWORK_ERROR"}
+    except KeyError as e:
+        return {"success": False, "error": f"API 响应格式错误: {str(e)}", "error_code": "INVALID_RESPONSE_FORMAT"}
+    if result["success"]:
+        result["image"] = captured[0]
+    return result
+
+
+def _edit_tile(router, prompt: str, tiled, deadline: Deadline, cancel_token, request_id, emit, index: int) -> dict:
+    """编辑第 index 个分块（tiles.process_tiles 的单块处理函数）"""
+    return _edit_piece(
+        router, TILE_PROMPT.format(index=index + 1, total=len(tiled.boxes), prompt=prompt), tiled.tile(index),
+        deadline, cancel_token, request_id, emit.tagged(piece=index)
+    )
+
+
+def _edit_frame(
+    router, prompt: str, animation, deadline: Deadline, cancel_token, request_id, emit, index: int
+) -> dict:
+    """编辑动画的第 index 个不同画面（tiles.process_tiles 的单块处理函数）"""
+    return _edit_piece(
+        router, FRAME_PROMPT.format(index=index + 1, total=len(animation.unique), prompt=prompt),
+        animation.frame(index), deadline, cancel_token, request_id, emit.tagged(piece=index)
+    )
+
+
+def _edit_tiled(
+    router,
+    prompt: str,
+    image_bytes: bytes,
+    tile_size: int,
+    deadline: Deadline = NO_DEADLINE,
+    cancel_token=None,
+    request_id: str = None,
+    emit=NULL_EMITTER,
+) -> dict:
+    """
+    分块并行编辑：切成重叠分块并发调用，失败的分块单独重试，全部成功后拼接写出；
+    整次操作先为原图和拼接画布预留内存预算，预算不足时返回 SERVER_BUSY
+
+    Returns:
+        成功时为 {"success": True, "tiles": 分块数, "model": ..., "usage": 各分块用量之和, ...}；
+        有分块重试后仍失败时返回其中序号最小者的错误，并附带 failed_tiles
+
+    Raises:
+        RequestCancelled: 请求被取消
     """
     try:
-        api_key = os.environ.get('GEMINI_API_KEY')
+        tiled = TiledImage(image_bytes, tile_size)
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "error_code": "INVALID_TILE_SIZE"
+        }
+    total = len(tiled.boxes)
+    process = functools.partial(_edit_tile, router, prompt, tiled, deadline, cancel_token, request_id, emit)
+
+    reserved_bytes = estimate_canvas_bytes(len(image_bytes), *tiled.image.size)
+    emit("queued", function="edit_image", input_bytes=len(image_bytes), reserved_bytes=reserved_bytes)
+    queued_at = time.monotonic()
+    with get_budget().reserve(reserved_bytes, deadline.bound(admission_timeout())) as admitted:
+        if not admitted:
+            deadline.check()
+            return _server_busy()
 
-        if not api_key:
+        emit("admitted", wait_ms=round((time.monotonic() - queued_at) * 1000, 1))
+        succeeded, failed = process_tiles(
+            total, process, on_progress=lambda **data: emit("tile", **data),
+            retry=lambda result: is_retryable(result) and not deadline.expired()
+        )
+        if failed:
+            index, last = min(failed.items())
             return {
                 "success": False,
-                "error": "未配置 GEMINI_API_KEY，请在平台上配置该密钥",
-                "error_code": "MISSING_API_KEY"
+                "error": f"{len(failed)}/{total} 个分块重试后仍失败，第 {index + 1} 块: {last.get('error')}",
+                "error_code": last.get("error_code", "UNEXPECTED_ERROR"),
+                "failed_tiles": sorted(failed)
             }
 
-        if not prompt or not isinstance(prompt, str):
+        stitched = tiled.stitch({index: result["image"] for index, result in succeeded.items()})
+        emit("image_decoded", bytes=len(stitched), mime_type="image/png")
+        stored = _write_output("edited_image.png", stitched, request_id, emit)
+    result = {"success": True, **stored, "model": succeeded[0]["model"], "tiles": total}
+    usage = None
+    for index in sorted(succeeded):
+        usage = merge_usage(usage, succeeded[index].get("usage"))
+    if usage is not None:
+        result["usage"] = usage
+    return result
+
+
+def _edit_frames(
+    router,
+    prompt: str,
+    image_bytes: bytes,
+    deadline: Deadline = NO_DEADLINE,
+    cancel_token=None,
+    request_id: str = None,
+    emit=NULL_EMITTER,
+) -> dict:
+    """
+    动画逐帧编辑：去掉重复帧后并发编辑各个不同画面，失败的帧单独重试，全部成功后按原时序组装写出；
+    整次操作先为原动画和各画面（原画面与编辑结果各一份）预留内存预算，预算不足时返回 SERVER_BUSY
+
+    Returns:
+        成功时为 {"success": True, "frames": 帧数, "unique_frames": 不同画面数, "model": ..., "usage": ..., ...}；
+        有帧重试后仍失败时返回其中序号最小者的错误，并附带 failed_frames（画面序号）
+
+    Raises:
+        RequestCancelled: 请求被取消
+    """
+    try:
+        animation = AnimatedImage(image_bytes)
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "error_code": "INVALID_ANIMATION"
+        }
+    total = len(animation.unique)
+    if total > max_frames():
+        return {
+            "success": False,
+            "error": f"动画有 {total} 个不同画面，超过上限 {max_frames()}（GEMINI_MAX_FRAMES）",
+            "error_code": "INVALID_ANIMATION"
+        }
+
+    process = functools.partial(_edit_frame, router, prompt, animation, deadline, cancel_token, request_id, emit)
+
+    reserved_bytes = estimate_canvas_bytes(len(image_bytes), *animation.size, canvases=2 * total)
+    emit("queued", function="edit_image", input_bytes=len(image_bytes), reserved_bytes=reserved_bytes)
+    queued_at = time.monotonic()
+    with get_budget().reserve(reserved_bytes, deadline.bound(admission_timeout())) as admitted:
+        if not admitted:
+            deadline.check()
+            return _server_busy()
+
+        emit("admitted", wait_ms=round((time.monotonic() - queued_at) * 1000, 1))
+        succeeded, failed = process_tiles(
+            total, process, concurrency=frame_concurrency(), on_progress=lambda **data: emit("frame", **data),
+            retry=lambda result: is_retryable(result) and not deadline.expired()
+        )
+        if failed:
+            index, last = min(failed.items())
             return {
                 "success": False,
-                "error": "prompt 参数必须是非空字符串",
-                "error_code": "INVALID_PROMPT"
+                "error": f"{len(failed)}/{total} 个画面重试后仍失败，第 {index + 1} 个: {last.get('error')}",
+                "error_code": last.get("error_code", "UNEXPECTED_ERROR"),
+                "failed_frames": sorted(failed)
             }
 
-        headers = {
-            "x-goog-api-key": api_key,
-            "Content-Type": "application/json"
-        }
+        assembled = animation.assemble({index: result["image"] for index, result in succeeded.items()})
+        emit("image_decoded", bytes=len(assembled), mime_type=animation.mime_type)
+        stored = _write_output(
+            f"edited_image.{animation.extension}", assembled, request_id, emit, mime_type=animation.mime_type
+        )
+    result = {
+        "success": True, **stored, "model": succeeded[0]["model"], "frames": len(animation.order),
+        "unique_frames": total
+    }
+    usage = None
+    for index in sorted(succeeded):
+        usage = merge_usage(usage, succeeded[index].get("usage"))
+    if usage is not None:
+        result["usage"] = usage
+    return result
+
+
+@contextlib.contextmanager
+def _cancel_scope(request_id: str = None):
+    """为 request_id 注册取消令牌，调用结束后注销；未传 request_id 时产出 None"""
+    if request_id is None:
+        yield None
+        return
+    token = register(request_id)
+    try:
+        yield token
+    finally:
+        unregister(request_id, token)
+
+
+def _edit_in_session(
+    router, session, prompt: str, deadline: Deadline = NO_DEADLINE, cancel_token=None, request_id: str = None,
+    emit=NULL_EMITTER
+) -> dict:
+    """
+    基于会话历史和上一轮输出继续编辑（调用方需持有 session.lock）
+
+    Returns:
+        与 _generate 相同
+    """
+    contents = session.build_contents([{"text": prompt}])
+    return _generate(
+        router, "edit_image", contents[-1]["parts"], "edited_image.png",
+        stream=False, deadline=deadline, history=contents[:-1], on_content=session.record,
+        cancel_token=cancel_token, request_id=request_id, emit=emit
+    )
 
-        data = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
 
-        response = requests.post(GEMINI_API_URL, headers=headers, json=data, timeout=60)
+@logged("text_to_image")
+@cataloged("text_to_image")
+@profiled("text_to_image")
+def _text_to_image(
+    prompt: str, stream: bool = False, deadline: float = None, request_id: str = None, emit=NULL_EMITTER, capture=None,
+    seed: int = None
+) -> dict:
+    """
+    text_to_image 的实现，emit 为 events.EventEmitter，参数与返回值见 text_to_image
+
+    capture 为回调 (图像字节, MIME 类型) 时把图像交给它而不写出（供 dataset 等批量模式使用），始终使用非流式接口。
+    seed 作为 generationConfig.seed 发送，dataset 据此让同一提示词的各变体互不相同。
+    """
+    try:
+        router = get_router(GEMINI_API_BASE)
 
-        if response.status_code != 200:
+        if router is None:
             return {
                 "success": False,
-                "error": f"API 请求失败: {response.status_code} - {response.text}",
-                "error_code": "API_REQUEST_FAILED"
+                "error": "未配置 GEMINI_API_KEY，请在平台上配置该密钥",
+                "error_code": "MISSING_API_KEY"
             }
 
-        result = response.json()
-
-        if "candidates" not in result or not result["candidates"]:
+        if not prompt or not isinstance(prompt, str):
             return {
                 "success": False,
-                "error": "API 响应中没有生成的图像数据",
-                "error_code": "NO_IMAGE_DATA"
+                "error": "prompt 参数必须是非空字符串",
+                "error_code": "INVALID_PROMPT"
             }
 
-        image_data = result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
-        image_bytes = base64.b64decode(image_data)
+        if deadline is not None and not _is_positive_number(deadline):
+            return {
+                "success": False,
+                "error": "deadline 参数必须是正数（秒）",
+                "error_code": "INVALID_DEADLINE"
+            }
 
-        DATA_OUTPUTS.mkdir(parents=True, exist_ok=True)
+        if request_id is not None and (not isinstance(request_id, str) or not request_id):
+            return {
+                "success": False,
+                "error": "request_id 参数必须是非空字符串",
+                "error_code": "INVALID_REQUEST_ID"
+            }
 
-        output_filename = "generated_image.png"
-        output_path = DATA_OUTPUTS / output_filename
-        output_path.write_bytes(image_bytes)
+        with _cancel_scope(request_id) as cancel_token:
+            result = _generate(
+                router, "text_to_image", [{"text": prompt}], None if capture else "generated_image.png",
+                stream=stream and capture is None, deadline=Deadline(deadline), cancel_token=cancel_token,
+                request_id=request_id, emit=emit,
+                postprocess=functools.partial(_forward_capture, capture) if capture else None,
+                generation_config={"seed": seed} if seed is not None else None
+            )
+        if not result["success"]:
+            return result
 
         return {
-            "success": True,
+            **result,
             "prompt": prompt,
             "message": "图像生成成功"
         }
 
+    except RequestCancelled:
+        return {
+            "success": False,
+            "error": "请求已取消",
+            "error_code": "CANCELLED"
+        }
     except requests.exceptions.Timeout:
         return {
             "success": False,
@@ -140,33 +954,60 @@ def text_to_image(prompt: str) -> dict:
         }
 
 
-def edit_image(prompt: str) -> dict:
+def text_to_image(prompt: str, stream: bool = False, deadline: float = None, request_id: str = None) -> dict:
     """
-    基于现有图片进行编辑
+    根据文本提示词生成图像
 
-    使用 Gemini API 根据用户提供的编辑指令，对输入图像进行修改。
-    输入图像从 data/inputs/input_image/ 目录自动读取（由平台自动下载）。
-    编辑后的图像会保存到输出目录，由平台自动上传。
+    使用 Gemini API 根据用户提供的文本描述生成图像。
+    生成的图像会自动保存到输出目录，由平台自动上传。
 
     Args:
-        prompt: 图像编辑指令，描述想要对图像进行的修改
+        prompt: 图像生成提示词，描述想要生成的图像内容
+        stream: 是否使用流式接口。开启后图像分块到达即写盘，
+            超时发生在已写出图像之后时返回部分结果
+        deadline: 本次调用的最长等待时间（秒），排队、限流、上传、请求和重试都计入其中；
+            不传时根据近期观测延迟自动推导每个请求的超时
+        request_id: 调用方分配的请求 ID。传入后可在其他线程调用 cancellation.cancel(request_id)
+            取消本次调用：立即返回 CANCELLED，中断传输，不再解码和写出图像
 
     Returns:
-        包含编辑结果的字典，包含以下字段：
+        包含生成结果的字典，包含以下字段：
             - success: 操作是否成功
-            - prompt: 使用的编辑指令（成功时）
+            - prompt: 使用的提示词（成功时）
             - message: 操作消息（成功时）
+            - images: 写出的图像文件名列表（流式模式）
+            - text: 模型返回的文本（流式模式）
+            - partial: 是否为超时后保留的部分结果（流式模式）
+            - model: 实际提供服务的模型（成功时）
+            - usage: 本次调用的 token 用量 prompt_tokens / output_tokens / total_tokens（响应带 usageMetadata 时）
             - error: 错误信息（失败时）
             - error_code: 错误代码（失败时）
 
     Examples:
-        >>> edit_image(prompt="把背景改成蓝天白云")
-        {'success': True, 'prompt': '把背景改成蓝天白云', 'message': '图像编辑成功'}
+        >>> text_to_image(prompt="一只可爱的猫咪坐在窗边")
+        {'success': True, 'prompt': '一只可爱的猫咪坐在窗边', 'message': '图像生成成功'}
     """
+    return _text_to_image(prompt, stream, deadline, request_id)
+
+
+@logged("edit_image")
+@cataloged("edit_image")
+@profiled("edit_image")
+def _edit_image(
+    prompt: str,
+    stream: bool = False,
+    deadline: float = None,
+    session_id: str = None,
+    request_id: str = None,
+    region: list = None,
+    tile_size: int = None,
+    emit=NULL_EMITTER,
+) -> dict:
+    """edit_image 的实现，emit 为 events.EventEmitter，参数与返回值见 edit_image"""
     try:
-        api_key = os.environ.get('GEMINI_API_KEY')
+        router = get_router(GEMINI_API_BASE)
 
-        if not api_key:
+        if router is None:
             return {
                 "success": False,
                 "error": "未配置 GEMINI_API_KEY，请在平台上配置该密钥",
@@ -180,88 +1021,114 @@ def edit_image(prompt: str) -> dict:
                 "error_code": "INVALID_PROMPT"
             }
 
-        input_files = list(DATA_INPUTS_IMAGE.glob("*"))
-        if not input_files:
+        if deadline is not None and not _is_positive_number(deadline):
             return {
                 "success": False,
-                "error": "未找到输入图像文件",
-                "error_code": "NO_INPUT_FILE"
+                "error": "deadline 参数必须是正数（秒）",
+                "error_code": "INVALID_DEADLINE"
             }
 
-        input_path = input_files[0]
-
-        if not input_path.is_file():
+        if request_id is not None and (not isinstance(request_id, str) or not request_id):
             return {
                 "success": False,
-                "error": "输入路径不是有效的文件",
-                "error_code": "INVALID_INPUT_FILE"
+                "error": "request_id 参数必须是非空字符串",
+                "error_code": "INVALID_REQUEST_ID"
             }
 
-        input_image_bytes = input_path.read_bytes()
-        input_image_base64 = base64.b64encode(input_image_bytes).decode('utf-8')
-
-        suffix = input_path.suffix.lower()
-        mime_type_map = {
-            '.png': 'image/png',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp'
-        }
-        mime_type = mime_type_map.get(suffix, 'image/png')
-
-        headers = {
-            "x-goog-api-key": api_key,
-            "Content-Type": "application/json"
-        }
-
-        data = {
-            "contents": [{
-                "parts": [
-                    {"text": f"基于这张图片，生成一个新版本：{prompt}"},
-                    {
-                        "inline_data": {
-                            "mime_type": mime_type,
-                            "data": input_image_base64
-                        }
-                    }
-                ]
-            }]
-        }
+        if session_id is not None and (not isinstance(session_id, str) or not SESSION_ID_PATTERN.match(session_id)):
+            return {
+                "success": False,
+                "error": "session_id 只能包含字母、数字、下划线和连字符，且不超过 64 个字符",
+                "error_code": "INVALID_SESSION_ID"
+            }
 
-        response = requests.post(GEMINI_API_URL, headers=headers, json=data, timeout=90)
+        if tile_size is not None and (
+            not isinstance(tile_size, int) or isinstance(tile_size, bool) or tile_size <= 0
+        ):
+            return {
+                "success": False,
+                "error": "tile_size 参数必须是正整数（像素）",
+                "error_code": "INVALID_TILE_SIZE"
+            }
 
-        if response.status_code != 200:
+        region_mode = region is not None or bool(input_files(DATA_INPUTS_MASK))
+        if tile_size is not None and (region_mode or session_id is not None):
             return {
                 "success": False,
-                "error": f"API 请求失败: {response.status_code} - {response.text}",
-                "error_code": "API_REQUEST_FAILED"
+                "error": "分块模式（tile_size）不能与局部编辑或多轮会话同时使用",
+                "error_code": "INVALID_TILE_SIZE"
             }
 
-        result = response.json()
+        if region_mode and session_id is not None:
+            return {
+                "success": False,
+                "error": "局部编辑（region 或蒙版）不支持多轮会话",
+                "error_code": "INVALID_REGION"
+            }
 
-        if "candidates" not in result or not result["candidates"]:
+        if (region_mode or tile_size is not None) and not pillow_available():
             return {
                 "success": False,
-                "error": "API 响应中没有生成的图像数据",
-                "error_code": "NO_IMAGE_DATA"
+                "error": "局部编辑和分块模式需要安装 Pillow：pip install \"imagen[region]\"",
+                "error_code": "MISSING_DEPENDENCY"
             }
 
-        image_data = result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
-        image_bytes = base64.b64decode(image_data)
+        call_deadline = Deadline(deadline)
+        store = get_session_store()
 
-        DATA_OUTPUTS.mkdir(parents=True, exist_ok=True)
+        # checkout 期间会话不会被缓存淘汰，同一会话的调用始终争用同一把 session.lock
+        with _cancel_scope(request_id) as cancel_token, \
+                store.checkout(session_id) if session_id is not None else contextlib.nullcontext() as session, \
+                session.lock if session is not None else contextlib.nullcontext():
+            if session is not None and session.last_image is not None:
+                result = _edit_in_session(router, session, prompt, call_deadline, cancel_token, request_id, emit)
+            else:
+                input_image, error = read_input_image()
+                if error is not None:
+                    return error
+                emit("input_read", bytes=len(input_image[0]), sha256=_event_sha256(emit, input_image[0]))
+
+                animated = is_animated(input_image[0])
+                if animated and (tile_size is not None or region_mode or session is not None):
+                    return {
+                        "success": False,
+                        "error": "动画输入不能与分块模式、局部编辑或多轮会话同时使用",
+                        "error_code": "INVALID_ANIMATION"
+                    }
 
-        output_filename = "edited_image.png"
-        output_path = DATA_OUTPUTS / output_filename
-        output_path.write_bytes(image_bytes)
+                if animated:
+                    result = _edit_frames(
+                        router, prompt, input_image[0], call_deadline, cancel_token, request_id, emit
+                    )
+                elif tile_size is not None:
+                    result = _edit_tiled(
+                        router, prompt, input_image[0], tile_size, call_deadline, cancel_token, request_id, emit
+                    )
+                else:
+                    result = _edit_input_image(
+                        router, prompt, input_image, stream and session is None, call_deadline, session,
+                        region, region_mode, cancel_token, request_id, emit
+                    )
+
+            if not result["success"]:
+                return result
+
+            if session is not None:
+                store.save(session)
+                result.update({"session_id": session.session_id, "turn": session.turn_count})
 
         return {
-            "success": True,
+            **result,
             "prompt": prompt,
             "message": "图像编辑成功"
         }
 
+    except RequestCancelled:
+        return {
+            "success": False,
+            "error": "请求已取消",
+            "error_code": "CANCELLED"
+        }
     except requests.exceptions.Timeout:
         return {
             "success": False,
@@ -286,3 +1153,68 @@ def edit_image(prompt: str) -> dict:
             "error": str(e),
             "error_code": "UNEXPECTED_ERROR"
         }
+
+
+def edit_image(
+    prompt: str,
+    stream: bool = False,
+    deadline: float = None,
+    session_id: str = None,
+    request_id: str = None,
+    region: list = None,
+    tile_size: int = None,
+) -> dict:
+    """
+    基于现有图片进行编辑
+
+    使用 Gemini API 根据用户提供的编辑指令，对输入图像进行修改。
+    输入图像从 data/inputs/input_image/ 目录自动读取（由平台自动下载）。
+    编辑后的图像会保存到输出目录，由平台自动上传。
+
+    Args:
+        prompt: 图像编辑指令，描述想要对图像进行的修改
+        stream: 是否使用流式接口。开启后图像分块到达即写盘，
+            超时发生在已写出图像之后时返回部分结果
+        deadline: 本次调用的最长等待时间（秒），排队、限流、上传、请求和重试都计入其中；
+            不传时根据近期观测延迟自动推导每个请求的超时
+        session_id: 多轮编辑会话 ID。会话已有输出时基于上一轮输出和对话历史继续编辑，
+            无需再提供输入文件；会话模式始终使用非流式接口
+        request_id: 调用方分配的请求 ID。传入后可在其他线程调用 cancellation.cancel(request_id)
+            取消本次调用：立即返回 CANCELLED，中断传输，不再解码和写出图像，会话历史保持不变
+        region: 局部编辑区域 [x, y, width, height]（像素）。传入 region 或在 data/inputs/mask_image/
+            提供蒙版时只发送该区域及上下文边距，返回结果混合回原图，区域外的像素保持不变；
+            局部编辑始终使用非流式接口，不支持多轮会话，需要安装 Pillow
+        tile_size: 分块边长（像素）。传入后把输入切成相互重叠的分块并发编辑，失败的分块单独重试，
+            结果在重叠处渐变混合拼接回原尺寸；适用于超过模型输入尺寸的大图，始终使用非流式接口，
+            不能与局部编辑或多轮会话同时使用，需要安装 Pillow
+
+    输入为动画（GIF、APNG、动画 WebP）且已安装 Pillow 时自动逐帧编辑：重复帧只编辑一次，不同画面并发发送，
+    结果按原帧顺序和时长组装为同格式的动画写出（edited_image.gif 等）；动画输入不能与分块模式、局部编辑或
+    多轮会话同时使用。
+
+    Returns:
+        包含编辑结果的字典，包含以下字段：
+            - success: 操作是否成功
+            - prompt: 使用的编辑指令（成功时）
+            - message: 操作消息（成功时）
+            - images: 写出的图像文件名列表（流式模式）
+            - text: 模型返回的文本（流式模式）
+            - partial: 是否为超时后保留的部分结果（流式模式）
+            - model: 实际提供服务的模型（成功时）
+            - usage: 本次调用的 token 用量 prompt_tokens / output_tokens / total_tokens（响应带 usageMetadata 时）
+            - session_id: 会话 ID（会话模式）
+            - turn: 本次是会话中的第几轮（会话模式）
+            - region: 实际编辑的区域 [x, y, width, height]（局部编辑模式）
+            - tiles: 分块数（分块模式）
+            - failed_tiles: 重试后仍失败的分块序号（分块模式失败时）
+            - frames: 动画帧数（动画输入）
+            - unique_frames: 去重后实际编辑的画面数（动画输入）
+            - failed_frames: 重试后仍失败的画面序号（动画输入失败时）
+            - error: 错误信息（失败时）
+            - error_code: 错误代码（失败时）
+
+    Examples:
+        >>> edit_image(prompt="把背景改成蓝天白云")
+        {'success': True, 'prompt': '把背景改成蓝天白云', 'message': '图像编辑成功'}
+    """
+    return _edit_image(prompt, stream, deadline, session_id, request_id, region, tile_size)
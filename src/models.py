@@ -0,0 +1,187 @@
+"""
+模型注册表与基于延迟 SLO 的降级策略
+
+注册表为每个模型记录超时、成本权重和延迟目标（p95，秒），超时和延迟目标都按函数区分。
+FallbackPolicy 按 (模型, 函数) 跟踪最近的延迟样本，各函数独立降级，编辑请求变慢不会让文生图也降级：
+- 主模型某个函数最近的 p95 超过其目标时，该函数切换到备选模型中第一个仍满足自身目标的模型
+- 降级期间每隔 probe_every 个请求向主模型发送一次探测请求，
+  探测样本的 p95 回落到 目标 × recover_ratio 以内后恢复使用主模型
+
+配置：
+- GEMINI_MODEL：主模型（默认 gemini-3-pro-image-preview）
+- GEMINI_FALLBACK_MODELS：逗号分隔的备选模型，按优先级排列；设为空字符串可关闭降级
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class ModelSpec:
+    """单个模型的调用参数"""
+
+    def __init__(
+        self,
+        name: str,
+        text_timeout: float,
+        edit_timeout: float,
+        cost_weight: float,
+        text_latency_target: float,
+        edit_latency_target: float,
+    ):
+        self.name = name
+        self.text_timeout = text_timeout
+        self.edit_timeout = edit_timeout
+        self.cost_weight = cost_weight
+        self.text_latency_target = text_latency_target
+        self.edit_latency_target = edit_latency_target
+
+    def timeout_for(self, function: str) -> float:
+        """返回指定函数（text_to_image / edit_image）的超时时间（秒）"""
+        return self.edit_timeout if function == "edit_image" else self.text_timeout
+
+    def latency_target_for(self, function: str) -> float:
+        """返回指定函数的延迟目标（p95，秒）"""
+        return self.edit_latency_target if function == "edit_image" else self.text_latency_target
+
+
+MODEL_REGISTRY: Dict[str, ModelSpec] = {
+    spec.name: spec for spec in (
+        ModelSpec(
+            "gemini-3-pro-image-preview", text_timeout=60, edit_timeout=90, cost_weight=1.0,
+            text_latency_target=40, edit_latency_target=60,
+        ),
+        ModelSpec(
+            "gemini-2.5-flash-image", text_timeout=30, edit_timeout=45, cost_weight=0.3,
+            text_latency_target=15, edit_latency_target=25,
+        ),
+    )
+}
+
+DEFAULT_MODEL = "gemini-3-pro-image-preview"
+DEFAULT_FALLBACK_MODELS = "gemini-2.5-flash-image"
+FUNCTIONS = ("text_to_image", "edit_image")
+
+
+def get_model_spec(name: str) -> ModelSpec:
+    """
+    查询模型参数
+
+    Raises:
+        ValueError: 模型未注册
+    """
+    if name not in MODEL_REGISTRY:
+        raise ValueError(f"未注册的模型: {name}，可选值: {', '.join(MODEL_REGISTRY)}")
+    return MODEL_REGISTRY[name]
+
+
+def _p95(samples: List[float]) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+
+
+class FallbackPolicy:
+    """根据主模型各函数最近的 p95 延迟在主模型与备选模型之间切换（线程安全）"""
+
+    def __init__(
+        self,
+        primary: str,
+        fallbacks: Optional[List[str]] = None,
+        window_seconds: float = 300.0,
+        min_samples: int = 5,
+        probe_every: int = 10,
+        recover_ratio: float = 0.8,
+    ):
+        self.primary = get_model_spec(primary)
+        self.fallbacks = [get_model_spec(name) for name in fallbacks or [] if name != primary]
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.probe_every = probe_every
+        self.recover_ratio = recover_ratio
+        # 处于降级状态的函数
+        self.degraded = set()
+        self._requests = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, key: Tuple[str, str], now: float) -> List[float]:
+        samples = self._samples.get(key)
+        if not samples:
+            return []
+        while samples and now - samples[0][0] > self.window_seconds:
+            samples.popleft()
+        return [latency for _, latency in samples]
+
+    def p95(self, name: str, function: str) -> Optional[float]:
+        """模型在该函数上最近窗口内的 p95 延迟，样本不足时返回 None"""
+        with self._lock:
+            recent = self._recent((name, function), time.monotonic())
+        return _p95(recent) if len(recent) >= self.min_samples else None
+
+    def choose(self, function: str) -> ModelSpec:
+        """选出本次请求（text_to_image / edit_image）使用的模型"""
+        with self._lock:
+            self._requests[function] = self._requests.get(function, 0) + 1
+            if function not in self.degraded or self._requests[function] % self.probe_every == 0:
+                return self.primary
+
+            now = time.monotonic()
+            for spec in self.fallbacks:
+                recent = self._recent((spec.name, function), now)
+                if len(recent) < self.min_samples or _p95(recent) <= spec.latency_target_for(function):
+                    return spec
+            return self.fallbacks[-1] if self.fallbacks else self.primary
+
+    def record(self, name: str, function: str, latency: float) -> None:
+        """记录模型在该函数上一次请求的延迟（秒），并据此更新该函数的降级状态"""
+        with self._lock:
+            now = time.monotonic()
+            key = (name, function)
+            self._samples.setdefault(key, deque(maxlen=200)).append((now, latency))
+            if name != self.primary.name or not self.fallbacks:
+                return
+
+            recent = self._recent(key, now)
+            if len(recent) < self.min_samples:
+                return
+
+            target = self.primary.latency_target_for(function)
+            if function not in self.degraded and _p95(recent) > target:
+                self.degraded.add(function)
+                # 清空主模型样本，恢复判断只依据降级之后的探测请求
+                self._samples[key].clear()
+            elif function in self.degraded and _p95(recent) <= target * self.recover_ratio:
+                self.degraded.discard(function)
+
+    def stats(self) -> dict:
+        """返回处于降级状态的函数与各函数下各模型的 p95"""
+        names = [self.primary.name] + [spec.name for spec in self.fallbacks]
+        return {
+            "primary": self.primary.name,
+            "degraded": sorted(self.degraded),
+            "p95": {function: {name: self.p95(name, function) for name in names} for function in FUNCTIONS},
+        }
+
+
+_policy = None
+_policy_config = None
+_policy_lock = threading.Lock()
+
+
+def get_policy() -> FallbackPolicy:
+    """返回进程内共享的降级策略；GEMINI_MODEL / GEMINI_FALLBACK_MODELS 变化后自动重建"""
+    global _policy, _policy_config
+
+    config = (
+        os.environ.get('GEMINI_MODEL', DEFAULT_MODEL),
+        os.environ.get('GEMINI_FALLBACK_MODELS', DEFAULT_FALLBACK_MODELS),
+    )
+    with _policy_lock:
+        if config != _policy_config:
+            fallbacks = [name.strip() for name in config[1].split(',') if name.strip()]
+            _policy = FallbackPolicy(config[0], fallbacks)
+            _policy_config = config
+        return _policy
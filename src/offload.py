@@ -0,0 +1,127 @@
+"""
+响应解码的进程池卸载
+
+并发调用较多时，多 MB 响应体的 JSON 解析和 base64.b64decode 都在调用方线程中持有 GIL 执行，
+互相拖慢。开启后，网络层把原始响应体交给进程池解码：
+- 响应体写入调用方创建的共享内存块，工作进程直接从共享内存解析，避免 pickle 传输整个响应体
+- 解码后的图像由工作进程写回同一块共享内存（base64 解码后一定比响应体小），调用方读出后立即释放；
+  共享内存块只由调用方创建和释放，工作进程退出不会影响它
+- 小于 GEMINI_DECODE_OFFLOAD_MIN_BYTES（默认 1MiB）的响应体进程间传递的开销大于收益，仍在本线程解码
+- 需要完整模型 content 的调用（多轮会话）仍在本线程解码
+
+配置：
+- GEMINI_DECODE_PROCESSES：工作进程数，默认 0（关闭）
+- GEMINI_DECODE_OFFLOAD_MIN_BYTES：卸载的最小响应体大小
+
+工作进程使用 spawn 方式启动（调用方进程是多线程的，fork 可能死锁）。
+"""
+
+import base64
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+
+DEFAULT_MIN_BYTES = 1024 * 1024
+
+
+def _decode_worker(name: str, size: int) -> Optional[Tuple[int, str, Optional[dict]]]:
+    """
+    在工作进程中解析共享内存里的 generateContent 响应体，把第一张图像解码后写回同一块共享内存的开头
+
+    Returns:
+        (图像字节数, MIME 类型, usageMetadata)；响应中没有 candidates 时返回 None
+
+    Raises:
+        KeyError: 响应中没有图像 part
+        ValueError: 响应体不是合法 JSON 或图像数据不是合法 base64
+    """
+    shm = SharedMemory(name=name)
+    try:
+        body = json.loads(bytes(shm.buf[:size]))
+
+        candidates = body.get("candidates")
+        if not candidates:
+            return None
+
+        for part in candidates[0]["content"]["parts"]:
+            if "inlineData" in part:
+                inline_data = part["inlineData"]
+                break
+        else:
+            raise KeyError("inlineData")
+
+        image = base64.b64decode(inline_data["data"])
+        shm.buf[:len(image)] = image
+        return len(image), inline_data.get("mimeType", "image/png"), body.get("usageMetadata")
+    finally:
+        shm.close()
+
+
+class DecodePool:
+    """
+    解码工作进程池（线程安全）
+
+    Args:
+        processes: 工作进程数
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def decode(self, body: bytes) -> Optional[Tuple[bytes, str, Optional[dict]]]:
+        """
+        在工作进程中解码 generateContent 响应体
+
+        Args:
+            body: 原始响应体
+
+        Returns:
+            (图像字节, MIME 类型, usageMetadata)；响应中没有 candidates 时返回 None
+
+        Raises:
+            KeyError: 响应中没有图像 part 或格式错误
+            ValueError: 响应体不是合法 JSON 或图像数据不是合法 base64
+        """
+        shm = SharedMemory(create=True, size=max(len(body), 1))
+        try:
+            shm.buf[:len(body)] = body
+            result = self._executor.submit(_decode_worker, shm.name, len(body)).result()
+            if result is None:
+                return None
+            size, mime_type, usage_metadata = result
+            return bytes(shm.buf[:size]), mime_type, usage_metadata
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def offload_min_bytes() -> int:
+    """卸载的最小响应体大小"""
+    return int(os.environ.get('GEMINI_DECODE_OFFLOAD_MIN_BYTES', DEFAULT_MIN_BYTES))
+
+
+_pool = None
+_pool_processes = 0
+_pool_lock = threading.Lock()
+
+
+def get_decode_pool() -> Optional[DecodePool]:
+    """返回进程内共享的解码进程池；GEMINI_DECODE_PROCESSES 未配置或为 0 时返回 None"""
+    global _pool, _pool_processes
+
+    processes = int(os.environ.get('GEMINI_DECODE_PROCESSES', '0') or 0)
+    with _pool_lock:
+        if processes != _pool_processes:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = DecodePool(processes) if processes > 0 else None
+            _pool_processes = processes
+        return _pool
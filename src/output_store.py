@@ -0,0 +1,188 @@
+"""
+按内容寻址、去重的输出存储
+
+缓存命中、重试或重复提示词经常产出字节完全相同的图像。开启输出存储后：
+- 图像按 SHA-256 存为 blob：<store>/blobs/<前两位>/<digest><后缀>，相同内容只存一份
+- data/outputs/ 中的输出文件是指向 blob 的硬链接（跨文件系统等无法硬链接时退化为复制），
+  不额外占用磁盘
+- 紧凑索引 index.json 记录「引用 → blob」（引用为 request_id/文件名，未传 request_id 时以随机键代替）
+  以及每个 blob 的引用计数；同一引用写入新内容时旧 blob 计数减一
+- 引用计数归零的 blob 立即删除（已链接到 outputs 的文件不受影响）；
+  gc() 用于清理进程崩溃后遗留的无主 blob
+- 引用数超过 max_refs 时淘汰最早的引用
+
+结果中的 sha256 / deduplicated 字段可供上传方跳过已上传过的内容。
+
+设置环境变量 GEMINI_OUTPUT_STORE_DIR 开启；索引仅在单个进程内加锁，
+多个进程请使用各自的存储目录。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_MAX_REFS = 10000
+
+
+class OutputStore:
+    """
+    内容寻址的 blob 存储 + 引用计数索引（线程安全）
+
+    Args:
+        root: 存储目录
+        max_refs: 索引中最多保留的引用数
+    """
+
+    def __init__(self, root: Path, max_refs: int = DEFAULT_MAX_REFS):
+        self.root = Path(root)
+        self.max_refs = max_refs
+        self._index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+        self._refs = {}
+        self._blobs = {}
+        if self._index_path.is_file():
+            index = json.loads(self._index_path.read_text(encoding='utf-8'))
+            self._refs = index.get("refs", {})
+            self._blobs = index.get("blobs", {})
+
+    def blob_path(self, digest: str) -> Path:
+        suffix = self._blobs.get(digest, {}).get("suffix", "")
+        return self.root / "blobs" / digest[:2] / f"{digest}{suffix}"
+
+    def put(self, data: bytes, dest: Path, ref: str) -> dict:
+        """
+        存入内容并把 dest 链接到对应 blob
+
+        Args:
+            data: 文件内容
+            dest: 输出文件路径（已存在时原子替换）
+            ref: 引用名，同一引用再次写入时释放其旧内容
+
+        Returns:
+            {"sha256": 内容摘要, "deduplicated": blob 是否已存在}
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        dest = Path(dest)
+
+        with self._lock:
+            deduplicated = digest in self._blobs
+            if not deduplicated:
+                self._blobs[digest] = {"size": len(data), "suffix": dest.suffix, "refcount": 0}
+                blob = self.blob_path(digest)
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                tmp_blob = blob.with_name(f".{blob.name}.part")
+                tmp_blob.write_bytes(data)
+                os.replace(tmp_blob, blob)
+            blob = self.blob_path(digest)
+
+            self._link(blob, dest)
+
+            previous = self._refs.pop(ref, None)
+            self._refs[ref] = digest
+            self._blobs[digest]["refcount"] += 1
+            if previous is not None:
+                self._unref(previous)
+            while len(self._refs) > self.max_refs:
+                oldest = next(iter(self._refs))
+                self._unref(self._refs.pop(oldest))
+
+            self._save_index()
+
+        return {"sha256": digest, "deduplicated": deduplicated}
+
+    @staticmethod
+    def _link(blob: Path, dest: Path) -> None:
+        """把 dest 原子替换为 blob 的硬链接，无法硬链接时复制"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists() and os.path.samefile(dest, blob):
+            return
+        tmp_dest = dest.with_name(f".{dest.name}.part")
+        if tmp_dest.exists():
+            tmp_dest.unlink()
+        try:
+            os.link(blob, tmp_dest)
+        except OSError:
+            shutil.copyfile(blob, tmp_dest)
+        os.replace(tmp_dest, dest)
+
+    def _unref(self, digest: str) -> None:
+        """引用计数减一，归零时删除 blob（调用方需持有锁）"""
+        info = self._blobs.get(digest)
+        if info is None:
+            return
+        info["refcount"] -= 1
+        if info["refcount"] <= 0:
+            self.blob_path(digest).unlink(missing_ok=True)
+            del self._blobs[digest]
+
+    def _save_index(self) -> None:
+        tmp_path = self._index_path.with_name("index.json.part")
+        tmp_path.write_text(
+            json.dumps({"refs": self._refs, "blobs": self._blobs}, separators=(',', ':')), encoding='utf-8'
+        )
+        os.replace(tmp_path, self._index_path)
+
+    def lookup(self, ref: str) -> Optional[Path]:
+        """返回引用对应的 blob 路径，不存在时返回 None"""
+        with self._lock:
+            digest = self._refs.get(ref)
+            return None if digest is None else self.blob_path(digest)
+
+    def release(self, ref: str) -> bool:
+        """释放引用，返回引用是否存在"""
+        with self._lock:
+            digest = self._refs.pop(ref, None)
+            if digest is None:
+                return False
+            self._unref(digest)
+            self._save_index()
+            return True
+
+    def gc(self) -> dict:
+        """
+        删除索引之外的 blob 及遗留的临时文件
+
+        Returns:
+            {"removed": 删除的文件数, "freed_bytes": 释放的字节数}
+        """
+        removed = 0
+        freed = 0
+        with self._lock:
+            known = {self.blob_path(digest) for digest in self._blobs}
+            for path in (self.root / "blobs").glob("*/*"):
+                if path in known:
+                    continue
+                freed += path.stat().st_size
+                path.unlink()
+                removed += 1
+        return {"removed": removed, "freed_bytes": freed}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "refs": len(self._refs),
+                "blobs": len(self._blobs),
+                "stored_bytes": sum(info["size"] for info in self._blobs.values()),
+                "referenced_bytes": sum(self._blobs[d]["size"] for d in self._refs.values()),
+            }
+
+
+_store = None
+_store_dir = None
+_store_lock = threading.Lock()
+
+
+def get_output_store() -> Optional[OutputStore]:
+    """返回进程内共享的输出存储；未配置 GEMINI_OUTPUT_STORE_DIR 时返回 None"""
+    global _store, _store_dir
+
+    directory = os.environ.get('GEMINI_OUTPUT_STORE_DIR') or None
+    with _store_lock:
+        if directory != _store_dir:
+            _store = OutputStore(Path(directory)) if directory else None
+            _store_dir = directory
+        return _store
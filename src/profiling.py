@@ -0,0 +1,269 @@
+"""
+按调用开启的性能剖析
+
+线上个别调用变慢时，需要知道时间和内存花在了 main 的哪一段。开启后按比例抽取调用进行剖析，
+把结果写入剖析目录，文件名以 request_id 开头（未传时为函数名加时间戳）：
+- cpu：后台线程每隔 GEMINI_PROFILE_INTERVAL 秒对调用线程及其派生的工作线程（分块线程池、可取消请求的
+  辅助线程等，启动时通过 track_thread() 登记）采样调用栈，同时进行的其他调用的线程不会混入；写出 <名称>.folded（折叠栈格式，每行「线程;外层帧;...;内层帧 采样数」，可直接交给
+  flamegraph.pl / speedscope 生成火焰图）
+- memory：用 tracemalloc 记录调用前后的快照，写出 <名称>.memory.txt（调用期间的峰值和增长最多的分配位置）
+- 另写出 <名称>.json 摘要：函数、request_id、耗时、采样数、内存峰值（与其他内存剖析重叠时为 null）、调用结果
+
+采样剖析的开销与调用耗时无关（只取决于采样间隔）；tracemalloc 会明显拖慢内存分配，
+建议只在小比例调用上开启。
+
+配置：
+- GEMINI_PROFILE：cpu、memory 或 cpu,memory，未配置时不剖析（其他值忽略）
+- GEMINI_PROFILE_SAMPLE_RATE：被剖析的调用比例（0~1），默认 0.01
+- GEMINI_PROFILE_DIR：剖析结果目录，默认 profiles（不要放在会被上传的 data/outputs 下）
+- GEMINI_PROFILE_INTERVAL：CPU 采样间隔（秒），默认 0.005
+
+也可以在代码中对单次调用强制开启（不受采样比例限制）：
+    with profiling.profile("cpu,memory"):
+        edit_image(prompt="...", request_id="slow-1")
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+MODES = ("cpu", "memory")
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_PROFILE_DIR = "profiles"
+DEFAULT_INTERVAL = 0.005
+TOP_ALLOCATIONS = 30
+
+_forced = contextvars.ContextVar("gemini_profile", default=None)
+# 正在剖析当前调用的采样器；派生的工作线程在调用方上下文的副本中执行，据此登记自己
+_active_sampler = contextvars.ContextVar("gemini_profile_sampler", default=None)
+# 正在进行的内存剖析；tracemalloc 的峰值是进程级的，有重叠时各自的峰值都不可信
+_memory_profiles = set()
+_tracemalloc_lock = threading.Lock()
+
+
+def parse_modes(value: Optional[str]) -> frozenset:
+    """解析 "cpu,memory" 形式的剖析模式，忽略未知的值"""
+    return frozenset(mode.strip() for mode in (value or "").split(",")) & frozenset(MODES)
+
+
+@contextlib.contextmanager
+def profile(modes: str = "cpu,memory"):
+    """
+    在上下文内对每次调用强制开启剖析
+
+    Raises:
+        ValueError: modes 中没有可用的剖析模式
+    """
+    parsed = parse_modes(modes)
+    if not parsed:
+        raise ValueError(f"未知的剖析模式: {modes!r}，可选值: {', '.join(MODES)}")
+    reset = _forced.set(parsed)
+    try:
+        yield
+    finally:
+        _forced.reset(reset)
+
+
+def _modes_for_call() -> frozenset:
+    forced = _forced.get()
+    if forced is not None:
+        return forced
+    modes = parse_modes(os.environ.get('GEMINI_PROFILE'))
+    if not modes:
+        return modes
+    rate = float(os.environ.get('GEMINI_PROFILE_SAMPLE_RATE', DEFAULT_SAMPLE_RATE))
+    return modes if random.random() < rate else frozenset()
+
+
+def track_thread() -> None:
+    """
+    在调用派生的工作线程中调用（需在调用方上下文的副本中执行）：调用正在被 CPU 剖析时把本线程加入采样
+    """
+    sampler = _active_sampler.get()
+    if sampler is not None:
+        sampler.add_thread(threading.get_ident())
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    定时采样线程调用栈的 CPU 剖析器
+
+    只采样 start() 所在的线程，以及在该线程上下文中调用 track_thread()（或显式 add_thread()）登记的线程。
+
+    Args:
+        interval: 采样间隔（秒）
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._idents = set()
+        self._token = None
+
+    def add_thread(self, ident: int) -> None:
+        """把线程加入采样"""
+        self._idents.add(ident)
+
+    def start(self) -> None:
+        self._idents = {threading.get_ident()}
+        self._token = _active_sampler.set(self)
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        _active_sampler.reset(self._token)
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident not in self._idents:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """折叠栈文本，按采样数从多到少排列"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class MemoryProfile:
+    """
+    调用前后的 tracemalloc 快照（多个调用同时剖析时共享 tracemalloc，最后一个结束时停止）
+
+    峰值计数是进程级的，与其他内存剖析在时间上有重叠的调用无法得到自己的峰值，peak 为 None；
+    快照差异仍然写出，但其中包含同时进行的调用的分配。
+    """
+
+    def __init__(self):
+        self.before = None
+        self.after = None
+        self.peak = None
+        self.overlapped = False
+
+    def start(self) -> None:
+        with _tracemalloc_lock:
+            if _memory_profiles:
+                self.overlapped = True
+                for other in _memory_profiles:
+                    other.overlapped = True
+            else:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+            _memory_profiles.add(self)
+        self.before = tracemalloc.take_snapshot()
+
+    def stop(self) -> None:
+        self.after = tracemalloc.take_snapshot()
+        with _tracemalloc_lock:
+            if not self.overlapped:
+                self.peak = tracemalloc.get_traced_memory()[1]
+            _memory_profiles.discard(self)
+            if not _memory_profiles:
+                tracemalloc.stop()
+
+    def report(self) -> str:
+        peak = "unavailable (overlapping memory profiles)" if self.peak is None \
+            else f"{self.peak / 1024 / 1024:.2f} MiB"
+        lines = [f"traced peak: {peak}", "", f"top {TOP_ALLOCATIONS} growth by line:"]
+        lines += [str(stat) for stat in self.after.compare_to(self.before, "lineno")[:TOP_ALLOCATIONS]]
+        return "\n".join(lines) + "\n"
+
+
+def _artifact_name(function: str, request_id: Optional[str]) -> str:
+    if request_id:
+        return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', request_id)}-{function}"
+    return f"{function}-{time.strftime('%Y%m%d-%H%M%S')}-{random.getrandbits(32):08x}"
+
+
+def _write_artifacts(function, request_id, result, started, sampler, memory) -> None:
+    directory = Path(os.environ.get('GEMINI_PROFILE_DIR') or DEFAULT_PROFILE_DIR)
+    name = _artifact_name(function, request_id)
+    summary = {
+        "function": function,
+        "request_id": request_id,
+        "wall_ms": round((time.monotonic() - started) * 1000, 1),
+        "success": bool(result.get("success")),
+        "error_code": result.get("error_code"),
+    }
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        if sampler is not None:
+            (directory / f"{name}.folded").write_text(sampler.folded(), encoding="utf-8")
+            summary.update(samples=sampler.samples, interval=sampler.interval)
+        if memory is not None:
+            (directory / f"{name}.memory.txt").write_text(memory.report(), encoding="utf-8")
+            summary["peak_bytes"] = memory.peak
+        (directory / f"{name}.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    except OSError:
+        # 剖析结果写不出来不影响调用本身
+        pass
+
+
+def profiled(function: str):
+    """
+    装饰 main 中 text_to_image / edit_image 的实现：本次调用被抽中或被强制开启时进行剖析并写出结果
+
+    被装饰函数可以接收 request_id 关键字参数。
+    """
+
+    def decorator(impl):
+        signature = inspect.signature(impl)
+
+        @functools.wraps(impl)
+        def wrapper(*args, **kwargs):
+            modes = _modes_for_call()
+            if not modes:
+                return impl(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            sampler = StackSampler(float(os.environ.get('GEMINI_PROFILE_INTERVAL') or DEFAULT_INTERVAL)) \
+                if "cpu" in modes else None
+            memory = MemoryProfile() if "memory" in modes else None
+            started = time.monotonic()
+            if memory is not None:
+                memory.start()
+            if sampler is not None:
+                sampler.start()
+            result = {}
+            try:
+                result = impl(*args, **kwargs)
+                return result
+            finally:
+                if sampler is not None:
+                    sampler.stop()
+                if memory is not None:
+                    memory.stop()
+                _write_artifacts(function, bound.arguments.get("request_id"), result, started, sampler, memory)
+
+        return wrapper
+
+    return decorator
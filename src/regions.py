@@ -0,0 +1,189 @@
+"""
+局部区域编辑
+
+「去掉角落里的 logo」这类局部修改不必把整张高分辨率图像发给模型。区域编辑模式下：
+- 按矩形区域（或蒙版的外接矩形）加上一圈上下文边距裁出局部图像，只发送该局部
+- 模型返回的局部图像缩放回裁剪尺寸，在区域内按羽化后的蒙版混合回原图
+- 裁剪范围以外的像素保持与原图完全一致，输出为无损 PNG
+
+配置：
+- GEMINI_REGION_PADDING：区域四周附带的上下文边距（像素），默认 64
+- GEMINI_REGION_FEATHER：混合边缘的羽化半径（像素），默认 8，0 表示硬边
+
+依赖 Pillow（可选依赖，pip install "imagen[region]"），未安装时 pillow_available() 返回 False。
+"""
+
+import io
+import os
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageChops, ImageFilter
+except ImportError:  # pragma: no cover - 取决于运行环境
+    Image = None
+
+DEFAULT_PADDING = 64
+DEFAULT_FEATHER = 8
+
+# 发给模型的局部图像附带的说明，避免模型改变构图或尺寸
+REGION_PROMPT = "这是一张大图中的局部区域，请保持构图、视角和尺寸不变，只按要求修改：{prompt}"
+
+
+def pillow_available() -> bool:
+    """是否已安装 Pillow"""
+    return Image is not None
+
+
+def parse_region(region) -> Tuple[int, int, int, int]:
+    """
+    校验并转换矩形区域参数
+
+    Args:
+        region: [x, y, width, height]，以像素为单位的非负整数，宽高为正
+
+    Returns:
+        (left, top, right, bottom)
+
+    Raises:
+        ValueError: 格式不正确
+    """
+    if (
+        not isinstance(region, (list, tuple)) or len(region) != 4
+        or not all(isinstance(v, int) and not isinstance(v, bool) for v in region)
+    ):
+        raise ValueError("region 必须是 [x, y, width, height] 形式的 4 个整数")
+    x, y, width, height = region
+    if x < 0 or y < 0 or width <= 0 or height <= 0:
+        raise ValueError("region 的 x、y 不能为负数，width、height 必须大于 0")
+    return x, y, x + width, y + height
+
+
+class RegionEdit:
+    """
+    一次局部编辑：负责裁剪发送给模型的局部图像，以及把返回的局部图像混合回原图
+
+    Args:
+        image_bytes: 原图字节
+        box: 编辑区域 (left, top, right, bottom)；为 None 时使用蒙版的外接矩形
+        mask_bytes: 可选的蒙版图像字节，尺寸需与原图一致，非黑色像素为可修改区域
+        padding: 上下文边距（像素），默认读取 GEMINI_REGION_PADDING
+        feather: 羽化半径（像素），默认读取 GEMINI_REGION_FEATHER
+
+    Raises:
+        ValueError: 图像或蒙版无法解析、尺寸不一致、区域超出图像或为空
+    """
+
+    def __init__(
+        self,
+        image_bytes: bytes,
+        box: Optional[Tuple[int, int, int, int]] = None,
+        mask_bytes: Optional[bytes] = None,
+        padding: Optional[int] = None,
+        feather: Optional[int] = None,
+    ):
+        self.image = _open(image_bytes, "输入图像")
+        self.mask = None
+        if mask_bytes is not None:
+            self.mask = _open(mask_bytes, "蒙版图像").convert("L")
+            if self.mask.size != self.image.size:
+                raise ValueError(f"蒙版尺寸 {self.mask.size} 与输入图像尺寸 {self.image.size} 不一致")
+            if box is None:
+                box = self.mask.getbbox()
+                if box is None:
+                    raise ValueError("蒙版中没有可修改的区域")
+
+        if box is None:
+            raise ValueError("需要提供 region 或蒙版图像")
+        width, height = self.image.size
+        if box[2] > width or box[3] > height:
+            raise ValueError(f"region 超出输入图像范围（{width}x{height}）")
+
+        self.box = box
+        self.padding = int(os.environ.get('GEMINI_REGION_PADDING', DEFAULT_PADDING)) if padding is None else padding
+        self.feather = int(os.environ.get('GEMINI_REGION_FEATHER', DEFAULT_FEATHER)) if feather is None else feather
+        self.crop_box = (
+            max(box[0] - self.padding, 0),
+            max(box[1] - self.padding, 0),
+            min(box[2] + self.padding, width),
+            min(box[3] + self.padding, height),
+        )
+
+    @property
+    def region(self) -> list:
+        """实际编辑的区域 [x, y, width, height]"""
+        left, top, right, bottom = self.box
+        return [left, top, right - left, bottom - top]
+
+    def crop(self) -> Tuple[bytes, str]:
+        """
+        裁出发送给模型的局部图像
+
+        Returns:
+            (PNG 字节, "image/png")
+        """
+        return _encode(self.image.crop(self.crop_box)), "image/png"
+
+    def composite(self, patch_bytes: bytes, mime_type: str = "image/png") -> Tuple[bytes, str]:
+        """
+        把模型返回的局部图像混合回原图
+
+        Args:
+            patch_bytes: 模型返回的图像字节（尺寸可以与裁剪尺寸不同，会缩放回裁剪尺寸）
+            mime_type: 模型返回的 MIME 类型（忽略，输出始终为 PNG）
+
+        Returns:
+            (完整分辨率的 PNG 字节, "image/png")
+
+        Raises:
+            ValueError: 返回的图像无法解析
+        """
+        mode = "RGBA" if "A" in self.image.getbands() or "transparency" in self.image.info else "RGB"
+        base = self.image.convert(mode)
+        original = base.crop(self.crop_box)
+        patch = _open(patch_bytes, "模型返回的图像").convert(mode)
+        if patch.size != original.size:
+            patch = patch.resize(original.size, Image.LANCZOS)
+
+        blended = Image.composite(patch, original, self._blend_mask())
+        base.paste(blended, self.crop_box[:2])
+        return _encode(base), "image/png"
+
+    def _blend_mask(self):
+        """裁剪坐标系下的混合蒙版：区域（或蒙版）内为蒙版值（矩形区域为 255），向外羽化过渡，裁剪边界处为 0"""
+        left, top = self.crop_box[:2]
+        size = (self.crop_box[2] - left, self.crop_box[3] - top)
+        mask = Image.new("L", size, 0)
+        region = (self.box[0] - left, self.box[1] - top, self.box[2] - left, self.box[3] - top)
+        if self.mask is not None:
+            mask.paste(self.mask.crop(self.box), region[:2])
+        else:
+            mask.paste(255, region)
+
+        if self.feather > 0:
+            # 羽化后裁剪边界处的 alpha 必须为 0，否则边界外侧的原图像素与混合结果之间会出现接缝；
+            # 与原图边缘重合的一侧外面没有像素，不需要收边
+            width, height = self.image.size
+            border = Image.new("L", size, 0)
+            border.paste(255, (
+                int(left > 0), int(top > 0),
+                size[0] - int(self.crop_box[2] < width), size[1] - int(self.crop_box[3] < height),
+            ))
+            # 区域内保持完全替换，只向外侧的上下文边距过渡
+            feathered = ImageChops.lighter(mask.filter(ImageFilter.GaussianBlur(self.feather)), mask)
+            mask = ImageChops.multiply(feathered, border)
+        return mask
+
+
+def _open(data: bytes, label: str):
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ValueError(f"{label}无法解析: {e}") from e
+    return image
+
+
+def _encode(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
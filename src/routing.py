@@ -0,0 +1,231 @@
+"""
+多密钥、多端点路由
+
+把若干 (endpoint, api_key) 组合成一个成员池，按负载和健康度分配请求：
+- least_outstanding：优先选择在途请求最少的成员，相同时比较 EWMA 延迟
+- ewma：按 EWMA 延迟 ×（在途请求数 + 1）打分，分数最低者优先
+
+被限流（429）的成员立即被摘除一段时间；连续失败（5xx / 网络错误）达到阈值的成员
+同样会被摘除，再次被摘除时摘除时长翻倍。所有成员都被摘除时，选择最早恢复的成员
+继续尝试，避免整体不可用。
+
+成员池配置：
+- GEMINI_API_POOL：JSON 数组，例如
+  [{"endpoint": "https://gw-a/v1beta", "api_key": "k1"}, {"endpoint": "https://gw-b/v1beta", "api_key": "k2"}]
+- 未配置时使用 GEMINI_API_KEY 与默认端点组成单成员池
+"""
+
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+# 摘除策略默认值
+DEFAULT_EJECT_SECONDS = 30.0
+MAX_EJECT_SECONDS = 300.0
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_EWMA_ALPHA = 0.3
+
+STRATEGIES = ("least_outstanding", "ewma")
+
+
+class PoolMember:
+    """成员池中的单个 (endpoint, api_key) 组合及其运行统计"""
+
+    def __init__(self, endpoint: str, api_key: str):
+        self.endpoint = endpoint.rstrip('/')
+        self.api_key = api_key
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def stats(self, now: float) -> dict:
+        """返回可公开的统计信息（密钥只保留末 4 位）"""
+        return {
+            "endpoint": self.endpoint,
+            "api_key": f"...{self.api_key[-4:]}",
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": None if self.ewma_latency is None else round(self.ewma_latency * 1000, 1),
+            "requests": self.requests,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "ejected": self.is_ejected(now),
+            "ejected_for": round(max(0.0, self.ejected_until - now), 1),
+        }
+
+
+class Router:
+    """
+    健康度加权的负载均衡路由器（线程安全）
+
+    用法：
+        member = router.acquire()
+        ...使用 member.endpoint / member.api_key 发请求...
+        router.release(member, latency, status_code=200)
+    """
+
+    def __init__(
+        self,
+        members: List[PoolMember],
+        strategy: str = "least_outstanding",
+        eject_seconds: float = DEFAULT_EJECT_SECONDS,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        ewma_alpha: float = DEFAULT_EWMA_ALPHA,
+    ):
+        if not members:
+            raise ValueError("成员池不能为空")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的路由策略: {strategy}，可选值: {', '.join(STRATEGIES)}")
+
+        self.members = members
+        self.strategy = strategy
+        self.eject_seconds = eject_seconds
+        self.failure_threshold = failure_threshold
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+
+    def _score(self, member: PoolMember) -> tuple:
+        # 尚无延迟样本的成员视为 0，使新成员优先获得流量
+        latency = member.ewma_latency or 0.0
+        if self.strategy == "ewma":
+            return (latency * (member.outstanding + 1), member.outstanding)
+        return (member.outstanding, latency)
+
+    def acquire(self) -> PoolMember:
+        """选出一个成员并将其在途请求数加一"""
+        with self._lock:
+            now = time.monotonic()
+            healthy = [m for m in self.members if not m.is_ejected(now)]
+            if healthy:
+                member = min(healthy, key=self._score)
+            else:
+                member = min(self.members, key=lambda m: m.ejected_until)
+
+            member.outstanding += 1
+            member.requests += 1
+            return member
+
+    def release(
+        self,
+        member: PoolMember,
+        latency: float,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        cancelled: bool = False,
+    ) -> None:
+        """
+        归还成员并记录本次请求结果
+
+        Args:
+            member: acquire() 返回的成员
+            latency: 本次请求耗时（秒）
+            status_code: HTTP 状态码，网络错误/超时时为 None
+            retry_after: 服务端建议的重试等待时间（秒，来自 Retry-After）
+            cancelled: 请求被调用方取消，只归还成员，不计入成功或失败
+        """
+        with self._lock:
+            now = time.monotonic()
+            member.outstanding = max(0, member.outstanding - 1)
+            if cancelled:
+                return
+
+            if status_code is not None and status_code < 500 and status_code != 429:
+                if member.ewma_latency is None:
+                    member.ewma_latency = latency
+                else:
+                    member.ewma_latency += self.ewma_alpha * (latency - member.ewma_latency)
+                member.consecutive_failures = 0
+                member.ejections = 0
+                return
+
+            member.failures += 1
+            member.consecutive_failures += 1
+
+            if status_code == 429:
+                member.rate_limited += 1
+                self._eject(member, now, retry_after)
+            elif member.consecutive_failures >= self.failure_threshold:
+                self._eject(member, now)
+
+    def suspend(self, member: PoolMember, seconds: float) -> None:
+        """暂时摘除成员 seconds 秒（如该密钥的 token 用量即将超出预算），不计入失败"""
+        with self._lock:
+            member.ejected_until = max(member.ejected_until, time.monotonic() + seconds)
+
+    def _eject(self, member: PoolMember, now: float, duration: Optional[float] = None) -> None:
+        if duration is None:
+            duration = min(self.eject_seconds * (2 ** member.ejections), MAX_EJECT_SECONDS)
+        member.ejections += 1
+        member.consecutive_failures = 0
+        member.ejected_until = max(member.ejected_until, now + duration)
+
+    def stats(self) -> List[dict]:
+        """返回每个成员的统计信息"""
+        with self._lock:
+            now = time.monotonic()
+            return [m.stats(now) for m in self.members]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析以秒为单位的 Retry-After 头，无法解析时返回 None"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def load_pool(default_endpoint: str) -> List[PoolMember]:
+    """
+    从环境变量加载成员池
+
+    Raises:
+        ValueError: GEMINI_API_POOL 格式不正确
+    """
+    pool_config = os.environ.get('GEMINI_API_POOL')
+    if pool_config:
+        try:
+            entries = json.loads(pool_config)
+            return [PoolMember(e.get("endpoint") or default_endpoint, e["api_key"]) for e in entries]
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise ValueError(f"GEMINI_API_POOL 格式不正确: {e}") from e
+
+    api_key = os.environ.get('GEMINI_API_KEY')
+    if api_key:
+        return [PoolMember(default_endpoint, api_key)]
+    return []
+
+
+_router = None
+_router_config = None
+_router_lock = threading.Lock()
+
+
+def get_router(default_endpoint: str) -> Optional[Router]:
+    """
+    返回进程内共享的路由器；相关环境变量变化后自动重建
+
+    未配置任何密钥时返回 None。
+    """
+    global _router, _router_config
+
+    config = (
+        os.environ.get('GEMINI_API_POOL'),
+        os.environ.get('GEMINI_API_KEY'),
+        os.environ.get('GEMINI_ROUTING_STRATEGY', 'least_outstanding'),
+        default_endpoint,
+    )
+    with _router_lock:
+        if config != _router_config:
+            members = load_pool(default_endpoint)
+            _router = Router(members, strategy=config[2]) if members else None
+            _router_config = config
+        return _router
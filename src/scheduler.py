@@ -0,0 +1,231 @@
+"""
+优先级与截止时间感知的任务调度器
+
+交互式的 edit_image 调用和批量的 text_to_image 回填共用同一批 worker 和上游配额。
+调度器放在两个函数之前：
+- 优先级类别：interactive 严格优先于 bulk；bulk 最多占用 workers - reserved_interactive 个 worker，
+  为交互式请求始终保留空闲槽位（已在执行的请求无法抢占）；保留数必须小于 workers，只有 1 个 worker 时
+  无法保留（默认保留 0 个，显式要求保留时报错）
+- 同一类别内按租户公平分享：每个租户维护虚拟时间，每调度一个任务前进 1 / 权重，
+  总是选择虚拟时间最小的租户；新加入的租户从当前最小虚拟时间起步，不会积累额度
+- 同一租户内按截止时间最早优先（EDF），无截止时间的任务排在最后
+- 任务执行时计入该租户的 token 用量（见 usage 模块），租户预算即将耗尽时返回 QUOTA_EXCEEDED
+- 出队时已过截止时间的任务直接丢弃并返回 REQUEST_TIMEOUT（与调用中途超过 deadline 相同），不消耗上游请求；
+  未过期的任务把剩余时间作为 deadline 参数传给函数（不会放宽 kwargs 中已有的更短 deadline），
+  单个请求的读超时仍不超过模型注册表中的超时，不会因任务预算很长而等待过久
+- 排队中的任务可通过 future.cancel() 取消；已开始执行的任务需在 kwargs 中带上 request_id，
+  再调用 cancellation.cancel(request_id)
+
+用法：
+    scheduler = Scheduler(workers=4)
+    future = scheduler.submit("edit_image", prompt="...", priority="interactive", tenant="u1", deadline=30)
+    result = future.result()
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from . import usage
+from .main import edit_image, text_to_image
+
+PRIORITY_CLASSES = ("interactive", "bulk")
+
+FUNCTIONS = {
+    "text_to_image": text_to_image,
+    "edit_image": edit_image,
+}
+
+
+class _Job:
+    def __init__(self, function: str, kwargs: dict, priority: str, tenant: str, deadline: Optional[float]):
+        self.function = function
+        self.kwargs = kwargs
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.submitted = time.monotonic()
+        self.future = Future()
+
+
+class _PriorityClass:
+    """单个优先级类别：租户 → EDF 堆，外加租户虚拟时间"""
+
+    def __init__(self):
+        self.queues: Dict[str, list] = {}
+        self.vtime: Dict[str, float] = {}
+        self.size = 0
+
+    def push(self, job: _Job, seq: int) -> None:
+        if job.tenant not in self.queues or not self.queues[job.tenant]:
+            floor = min((self.vtime[t] for t, q in self.queues.items() if q), default=0.0)
+            self.vtime[job.tenant] = max(self.vtime.get(job.tenant, 0.0), floor)
+            self.queues.setdefault(job.tenant, [])
+        key = job.deadline if job.deadline is not None else float('inf')
+        heapq.heappush(self.queues[job.tenant], (key, seq, job))
+        self.size += 1
+
+    def pop(self, weights: Dict[str, float]) -> _Job:
+        tenant = min((t for t, q in self.queues.items() if q), key=lambda t: self.vtime[t])
+        _, _, job = heapq.heappop(self.queues[tenant])
+        self.vtime[tenant] += 1.0 / weights.get(tenant, 1.0)
+        self.size -= 1
+        return job
+
+
+class Scheduler:
+    """
+    在固定数量的 worker 线程上调度 text_to_image / edit_image 调用
+
+    Args:
+        workers: worker 线程数，即最大并发调用数
+        reserved_interactive: 为交互式任务保留、bulk 任务不能占用的 worker 数，必须小于 workers
+            （bulk 任务至少能用一个 worker）；默认保留 1 个，只有 1 个 worker 时无法保留，默认为 0
+        tenant_weights: 租户权重，默认均为 1
+
+    Raises:
+        ValueError: workers 小于 1，或 reserved_interactive 不在 [0, workers) 内
+    """
+
+    def __init__(
+        self, workers: int = 4, reserved_interactive: Optional[int] = None, tenant_weights: Dict[str, float] = None
+    ):
+        if workers < 1:
+            raise ValueError("workers 必须大于 0")
+        if reserved_interactive is None:
+            reserved_interactive = min(1, workers - 1)
+        if not 0 <= reserved_interactive < workers:
+            raise ValueError(
+                f"reserved_interactive 必须在 0 到 workers - 1 之间（workers={workers}），"
+                f"实际为 {reserved_interactive}"
+            )
+        self.workers = workers
+        self.reserved_interactive = reserved_interactive
+        self.bulk_limit = workers - reserved_interactive
+        self.tenant_weights = dict(tenant_weights or {})
+        self._classes = {name: _PriorityClass() for name in PRIORITY_CLASSES}
+        self._running = {name: 0 for name in PRIORITY_CLASSES}
+        self._counters = {"submitted": 0, "completed": 0, "dropped": 0}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"imagen-scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self,
+        function: str,
+        priority: str = "interactive",
+        tenant: str = "default",
+        deadline: Optional[float] = None,
+        **kwargs,
+    ) -> Future:
+        """
+        提交一次调用
+
+        Args:
+            function: 函数名（text_to_image / edit_image）
+            priority: 优先级类别（interactive / bulk）
+            tenant: 租户标识，用于公平分享
+            deadline: 截止时间（从现在起的秒数），过期未开始的任务会被丢弃
+            **kwargs: 传给函数的参数
+
+        Returns:
+            结果为函数返回字典的 Future
+
+        Raises:
+            ValueError: 未知的函数名或优先级类别
+            RuntimeError: 调度器已关闭
+        """
+        if function not in FUNCTIONS:
+            raise ValueError(f"未知的函数: {function}，可选值: {', '.join(FUNCTIONS)}")
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级类别: {priority}，可选值: {', '.join(PRIORITY_CLASSES)}")
+
+        job = _Job(
+            function, kwargs, priority, tenant, None if deadline is None else time.monotonic() + deadline
+        )
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            self._classes[priority].push(job, next(self._seq))
+            self._counters["submitted"] += 1
+            self._cond.notify_all()
+        return job.future
+
+    def run(self, function: str, **kwargs) -> dict:
+        """提交并等待结果"""
+        return self.submit(function, **kwargs).result()
+
+    def _next_job(self) -> Optional[_Job]:
+        """在持有锁的情况下选出下一个可执行的任务"""
+        if self._classes["interactive"].size:
+            return self._classes["interactive"].pop(self.tenant_weights)
+        if self._classes["bulk"].size and self._running["bulk"] < self.bulk_limit:
+            return self._classes["bulk"].pop(self.tenant_weights)
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed and not any(c.size for c in self._classes.values()):
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+
+                # 排队期间已被 future.cancel() 取消的任务直接丢弃
+                if not job.future.set_running_or_notify_cancel():
+                    self._counters["dropped"] += 1
+                    continue
+
+                remaining = None if job.deadline is None else job.deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._counters["dropped"] += 1
+                    job.future.set_result({
+                        "success": False,
+                        "error": "任务在截止时间之前未能开始执行，已丢弃",
+                        "error_code": "REQUEST_TIMEOUT"
+                    })
+                    continue
+                self._running[job.priority] += 1
+
+            try:
+                kwargs = dict(job.kwargs)
+                if remaining is not None:
+                    kwargs["deadline"] = min(remaining, kwargs.get("deadline") or remaining)
+                with usage.tenant(job.tenant):
+                    job.future.set_result(FUNCTIONS[job.function](**kwargs))
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[job.priority] -= 1
+                    self._counters["completed"] += 1
+                    self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """返回各类别的排队与执行情况"""
+        with self._cond:
+            return {
+                **self._counters,
+                "queued": {name: c.size for name, c in self._classes.items()},
+                "running": dict(self._running),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """停止接收新任务；wait=True 时等待已排队任务执行完毕"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
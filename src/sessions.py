@@ -0,0 +1,293 @@
+"""
+多轮编辑会话
+
+会话在内存中保存对话历史（contents）和最近一次输出的图像，下一次编辑直接把
+历史与新指令发给上游，模型基于上一轮输出继续修改，无需下载、重新放入
+data/inputs/input_image/ 再编码上传。
+
+历史裁剪：
+- 以「用户轮 + 模型轮」为单位，只保留最近 max_turns 轮
+- 序列化后的总大小超过 max_history_bytes 时继续丢弃最早的轮次
+- 连最近一轮都放不下时不带历史，把最近一次输出作为内联图像放进新的用户轮
+
+配置 GEMINI_SESSION_DIR 后会话同时落盘（history.json + 最近一次输出），
+进程重启或由其他 worker 处理后续请求时可以从磁盘恢复。多个 worker 共享该目录时：
+- 获取会话和持有 session.lock 时比较 history.json 的修改时间，其他 worker 写入过就重新加载，
+  不会基于过期的历史继续编辑
+- session.lock 在进程内互斥之外还对 <会话目录>/.lock 加文件锁（fcntl.flock），同一会话的
+  「读取历史 → 调用上游 → 保存」在所有 worker 之间串行，后保存的一方不会覆盖先保存的轮次
+"""
+
+import base64
+import contextlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非 POSIX 平台只做进程内互斥
+    fcntl = None
+
+DEFAULT_MAX_TURNS = 5
+DEFAULT_MAX_HISTORY_BYTES = 16 * 1024 * 1024
+MAX_CACHED_SESSIONS = 64
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def _content_size(content: dict) -> int:
+    return len(json.dumps(content, ensure_ascii=False))
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f"{path.name}.part")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _version(history_path: Path) -> Optional[tuple]:
+    """history.json 的 (修改时间, 大小)，文件不存在时返回 None"""
+    try:
+        stat = history_path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class _SessionLock:
+    """会话锁：进程内互斥；会话落盘时再加文件锁，并在获取后从磁盘刷新会话"""
+
+    def __init__(self, session: "EditSession"):
+        self._session = session
+        self._lock = threading.Lock()
+        self._file = None
+
+    def held(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self._lock.acquire()
+        directory = self._session.directory
+        if directory is None:
+            return self
+        try:
+            session_dir = directory / self._session.session_id
+            session_dir.mkdir(parents=True, exist_ok=True)
+            self._file = open(session_dir / ".lock", "a")
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            self._session.refresh()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            # 关闭文件即释放 flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+class EditSession:
+    """单个编辑会话的历史与最近输出"""
+
+    def __init__(
+        self,
+        session_id: str,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        max_history_bytes: int = DEFAULT_MAX_HISTORY_BYTES,
+        directory: Optional[Path] = None,
+    ):
+        self.session_id = session_id
+        self.max_turns = max_turns
+        self.max_history_bytes = max_history_bytes
+        self.directory = directory
+        self.turns = []
+        self.last_image = None
+        self.last_mime_type = None
+        self.lock = _SessionLock(self)
+        self._version = None
+        # 通过 SessionStore.checkout 使用中的次数（受 SessionStore._lock 保护），大于 0 时不会被淘汰
+        self._pins = 0
+
+    @property
+    def turn_count(self) -> int:
+        return len(self.turns)
+
+    def build_contents(self, prompt_parts: List[dict]) -> List[dict]:
+        """
+        组装发送给上游的 contents：裁剪后的历史 + 新的用户轮
+
+        Args:
+            prompt_parts: 新用户轮的文本 parts
+
+        Returns:
+            contents 列表；历史为空时只包含新用户轮（图像由调用方追加）
+        """
+        kept = []
+        budget = self.max_history_bytes
+        for user_turn, model_turn in reversed(self.turns[-self.max_turns:]):
+            size = _content_size(user_turn) + _content_size(model_turn)
+            if size > budget:
+                break
+            kept[:0] = [user_turn, model_turn]
+            budget -= size
+
+        new_turn = {"role": "user", "parts": list(prompt_parts)}
+        if self.turns and not kept:
+            new_turn["parts"].append({
+                "inline_data": {
+                    "mime_type": self.last_mime_type,
+                    "data": base64.b64encode(self.last_image).decode('utf-8')
+                }
+            })
+        return kept + [new_turn]
+
+    def record(self, user_turn: dict, model_content: dict, image_bytes: bytes, mime_type: str) -> None:
+        """记录一轮对话及其输出图像"""
+        model_turn = {"role": "model", "parts": model_content.get("parts", [])}
+        self.turns.append(({"role": "user", "parts": user_turn["parts"]}, model_turn))
+        del self.turns[:-self.max_turns]
+        self.last_image = image_bytes
+        self.last_mime_type = mime_type
+
+    def save(self, directory: Path) -> None:
+        """把会话写入 directory/<session_id>/（多个 worker 共享目录时应在持有 session.lock 时调用）"""
+        session_dir = directory / self.session_id
+        session_dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(session_dir / "last_image", self.last_image or b"")
+        history = {
+            "last_mime_type": self.last_mime_type,
+            "turns": [list(pair) for pair in self.turns],
+        }
+        # history.json 最后替换：其修改时间变化即表示整个会话已更新
+        _write_atomic(session_dir / "history.json", json.dumps(history, ensure_ascii=False).encode('utf-8'))
+        self._version = _version(session_dir / "history.json")
+
+    def refresh(self) -> bool:
+        """
+        history.json 在上次加载或保存之后被改写（其他 worker 保存过）时重新加载
+
+        Returns:
+            是否重新加载
+        """
+        if self.directory is None:
+            return False
+        session_dir = self.directory / self.session_id
+        version = _version(session_dir / "history.json")
+        if version is None or version == self._version:
+            return False
+        history = json.loads((session_dir / "history.json").read_text(encoding='utf-8'))
+        self.turns = [tuple(pair) for pair in history["turns"]]
+        self.last_mime_type = history["last_mime_type"]
+        self.last_image = (session_dir / "last_image").read_bytes() or None
+        self._version = version
+        return True
+
+    @classmethod
+    def load(cls, directory: Path, session_id: str) -> Optional["EditSession"]:
+        """从 directory/<session_id>/ 恢复会话，不存在时返回 None"""
+        if not (directory / session_id / "history.json").is_file():
+            return None
+        session = cls(session_id, directory=directory)
+        session.refresh()
+        return session
+
+
+class SessionStore:
+    """
+    会话缓存：内存 LRU，配置目录时写透到磁盘（线程安全）
+
+    使用中（checkout 期间）或锁被持有的会话不会被淘汰：淘汰后再获取会新建会话和会话锁，
+    同一会话的两个进程内写入者就可能同时执行。全部会话都在使用中时缓存暂时超过 max_sessions。
+    """
+
+    def __init__(self, directory: Optional[Path] = None, max_sessions: int = MAX_CACHED_SESSIONS):
+        self.directory = directory
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, session_id: str) -> EditSession:
+        """
+        获取会话，不存在时创建
+
+        Raises:
+            ValueError: session_id 格式不正确
+        """
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError("session_id 只能包含字母、数字、下划线和连字符，且不超过 64 个字符")
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = EditSession(session_id, directory=self.directory)
+            # 缓存的会话可能已被共享目录的其他 worker 更新；持有 session.lock 时还会再检查一次
+            session.refresh()
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._evict()
+            return session
+
+    @contextlib.contextmanager
+    def checkout(self, session_id: str) -> Iterator[EditSession]:
+        """
+        获取会话并在 with 块内保持其不被淘汰；调用方在块内持有 session.lock
+
+        Raises:
+            ValueError: session_id 格式不正确
+        """
+        with self._lock:
+            session = self.get(session_id)
+            session._pins += 1
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session._pins -= 1
+                self._evict()
+
+    def _evict(self) -> None:
+        """按最久未使用的顺序淘汰超出 max_sessions 的会话，跳过使用中的（调用方持有 self._lock）"""
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        for session_id, session in list(self._sessions.items()):
+            if session._pins == 0 and not session.lock.held():
+                del self._sessions[session_id]
+                excess -= 1
+                if excess == 0:
+                    return
+
+    def save(self, session: EditSession) -> None:
+        if self.directory is not None:
+            session.save(self.directory)
+
+    def drop(self, session_id: str) -> None:
+        """结束会话并删除其缓存"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+_store = None
+_store_dir = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """返回进程内共享的会话缓存；GEMINI_SESSION_DIR 变化后自动重建"""
+    global _store, _store_dir
+
+    directory = os.environ.get('GEMINI_SESSION_DIR') or None
+    with _store_lock:
+        if _store is None or directory != _store_dir:
+            _store = SessionStore(Path(directory) if directory else None)
+            _store_dir = directory
+        return _store
@@ -0,0 +1,386 @@
+"""
+可插拔的输出目标与后台上传队列
+
+默认情况下输出写入 data/outputs/，由平台在调用结束后上传。配置 GEMINI_OUTPUT_SINK 后改为写入：
+- local：本地目录（GEMINI_SINK_DIR，默认 data/outputs），先写临时文件再原子重命名
+- memory：进程内存，便于测试和嵌入式使用
+- s3：S3 兼容的对象存储，使用 AWS Signature V4 签名的 REST 请求，
+  超过 GEMINI_S3_MULTIPART_BYTES（默认 8MiB）的图像使用分片上传
+
+设置 GEMINI_SINK_ASYNC=1 后写入经过后台上传队列：调用在图像入队后即返回，
+存储 I/O 不再位于请求的关键路径上。队列以固定数量的线程并发上传（GEMINI_SINK_CONCURRENCY，默认 4），
+排队数达到上限时入队阻塞形成背压；失败的上传重试 UPLOAD_ATTEMPTS 次，仍失败则计入 stats()。
+
+S3 配置：GEMINI_S3_ENDPOINT、GEMINI_S3_BUCKET、GEMINI_S3_ACCESS_KEY、GEMINI_S3_SECRET_KEY、
+GEMINI_S3_REGION（默认 us-east-1）、GEMINI_S3_PREFIX（对象键前缀）。使用路径风格地址：{endpoint}/{bucket}/{key}。
+"""
+
+import abc
+import hashlib
+import hmac
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, quote, urlsplit
+
+import requests
+
+SINK_TYPES = ("local", "memory", "s3")
+DEFAULT_SINK_DIR = "data/outputs"
+DEFAULT_MULTIPART_BYTES = 8 * 1024 * 1024
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_PENDING = 64
+UPLOAD_ATTEMPTS = 3
+S3_TIMEOUT = (5.0, 60.0)
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class OutputSink(abc.ABC):
+    """输出目标接口：write() 写入一个对象并返回其 URI"""
+
+    @abc.abstractmethod
+    def write(self, name: str, data: bytes, content_type: str = "image/png") -> str:
+        """写入一个对象，返回其 URI"""
+
+    @abc.abstractmethod
+    def uri(self, name: str) -> str:
+        """对象写入后的 URI（入队时即可确定）"""
+
+
+class LocalSink(OutputSink):
+    """本地目录"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def uri(self, name: str) -> str:
+        return str(self.directory / name)
+
+    def write(self, name: str, data: bytes, content_type: str = "image/png") -> str:
+        path = self.directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.part")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return str(path)
+
+
+class MemorySink(OutputSink):
+    """进程内存（线程安全）"""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def uri(self, name: str) -> str:
+        return f"memory://{name}"
+
+    def write(self, name: str, data: bytes, content_type: str = "image/png") -> str:
+        with self._lock:
+            self.objects[name] = data
+        return self.uri(name)
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            return self.objects.get(name)
+
+
+def sign_v4(
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    payload_hash: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    service: str = "s3",
+    now: Optional[datetime] = None,
+) -> Dict[str, str]:
+    """
+    按 AWS Signature Version 4 为请求签名
+
+    Args:
+        headers: 需要签名的额外请求头（不含 host / x-amz-date / x-amz-content-sha256）
+        payload_hash: 请求体的 SHA-256 十六进制摘要
+
+    Returns:
+        加上 x-amz-date、x-amz-content-sha256 和 Authorization 之后的完整请求头
+    """
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+    parts = urlsplit(url)
+
+    signed = {k.lower(): str(v).strip() for k, v in headers.items()}
+    signed.update({"host": parts.netloc, "x-amz-date": amz_date, "x-amz-content-sha256": payload_hash})
+    names = sorted(signed)
+
+    canonical_query = "&".join(
+        f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+        for k, v in sorted(parse_qsl(parts.query, keep_blank_values=True))
+    )
+    canonical_request = "\n".join([
+        method,
+        parts.path or "/",
+        canonical_query,
+        "".join(f"{name}:{signed[name]}\n" for name in names),
+        ";".join(names),
+        payload_hash,
+    ])
+    scope = f"{date}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+    ])
+
+    key = f"AWS4{secret_key}".encode('utf-8')
+    for item in (date, region, service, "aws4_request"):
+        key = hmac.new(key, item.encode('utf-8'), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    result = {k: v for k, v in signed.items() if k != "host"}
+    result["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={';'.join(names)}, Signature={signature}"
+    )
+    return result
+
+
+class S3Sink(OutputSink):
+    """
+    S3 兼容对象存储（路径风格地址）
+
+    Args:
+        endpoint: 服务地址，例如 https://s3.us-east-1.amazonaws.com 或 http://127.0.0.1:9000
+        bucket: 存储桶
+        access_key / secret_key: 访问密钥
+        region: 签名使用的区域
+        prefix: 对象键前缀
+        multipart_bytes: 达到该大小的对象使用分片上传，同时也是分片大小（S3 要求除最后一片外不小于 5MiB）
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        prefix: str = "",
+        multipart_bytes: int = DEFAULT_MULTIPART_BYTES,
+    ):
+        self.endpoint = endpoint.rstrip('/')
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self.multipart_bytes = multipart_bytes
+
+    def _url(self, name: str, query: str = "") -> str:
+        key = quote(f"{self.prefix}{name}", safe="/-_.~")
+        return f"{self.endpoint}/{self.bucket}/{key}" + (f"?{query}" if query else "")
+
+    def uri(self, name: str) -> str:
+        return f"s3://{self.bucket}/{self.prefix}{name}"
+
+    def _request(self, method: str, url: str, data: bytes = b"", headers: Optional[dict] = None):
+        signed = sign_v4(
+            method, url, headers or {}, hashlib.sha256(data).hexdigest() if data else EMPTY_SHA256,
+            self.access_key, self.secret_key, self.region,
+        )
+        response = requests.request(method, url, data=data, headers=signed, timeout=S3_TIMEOUT)
+        response.raise_for_status()
+        return response
+
+    def write(self, name: str, data: bytes, content_type: str = "image/png") -> str:
+        """
+        上传对象
+
+        Raises:
+            requests.exceptions.RequestException: 上传失败（分片上传失败时会先中止该上传）
+        """
+        if len(data) < self.multipart_bytes:
+            self._request("PUT", self._url(name), data, {"content-type": content_type})
+        else:
+            self._write_multipart(name, data, content_type)
+        return self.uri(name)
+
+    def _write_multipart(self, name: str, data: bytes, content_type: str) -> None:
+        response = self._request("POST", self._url(name, "uploads="), headers={"content-type": content_type})
+        match = re.search(r"<UploadId>([^<]+)</UploadId>", response.text)
+        if match is None:
+            raise requests.exceptions.RequestException("分片上传初始化响应中缺少 UploadId")
+        upload_id = match.group(1)
+        query_id = quote(upload_id, safe='')
+
+        try:
+            part_size = self.multipart_bytes
+            etags = []
+            view = memoryview(data)
+            for number, offset in enumerate(range(0, len(data), part_size), start=1):
+                chunk = bytes(view[offset:offset + part_size])
+                response = self._request("PUT", self._url(name, f"partNumber={number}&uploadId={query_id}"), chunk)
+                etags.append(response.headers.get("ETag", ""))
+
+            body = "<CompleteMultipartUpload>" + "".join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                for number, etag in enumerate(etags, start=1)
+            ) + "</CompleteMultipartUpload>"
+            self._request("POST", self._url(name, f"uploadId={query_id}"), body.encode('utf-8'))
+        except requests.exceptions.RequestException:
+            try:
+                self._request("DELETE", self._url(name, f"uploadId={query_id}"))
+            except requests.exceptions.RequestException:
+                pass
+            raise
+
+
+class UploadQueue:
+    """
+    后台上传队列：固定数量的线程并发写入 sink，排队数有上限（线程安全）
+
+    Args:
+        sink: 输出目标
+        concurrency: 并发上传线程数
+        max_pending: 最大排队数，达到后 submit 阻塞
+    """
+
+    def __init__(
+        self, sink: OutputSink, concurrency: int = DEFAULT_CONCURRENCY, max_pending: int = DEFAULT_MAX_PENDING
+    ):
+        self.sink = sink
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._counters = {"queued": 0, "uploaded": 0, "failed": 0, "retried": 0, "bytes": 0}
+        self.last_error = None
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"imagen-upload-{i}", daemon=True) for i in range(concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, name: str, data: bytes, content_type: str = "image/png") -> Future:
+        """入队一次写入，返回结果为 URI 的 Future"""
+        future = Future()
+        with self._lock:
+            self._counters["queued"] += 1
+        self._queue.put((name, data, content_type, future))
+        return future
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            name, data, content_type, future = item
+            try:
+                for attempt in range(UPLOAD_ATTEMPTS):
+                    try:
+                        uri = self.sink.write(name, data, content_type)
+                        break
+                    except Exception:
+                        if attempt == UPLOAD_ATTEMPTS - 1:
+                            raise
+                        with self._lock:
+                            self._counters["retried"] += 1
+                        time.sleep(0.2 * 2 ** attempt)
+                with self._lock:
+                    self._counters["uploaded"] += 1
+                    self._counters["bytes"] += len(data)
+                future.set_result(uri)
+            except Exception as e:
+                with self._lock:
+                    self._counters["failed"] += 1
+                    self.last_error = str(e)
+                future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """等待所有已入队的写入完成"""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "pending": self._queue.qsize(), "last_error": self.last_error}
+
+    def close(self) -> None:
+        """写完已入队的对象后停止工作线程"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def load_sink() -> Optional[OutputSink]:
+    """
+    根据环境变量创建输出目标；未配置 GEMINI_OUTPUT_SINK 时返回 None（使用默认的 data/outputs/）
+
+    Raises:
+        ValueError: 未知的类型或 S3 配置不完整
+    """
+    sink_type = os.environ.get('GEMINI_OUTPUT_SINK')
+    if not sink_type:
+        return None
+    if sink_type == "local":
+        return LocalSink(Path(os.environ.get('GEMINI_SINK_DIR') or DEFAULT_SINK_DIR))
+    if sink_type == "memory":
+        return MemorySink()
+    if sink_type == "s3":
+        missing = [
+            name for name in ('GEMINI_S3_ENDPOINT', 'GEMINI_S3_BUCKET', 'GEMINI_S3_ACCESS_KEY', 'GEMINI_S3_SECRET_KEY')
+            if not os.environ.get(name)
+        ]
+        if missing:
+            raise ValueError(f"S3 输出目标缺少配置: {', '.join(missing)}")
+        return S3Sink(
+            os.environ['GEMINI_S3_ENDPOINT'],
+            os.environ['GEMINI_S3_BUCKET'],
+            os.environ['GEMINI_S3_ACCESS_KEY'],
+            os.environ['GEMINI_S3_SECRET_KEY'],
+            region=os.environ.get('GEMINI_S3_REGION', 'us-east-1'),
+            prefix=os.environ.get('GEMINI_S3_PREFIX', ''),
+            multipart_bytes=int(os.environ.get('GEMINI_S3_MULTIPART_BYTES', DEFAULT_MULTIPART_BYTES)),
+        )
+    raise ValueError(f"未知的输出目标: {sink_type}，可选值: {', '.join(SINK_TYPES)}")
+
+
+_sink = None
+_queue = None
+_sink_config = None
+_sink_lock = threading.Lock()
+
+_CONFIG_KEYS = (
+    'GEMINI_OUTPUT_SINK', 'GEMINI_SINK_DIR', 'GEMINI_SINK_ASYNC', 'GEMINI_SINK_CONCURRENCY',
+    'GEMINI_S3_ENDPOINT', 'GEMINI_S3_BUCKET', 'GEMINI_S3_ACCESS_KEY', 'GEMINI_S3_SECRET_KEY',
+    'GEMINI_S3_REGION', 'GEMINI_S3_PREFIX', 'GEMINI_S3_MULTIPART_BYTES',
+)
+
+
+def get_sink() -> tuple:
+    """
+    返回进程内共享的 (输出目标, 上传队列)；相关环境变量变化后自动重建
+
+    未配置 GEMINI_OUTPUT_SINK 时为 (None, None)；未开启 GEMINI_SINK_ASYNC 时上传队列为 None。
+    重建时旧队列中已入队的对象会先写完。
+    """
+    global _sink, _queue, _sink_config
+
+    config = tuple(os.environ.get(name) for name in _CONFIG_KEYS)
+    with _sink_lock:
+        if config != _sink_config:
+            if _queue is not None:
+                _queue.close()
+            _sink = load_sink()
+            _queue = None
+            if _sink is not None and os.environ.get('GEMINI_SINK_ASYNC', '0') == '1':
+                concurrency = int(os.environ.get('GEMINI_SINK_CONCURRENCY', DEFAULT_CONCURRENCY))
+                _queue = UploadQueue(_sink, concurrency)
+            _sink_config = config
+        return _sink, _queue
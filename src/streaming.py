@@ -0,0 +1,246 @@
+"""
+流式生成（streamGenerateContent）
+
+使用 Gemini 的 :streamGenerateContent?alt=sse 接口，按 Server-Sent Events
+逐块解析响应：
+- 图像 part 一旦到达即解码并写入输出目录（先写临时文件再原子重命名，
+  避免平台上传到半截文件）
+- 文本 part 一旦到达即作为 text 事件发出：text_to_image / edit_image 的调用方通过
+  events.run / events.iter_events 实时收到；直接调用 stream_generate_content 时也可传入 on_text 回调
+
+即使后续分块因超时中断，已经落盘的图像依然保留，调用方可据此返回部分结果。
+读超时只限制相邻两个分块之间的间隔；传入 deadline 时每个分块到达后检查整次调用的剩余时间，
+服务端持续缓慢地发送分块也不会超出调用方的 deadline。
+传入取消令牌时，取消会立即关闭响应、中断传输，之后的分块不再解码写盘。
+"""
+
+import base64
+import functools
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from . import transport
+from .cancellation import CancelToken, abort_response, call_cancellable
+from .contents import encode_body
+from .events import NULL_EMITTER, EventEmitter
+from .routing import parse_retry_after
+from .timeouts import NO_DEADLINE, Deadline
+from .usage import parse_usage
+
+
+def iter_sse_events(lines: Iterable) -> Iterator[str]:
+    """
+    将 SSE 文本行序列解析为事件数据
+
+    按 SSE 规范处理：同一事件内的多行 data 用换行拼接，空行表示事件结束，
+    以冒号开头的注释行（如心跳）会被忽略。
+
+    Args:
+        lines: 逐行迭代的 SSE 响应内容（str 或 bytes，不含行尾换行符）
+
+    Yields:
+        每个事件的 data 字段内容
+    """
+    data_lines = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r')
+
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+
+        if line.startswith(':'):
+            continue
+
+        field, _, value = line.partition(':')
+        if field == 'data':
+            data_lines.append(value[1:] if value.startswith(' ') else value)
+
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+def _output_name(filename: str, index: int) -> str:
+    """第一张图沿用原文件名，后续图像追加序号：generated_image_1.png ..."""
+    if index == 0:
+        return filename
+    path = Path(filename)
+    return f"{path.stem}_{index}{path.suffix}"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """先写入同目录临时文件再重命名，保证输出目录中不出现写了一半的图像（临时文件名唯一，并发写同名输出互不干扰）"""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def stream_generate_content(
+    url: str,
+    headers: dict,
+    payload: dict,
+    output_dir: Path,
+    filename: str,
+    timeout,
+    on_text: Optional[Callable[[str], None]] = None,
+    cancel_token: Optional[CancelToken] = None,
+    write_image: Optional[Callable[[str, bytes], object]] = None,
+    emit: EventEmitter = NULL_EMITTER,
+    deadline: Deadline = NO_DEADLINE,
+) -> dict:
+    """
+    调用 streamGenerateContent 接口并边接收边处理
+
+    Args:
+        url: 流式接口地址（需带 alt=sse 参数）
+        headers: 请求头
+        payload: 请求体（与 generateContent 相同），可以是已序列化的字节
+        output_dir: 图像输出目录
+        filename: 第一张图像的文件名，后续图像自动追加序号
+        timeout: 连接超时及相邻两个分块之间的最大等待时间（秒，或 (连接超时, 读超时) 元组）
+        on_text: 文本 part 回调，每收到一段文本调用一次
+        cancel_token: 取消令牌，取消后关闭响应并抛出 RequestCancelled
+        write_image: 图像写出函数 (文件名, 图像字节)，默认原子写入 output_dir；自定义写出函数负责发送 written 事件
+        emit: events.EventEmitter，发送 first_byte/text/image_decoded/written 事件
+        deadline: 整次调用的截止时间（timeouts.Deadline），超过后与读超时同样处理
+
+    Returns:
+        包含以下字段的字典：
+            - success: 是否成功
+            - images: 已写入的图像文件名列表
+            - text: 拼接后的全部文本
+            - partial: 是否因超时/断连提前结束（仅在已有图像时为 True）
+            - first_byte_ms: 从发出请求到收到首个分块的耗时（毫秒）
+            - usage: 最后一次 usageMetadata 转换后的 token 用量（响应带 usageMetadata 时）
+            - error / error_code: 失败时的错误信息（HTTP 失败时附带 status_code/retry_after）
+
+    Raises:
+        RequestCancelled: 请求被取消（已写出的图像保留）
+        requests.exceptions.RequestException: 尚未写出任何图像就发生网络错误或超时（含超过 deadline）
+        ValueError: 分块不是合法 JSON
+    """
+    body = payload if isinstance(payload, bytes) else encode_body(payload)
+    images = []
+    texts = []
+    usage = None
+    first_byte_ms = None
+    started = time.monotonic()
+
+    response = call_cancellable(
+        lambda: transport.post(url, headers=headers, data=body, timeout=timeout, stream=True),
+        cancel_token,
+        cleanup=abort_response,
+    )
+    emit("first_byte", status_code=response.status_code)
+    abort = functools.partial(abort_response, response)
+    if cancel_token is not None:
+        cancel_token.add_callback(abort)
+
+    try:
+        if response.status_code != 200:
+            return {
+                "success": False,
+                "error": f"API 请求失败: {response.status_code} - {response.text}",
+                "error_code": "API_REQUEST_FAILED",
+                "status_code": response.status_code,
+                "retry_after": parse_retry_after(response.headers.get("Retry-After"))
+            }
+
+        try:
+            # chunk_size=None：按服务端分块到达即处理，而不是攒满固定字节数
+            for event in iter_sse_events(response.iter_lines(chunk_size=None)):
+                if first_byte_ms is None:
+                    first_byte_ms = round((time.monotonic() - started) * 1000, 1)
+
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                deadline.check()
+                chunk = json.loads(event)
+                # usageMetadata 随分块累计，以最后一次为准
+                usage = parse_usage(chunk.get("usageMetadata")) or usage
+                for candidate in chunk.get("candidates") or []:
+                    for part in (candidate.get("content") or {}).get("parts") or []:
+                        if "text" in part:
+                            texts.append(part["text"])
+                            emit("text", text=part["text"])
+                            if on_text is not None:
+                                on_text(part["text"])
+                        elif "inlineData" in part:
+                            if cancel_token is not None:
+                                cancel_token.raise_if_cancelled()
+                            name = _output_name(filename, len(images))
+                            image_bytes = base64.b64decode(part["inlineData"]["data"])
+                            emit(
+                                "image_decoded", bytes=len(image_bytes),
+                                mime_type=part["inlineData"].get("mimeType", "image/png")
+                            )
+                            if write_image is not None:
+                                write_image(name, image_bytes)
+                            else:
+                                output_dir.mkdir(parents=True, exist_ok=True)
+                                _write_atomic(output_dir / name, image_bytes)
+                                emit(
+                                    "written", path=str(output_dir / name), bytes=len(image_bytes),
+                                    sha256=hashlib.sha256(image_bytes).hexdigest() if emit.digests else None
+                                )
+                            images.append(name)
+        except requests.exceptions.RequestException as e:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if not images:
+                # requests 在读取流时把读超时包装成 ConnectionError，这里还原为 Timeout
+                if e.args and isinstance(e.args[0], ReadTimeoutError):
+                    raise requests.exceptions.Timeout(str(e)) from e
+                raise
+            return _with_usage({
+                "success": True,
+                "images": images,
+                "text": "".join(texts),
+                "partial": True,
+                "first_byte_ms": first_byte_ms,
+            }, usage)
+        except Exception:
+            # 取消时从其他线程关闭响应，读取端可能抛出各种底层错误
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            raise
+
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(abort)
+        response.close()
+
+    if not images:
+        return {
+            "success": False,
+            "error": "API 响应中没有生成的图像数据",
+            "error_code": "NO_IMAGE_DATA"
+        }
+
+    return _with_usage({
+        "success": True,
+        "images": images,
+        "text": "".join(texts),
+        "partial": False,
+        "first_byte_ms": first_byte_ms,
+    }, usage)
+
+
+def _with_usage(result: dict, usage: Optional[dict]) -> dict:
+    if usage is not None:
+        result["usage"] = usage
+    return result
@@ -0,0 +1,209 @@
+"""
+超大图像的分块并行编辑
+
+超过模型实际输入尺寸的图像要么失败，要么被上游缩小。分块模式下：
+- 输入按 tile_size 切成相互重叠的分块（重叠宽度 GEMINI_TILE_OVERLAP，默认 64 像素）
+- 分块由有界线程池并发发送（GEMINI_TILE_CONCURRENCY，默认 4），每块各自经过准入控制和路由
+- 单个分块失败只重试该分块（GEMINI_TILE_ATTEMPTS，默认 3 次），不必整张重来；只重试超时、网络错误、
+  429 和 5xx，参数错误等其他 4xx 和安全拦截重试也不会成功，立即失败
+- 返回的分块缩放回原尺寸后按位置拼接，重叠区域线性渐变混合，消除接缝
+
+依赖 Pillow（可选依赖，pip install "imagen[region]"）。
+"""
+
+import contextvars
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import profiling
+
+try:
+    from PIL import Image, ImageChops
+except ImportError:  # pragma: no cover - 取决于运行环境
+    Image = None
+
+DEFAULT_OVERLAP = 64
+DEFAULT_CONCURRENCY = 4
+DEFAULT_ATTEMPTS = 3
+# 分块重试前的等待（秒），按尝试次数线性增加
+RETRY_BACKOFF = 0.5
+
+# 没有 HTTP 状态码时值得重试的错误代码
+RETRYABLE_ERROR_CODES = frozenset({"REQUEST_TIMEOUT", "NETWORK_ERROR"})
+
+TILE_PROMPT = (
+    "这是一张大图中的一个分块（第 {index}/{total} 块），请保持构图、视角和尺寸不变，"
+    "修改要与相邻分块自然衔接：{prompt}"
+)
+
+
+def tile_overlap() -> int:
+    return int(os.environ.get('GEMINI_TILE_OVERLAP', DEFAULT_OVERLAP))
+
+
+def _positions(length: int, tile: int, step: int) -> List[int]:
+    """一维上的分块起点：等步长排列，最后一块与末端对齐"""
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile, step))
+    positions.append(length - tile)
+    return positions
+
+
+class TiledImage:
+    """
+    把一张图像切成重叠分块，并把处理后的分块拼回原尺寸
+
+    Args:
+        image_bytes: 原图字节
+        tile_size: 分块边长（像素）
+        overlap: 相邻分块的重叠宽度（像素），默认读取 GEMINI_TILE_OVERLAP
+
+    Raises:
+        ValueError: 图像无法解析，或 tile_size 不大于两倍重叠宽度
+    """
+
+    def __init__(self, image_bytes: bytes, tile_size: int, overlap: Optional[int] = None):
+        self.overlap = tile_overlap() if overlap is None else overlap
+        if tile_size <= 2 * self.overlap:
+            raise ValueError(f"tile_size 必须大于两倍重叠宽度（{2 * self.overlap} 像素）")
+        try:
+            self.image = Image.open(io.BytesIO(image_bytes))
+            self.image.load()
+        except Exception as e:
+            raise ValueError(f"输入图像无法解析: {e}") from e
+
+        self.mode = "RGBA" if "A" in self.image.getbands() or "transparency" in self.image.info else "RGB"
+        width, height = self.image.size
+        self.tile_width = min(tile_size, width)
+        self.tile_height = min(tile_size, height)
+        step = tile_size - self.overlap
+        self.xs = _positions(width, self.tile_width, step)
+        self.ys = _positions(height, self.tile_height, step)
+
+    @property
+    def boxes(self) -> List[Tuple[int, int, int, int]]:
+        """按行优先排列的分块 (left, top, right, bottom)"""
+        return [(x, y, x + self.tile_width, y + self.tile_height) for y in self.ys for x in self.xs]
+
+    def tile(self, index: int) -> Tuple[bytes, str]:
+        """返回第 index 个分块的 (PNG 字节, "image/png")"""
+        return _encode(self.image.crop(self.boxes[index])), "image/png"
+
+    def stitch(self, patches: Dict[int, bytes]) -> bytes:
+        """
+        按行优先顺序把处理后的分块贴回原图，与左侧、上方已贴分块的重叠区域线性渐变混合
+
+        Args:
+            patches: {分块序号: 图像字节}，缺失的分块保留原图内容
+
+        Returns:
+            完整分辨率的 PNG 字节
+        """
+        canvas = self.image.convert(self.mode)
+        size = (self.tile_width, self.tile_height)
+        columns = len(self.xs)
+        for index, box in enumerate(self.boxes):
+            if index not in patches:
+                continue
+            patch = Image.open(io.BytesIO(patches[index])).convert(self.mode)
+            if patch.size != size:
+                patch = patch.resize(size, Image.LANCZOS)
+
+            row, column = divmod(index, columns)
+            ramp_x = self.xs[column - 1] + self.tile_width - self.xs[column] if column else 0
+            ramp_y = self.ys[row - 1] + self.tile_height - self.ys[row] if row else 0
+            canvas.paste(patch, box[:2], _seam_mask(size, ramp_x, ramp_y))
+        return _encode(canvas)
+
+
+def _seam_mask(size: Tuple[int, int], ramp_x: int, ramp_y: int):
+    """分块的混合蒙版：左侧 ramp_x、上方 ramp_y 像素内从 0 渐变到 255，其余为 255"""
+    mask = Image.new("L", size, 255)
+    if ramp_x > 0:
+        # linear_gradient 是自上而下 0→255 的 256x256 渐变，逆时针旋转 90° 后为自左向右
+        mask.paste(Image.linear_gradient("L").rotate(90).resize((ramp_x, size[1])), (0, 0))
+    if ramp_y > 0:
+        vertical = Image.new("L", size, 255)
+        vertical.paste(Image.linear_gradient("L").resize((size[0], ramp_y)), (0, 0))
+        mask = ImageChops.multiply(mask, vertical)
+    return mask
+
+
+def _encode(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def is_retryable(result: dict) -> bool:
+    """失败结果是否值得重试：超时、网络错误、HTTP 429 和 5xx"""
+    status_code = result.get("status_code")
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return result.get("error_code") in RETRYABLE_ERROR_CODES
+
+
+def process_tiles(
+    count: int,
+    process: Callable[[int], dict],
+    concurrency: Optional[int] = None,
+    attempts: Optional[int] = None,
+    on_progress: Optional[Callable[..., None]] = None,
+    retry: Optional[Callable[[dict], bool]] = None,
+) -> Tuple[Dict[int, dict], Dict[int, dict]]:
+    """
+    用有界线程池并发处理分块，失败的分块单独重试
+
+    Args:
+        count: 分块数
+        process: 处理单个分块的函数，返回带 success 的结果字典；抛出的异常（如取消）会终止整个处理
+        concurrency: 并发数，默认读取 GEMINI_TILE_CONCURRENCY
+        attempts: 每个分块的最多尝试次数，默认读取 GEMINI_TILE_ATTEMPTS
+        on_progress: 进度回调 on_progress(index=, status=, attempt=, completed=, total=, ...)，
+            status 为 done / retry / failed，在工作线程中调用
+        retry: 判断失败结果是否值得重试，默认为 is_retryable
+
+    Returns:
+        (成功的 {序号: 结果}, 重试后仍失败的 {序号: 最后一次结果})
+    """
+    concurrency = concurrency or int(os.environ.get('GEMINI_TILE_CONCURRENCY', DEFAULT_CONCURRENCY))
+    attempts = attempts or int(os.environ.get('GEMINI_TILE_ATTEMPTS', DEFAULT_ATTEMPTS))
+    retry = retry or is_retryable
+    succeeded, failed = {}, {}
+    lock = threading.Lock()
+
+    def report(index, status, attempt, **data):
+        if on_progress is None:
+            return
+        with lock:
+            completed = len(succeeded) + len(failed)
+        on_progress(index=index, status=status, attempt=attempt, completed=completed, total=count, **data)
+
+    def run(index):
+        profiling.track_thread()
+        for attempt in range(1, attempts + 1):
+            result = process(index)
+            if result.get("success"):
+                with lock:
+                    succeeded[index] = result
+                report(index, "done", attempt)
+                return
+            if attempt == attempts or not retry(result):
+                break
+            report(index, "retry", attempt, error_code=result.get("error_code"))
+            time.sleep(RETRY_BACKOFF * attempt)
+        with lock:
+            failed[index] = result
+        report(index, "failed", attempt, error_code=result.get("error_code"))
+
+    with ThreadPoolExecutor(max(1, min(concurrency, count))) as executor:
+        # 每个分块在调用方上下文的副本中执行，保留 usage.tenant() 等上下文变量
+        futures = [executor.submit(contextvars.copy_context().run, run, index) for index in range(count)]
+        for future in futures:
+            future.result()
+    return succeeded, failed
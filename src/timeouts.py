@@ -0,0 +1,163 @@
+"""
+基于观测延迟的自适应超时
+
+按函数（edit_image 再按输入大小分桶）维护最近的延迟样本，
+读超时 = 高分位延迟 × 安全系数，并限制在 [floor, ceiling] 之间：
+- 样本不足 min_samples 时直接使用 ceiling（即模型注册表中的超时）
+- 超时的请求以超时时长作为样本记入，上游整体变慢时估计值会随之上升，不会卡死在过短的超时上
+
+连接超时无法从 requests 的耗时中单独观测，固定为 CONNECT_TIMEOUT（不超过读超时）。
+
+调用方传入的 deadline 是整次调用的最长等待时间：调用开始时换算为 Deadline（time.monotonic() 绝对时间），
+准入排队、配额限流、文件上传、各个请求（含分块和动画帧的重试）和流式读取都从同一个剩余时间中扣除；
+每个请求的读超时取 min(剩余时间, ceiling)，剩余时间耗尽时抛出 DeadlineExceeded（即 REQUEST_TIMEOUT）。
+
+设置环境变量 GEMINI_ADAPTIVE_TIMEOUTS=0 可关闭自适应，始终使用注册表中的超时。
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+import requests
+
+CONNECT_TIMEOUT = 5.0
+
+# edit_image 输入大小分桶上界（字节），超过最后一档归入 "large"
+SIZE_BUCKETS = (
+    (256 * 1024, "256k"),
+    (1024 * 1024, "1m"),
+    (4 * 1024 * 1024, "4m"),
+)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """整次调用的 deadline 已耗尽（按请求超时处理）"""
+
+
+class Deadline:
+    """
+    一次调用的截止时间
+
+    Args:
+        seconds: 从现在起的秒数，None 表示不限
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数（不小于 0），不限时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def bound(self, wait: Optional[float]) -> Optional[float]:
+        """把一段等待时间限制在剩余时间内（wait 为 None 表示不限）"""
+        remaining = self.remaining()
+        if remaining is None:
+            return wait
+        return remaining if wait is None else min(wait, remaining)
+
+    def check(self) -> None:
+        """
+        Raises:
+            DeadlineExceeded: 已过截止时间
+        """
+        if self.expired():
+            raise DeadlineExceeded("已超过本次调用的 deadline")
+
+
+NO_DEADLINE = Deadline()
+
+
+def size_bucket(size_bytes: int) -> str:
+    """返回输入大小所在的分桶名称"""
+    for limit, name in SIZE_BUCKETS:
+        if size_bytes <= limit:
+            return name
+    return "large"
+
+
+def latency_key(function: str, size_bytes: Optional[int] = None) -> str:
+    """延迟统计键：text_to_image，或 edit_image:<分桶>"""
+    if size_bytes is None:
+        return function
+    return f"{function}:{size_bucket(size_bytes)}"
+
+
+class AdaptiveTimeouts:
+    """按键维护滚动延迟样本并推导超时（线程安全）"""
+
+    def __init__(
+        self,
+        quantile: float = 0.99,
+        safety_factor: float = 1.5,
+        floor: float = 10.0,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.quantile = quantile
+        self.safety_factor = safety_factor
+        self.floor = floor
+        self.min_samples = min_samples
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, latency: float) -> None:
+        """记录一次请求耗时（秒）"""
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def quantile_of(self, key: str) -> Optional[float]:
+        """返回指定键的高分位延迟，样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[max(0, math.ceil(len(samples) * self.quantile) - 1)]
+
+    def read_timeout(self, key: str, ceiling: float) -> float:
+        """推导读超时：高分位 × 安全系数，限制在 [floor, ceiling]"""
+        observed = self.quantile_of(key)
+        if observed is None:
+            return ceiling
+        return min(ceiling, max(self.floor, observed * self.safety_factor))
+
+    def timeout_for(self, key: str, ceiling: float, deadline: Optional[float] = None) -> Tuple[float, float]:
+        """
+        返回 requests 使用的 (连接超时, 读超时)
+
+        Args:
+            key: 延迟统计键（见 latency_key）
+            ceiling: 超时上限，通常为模型注册表中的超时
+            deadline: 整次调用的剩余时间（秒，见 Deadline.remaining），优先于自适应结果，不超过 ceiling
+        """
+        if deadline is not None:
+            read = min(deadline, ceiling)
+        elif os.environ.get('GEMINI_ADAPTIVE_TIMEOUTS', '1') == '0':
+            read = ceiling
+        else:
+            read = self.read_timeout(key, ceiling)
+        return (min(CONNECT_TIMEOUT, read), read)
+
+    def snapshot(self) -> dict:
+        """返回各键的样本数与当前高分位延迟"""
+        with self._lock:
+            keys = list(self._samples)
+        return {key: {"samples": len(self._samples[key]), "quantile": self.quantile_of(key)} for key in keys}
+
+
+_timeouts = AdaptiveTimeouts()
+
+
+def get_timeouts() -> AdaptiveTimeouts:
+    """返回进程内共享的自适应超时实例"""
+    return _timeouts
@@ -0,0 +1,417 @@
+"""
+可插拔的 HTTP 传输层：录制与回放
+
+Gemini 调用（main / streaming / files / batch）统一经由 post() / get() 发出。默认直接调用 requests.post
+（开启连接预热时改用预热的连接池会话，见 warmup 模块）；
+安装了传输适配器（requests 的 Transport Adapter）时改由该适配器收发（每个适配器复用同一个会话）：
+- RecordingAdapter：照常访问网络，同时把请求/响应录制到磁带文件
+- ReplayAdapter：不访问网络，从磁带中取出匹配的响应返回，可按录制时的节奏（首字节延迟、分块到达时间）回放
+
+磁带是 gzip 压缩的记录流，每条记录为一行 JSON 头加紧跟其后的原始响应体字节（不做 base64），
+多 MB 的图像响应也能紧凑保存。录制时会脱敏：
+- 请求头中的 x-goog-api-key / Authorization 等替换为 REDACTED，URL 中的 key 参数同理
+- 请求体只保存 SHA-256 和大小（用于回放时匹配），不保存输入图像
+- 响应的 Set-Cookie 不保存
+
+配置：
+- GEMINI_TRANSPORT：record:<磁带路径> 或 replay:<磁带路径>，未配置时直连
+- GEMINI_REPLAY_TIMING：回放节奏倍率，0（默认）立即返回，1 按原始耗时，0.5 为两倍速
+
+也可以在代码中临时安装：
+    with transport.use(ReplayAdapter("tests/cassettes/edit.cassette", timing=1)):
+        edit_image(prompt="...")
+"""
+
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .warmup import get_warm_pool
+
+CASSETTE_VERSION = 1
+REDACTED = "REDACTED"
+REDACTED_HEADERS = {"x-goog-api-key", "authorization", "cookie", "proxy-authorization"}
+REDACTED_PARAMS = {"key", "api_key"}
+# 响应体按解码后的内容保存，这些描述传输编码的响应头回放时不再适用
+DROPPED_RESPONSE_HEADERS = {"set-cookie", "content-encoding", "content-length", "transfer-encoding"}
+# 录制时每次从 socket 读取的最大字节数；分块传输的响应按服务端分块逐个读取
+RECORD_CHUNK_SIZE = 64 * 1024
+
+
+class CassetteMiss(requests.exceptions.RequestException):
+    """回放磁带中没有与请求匹配的记录"""
+
+
+def redact_url(url: str) -> str:
+    """把 URL 查询参数中的密钥替换为 REDACTED"""
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(k, REDACTED if k.lower() in REDACTED_PARAMS else v) for k, v in parse_qsl(parts.query, True)]
+    return urlunsplit(parts._replace(query=urlencode(query, safe=":/")))
+
+
+def _body_digest(body) -> Optional[str]:
+    if body is None:
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, (bytes, bytearray)):
+        return None
+    return hashlib.sha256(body).hexdigest()
+
+
+def _body_size(body) -> int:
+    return len(body) if isinstance(body, (bytes, bytearray, str)) else 0
+
+
+class Interaction:
+    """
+    一次录制的请求/响应交换
+
+    Args:
+        request: {"method", "url", "headers", "body_sha256", "body_bytes"}（已脱敏）
+        response: {"status", "reason", "headers"}
+        body: 解码后的响应体
+        ttfb_ms: 从发出请求到收到响应头的耗时（毫秒）
+        chunks: [[到达时间 ms, 累计字节数], ...]，响应体分块到达的时间线
+    """
+
+    def __init__(self, request: dict, response: dict, body: bytes, ttfb_ms: float, chunks: List[list]):
+        self.request = request
+        self.response = response
+        self.body = body
+        self.ttfb_ms = ttfb_ms
+        self.chunks = chunks
+
+    @property
+    def elapsed_ms(self) -> float:
+        return self.chunks[-1][0] if self.chunks else self.ttfb_ms
+
+    @classmethod
+    def from_exchange(cls, request, response, body: bytes, ttfb_ms: float, chunks: List[list]) -> "Interaction":
+        """从 requests 的 PreparedRequest 和响应构造（脱敏）"""
+        return cls(
+            {
+                "method": request.method,
+                "url": redact_url(request.url),
+                "headers": {
+                    k: REDACTED if k.lower() in REDACTED_HEADERS else v for k, v in request.headers.items()
+                },
+                "body_sha256": _body_digest(request.body),
+                "body_bytes": _body_size(request.body),
+            },
+            {
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": {
+                    k: v for k, v in response.headers.items() if k.lower() not in DROPPED_RESPONSE_HEADERS
+                },
+            },
+            body,
+            ttfb_ms,
+            chunks,
+        )
+
+    def header(self) -> dict:
+        return {
+            "version": CASSETTE_VERSION,
+            "request": self.request,
+            "response": self.response,
+            "ttfb_ms": self.ttfb_ms,
+            "chunks": self.chunks,
+            "body_size": len(self.body),
+        }
+
+
+def load_cassette(path) -> List[Interaction]:
+    """
+    读取磁带中的全部记录
+
+    Raises:
+        OSError: 文件不存在或无法读取
+        ValueError: 文件格式错误或版本不支持
+    """
+    interactions = []
+    with gzip.open(path, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            header = json.loads(line)
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"不支持的磁带版本: {header.get('version')}")
+            body = f.read(header["body_size"])
+            if len(body) != header["body_size"]:
+                raise ValueError("磁带记录被截断")
+            interactions.append(Interaction(
+                header["request"], header["response"], body, header["ttfb_ms"], header["chunks"]
+            ))
+    return interactions
+
+
+class _ReplayBody(io.RawIOBase):
+    """
+    回放的响应体：按记录的分块时间线释放数据（scale 为 0 时不等待）；close() 会唤醒等待中的读取
+    """
+
+    def __init__(self, interaction: Interaction, started: float, scale: float):
+        self._body = interaction.body
+        self._chunks = interaction.chunks or [[interaction.ttfb_ms, len(interaction.body)]]
+        self._started = started
+        self._scale = scale
+        self._offset = 0
+        self._closed = threading.Event()
+
+    def readable(self) -> bool:
+        return True
+
+    def _available(self) -> int:
+        """等到下一个分块到达，返回当前可读到的字节位置"""
+        for at_ms, end in self._chunks:
+            if end <= self._offset:
+                continue
+            delay = self._started + at_ms / 1000 * self._scale - time.monotonic()
+            if delay > 0 and self._closed.wait(delay):
+                return self._offset
+            return end
+        return len(self._body)
+
+    def read(self, amt: int = -1) -> bytes:
+        if self._closed.is_set():
+            return b""
+        end = self._available()
+        if amt is not None and amt >= 0:
+            end = min(end, self._offset + amt)
+        data = self._body[self._offset:end]
+        self._offset = end
+        return data
+
+    def close(self) -> None:
+        self._closed.set()
+        super().close()
+
+
+def _read_timeout(timeout) -> Optional[float]:
+    if isinstance(timeout, tuple):
+        return timeout[1]
+    return timeout
+
+
+def _build_response(adapter, request, interaction: Interaction, started: float, scale: float):
+    response = requests.Response()
+    response.status_code = interaction.response["status"]
+    response.reason = interaction.response.get("reason", "")
+    response.headers = CaseInsensitiveDict(interaction.response["headers"])
+    response.headers["Content-Length"] = str(len(interaction.body))
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    response.raw = _ReplayBody(interaction, started, scale)
+    return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    从磁带回放响应，不访问网络（线程安全）
+
+    按「方法 + 脱敏 URL + 请求体 SHA-256」匹配记录；没有完全匹配时按「方法 + URL」匹配。
+    同一键的多条记录按录制顺序依次返回，用完后重复最后一条（repeat=False 时改为抛出 CassetteMiss）。
+
+    Args:
+        cassette: 磁带路径，或 load_cassette 返回的记录列表
+        timing: 节奏倍率，0 立即返回，1 按原始耗时；超过请求的读超时时抛出 ReadTimeout
+        repeat: 记录用完后是否重复最后一条
+    """
+
+    def __init__(self, cassette, timing: float = 0, repeat: bool = True):
+        super().__init__()
+        self.interactions = cassette if isinstance(cassette, list) else load_cassette(cassette)
+        self.timing = timing
+        self.repeat = repeat
+        self.served = 0
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def _match(self, request) -> Interaction:
+        url = redact_url(request.url)
+        digest = _body_digest(request.body)
+        for key, predicate in (
+            (("body", request.method, url, digest),
+             lambda i: i.request["body_sha256"] == digest),
+            (("url", request.method, url), lambda i: True),
+        ):
+            candidates = [
+                i for i in self.interactions
+                if i.request["method"] == request.method and i.request["url"] == url and predicate(i)
+            ]
+            if not candidates:
+                continue
+            with self._lock:
+                cursor = self._cursors.get(key, 0)
+                if cursor >= len(candidates) and not self.repeat:
+                    break
+                self._cursors[key] = cursor + 1
+                self.served += 1
+            return candidates[min(cursor, len(candidates) - 1)]
+        raise CassetteMiss(f"回放磁带中没有匹配的请求: {request.method} {url}")
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.monotonic()
+        interaction = self._match(request)
+
+        delay = interaction.ttfb_ms / 1000 * self.timing
+        read_timeout = _read_timeout(timeout)
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout(f"回放的首字节延迟 {delay:.2f}s 超过读超时 {read_timeout}s")
+        time.sleep(delay)
+
+        response = _build_response(self, request, interaction, started, self.timing)
+        if not stream:
+            response.content
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    照常访问网络，并把每次交换追加到磁带（线程安全）
+
+    录制时在返回前读完整个响应体以记录分块时间线，因此录制期间流式响应不是边到边处理的，
+    取消也要等响应体读完才生效；返回给调用方的响应与回放时相同。
+
+    Args:
+        path: 磁带路径，已存在时追加
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.recorded = 0
+        self._write_lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.monotonic()
+        upstream = super().send(request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        ttfb_ms = round((time.monotonic() - started) * 1000, 1)
+
+        body = bytearray()
+        chunks = []
+        try:
+            for chunk in upstream.raw.stream(RECORD_CHUNK_SIZE, decode_content=True):
+                body += chunk
+                chunks.append([round((time.monotonic() - started) * 1000, 1), len(body)])
+        finally:
+            upstream.close()
+
+        interaction = Interaction.from_exchange(request, upstream, bytes(body), ttfb_ms, chunks)
+        self._append(interaction)
+        response = _build_response(self, request, interaction, started, 0)
+        if not stream:
+            response.content
+        return response
+
+    def _append(self, interaction: Interaction) -> None:
+        with self._write_lock:
+            # 每条记录追加为一个独立的 gzip 成员，gzip 读取时会自动拼接
+            with gzip.open(self.path, "ab") as f:
+                f.write(json.dumps(interaction.header(), ensure_ascii=False).encode('utf-8') + b"\n")
+                f.write(interaction.body)
+            self.recorded += 1
+
+
+_override = None
+_session_lock = threading.Lock()
+_adapter = None
+_adapter_config = None
+_adapter_lock = threading.Lock()
+
+
+def get_adapter() -> Optional[BaseAdapter]:
+    """返回当前的传输适配器：use() 安装的优先，其次按 GEMINI_TRANSPORT 构造；直连时返回 None"""
+    global _adapter, _adapter_config
+
+    if _override is not None:
+        return _override
+
+    config = (os.environ.get('GEMINI_TRANSPORT', ''), os.environ.get('GEMINI_REPLAY_TIMING', '0'))
+    with _adapter_lock:
+        if config != _adapter_config:
+            mode, _, path = config[0].partition(":")
+            if mode == "record" and path:
+                _adapter = RecordingAdapter(path)
+            elif mode == "replay" and path:
+                _adapter = ReplayAdapter(path, timing=float(config[1] or 0))
+            elif config[0]:
+                raise ValueError(f"GEMINI_TRANSPORT 格式应为 record:<路径> 或 replay:<路径>，当前为 {config[0]!r}")
+            else:
+                _adapter = None
+            _adapter_config = config
+        return _adapter
+
+
+@contextlib.contextmanager
+def use(adapter: BaseAdapter):
+    """在代码块内为整个进程安装传输适配器"""
+    global _override
+    previous, _override = _override, adapter
+    try:
+        yield adapter
+    finally:
+        _override = previous
+
+
+def _session(adapter: BaseAdapter) -> requests.Session:
+    """挂载了 adapter 的会话：每个适配器一个，随适配器一起释放，不为每次请求新建"""
+    session = getattr(adapter, "_transport_session", None)
+    if session is None:
+        with _session_lock:
+            session = getattr(adapter, "_transport_session", None)
+            if session is None:
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                adapter._transport_session = session
+    return session
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """与 requests.post 相同；安装了传输适配器时经由该适配器收发，开启连接预热时经由预热的连接池会话收发"""
+    adapter = get_adapter()
+    if adapter is None:
+        warm_pool = get_warm_pool()
+        if warm_pool is not None:
+            return warm_pool.session.post(url, **kwargs)
+        return requests.post(url, **kwargs)
+
+    return _session(adapter).post(url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """与 requests.get 相同，传输路径与 post() 一致（用于轮询批处理任务等）"""
+    adapter = get_adapter()
+    if adapter is None:
+        warm_pool = get_warm_pool()
+        if warm_pool is not None:
+            return warm_pool.session.get(url, **kwargs)
+        return requests.get(url, **kwargs)
+
+    return _session(adapter).get(url, **kwargs)
@@ -0,0 +1,267 @@
+"""
+用量统计与配额预控
+
+Gemini 响应中的 usageMetadata 给出了每次调用的 token 数。这里按 API 密钥和租户维护滑动窗口内的
+用量计数，调用结果中附带本次的 usage，并在预算即将耗尽时在发出请求之前限流或拒绝，避免配额被打满后
+整体不可用：
+- 每个计数按窗口均分为 BUCKETS 个时间桶，记录和查询只涉及桶的追加与过期，开销与窗口长度无关
+- 「即将耗尽」按窗口内已用量加上该计数的平均单次用量判断：预计超出预算时不发请求
+- 同一密钥超出预算时路由器暂时摘除该成员，流量转到其他成员；全部成员都超出时才拒绝
+- 配置了 GEMINI_USAGE_MAX_WAIT 时先等待窗口滑出（限流），等待上限内仍不足才返回 QUOTA_EXCEEDED
+
+租户由调用方通过 tenant() 上下文指定（调度器按任务的 tenant 自动设置），未指定时只按密钥统计。
+
+配置：
+- GEMINI_USAGE_WINDOW：滑动窗口长度（秒），默认 3600
+- GEMINI_KEY_TOKEN_BUDGET：单个密钥在窗口内的 token 预算，未配置时不限制
+- GEMINI_TENANT_TOKEN_BUDGET：单个租户在窗口内的 token 预算，未配置时不限制
+- GEMINI_USAGE_MAX_WAIT：超出预算时的最长等待时间（秒），默认 0（直接拒绝）
+"""
+
+import contextlib
+import contextvars
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from .cancellation import CancelToken
+
+DEFAULT_WINDOW = 3600.0
+BUCKETS = 60
+
+# usageMetadata 字段 → 结果中的字段
+USAGE_FIELDS = {
+    "promptTokenCount": "prompt_tokens",
+    "candidatesTokenCount": "output_tokens",
+    "thoughtsTokenCount": "thoughts_tokens",
+    "totalTokenCount": "total_tokens",
+}
+
+_tenant = contextvars.ContextVar("gemini_tenant", default=None)
+
+
+def parse_usage(metadata) -> Optional[dict]:
+    """把 usageMetadata 转换为 {"prompt_tokens", "output_tokens", "total_tokens", ...}，缺失时返回 None"""
+    if not isinstance(metadata, dict):
+        return None
+    usage = {name: int(metadata[field]) for field, name in USAGE_FIELDS.items() if field in metadata}
+    if not usage:
+        return None
+    usage.setdefault("total_tokens", sum(usage.values()))
+    return usage
+
+
+def merge_usage(total: Optional[dict], usage: Optional[dict]) -> Optional[dict]:
+    """累加两次调用的用量（如分块模式的各个分块）"""
+    if usage is None:
+        return total
+    if total is None:
+        return dict(usage)
+    return {name: total.get(name, 0) + usage.get(name, 0) for name in {**total, **usage}}
+
+
+def key_fingerprint(api_key: str) -> str:
+    """密钥的短指纹，用于统计输出（不暴露密钥本身）"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+
+@contextlib.contextmanager
+def tenant(name: Optional[str]):
+    """在上下文内把调用计入租户 name 的用量"""
+    reset = _tenant.set(name)
+    try:
+        yield
+    finally:
+        _tenant.reset(reset)
+
+
+def current_tenant() -> Optional[str]:
+    return _tenant.get()
+
+
+class _Counter:
+    """单个密钥或租户的滑动窗口计数：[(桶序号, tokens, 调用数)]"""
+
+    def __init__(self):
+        self.buckets = deque()
+
+    def add(self, bucket: int, tokens: int) -> None:
+        if self.buckets and self.buckets[-1][0] == bucket:
+            _, total, calls = self.buckets[-1]
+            self.buckets[-1] = (bucket, total + tokens, calls + 1)
+        else:
+            self.buckets.append((bucket, tokens, 1))
+
+    def expire(self, oldest: int) -> None:
+        while self.buckets and self.buckets[0][0] < oldest:
+            self.buckets.popleft()
+
+    def totals(self) -> tuple:
+        return sum(b[1] for b in self.buckets), sum(b[2] for b in self.buckets)
+
+
+class UsageTracker:
+    """
+    按密钥和租户统计滑动窗口内的 token 用量（线程安全）
+
+    Args:
+        window: 窗口长度（秒）
+        key_budget: 单个密钥在窗口内的 token 预算，None 表示不限制
+        tenant_budget: 单个租户在窗口内的 token 预算，None 表示不限制
+        max_wait: 超出预算时的最长等待时间（秒）
+    """
+
+    def __init__(
+        self,
+        window: float = DEFAULT_WINDOW,
+        key_budget: Optional[int] = None,
+        tenant_budget: Optional[int] = None,
+        max_wait: float = 0.0,
+    ):
+        if window <= 0:
+            raise ValueError("用量窗口必须是正数（秒）")
+        self.window = window
+        self.key_budget = key_budget
+        self.tenant_budget = tenant_budget
+        self.max_wait = max_wait
+        self._width = window / BUCKETS
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self._width)
+
+    def _counter(self, scope: str, name: str, now: float) -> _Counter:
+        counter = self._counters.setdefault((scope, name), _Counter())
+        counter.expire(self._bucket(now) - BUCKETS + 1)
+        return counter
+
+    def record(self, api_key: Optional[str], tenant_name: Optional[str], usage: Optional[dict]) -> None:
+        """记录一次调用的用量"""
+        if not usage:
+            return
+        tokens = usage.get("total_tokens", 0)
+        now = time.monotonic()
+        with self._lock:
+            if api_key:
+                self._counter("key", key_fingerprint(api_key), now).add(self._bucket(now), tokens)
+            if tenant_name:
+                self._counter("tenant", tenant_name, now).add(self._bucket(now), tokens)
+
+    def _wait_for(self, scope: str, name: str, budget: Optional[int], now: float) -> Optional[float]:
+        if budget is None:
+            return None
+        counter = self._counter(scope, name, now)
+        used, calls = counter.totals()
+        if not calls:
+            return None
+        estimate = used / calls
+        if used + estimate <= budget:
+            return None
+
+        # 从最早的桶开始依次过期，直到已用量加上预计用量不超过预算
+        for bucket, tokens, _ in counter.buckets:
+            used -= tokens
+            if used + estimate <= budget or used <= 0:
+                return max(0.0, (bucket + BUCKETS) * self._width - now)
+        return None
+
+    def exceeded(self, api_key: Optional[str] = None, tenant_name: Optional[str] = None) -> Optional[float]:
+        """
+        预计下一次调用是否会超出预算
+
+        Returns:
+            不会超出时为 None；否则为预计需要等待窗口滑出的秒数
+        """
+        now = time.monotonic()
+        with self._lock:
+            waits = [
+                wait for wait in (
+                    self._wait_for("key", key_fingerprint(api_key), self.key_budget, now) if api_key else None,
+                    self._wait_for("tenant", tenant_name, self.tenant_budget, now) if tenant_name else None,
+                ) if wait is not None
+            ]
+        return max(waits) if waits else None
+
+    def throttle(
+        self,
+        api_key: Optional[str] = None,
+        tenant_name: Optional[str] = None,
+        cancel_token: Optional[CancelToken] = None,
+        max_wait: Optional[float] = None,
+    ) -> Optional[float]:
+        """
+        超出预算时在 max_wait 内等待窗口滑出
+
+        Args:
+            max_wait: 本次最长等待时间（如调用的剩余 deadline），不超过配置的 max_wait
+
+        Returns:
+            可以发出请求时为 None；等待上限内仍会超出时为建议的重试等待秒数
+
+        Raises:
+            RequestCancelled: 等待期间请求被取消
+        """
+        deadline = time.monotonic() + (self.max_wait if max_wait is None else min(self.max_wait, max_wait))
+        while True:
+            wait = self.exceeded(api_key, tenant_name)
+            if wait is None or time.monotonic() + wait > deadline:
+                return wait
+            _sleep(wait, cancel_token)
+
+    def snapshot(self) -> dict:
+        """返回窗口内各密钥（以指纹表示）和租户的用量"""
+        now = time.monotonic()
+        with self._lock:
+            result = {"window": self.window, "keys": {}, "tenants": {}}
+            for (scope, name) in list(self._counters):
+                tokens, calls = self._counter(scope, name, now).totals()
+                budget = self.key_budget if scope == "key" else self.tenant_budget
+                result["keys" if scope == "key" else "tenants"][name] = {
+                    "tokens": tokens, "calls": calls, "budget": budget
+                }
+            return result
+
+
+def _sleep(seconds: float, cancel_token: Optional[CancelToken]) -> None:
+    if cancel_token is None:
+        time.sleep(seconds)
+        return
+    woken = threading.Event()
+    cancel_token.add_callback(woken.set)
+    try:
+        woken.wait(seconds)
+    finally:
+        cancel_token.remove_callback(woken.set)
+    cancel_token.raise_if_cancelled()
+
+
+_tracker = None
+_tracker_config = None
+_tracker_lock = threading.Lock()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """返回进程内共享的用量统计；配置变化时重建（已有计数清零）"""
+    global _tracker, _tracker_config
+
+    config = (
+        os.environ.get('GEMINI_USAGE_WINDOW'),
+        os.environ.get('GEMINI_KEY_TOKEN_BUDGET'),
+        os.environ.get('GEMINI_TENANT_TOKEN_BUDGET'),
+        os.environ.get('GEMINI_USAGE_MAX_WAIT'),
+    )
+    with _tracker_lock:
+        if _tracker is None or config != _tracker_config:
+            window, key_budget, tenant_budget, max_wait = config
+            _tracker = UsageTracker(
+                window=float(window or DEFAULT_WINDOW),
+                key_budget=int(key_budget) if key_budget else None,
+                tenant_budget=int(tenant_budget) if tenant_budget else None,
+                max_wait=float(max_wait or 0),
+            )
+            _tracker_config = config
+        return _tracker
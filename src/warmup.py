@@ -0,0 +1,366 @@
+"""
+连接预热与 DNS 缓存
+
+默认每次调用都经由 requests.post 新建连接，扩容后每个 worker 的第一批请求都要付出 DNS 解析和
+TCP/TLS 握手的耗时。开启预热后 Gemini 请求改走共享的连接池会话：
+- 端点主机名解析结果按 TTL 缓存，过期后重新解析；重新解析失败时继续使用旧地址
+- 预热时为每个端点（含 GEMINI_API_POOL 中的全部端点）并发建立若干空闲连接放入连接池
+- 后台线程定期对空闲连接发送 HEAD 请求保活，已被服务端关闭的连接重新建立，
+  DNS 缓存也在这里提前刷新，请求线程不必等待解析
+
+第一次构建连接池时自动在后台预热成员池中的全部端点。导入本模块没有网络副作用：worker 启动钩子中调用
+warm_at_start() 即开始预热，否则在第一次调用取用连接池时开始；修改配置后在下一次取用时重新预热。
+也可以显式调用 start(端点列表) 并拿到预热耗时报告。
+
+配置：
+- GEMINI_WARM_CONNECTIONS：每个端点预热的空闲连接数，默认 0（关闭，沿用 requests.post）
+- GEMINI_DNS_TTL：DNS 缓存有效期（秒），默认 300
+- GEMINI_WARM_PING_INTERVAL：保活间隔（秒），默认 30，0 表示不保活
+"""
+
+import ipaddress
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .routing import load_pool
+
+DEFAULT_DNS_TTL = 300.0
+DEFAULT_PING_INTERVAL = 30.0
+CONNECT_TIMEOUT = 10.0
+
+
+class DnsCache:
+    """
+    按 TTL 缓存主机名解析结果（线程安全）
+
+    Args:
+        ttl: 有效期（秒）
+    """
+
+    def __init__(self, ttl: float = DEFAULT_DNS_TTL):
+        self.ttl = ttl
+        self.lookups = 0
+        self.hits = 0
+        self.stale = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int, refresh: bool = False) -> str:
+        """
+        返回 host 的一个地址；IP 地址原样返回
+
+        Raises:
+            socket.gaierror: 解析失败且没有可用的旧地址
+        """
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry is not None and not refresh and now < entry[1]:
+                self.hits += 1
+                return entry[0][0]
+
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            if entry is None:
+                raise
+            with self._lock:
+                self.stale += 1
+            return entry[0][0]
+
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self.lookups += 1
+            self._entries[(host, port)] = (addresses, time.monotonic() + self.ttl)
+        return addresses[0]
+
+    def expiring(self, within: float) -> List[tuple]:
+        """返回将在 within 秒内过期的 (host, port)"""
+        deadline = time.monotonic() + within
+        with self._lock:
+            return [key for key, (_, expires) in self._entries.items() if expires <= deadline]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "stale": self.stale,
+                "entries": {
+                    f"{host}:{port}": {"addresses": addresses, "expires_in": round(max(0.0, expires - now), 1)}
+                    for (host, port), (addresses, expires) in self._entries.items()
+                },
+            }
+
+
+def _cached_dns_pool_classes(dns_cache: DnsCache) -> dict:
+    """构造通过 dns_cache 解析主机名的连接池类；TLS 的 SNI 和证书校验仍使用原主机名"""
+
+    def new_conn(self):
+        host = self._dns_host
+        self._dns_host = dns_cache.resolve(host.rstrip("."), self.port)
+        try:
+            return super(type(self), self)._new_conn()
+        finally:
+            self._dns_host = host
+
+    http_conn = type("CachedDnsHTTPConnection", (HTTPConnection,), {"_new_conn": new_conn})
+    https_conn = type("CachedDnsHTTPSConnection", (HTTPSConnection,), {"_new_conn": new_conn})
+    return {
+        "http": type("CachedDnsHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_conn}),
+        "https": type("CachedDnsHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_conn}),
+    }
+
+
+class _CachedDnsAdapter(HTTPAdapter):
+    def __init__(self, dns_cache: DnsCache, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _cached_dns_pool_classes(self.dns_cache)
+
+
+class WarmPool:
+    """
+    预热并保活的共享连接池会话
+
+    Args:
+        connections: 每个端点预热的空闲连接数
+        dns_ttl: DNS 缓存有效期（秒）
+        ping_interval: 保活间隔（秒），0 表示不保活
+    """
+
+    def __init__(
+        self, connections: int, dns_ttl: float = DEFAULT_DNS_TTL, ping_interval: float = DEFAULT_PING_INTERVAL
+    ):
+        self.connections = connections
+        self.ping_interval = ping_interval
+        self.dns = DnsCache(dns_ttl)
+        self.endpoints = []
+        self.report = None
+        self.pings = 0
+        self.reconnects = 0
+        self._adapter = _CachedDnsAdapter(self.dns, pool_maxsize=max(10, connections))
+        self.session = requests.Session()
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pinger = None
+        self.warm_thread = None
+
+    def _pool(self, endpoint: str):
+        """返回 session 发往 endpoint 的请求所用的 urllib3 连接池（按与 session 相同的环境设置选取）"""
+        settings = self.session.merge_environment_settings(endpoint, {}, None, None, None)
+        return self._adapter.get_connection_with_tls_context(
+            requests.Request("HEAD", endpoint).prepare(), settings["verify"], settings["proxies"], settings["cert"]
+        )
+
+    def _connect(self, conn) -> float:
+        started = time.monotonic()
+        conn.timeout = CONNECT_TIMEOUT
+        conn.connect()
+        return round((time.monotonic() - started) * 1000, 1)
+
+    def warm(self, endpoints: Iterable[str]) -> dict:
+        """
+        解析各端点并建立空闲连接
+
+        Returns:
+            {"total_ms": 总耗时, "endpoints": [{"endpoint", "address", "dns_ms", "connect_ms": [每个连接的握手耗时],
+            "error"（失败时）}]}
+        """
+        started = time.monotonic()
+        endpoints = list(dict.fromkeys(endpoint.rstrip('/') for endpoint in endpoints))
+        with self._lock:
+            self.endpoints = list(dict.fromkeys(self.endpoints + endpoints))
+
+        with ThreadPoolExecutor(max(1, len(endpoints))) as executor:
+            reports = list(executor.map(self._warm_endpoint, endpoints))
+
+        self.report = {"total_ms": round((time.monotonic() - started) * 1000, 1), "endpoints": reports}
+        return self.report
+
+    def _warm_endpoint(self, endpoint: str) -> dict:
+        report = {"endpoint": endpoint}
+        try:
+            parts = urlsplit(endpoint)
+            dns_started = time.monotonic()
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            report["address"] = self.dns.resolve(parts.hostname, port, refresh=True)
+            report["dns_ms"] = round((time.monotonic() - dns_started) * 1000, 1)
+
+            pool = self._pool(endpoint)
+            conns = [pool._get_conn() for _ in range(self.connections)]
+            try:
+                with ThreadPoolExecutor(len(conns)) as executor:
+                    report["connect_ms"] = list(executor.map(
+                        lambda conn: 0.0 if conn.is_connected else self._connect(conn), conns
+                    ))
+            finally:
+                for conn in conns:
+                    pool._put_conn(conn)
+        except Exception as e:
+            report["error"] = str(e)
+        return report
+
+    def ping(self) -> None:
+        """刷新即将过期的 DNS 缓存，对各端点的空闲连接发送 HEAD 保活，已断开的连接重新建立"""
+        for host, port in self.dns.expiring(self.ping_interval):
+            try:
+                self.dns.resolve(host, port, refresh=True)
+            except OSError:
+                pass
+
+        for endpoint in list(self.endpoints):
+            pool = self._pool(endpoint)
+            path = urlsplit(endpoint).path or "/"
+            conns = [pool._get_conn() for _ in range(self.connections)]
+            try:
+                for conn in conns:
+                    self._ping_conn(conn, path)
+            finally:
+                for conn in conns:
+                    pool._put_conn(conn)
+
+    def _ping_conn(self, conn, path: str) -> None:
+        try:
+            if not conn.is_connected:
+                self._connect(conn)
+                with self._lock:
+                    self.reconnects += 1
+                return
+            conn.request("HEAD", path)
+            response = conn.getresponse()
+            response.read()
+            with self._lock:
+                self.pings += 1
+            if response.headers.get("Connection", "").lower() == "close":
+                conn.close()
+                self._connect(conn)
+                with self._lock:
+                    self.reconnects += 1
+        except Exception:
+            # 保活失败时丢弃该连接，下次请求或保活时重新建立
+            conn.close()
+
+    def start_pinging(self) -> None:
+        if self.ping_interval <= 0 or self._pinger is not None:
+            return
+        self._pinger = threading.Thread(target=self._ping_loop, name="warm-ping", daemon=True)
+        self._pinger.start()
+
+    def _ping_loop(self) -> None:
+        while not self._stop.wait(self.ping_interval):
+            self.ping()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._pinger is not None:
+            self._pinger.join()
+        self.session.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "endpoints": list(self.endpoints),
+                "pings": self.pings,
+                "reconnects": self.reconnects,
+                "dns": self.dns.stats(),
+                "report": self.report,
+            }
+
+
+_pool = None
+_pool_config = None
+_pool_lock = threading.Lock()
+
+
+def _warm_up(pool: WarmPool) -> None:
+    # 延迟导入，避免与 main 循环导入
+    from .main import GEMINI_API_BASE
+
+    try:
+        endpoints = [member.endpoint for member in load_pool(GEMINI_API_BASE)]
+    except ValueError:
+        # 成员池配置错误会在第一次调用时以明确的错误返回，这里不重复报告
+        return
+    pool.warm(endpoints)
+    pool.start_pinging()
+
+
+def get_warm_pool() -> Optional[WarmPool]:
+    """
+    返回进程内共享的预热连接池；GEMINI_WARM_CONNECTIONS 未配置或为 0 时返回 None
+
+    新建连接池时在后台线程（WarmPool.warm_thread）中预热成员池（GEMINI_API_POOL 或默认端点）中的全部端点，
+    不阻塞调用方
+    """
+    global _pool, _pool_config
+
+    config = (
+        os.environ.get('GEMINI_WARM_CONNECTIONS'),
+        os.environ.get('GEMINI_DNS_TTL'),
+        os.environ.get('GEMINI_WARM_PING_INTERVAL'),
+    )
+    with _pool_lock:
+        if config != _pool_config:
+            if _pool is not None:
+                _pool.close()
+            _pool = None
+            connections = int(config[0] or 0)
+            if connections > 0:
+                _pool = WarmPool(
+                    connections,
+                    dns_ttl=float(config[1] or DEFAULT_DNS_TTL),
+                    ping_interval=float(config[2] if config[2] is not None else DEFAULT_PING_INTERVAL),
+                )
+                _pool.warm_thread = threading.Thread(target=_warm_up, args=(_pool,), name="warm-up", daemon=True)
+                _pool.warm_thread.start()
+            _pool_config = config
+        return _pool
+
+
+def start(endpoints: Iterable[str]) -> Optional[dict]:
+    """
+    预热各端点并开始保活
+
+    Returns:
+        预热报告（见 WarmPool.warm）；未开启预热时返回 None
+    """
+    pool = get_warm_pool()
+    if pool is None:
+        return None
+    report = pool.warm(endpoints)
+    pool.start_pinging()
+    return report
+
+
+def warm_at_start() -> Optional[threading.Thread]:
+    """
+    worker 启动时调用：确保连接池已构建，其后台预热随之开始，不阻塞启动
+
+    Returns:
+        预热线程；未开启预热时返回 None
+    """
+    pool = get_warm_pool()
+    return pool.warm_thread if pool is not None else None
@@ -0,0 +1,63 @@
+"""
+测试共用的 fixture 与辅助函数
+"""
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+
+def image_response(data: bytes, mime_type: str = "image/png", **fields) -> MagicMock:
+    """
+    构造上游成功返回一张图像的响应
+
+    Args:
+        data: 图像字节
+        mime_type: 图像 MIME 类型
+        **fields: 响应 JSON 中的其他顶层字段（如 usageMetadata）
+    """
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+        "mimeType": mime_type, "data": base64.b64encode(data).decode('utf-8')
+    }}]}}], **fields}
+    return response
+
+
+def sent_json(call) -> dict:
+    """mock 的 requests.post 某次调用发出的请求体（main 发送已序列化的字节）"""
+    return json.loads(call.kwargs["data"])
+
+
+@pytest.fixture
+def workspace_env() -> dict:
+    """
+    workspace 设置的环境变量，测试模块或类可覆盖此 fixture
+
+    值中的 {workspace} 替换为临时目录，值为 None 时删除该变量。
+    """
+    return {"GEMINI_API_KEY": "test-api-key"}
+
+
+@pytest.fixture
+def workspace(monkeypatch, workspace_env):
+    """创建临时工作空间、切换到其中并设置 workspace_env 中的环境变量"""
+    temp_dir = tempfile.mkdtemp()
+    original_cwd = os.getcwd()
+    os.chdir(temp_dir)
+    for name, value in workspace_env.items():
+        if value is None:
+            monkeypatch.delenv(name, raising=False)
+        else:
+            monkeypatch.setenv(name, value.format(workspace=temp_dir))
+
+    yield Path(temp_dir)
+
+    os.chdir(original_cwd)
+    shutil.rmtree(temp_dir)
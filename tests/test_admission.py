@@ -0,0 +1,146 @@
+"""
+在途字节预算与准入控制测试
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from src.admission import ByteBudget, estimate_canvas_bytes, estimate_peak_bytes, get_budget
+from src.main import text_to_image
+
+
+class TestEstimate:
+    """测试峰值内存估算"""
+
+    def test_grows_with_input_and_output(self):
+        small = estimate_peak_bytes(0, 1024)
+        large = estimate_peak_bytes(10 * 1024 * 1024, 1024)
+
+        assert large - small > 30 * 1024 * 1024
+
+    def test_expected_output_from_env(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_EXPECTED_OUTPUT_BYTES", "0")
+
+        assert estimate_peak_bytes(0) == estimate_peak_bytes(0, 0)
+
+    def test_canvas_grows_with_pixels_and_canvases(self):
+        one = estimate_canvas_bytes(1024, 100, 100, canvases=1)
+
+        assert estimate_canvas_bytes(1024, 100, 100, canvases=3) - one == 2 * 100 * 100 * 4
+        assert estimate_canvas_bytes(1024, 200, 100, canvases=1) - one == 100 * 100 * 4
+
+
+class TestByteBudget:
+    """测试预算预留、排队与拒绝"""
+
+    def test_reserve_and_release(self):
+        budget = ByteBudget(100)
+
+        with budget.reserve(60) as admitted:
+            assert admitted is True
+            assert budget.usage()["in_use"] == 60
+
+        assert budget.usage()["in_use"] == 0
+        assert budget.usage()["peak"] == 60
+
+    def test_rejects_after_timeout(self):
+        budget = ByteBudget(100)
+        budget.acquire(80)
+
+        assert budget.acquire(30, timeout=0.05) is False
+        assert budget.usage()["rejected"] == 1
+
+    def test_waiter_admitted_after_release(self):
+        budget = ByteBudget(100)
+        budget.acquire(80)
+        admitted = []
+        waiter = threading.Thread(target=lambda: admitted.append(budget.acquire(50, timeout=2)))
+        waiter.start()
+        time.sleep(0.05)
+
+        assert budget.usage()["waiting"] == 1
+        budget.release(80)
+        waiter.join()
+
+        assert admitted == [True]
+        assert budget.usage()["in_use"] == 50
+
+    def test_oversized_request_runs_alone(self):
+        budget = ByteBudget(100)
+
+        assert budget.acquire(500, timeout=0) is True
+        assert budget.acquire(1, timeout=0.05) is False
+
+    def test_fifo_prevents_starvation(self):
+        budget = ByteBudget(100)
+        budget.acquire(60)
+        order = []
+
+        def worker(name, nbytes):
+            budget.acquire(nbytes, timeout=2)
+            order.append(name)
+
+        big = threading.Thread(target=worker, args=("big", 90))
+        big.start()
+        time.sleep(0.05)
+        small = threading.Thread(target=worker, args=("small", 20))
+        small.start()
+        time.sleep(0.05)
+
+        # 小请求虽然放得下，但排在大请求之后，不能插队
+        assert order == []
+        budget.release(60)
+        big.join()
+        assert order == ["big"]
+        budget.release(90)
+        small.join()
+        assert order == ["big", "small"]
+
+    def test_nested_reservation_runs_beside_its_parent(self):
+        budget = ByteBudget(100)
+        admitted = []
+
+        with budget.reserve(90) as outer:
+            waiter = threading.Thread(target=lambda: admitted.append(budget.acquire(50, timeout=2)))
+            waiter.start()
+            time.sleep(0.05)
+
+            # 嵌套预留不排在等待者之后；除外层预留外没有其他在途请求时即使超出预算也放行
+            with budget.reserve(30, timeout=0.5) as inner:
+                assert outer is True and inner is True
+                assert budget.usage()["in_use"] == 120
+            assert admitted == []
+
+        waiter.join()
+        assert admitted == [True]
+
+
+class TestTextToImageAdmission:
+    """测试 text_to_image 在预算耗尽时拒绝请求"""
+
+    @patch('src.main.requests.post')
+    def test_server_busy(self, mock_post, monkeypatch):
+        temp_dir = tempfile.mkdtemp()
+        original_cwd = os.getcwd()
+        os.chdir(temp_dir)
+
+        try:
+            monkeypatch.setenv("GEMINI_API_KEY", "test-api-key")
+            monkeypatch.setenv("GEMINI_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024))
+            monkeypatch.setenv("GEMINI_ADMISSION_TIMEOUT", "0.05")
+            budget = get_budget()
+            budget.acquire(60 * 1024 * 1024)
+
+            result = text_to_image(prompt="测试提示词")
+
+            assert result["success"] is False
+            assert result["error_code"] == "SERVER_BUSY"
+            mock_post.assert_not_called()
+
+        finally:
+            os.chdir(original_cwd)
+            shutil.rmtree(temp_dir)
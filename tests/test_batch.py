@@ -0,0 +1,199 @@
+"""
+离线批处理任务测试
+
+使用本地桩批处理服务：提交后每次查询多返回一个结果（顺序与提交相反），全部返回后任务结束。
+"""
+
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import batch
+from src.batch import BatchError, BatchJob, submit
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """桩批处理服务；state 中记录收到的任务和查询次数"""
+    state = {"batch": None, "polls": 0, "fail_polls": 0, "cancelled": False, "lock": threading.Lock()}
+
+    def result_for(item):
+        key = item["metadata"]["key"]
+        if key.startswith("bad"):
+            return {"metadata": {"key": key}, "error": {"code": 400, "message": "unsafe prompt"}}
+        return {"metadata": {"key": key}, "response": {
+            "candidates": [{"content": {"parts": [{"text": "ok"}, {"inlineData": {
+                "mimeType": "image/png", "data": base64.b64encode(f"image:{key}".encode()).decode('utf-8')
+            }}]}}],
+            "usageMetadata": {"promptTokenCount": 3, "candidatesTokenCount": 5, "totalTokenCount": 8},
+        }}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.startswith("/v1beta/models/") and self.path.endswith(":batchGenerateContent"):
+                state["batch"] = payload["batch"]
+                state["model"] = self.path.split("/models/")[1].split(":")[0]
+                state["api_key"] = self.headers["x-goog-api-key"]
+                self._send(200, {"name": "batches/b1", "metadata": {"state": "BATCH_STATE_PENDING"}})
+            elif self.path == "/v1beta/batches/b1:cancel":
+                state["cancelled"] = True
+                self._send(200, {})
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_GET(self):
+            if self.path != "/v1beta/batches/b1":
+                return self._send(404, {"error": {"message": "not found"}})
+            with state["lock"]:
+                state["polls"] += 1
+                if state["fail_polls"]:
+                    state["fail_polls"] -= 1
+                    return self._send(503, {"error": {"message": "unavailable"}})
+                items = list(reversed(state["batch"]["inputConfig"]["requests"]["requests"]))
+                shown = [result_for(item) for item in items[:state["polls"] - 1]]
+            if state["cancelled"]:
+                return self._send(200, {"name": "batches/b1", "done": True, "metadata": {
+                    "state": "BATCH_STATE_CANCELLED", "output": {"inlinedResponses": {"inlinedResponses": shown}}
+                }})
+            if len(shown) < len(items):
+                return self._send(200, {"name": "batches/b1", "metadata": {
+                    "state": "BATCH_STATE_RUNNING", "output": {"inlinedResponses": {"inlinedResponses": shown}}
+                }})
+            self._send(200, {
+                "name": "batches/b1", "done": True, "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+                "response": {"inlinedResponses": {"inlinedResponses": shown}},
+            })
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(batch, "GEMINI_API_BASE", f"http://127.0.0.1:{server.server_address[1]}/v1beta")
+
+    yield state
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workspace(workspace):
+    (workspace / "photo.jpg").write_bytes(b"jpeg-bytes")
+    return workspace
+
+
+ENTRIES = [
+    {"request_id": "cat", "function": "text_to_image", "prompt": "一只猫"},
+    {"request_id": "bad/1", "function": "text_to_image", "prompt": "不合规"},
+    {"request_id": "night", "function": "edit_image", "prompt": "换成夜景", "input_path": "photo.jpg"},
+]
+
+
+class TestBatchJob:
+    """测试提交、轮询与结果写出"""
+
+    def test_results_streamed_to_disk_and_mapped_to_request_ids(self, service, workspace):
+        service["fail_polls"] = 1
+        job = submit(ENTRIES, workspace / "run")
+        seen = []
+
+        summary = job.wait(on_result=lambda record: seen.append((record["request_id"], job.done)), poll_interval=0.01)
+
+        assert summary["done"] is True and summary["state"] == "BATCH_STATE_SUCCEEDED"
+        assert (summary["total"], summary["succeeded"], summary["failed"], summary["pending"]) == (3, 2, 1, 0)
+        assert summary["poll_errors"] == 1
+        # 结果在任务结束前就逐个写出（桩服务按提交的逆序返回）
+        assert seen == [("night", False), ("bad/1", False), ("cat", True)]
+
+        results = job.results()
+        assert (workspace / "run" / results["cat"]["file"]).read_bytes() == b"image:cat"
+        assert results["night"]["file"] == "night.png" and results["night"]["function"] == "edit_image"
+        assert results["cat"]["usage"]["total_tokens"] == 8
+        assert results["bad/1"]["error_code"] == "API_REQUEST_FAILED"
+        assert "unsafe prompt" in results["bad/1"]["error"]
+
+        requests = service["batch"]["inputConfig"]["requests"]["requests"]
+        assert [r["metadata"]["key"] for r in requests] == ["cat", "bad/1", "night"]
+        edit_parts = requests[2]["request"]["contents"][0]["parts"]
+        assert edit_parts[0]["text"].endswith("换成夜景")
+        assert base64.b64decode(edit_parts[1]["inline_data"]["data"]) == b"jpeg-bytes"
+        assert edit_parts[1]["inline_data"]["mime_type"] == "image/jpeg"
+
+        info = json.loads((workspace / "run" / "job.json").read_text(encoding="utf-8"))
+        assert "test-api-key" not in json.dumps(info) and info["model"] == service["model"]
+
+    def test_resume_from_directory_without_duplicates(self, service, workspace):
+        job = submit(ENTRIES, workspace / "run")
+        assert job.poll() == [] and [r["request_id"] for r in job.poll()] == ["night"]
+
+        resumed = BatchJob.load(workspace / "run")
+        assert list(resumed.results()) == ["night"]
+        summary = resumed.wait(poll_interval=0.01)
+
+        assert summary["succeeded"] == 2 and summary["pending"] == 0
+        lines = (workspace / "run" / "results.jsonl").read_text(encoding="utf-8").splitlines()
+        assert sorted(json.loads(line)["request_id"] for line in lines) == ["bad/1", "cat", "night"]
+
+    def test_cancel_marks_missing_results(self, service, workspace):
+        job = submit(ENTRIES, workspace / "run")
+        job.poll()
+        job.poll()
+        job.cancel()
+
+        summary = job.wait(poll_interval=0.01)
+
+        assert service["cancelled"] and summary["state"] == "BATCH_STATE_CANCELLED"
+        results = job.results()
+        assert results["night"]["success"] is True
+        assert results["bad/1"]["error_code"] == "API_REQUEST_FAILED"
+        assert results["cat"]["error_code"] == "BATCH_FAILED"
+
+    def test_wait_timeout_leaves_job_pending(self, service, workspace):
+        job = submit(ENTRIES, workspace / "run")
+
+        summary = job.wait(timeout=0.05, poll_interval=10)
+
+        # 超时前查询两次（开始时和超时时），第二次取回一个结果
+        assert service["polls"] == 2
+        assert summary["done"] is False and summary["pending"] == 2
+
+    def test_poll_interval_backs_off_from_initial(self, service, workspace, monkeypatch):
+        service["fail_polls"] = 2
+        job = submit(ENTRIES, workspace / "run")
+        delays = []
+        monkeypatch.setattr(batch.time, "sleep", delays.append)
+
+        summary = job.wait(poll_interval=1, max_poll_interval=100)
+
+        # 两次查询失败后按初始间隔开始退避，第三次取回结果后回到初始间隔
+        assert summary["done"] is True
+        assert delays == [1, 1.5, 1]
+
+    def test_invalid_requests_rejected(self, service, workspace, monkeypatch):
+        with pytest.raises(ValueError):
+            submit(ENTRIES + [dict(ENTRIES[0])], workspace / "run")
+        with pytest.raises(ValueError):
+            submit([{"request_id": "x", "function": "upscale", "prompt": "p"}], workspace / "run")
+        with pytest.raises(ValueError):
+            submit([{"request_id": "x", "function": "edit_image", "prompt": "p"}], workspace / "run")
+        assert service["batch"] is None
+
+        monkeypatch.setattr(batch, "GEMINI_API_BASE", batch.GEMINI_API_BASE.replace("/v1beta", "/missing"))
+        with pytest.raises(BatchError) as error:
+            submit(ENTRIES, workspace / "run")
+        assert error.value.status_code == 404
+        assert not (workspace / "run").exists()
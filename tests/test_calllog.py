@@ -0,0 +1,168 @@
+"""
+结构化调用日志测试
+"""
+
+import hashlib
+import io
+import json
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import events, main, tiles
+from src.calllog import CallLog, get_call_log, iter_entries
+from src.main import edit_image, text_to_image
+
+from conftest import image_response
+
+
+@pytest.fixture
+def workspace_env():
+    """开启调用日志"""
+    return {"GEMINI_API_KEY": "test-api-key", "GEMINI_CALL_LOG": "{workspace}/logs/calls.jsonl"}
+
+
+@pytest.fixture
+def workspace(workspace, monkeypatch):
+    yield workspace
+
+    monkeypatch.delenv("GEMINI_CALL_LOG")
+    assert get_call_log() is None
+
+
+def _entries(workspace: Path) -> list:
+    get_call_log().flush()
+    return list(iter_entries(workspace / "logs" / "calls.jsonl"))
+
+
+class TestCallLog:
+    """测试后台写入与轮转"""
+
+    def test_rotation_compresses_and_keeps_order(self, tmp_path):
+        log = CallLog(tmp_path / "calls.jsonl", max_bytes=200, backups=2)
+
+        for i in range(20):
+            log.write({"i": i, "padding": "x" * 40})
+            log.flush()
+        log.close()
+
+        # 超出 backups 的压缩文件被删除；最后一次写入触发轮转时当前文件也可能不存在
+        assert {p.name for p in tmp_path.iterdir()} - {"calls.jsonl"} == {"calls.jsonl.1.gz", "calls.jsonl.2.gz"}
+        numbers = [e["i"] for e in iter_entries(tmp_path / "calls.jsonl")]
+        assert numbers == sorted(numbers) and numbers[-1] == 19
+        assert log.stats()["rotations"] > 2
+        assert log.stats()["written"] == 20
+
+    def test_full_queue_drops_instead_of_blocking(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("src.calllog.QUEUE_SIZE", 1)
+        release = threading.Event()
+        real_dumps = json.dumps
+
+        def slow_dumps(*args, **kwargs):
+            release.wait()
+            return real_dumps(*args, **kwargs)
+
+        monkeypatch.setattr("src.calllog.json.dumps", slow_dumps)
+        log = CallLog(tmp_path / "calls.jsonl")
+
+        started = time.monotonic()
+        for i in range(50):
+            log.write({"i": i})
+        assert time.monotonic() - started < 0.5
+        release.set()
+        log.flush()
+
+        stats = log.stats()
+        assert stats["written"] + stats["dropped"] == 50
+        assert stats["dropped"] >= 48
+        log.close()
+
+
+class TestLoggedCalls:
+    """测试调用结束后写入的记录"""
+
+    @patch('src.main.requests.post')
+    def test_success_entry(self, mock_post, workspace):
+        mock_post.return_value = image_response(b"image-bytes")
+
+        text_to_image(prompt="一只猫", request_id="req-1")
+
+        entry, = _entries(workspace)
+        assert entry["function"] == "text_to_image"
+        assert entry["request_id"] == "req-1"
+        assert entry["prompt_sha256"] == hashlib.sha256("一只猫".encode('utf-8')).hexdigest()
+        assert (entry["success"], entry["error_code"], entry["http_status"]) == (True, None, 200)
+        assert entry["model"] == "gemini-3-pro-image-preview"
+        assert entry["response_bytes"] == len(b"image-bytes")
+        assert entry["request_bytes"] == len(mock_post.call_args.kwargs["data"])
+        assert entry["retries"] == 0
+        assert set(entry["phases"]) == {"queue", "ttfb", "download", "write", "total"}
+
+    @patch('src.main.requests.post')
+    def test_logging_alone_skips_image_digests(self, mock_post, workspace):
+        mock_post.return_value = image_response(b"image-bytes")
+
+        with patch('src.main._event_sha256', wraps=main._event_sha256) as digest:
+            text_to_image(prompt="一只猫")
+            events.run("text_to_image", lambda event: None, prompt="一只猫")
+
+        # 只开启调用日志时不为写出的图像计算哈希；有事件消费方时仍然计算
+        assert [c.args[0].digests for c in digest.call_args_list] == [False, True]
+        assert [entry["success"] for entry in _entries(workspace)] == [True, True]
+
+    @patch('src.main.requests.post')
+    def test_failure_entry(self, mock_post, workspace):
+        response = MagicMock()
+        response.status_code = 503
+        response.text = "unavailable"
+        response.headers = {}
+        mock_post.return_value = response
+
+        text_to_image(prompt="一只猫")
+        edit_image(prompt="")
+
+        api_error, validation_error = _entries(workspace)
+        assert (api_error["error_code"], api_error["http_status"]) == ("API_REQUEST_FAILED", 503)
+        assert validation_error["function"] == "edit_image"
+        assert validation_error["error_code"] == "INVALID_PROMPT"
+        assert set(validation_error["phases"]) == {"total"}
+
+    @patch('src.main.requests.post')
+    def test_events_still_delivered(self, mock_post, workspace):
+        mock_post.return_value = image_response(b"image-bytes")
+        received = []
+
+        events.run("text_to_image", received.append, prompt="一只猫")
+
+        assert [e.type for e in received][-2:] == ["written", "done"]
+        assert len(_entries(workspace)) == 1
+
+    @patch('src.main.requests.post')
+    def test_tiled_entry_includes_piece_events(self, mock_post, workspace, monkeypatch):
+        Image = pytest.importorskip("PIL.Image")
+        monkeypatch.setattr(tiles, "RETRY_BACKOFF", 0)
+        monkeypatch.setenv("GEMINI_TILE_CONCURRENCY", "1")
+        monkeypatch.setenv("GEMINI_TILE_OVERLAP", "16")
+        inputs = workspace / "data" / "inputs" / "input_image"
+        inputs.mkdir(parents=True)
+        Image.new("RGB", (200, 120), "white").save(inputs / "large.png")
+        tile = io.BytesIO()
+        Image.new("RGB", (32, 32), "black").save(tile, format="PNG")
+        failure = MagicMock()
+        failure.status_code = 503
+        failure.text = "unavailable"
+        failure.headers = {}
+        mock_post.side_effect = [failure] + [image_response(tile.getvalue()) for _ in range(6)]
+
+        assert edit_image(prompt="提高清晰度", tile_size=80)["success"] is True
+
+        entry, = _entries(workspace)
+        sent = [len(c.kwargs["data"]) for c in mock_post.call_args_list]
+        assert entry["request_bytes"] == sum(sent)
+        assert entry["retries"] == 1
+        assert entry["http_status"] == 503
+        assert entry["response_bytes"] == (workspace / "data" / "outputs" / "edited_image.png").stat().st_size
+        assert set(entry["phases"]) == {"queue", "ttfb", "download", "write", "total"}
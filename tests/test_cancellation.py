@@ -0,0 +1,171 @@
+"""
+在途请求取消测试
+
+使用本地桩服务器模拟迟迟不返回响应头、或流式分块之间长时间停顿的上游。
+"""
+
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.main
+from src import cancellation
+from src.cancellation import CancelToken, RequestCancelled, call_cancellable
+from src.main import text_to_image
+from src.routing import get_router
+
+
+def _image_body(content: bytes) -> dict:
+    return {"candidates": [{"content": {"parts": [{"inlineData": {
+        "mimeType": "image/png", "data": base64.b64encode(content).decode('utf-8')
+    }}]}}]}
+
+
+@pytest.fixture
+def slow_server():
+    """
+    启动本地桩服务器：generateContent 等待 handler.delay 秒后返回图像；
+    streamGenerateContent 先发一段文本，等待 handler.delay 秒后再发图像
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        delay = 2.0
+        hits = 0
+
+        def do_POST(self):
+            type(self).hits += 1
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                if "alt=sse" in self.path:
+                    self._stream()
+                else:
+                    time.sleep(self.delay)
+                    body = json.dumps(_image_body(b"unwanted")).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _stream(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            events = [(0, {"candidates": [{"content": {"parts": [{"text": "思考中"}]}}]}),
+                      (self.delay, _image_body(b"unwanted"))]
+            for delay, event in events:
+                time.sleep(delay)
+                body = f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8')
+                self.wfile.write(f"{len(body):x}\r\n".encode('ascii') + body + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield Handler, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+    server.shutdown()
+    server.server_close()
+
+
+def _cancel_later(request_id: str, delay: float = 0.2) -> None:
+    threading.Timer(delay, cancellation.cancel, args=(request_id,)).start()
+
+
+class TestCancelToken:
+    """测试取消令牌与可取消调用"""
+
+    def test_callbacks_run_once(self):
+        token = CancelToken()
+        calls = []
+        token.add_callback(lambda: calls.append("a"))
+
+        token.cancel()
+        token.cancel()
+        token.add_callback(lambda: calls.append("b"))
+
+        assert token.cancelled is True
+        assert calls == ["a", "b"]
+        with pytest.raises(RequestCancelled):
+            token.raise_if_cancelled()
+
+    def test_cancel_returns_immediately_and_cleans_up_late_result(self):
+        token = CancelToken()
+        release = threading.Event()
+        cleaned = threading.Event()
+        threading.Timer(0.1, token.cancel).start()
+
+        started = time.monotonic()
+        with pytest.raises(RequestCancelled):
+            call_cancellable(lambda: release.wait(5) and "late", token, cleanup=lambda r: cleaned.set())
+
+        assert time.monotonic() - started < 1
+        release.set()
+        assert cleaned.wait(1)
+
+    def test_without_token_runs_inline(self):
+        assert call_cancellable(lambda: 42, None) == 42
+
+
+class TestCancelGeneration:
+    """测试取消 text_to_image"""
+
+    def test_cancel_while_waiting_for_response(self, slow_server, workspace, monkeypatch):
+        handler, url = slow_server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", url)
+        _cancel_later("req-1")
+
+        started = time.monotonic()
+        result = text_to_image(prompt="一只猫", request_id="req-1")
+
+        assert time.monotonic() - started < 1.5
+        assert result == {"success": False, "error": "请求已取消", "error_code": "CANCELLED"}
+
+        # 上游稍后返回的图像不会被写出，成员被归还且不计为失败
+        time.sleep(handler.delay)
+        assert not (workspace / "data" / "outputs" / "generated_image.png").exists()
+        stats = get_router(url).stats()[0]
+        assert stats["outstanding"] == 0
+        assert stats["failures"] == 0
+
+    def test_cancel_during_stream(self, slow_server, workspace, monkeypatch):
+        handler, url = slow_server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", url)
+        _cancel_later("req-2", 0.3)
+
+        started = time.monotonic()
+        result = text_to_image(prompt="一只猫", stream=True, request_id="req-2")
+
+        assert time.monotonic() - started < 1.5
+        assert result["error_code"] == "CANCELLED"
+        assert not (workspace / "data" / "outputs" / "generated_image.png").exists()
+
+    def test_cancel_before_start(self, slow_server, workspace, monkeypatch):
+        handler, url = slow_server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", url)
+        handler.hits = 0
+
+        assert cancellation.cancel("req-3") is False
+        result = text_to_image(prompt="一只猫", request_id="req-3")
+
+        assert result["error_code"] == "CANCELLED"
+        assert handler.hits == 0
+
+    def test_invalid_request_id(self, workspace):
+        result = text_to_image(prompt="一只猫", request_id="")
+
+        assert result["error_code"] == "INVALID_REQUEST_ID"
@@ -0,0 +1,133 @@
+"""
+生成结果目录测试
+"""
+
+import hashlib
+import subprocess
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import catalog, events
+from src.catalog import Catalog, get_catalog
+from src.main import edit_image, text_to_image
+
+from conftest import image_response
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def workspace_env():
+    return {"GEMINI_API_KEY": "test-api-key", "GEMINI_CATALOG": "{workspace}/catalog.db"}
+
+
+@pytest.fixture
+def workspace(workspace, monkeypatch):
+    yield workspace
+
+    monkeypatch.delenv("GEMINI_CATALOG")
+    assert get_catalog() is None
+
+
+def _write_input(workspace: Path, data: bytes) -> None:
+    input_dir = workspace / "data" / "inputs" / "input_image"
+    input_dir.mkdir(parents=True, exist_ok=True)
+    (input_dir / "input.png").write_bytes(data)
+
+
+class TestCatalogedCalls:
+    """测试调用结果写入目录与查询"""
+
+    @patch('src.main.requests.post')
+    def test_records_outputs_with_prompt_input_and_output_hashes(self, mock_post, workspace):
+        mock_post.side_effect = [image_response(b"cat-1"), image_response(b"cat-2"), image_response(b"edited")]
+        _write_input(workspace, b"input-image")
+
+        assert text_to_image(prompt="一只猫", request_id="r1")["success"] is True
+        assert text_to_image(prompt="一只猫")["success"] is True
+        assert edit_image(prompt="一只猫")["success"] is True
+        get_catalog().flush()
+
+        rows = catalog.find("一只猫")
+        assert [row["output_sha256"] for row in rows] == [
+            hashlib.sha256(data).hexdigest() for data in (b"edited", b"cat-2", b"cat-1")
+        ]
+        edited, _, first = rows
+        assert first["request_id"] == "r1" and first["function"] == "text_to_image"
+        assert first["prompt"] == "一只猫" and first["input_sha256"] is None
+        assert first["bytes"] == 5 and first["mime"] == "image/png" and first["model"]
+        assert Path(edited["path"]).read_bytes() == b"edited"
+        assert edited["input_sha256"] == hashlib.sha256(b"input-image").hexdigest()
+
+        assert catalog.find("一只猫", input_image=b"input-image") == [edited]
+        assert catalog.find("一只猫", function="text_to_image", limit=1)[0]["output_sha256"] == rows[1]["output_sha256"]
+        assert get_catalog().by_output(edited["output_sha256"]) == [edited]
+        assert get_catalog().by_input(edited["input_sha256"]) == [edited]
+        assert len(get_catalog().between(since=first["ts"])) == 3
+        assert catalog.find("一只狗") == []
+
+    @patch('src.main.requests.post')
+    def test_failed_calls_not_recorded_and_events_forwarded(self, mock_post, workspace):
+        failed = MagicMock()
+        failed.status_code = 400
+        failed.text = "bad request"
+        mock_post.side_effect = [failed, image_response(b"dog")]
+
+        assert text_to_image(prompt="一只狗")["success"] is False
+        seen = []
+        events.run("text_to_image", seen.append, prompt="一只狗")
+        get_catalog().flush()
+
+        row, = catalog.find("一只狗")
+        written = next(event for event in seen if event.type == "written")
+        assert written.data["sha256"] == row["output_sha256"] == hashlib.sha256(b"dog").hexdigest()
+        assert get_catalog().stats()["written"] == 1
+
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.delenv("GEMINI_CATALOG", raising=False)
+        assert get_catalog() is None
+        assert catalog.find("一只猫") == []
+
+
+WRITER = """
+import sys
+sys.path.insert(0, {root!r})
+from src.catalog import Catalog, sha256_hex
+c = Catalog({path!r})
+for i in range({count}):
+    c.add({{
+        "ts": float(i), "function": "text_to_image", "prompt_sha256": sha256_hex("{name}"),
+        "output_sha256": "{name}-%d" % i,
+    }})
+c.close()
+print(c.stats()["written"])
+"""
+
+
+class TestConcurrentProcesses:
+    """测试多个进程同时写入和读取同一个数据库"""
+
+    def test_writers_in_several_processes(self, tmp_path):
+        path = tmp_path / "catalog.db"
+        reader = Catalog(path)
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", WRITER.format(root=str(ROOT), path=str(path), count=500, name=name)],
+                stdout=subprocess.PIPE, text=True
+            )
+            for name in ("a", "b", "c")
+        ]
+        # 写入进行中时读取不被阻塞
+        deadline = time.monotonic() + 30
+        while any(process.poll() is None for process in processes) and time.monotonic() < deadline:
+            reader.between(limit=10)
+
+        assert [process.communicate()[0].strip() for process in processes] == ["500", "500", "500"]
+        for name in ("a", "b", "c"):
+            assert len(reader.find(name, limit=-1)) == 500
+        assert reader.by_output("b-499")[0]["ts"] == 499.0
+        reader.close()
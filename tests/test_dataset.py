@@ -0,0 +1,159 @@
+"""
+数据集生成测试
+"""
+
+import hashlib
+import json
+import tarfile
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.dataset import DatasetReader, DatasetWriter, generate_dataset
+
+from conftest import image_response, sent_json
+
+PROMPTS = ["一只猫", "一只狗", "一只鸟"]
+
+
+def _image_response(*args, **kwargs) -> MagicMock:
+    """每次返回内容不同的图像，内容中带上提示词"""
+    prompt = json.loads(kwargs["data"])["contents"][0]["parts"][0]["text"]
+    with _counter_lock:
+        _counter[0] += 1
+        data = f"{prompt}#{_counter[0]}".encode('utf-8') * 50
+    return image_response(data)
+
+
+_counter = [0]
+_counter_lock = threading.Lock()
+
+
+class TestGenerateDataset:
+    """测试生成、分片与随机读取"""
+
+    @pytest.mark.parametrize("layout", ["dir", "tar"])
+    @patch('src.main.requests.post')
+    def test_generates_sharded_dataset(self, mock_post, workspace, layout):
+        mock_post.side_effect = _image_response
+
+        summary = generate_dataset(PROMPTS, workspace / "ds", variants=2, layout=layout, shard_size=4)
+
+        assert (summary["total"], summary["generated"], summary["failed"], summary["skipped"]) == (6, 6, 0, 0)
+        assert not (workspace / "data").exists()
+        shards = sorted(p.name for p in (workspace / "ds" / "shards").iterdir())
+        assert shards == (["00000.tar", "00001.tar"] if layout == "tar" else ["00000", "00001"])
+
+        reader = DatasetReader(workspace / "ds")
+        assert len(reader) == 6
+        for p, v in reader.keys():
+            image = reader.read(p, v)
+            record = reader.records[(p, v)]
+            assert image.startswith(reader.prompt(p).encode('utf-8'))
+            assert hashlib.sha256(image).hexdigest() == record["sha256"]
+            assert record["bytes"] == len(image) and record["mime"] == "image/png" and record["ms"] >= 0
+
+    @patch('src.main.requests.post')
+    def test_tar_shards_are_valid_archives(self, mock_post, workspace):
+        mock_post.side_effect = _image_response
+
+        generate_dataset(PROMPTS, workspace / "ds", variants=2, layout="tar", shard_size=4, concurrency=3)
+
+        reader = DatasetReader(workspace / "ds")
+        with tarfile.open(workspace / "ds" / "shards" / "00000.tar") as archive:
+            members = archive.getmembers()
+            assert len(members) == 4
+            for member in members:
+                record = next(r for r in reader.records.values() if r["name"] == member.name)
+                assert archive.extractfile(member).read() == reader.read(record["p"], record["v"])
+
+    @patch('src.main.requests.post')
+    def test_resume_skips_indexed_and_retries_failed(self, mock_post, workspace):
+        failing = {"calls": 0}
+
+        def flaky(*args, **kwargs):
+            failing["calls"] += 1
+            if failing["calls"] in (2, 5):
+                response = MagicMock()
+                response.status_code = 400
+                response.text = "bad request"
+                return response
+            return _image_response(*args, **kwargs)
+
+        mock_post.side_effect = flaky
+        first = generate_dataset(PROMPTS, workspace / "ds", variants=2, layout="tar", shard_size=4, concurrency=1)
+        assert (first["generated"], first["failed"]) == (4, 2)
+        assert first["errors"] == {first["failures"][0]["error_code"]: 2}
+
+        # 模拟写入中断：tar 尾部有未入索引的数据，索引末行不完整
+        with open(workspace / "ds" / "shards" / "00001.tar", "ab") as f:
+            f.write(b"garbage" * 100)
+        with open(workspace / "ds" / "index.jsonl", "a") as f:
+            f.write('{"p": 2, "v"')
+
+        mock_post.side_effect = _image_response
+        second = generate_dataset(PROMPTS, workspace / "ds", variants=2, layout="tar", shard_size=4, concurrency=1)
+
+        assert (second["skipped"], second["generated"], second["failed"]) == (4, 2, 0)
+        reader = DatasetReader(workspace / "ds")
+        assert len(reader) == 6
+        for p, v in reader.keys():
+            assert hashlib.sha256(reader.read(p, v)).hexdigest() == reader.records[(p, v)]["sha256"]
+        with tarfile.open(workspace / "ds" / "shards" / "00001.tar") as archive:
+            assert len(archive.getmembers()) == 2
+
+    @patch('src.main.requests.post')
+    def test_rejects_resume_with_different_parameters(self, mock_post, workspace):
+        mock_post.side_effect = _image_response
+        generate_dataset(PROMPTS, workspace / "ds", variants=1)
+
+        with pytest.raises(ValueError):
+            generate_dataset(PROMPTS + ["一条鱼"], workspace / "ds", variants=1)
+        with pytest.raises(ValueError):
+            generate_dataset(PROMPTS, workspace / "other", layout="zip")
+
+        meta = json.loads((workspace / "ds" / "dataset.json").read_text(encoding="utf-8"))
+        assert meta["prompts"] == 3
+
+    @patch('src.main.requests.post')
+    def test_variants_use_distinct_reproducible_seeds(self, mock_post, workspace):
+        mock_post.side_effect = _image_response
+        generate_dataset(PROMPTS, workspace / "ds", variants=3)
+
+        seeds = {}
+        for call in mock_post.call_args_list:
+            body = sent_json(call)
+            seeds[(body["contents"][0]["parts"][0]["text"], body["generationConfig"]["seed"])] = True
+        assert len(seeds) == 9
+        records = DatasetReader(workspace / "ds").records
+        assert len({r["seed"] for r in records.values()}) == 9
+
+        mock_post.reset_mock()
+        generate_dataset(PROMPTS, workspace / "again", variants=3)
+        again = DatasetReader(workspace / "again").records
+        assert {k: r["seed"] for k, r in again.items()} == {k: r["seed"] for k, r in records.items()}
+
+    @patch('src.main.requests.post')
+    def test_write_failure_aborts_and_is_reported(self, mock_post, workspace):
+        mock_post.side_effect = _image_response
+        original_add = DatasetWriter.add
+        calls = {"n": 0}
+
+        def failing_add(self, *args, **kwargs):
+            calls["n"] += 1
+            if calls["n"] == 2:
+                raise OSError(28, "No space left on device")
+            return original_add(self, *args, **kwargs)
+
+        with patch.object(DatasetWriter, "add", failing_add):
+            first = generate_dataset(PROMPTS, workspace / "ds", variants=2, layout="tar", concurrency=1)
+
+        assert (first["generated"], first["failed"]) == (1, 1)
+        assert first["errors"] == {"WRITE_FAILED": 1}
+        assert "No space left on device" in first["aborted"]
+        assert mock_post.call_count == 2
+
+        second = generate_dataset(PROMPTS, workspace / "ds", variants=2, layout="tar", concurrency=1)
+        assert (second["skipped"], second["generated"], second["failed"], second["aborted"]) == (1, 5, 0, None)
+        assert len(DatasetReader(workspace / "ds")) == 6
@@ -0,0 +1,138 @@
+"""
+按 manifest 分发调用测试
+"""
+
+import json
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import dispatch as dispatch_module
+from src.dispatch import Dispatcher, compile_validator, dispatch, get_dispatcher
+
+MANIFEST = json.loads(dispatch_module.MANIFEST_PATH.read_text(encoding="utf-8"))
+FUNCTIONS = {function["name"]: function for function in MANIFEST["functions"]}
+
+
+def _write_inputs(workspace: Path, count: int, group: str = "input_image") -> None:
+    directory = workspace / "data" / "inputs" / group
+    directory.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        (directory / f"input{index}.png").write_bytes(b"image")
+
+
+class TestCompiledValidator:
+    """测试由 manifest 编译出的参数和文件校验"""
+
+    @pytest.mark.parametrize("arguments, message", [
+        ({}, "缺少必需参数: prompt"),
+        ({"prompt": None}, "缺少必需参数: prompt"),
+        ({"prompt": 1}, "prompt 参数必须是字符串"),
+        ({"prompt": "猫", "stream": 1}, "stream 参数必须是布尔值"),
+        ({"prompt": "猫", "deadline": True}, "deadline 参数必须是数字"),
+        ({"prompt": "猫", "emit": print}, "不支持参数: emit"),
+    ])
+    def test_text_to_image_rejected(self, arguments, message, workspace):
+        error = compile_validator(FUNCTIONS["text_to_image"])(arguments)
+
+        assert error["success"] is False and error["error_code"] == "INVALID_PARAMETER"
+        assert message in error["error"]
+
+    def test_valid_arguments_pass(self, workspace):
+        validate = compile_validator(FUNCTIONS["text_to_image"])
+
+        assert validate({"prompt": "猫"}) is None
+        assert validate({"prompt": "猫", "stream": True, "deadline": 5, "request_id": None}) is None
+
+    def test_array_items_and_integer_types(self, workspace):
+        _write_inputs(workspace, 1)
+        validate = compile_validator(FUNCTIONS["edit_image"])
+
+        assert validate({"prompt": "猫", "region": [0, 0, 8, 8], "tile_size": 256}) is None
+        assert validate({"prompt": "猫", "region": [0, 0, 8.5, 8]})["error_code"] == "INVALID_PARAMETER"
+        assert validate({"prompt": "猫", "region": "0,0,8,8"})["error_code"] == "INVALID_PARAMETER"
+        assert validate({"prompt": "猫", "tile_size": 2.0})["error_code"] == "INVALID_PARAMETER"
+
+    @pytest.mark.parametrize("region", [[0, 0, 8], [0, 0, 8, 8, 8], []])
+    def test_region_needs_four_items(self, region, workspace):
+        _write_inputs(workspace, 1)
+        calls = []
+        dispatcher = Dispatcher(functions={"edit_image": lambda **kwargs: calls.append(kwargs) or {"success": True}})
+
+        error = dispatcher.dispatch("edit_image", {"prompt": "猫", "region": region})
+
+        assert error["error_code"] == "INVALID_PARAMETER" and error["error"].endswith("长度 4")
+        assert calls == []
+
+    def test_array_length_limits(self):
+        validate = compile_validator({"name": "f", "parameters": [
+            {"name": "box", "type": "array", "items": {"type": "integer"}, "minItems": 2, "maxItems": 3},
+        ]})
+
+        assert validate({"box": [1, 2]}) is None
+        assert "长度 2~3" in validate({"box": [1]})["error"]
+        assert validate({"box": [1, 2, 3, 4]})["error_code"] == "INVALID_PARAMETER"
+
+    def test_input_file_counts(self, workspace):
+        validate = compile_validator(FUNCTIONS["edit_image"])
+
+        assert validate({"prompt": "猫"})["error_code"] == "NO_INPUT_FILE"
+        # 会话续编时可以不提供输入图像
+        assert validate({"prompt": "猫", "session_id": "s1"}) is None
+
+        _write_inputs(workspace, 1)
+        _write_inputs(workspace, 1, "mask_image")
+        assert validate({"prompt": "猫"}) is None
+
+        _write_inputs(workspace, 2, "mask_image")
+        error = validate({"prompt": "猫"})
+        assert error["error_code"] == "INVALID_INPUT_FILE" and "mask_image" in error["error"]
+
+    def test_hidden_files_and_directories_not_counted(self, workspace):
+        _write_inputs(workspace, 1)
+        _write_inputs(workspace, 1, "mask_image")
+        mask_dir = workspace / "data" / "inputs" / "mask_image"
+        (mask_dir / ".DS_Store").write_bytes(b"finder")
+        (mask_dir / "nested").mkdir()
+        calls = []
+        dispatcher = Dispatcher(functions={"edit_image": lambda **kwargs: calls.append(kwargs) or {"success": True}})
+
+        assert dispatcher.dispatch("edit_image", {"prompt": "猫"}) == {"success": True}
+        assert calls == [{"prompt": "猫"}]
+
+        (workspace / "data" / "inputs" / "input_image" / "input0.png").unlink()
+        assert dispatcher.dispatch("edit_image", {"prompt": "猫"})["error_code"] == "NO_INPUT_FILE"
+
+
+class TestDispatcher:
+    """测试按函数名路由"""
+
+    def test_routes_valid_calls_only(self, workspace):
+        calls = []
+        dispatcher = Dispatcher(functions={"text_to_image": lambda **kwargs: calls.append(kwargs) or {"success": True}})
+
+        assert dispatcher.dispatch("text_to_image", {"prompt": "猫", "stream": True}) == {"success": True}
+        assert dispatcher.dispatch("text_to_image", {"prompt": 3})["error_code"] == "INVALID_PARAMETER"
+        assert calls == [{"prompt": "猫", "stream": True}]
+        with pytest.raises(ValueError):
+            dispatcher.dispatch("edit_image", {"prompt": "猫"})
+
+    @patch('src.main.requests.post')
+    def test_shared_dispatcher_calls_main(self, mock_post, workspace):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+            "mimeType": "image/png", "data": "aW1hZ2U="
+        }}]}}]}
+        mock_post.return_value = response
+        seen = []
+
+        result = dispatch("text_to_image", {"prompt": "一只猫"}, on_event=seen.append)
+
+        assert result["success"] is True
+        assert (workspace / "data" / "outputs" / "generated_image.png").read_bytes() == b"image"
+        assert [event.type for event in seen][-1] == "done"
+        assert get_dispatcher() is get_dispatcher()
+        assert dispatch("edit_image", {"prompt": "换背景"})["error_code"] == "NO_INPUT_FILE"
+        assert mock_post.call_count == 1
@@ -0,0 +1,65 @@
+"""
+事件流进度接口测试
+"""
+
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src import events
+
+from conftest import image_response
+
+
+class TestRun:
+    """测试回调方式"""
+
+    @patch('src.main.requests.post')
+    def test_emits_events_in_order(self, mock_post, workspace):
+        mock_post.return_value = image_response(b"image-bytes")
+        received = []
+
+        result = events.run("text_to_image", received.append, prompt="一只猫")
+
+        assert result["success"] is True
+        assert [e.type for e in received] == [
+            "queued", "admitted", "request_sent", "first_byte", "image_decoded", "written", "done"
+        ]
+        assert [e.elapsed_ms for e in received] == sorted(e.elapsed_ms for e in received)
+        written = received[5].data
+        assert written["bytes"] == len(b"image-bytes")
+        assert Path(written["path"]).read_bytes() == b"image-bytes"
+        assert received[-1].data["result"] is result
+        assert received[0].to_dict()["function"] == "text_to_image"
+
+    def test_validation_error_emits_error_event(self, workspace):
+        received = []
+
+        result = events.run("edit_image", received.append, prompt="")
+
+        assert result["error_code"] == "INVALID_PROMPT"
+        assert [(e.type, e.data["error_code"]) for e in received] == [("error", "INVALID_PROMPT")]
+
+    def test_unknown_function(self):
+        with pytest.raises(ValueError):
+            events.run("no_such_function", print, prompt="x")
+
+
+class TestIterEvents:
+    """测试生成器方式"""
+
+    @patch('src.main.requests.post')
+    def test_yields_until_done(self, mock_post, workspace):
+        mock_post.return_value = image_response(b"image-bytes")
+
+        received = list(events.iter_events("text_to_image", prompt="一只猫"))
+
+        assert received[-1].type == "done"
+        assert "written" in [e.type for e in received]
+
+    def test_bad_arguments_end_with_error(self, workspace):
+        received = list(events.iter_events("text_to_image", prompt="一只猫", no_such_argument=1))
+
+        assert [e.type for e in received] == ["error"]
+        assert received[0].data["error_code"] == "UNEXPECTED_ERROR"
@@ -0,0 +1,156 @@
+"""
+输入图像上传复用测试
+
+使用本地桩服务器模拟 files 上传接口和 generateContent 接口。
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.main
+from src.files import FileCache, FileRef, get_file_cache, upload_url
+from src.main import edit_image
+
+
+@pytest.fixture
+def gemini_server():
+    """模拟 Gemini 的 files 接口与 generateContent 接口，记录收到的请求"""
+
+    class Handler(BaseHTTPRequestHandler):
+        uploads = []
+        image_parts = []
+        known_files = set()
+
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            if self.path.startswith("/upload/v1beta/files"):
+                name = f"files/f{len(self.uploads)}"
+                self.uploads.append(body)
+                self.known_files.add(name)
+                self._reply(200, {"file": {
+                    "name": name,
+                    "uri": f"http://{self.headers['Host']}/v1beta/{name}",
+                    "mimeType": self.headers["Content-Type"],
+                    "expirationTime": "2099-01-01T00:00:00.000000Z",
+                }})
+                return
+
+            part = json.loads(body)["contents"][0]["parts"][-1]
+            self.image_parts.append(part)
+            if "file_data" in part and part["file_data"]["file_uri"].split("/v1beta/")[1] not in self.known_files:
+                self._reply(404, {"error": {"message": "File not found"}})
+                return
+            self._reply(200, {"candidates": [{"content": {"parts": [{
+                "inlineData": {"data": base64.b64encode(b"edited").decode('utf-8')}
+            }]}}]})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield Handler, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workspace_env():
+    """开启上传复用"""
+    return {"GEMINI_API_KEY": "test-api-key", "GEMINI_UPLOAD_INPUTS": "1", "GEMINI_UPLOAD_MIN_BYTES": "0"}
+
+
+@pytest.fixture
+def workspace(workspace):
+    """带输入图像的工作空间"""
+    os.makedirs("data/inputs/input_image")
+    with open("data/inputs/input_image/photo.jpg", "wb") as f:
+        f.write(os.urandom(4096))
+    return workspace
+
+
+class TestFileCache:
+    """测试文件引用缓存"""
+
+    def test_expired_entries_are_dropped(self):
+        cache = FileCache()
+        cache.put("fresh", FileRef("uri-1", "image/png", time.time() + 3600))
+        cache.put("stale", FileRef("uri-2", "image/png", time.time() + 10))
+
+        assert cache.get("fresh").uri == "uri-1"
+        assert cache.get("stale") is None
+
+    def test_lru_eviction(self):
+        cache = FileCache(max_entries=2)
+        for key in ("a", "b"):
+            cache.put(key, FileRef(key, "image/png", time.time() + 3600))
+        cache.get("a")
+        cache.put("c", FileRef("c", "image/png", time.time() + 3600))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+    def test_upload_url(self):
+        assert upload_url("https://gemini.visualize.top/v1beta") == "https://gemini.visualize.top/upload/v1beta/files"
+
+
+class TestEditImageUploadReuse:
+    """测试 edit_image 复用已上传的输入"""
+
+    def test_repeated_edits_upload_once(self, gemini_server, workspace, monkeypatch):
+        handler, base = gemini_server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", base)
+
+        results = [edit_image(prompt=f"第 {i} 次编辑") for i in range(3)]
+
+        assert all(r["success"] for r in results)
+        assert len(handler.uploads) == 1
+        assert all("file_data" in part for part in handler.image_parts)
+        assert handler.image_parts[0]["file_data"]["mime_type"] == "image/jpeg"
+
+    def test_stale_reference_falls_back_to_inline(self, gemini_server, workspace, monkeypatch):
+        handler, base = gemini_server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", base)
+        edit_image(prompt="第一次编辑")
+        handler.known_files.clear()
+
+        result = edit_image(prompt="文件已被删除")
+
+        assert result["success"] is True
+        assert "inline_data" in handler.image_parts[-1]
+        # 失效的引用已被作废，下一次编辑会重新上传
+        edit_image(prompt="再次编辑")
+        assert len(handler.uploads) == 2
+
+    def test_disabled_by_default(self, gemini_server, workspace, monkeypatch):
+        handler, base = gemini_server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", base)
+        monkeypatch.delenv("GEMINI_UPLOAD_INPUTS")
+
+        edit_image(prompt="编辑")
+
+        assert handler.uploads == []
+        assert "inline_data" in handler.image_parts[0]
+
+
+@pytest.fixture(autouse=True)
+def _clear_file_cache():
+    yield
+    get_file_cache().clear()
@@ -0,0 +1,188 @@
+"""
+动画逐帧编辑测试
+"""
+
+import base64
+import io
+import json
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import events, tiles
+from src.frames import AnimatedImage, is_animated
+from src.main import edit_image
+
+from conftest import sent_json
+
+Image = pytest.importorskip("PIL.Image")
+
+RED, GREEN, BLUE = (255, 0, 0), (0, 255, 0), (0, 0, 255)
+
+
+def _animation(colors, durations, format="GIF", loop=0) -> bytes:
+    frames = [Image.new("RGB", (48, 32), color) for color in colors]
+    buffer = io.BytesIO()
+    options = {"lossless": True} if format == "WEBP" else {}
+    if loop is not None:
+        options["loop"] = loop
+    frames[0].save(buffer, format=format, save_all=True, append_images=frames[1:], duration=durations, **options)
+    return buffer.getvalue()
+
+
+def _frames(data: bytes) -> list:
+    image = Image.open(io.BytesIO(data))
+    frames = []
+    for index in range(image.n_frames):
+        image.seek(index)
+        frames.append((image.convert("RGB").getpixel((5, 5)), image.info["duration"]))
+    return frames
+
+
+def _inverting_response(*args, **kwargs) -> MagicMock:
+    """把请求中的帧反色后以较小尺寸返回"""
+    parts = json.loads(kwargs["data"])["contents"][-1]["parts"]
+    inline = next(part["inline_data"] for part in parts if "inline_data" in part)
+    frame = Image.open(io.BytesIO(base64.b64decode(inline["data"]))).convert("RGB")
+    inverted = Image.eval(frame, lambda value: 255 - value).resize((24, 16))
+    buffer = io.BytesIO()
+    inverted.save(buffer, format="PNG")
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+        "mimeType": "image/png", "data": base64.b64encode(buffer.getvalue()).decode('utf-8')
+    }}]}}]}
+    return response
+
+
+class TestAnimatedImage:
+    """测试解码、去重与组装"""
+
+    def test_duplicate_frames_decoded_once(self):
+        animation = AnimatedImage(_animation([RED, GREEN, RED, GREEN, BLUE], [100, 200, 300, 400, 500]))
+
+        assert len(animation.unique) == 3
+        assert animation.order == [0, 1, 0, 1, 2]
+        assert animation.durations == [100, 200, 300, 400, 500]
+        assert animation.mime_type == "image/gif"
+
+    def test_assemble_keeps_order_and_timing(self):
+        data = _animation([RED, GREEN, RED, BLUE], [100, 200, 300, 400])
+        animation = AnimatedImage(data)
+
+        assert _frames(animation.assemble({})) == _frames(data)
+
+    @pytest.mark.parametrize("loop", [None, 0, 3])
+    def test_assemble_keeps_loop_count(self, loop):
+        data = _animation([RED, GREEN], [100, 200], loop=loop)
+
+        assembled = Image.open(io.BytesIO(AnimatedImage(data).assemble({})))
+
+        assert assembled.info.get("loop") == Image.open(io.BytesIO(data)).info.get("loop") == loop
+
+    @pytest.mark.parametrize("format", ["PNG", "WEBP"])
+    def test_other_animated_formats(self, format):
+        data = _animation([RED, GREEN, RED], [100, 200, 300], format=format)
+
+        animation = AnimatedImage(data)
+
+        assert is_animated(data)
+        assert animation.order == [0, 1, 0]
+        assert Image.open(io.BytesIO(animation.assemble({}))).format == format
+
+    def test_still_image_is_not_animated(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8)).save(buffer, format="GIF")
+
+        assert not is_animated(buffer.getvalue())
+        assert not is_animated(b"not an image")
+
+
+class TestEditAnimation:
+    """测试 edit_image 的动画输入"""
+
+    @pytest.fixture
+    def workspace(self, workspace, monkeypatch):
+        monkeypatch.setattr(tiles, "RETRY_BACKOFF", 0)
+        inputs_dir = workspace / "data" / "inputs" / "input_image"
+        inputs_dir.mkdir(parents=True)
+        (inputs_dir / "input.gif").write_bytes(_animation([RED, GREEN, RED, GREEN, BLUE], [100, 200, 300, 400, 500]))
+        return workspace
+
+    @patch('src.main.requests.post')
+    def test_distinct_frames_edited_concurrently_and_reassembled(self, mock_post, workspace):
+        in_flight = {"now": 0, "max": 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(3, timeout=5)
+
+        def respond(*args, **kwargs):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            barrier.wait()
+            with lock:
+                in_flight["now"] -= 1
+            return _inverting_response(*args, **kwargs)
+
+        mock_post.side_effect = respond
+        seen = []
+
+        result = events.run("edit_image", seen.append, prompt="反色")
+
+        assert result["success"] is True
+        assert (result["frames"], result["unique_frames"]) == (5, 3)
+        assert mock_post.call_count == 3 and in_flight["max"] == 3
+        output = workspace / "data" / "outputs" / "edited_image.gif"
+        assert _frames(output.read_bytes()) == [
+            ((0, 255, 255), 100), ((255, 0, 255), 200), ((0, 255, 255), 300), ((255, 0, 255), 400),
+            ((255, 255, 0), 500),
+        ]
+        assert Image.open(output).size == (48, 32)
+        assert sorted(e.data["index"] for e in seen if e.type == "frame" and e.data["status"] == "done") == [0, 1, 2]
+        prompt = sent_json(mock_post.call_args)["contents"][-1]["parts"][0]["text"]
+        assert "/3 个不同画面" in prompt and "反色" in prompt
+
+    @patch('src.main.requests.post')
+    def test_failed_frame_retried_then_reported(self, mock_post, workspace, monkeypatch):
+        failure = MagicMock()
+        failure.status_code = 503
+        failure.text = "unavailable"
+        mock_post.side_effect = lambda *args, **kwargs: (
+            failure if "第 2/3" in json.loads(kwargs["data"])["contents"][-1]["parts"][0]["text"]
+            else _inverting_response(*args, **kwargs)
+        )
+        monkeypatch.setenv("GEMINI_TILE_ATTEMPTS", "2")
+
+        result = edit_image(prompt="反色")
+
+        assert result["success"] is False
+        assert result["error_code"] == "API_REQUEST_FAILED"
+        assert result["failed_frames"] == [1]
+        assert mock_post.call_count == 4
+        assert not (workspace / "data" / "outputs").exists()
+
+    @patch('src.main.requests.post')
+    def test_invalid_frame_request_not_retried(self, mock_post, workspace, monkeypatch):
+        failure = MagicMock()
+        failure.status_code = 400
+        failure.text = "bad request"
+        mock_post.side_effect = lambda *args, **kwargs: (
+            failure if "第 2/3" in json.loads(kwargs["data"])["contents"][-1]["parts"][0]["text"]
+            else _inverting_response(*args, **kwargs)
+        )
+        monkeypatch.setenv("GEMINI_TILE_ATTEMPTS", "3")
+
+        result = edit_image(prompt="反色")
+
+        assert result["failed_frames"] == [1]
+        assert mock_post.call_count == 3
+
+    def test_too_many_frames_or_combined_modes_rejected(self, workspace, monkeypatch):
+        assert edit_image(prompt="反色", tile_size=256)["error_code"] == "INVALID_ANIMATION"
+        assert edit_image(prompt="反色", region=[0, 0, 8, 8])["error_code"] == "INVALID_ANIMATION"
+
+        monkeypatch.setenv("GEMINI_MAX_FRAMES", "2")
+        result = edit_image(prompt="反色")
+        assert result["error_code"] == "INVALID_ANIMATION"
+        assert "3 个不同画面" in result["error"]
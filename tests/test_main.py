@@ -4,7 +4,9 @@ Gemini 图像生成预制件测试
 测试所有暴露给 AI 的函数，确保它们按预期工作。
 """
 
+import ast
 import base64
+import json
 import os
 import shutil
 import tempfile
@@ -113,24 +115,15 @@ class TestEditImage:
     """测试图像编辑功能"""
 
     @pytest.fixture
-    def workspace(self):
-        """创建临时工作空间"""
-        temp_dir = tempfile.mkdtemp()
-        workspace_path = Path(temp_dir)
-
-        inputs_dir = workspace_path / "data" / "inputs" / "input_image"
+    def workspace(self, workspace):
+        """带输入图像的工作空间"""
+        inputs_dir = workspace / "data" / "inputs" / "input_image"
         inputs_dir.mkdir(parents=True)
 
         test_image = inputs_dir / "test.png"
         test_image.write_bytes(b"fake_input_image_content")
 
-        original_cwd = os.getcwd()
-        os.chdir(workspace_path)
-
-        yield workspace_path
-
-        os.chdir(original_cwd)
-        shutil.rmtree(temp_dir)
+        return workspace
 
     @patch('src.main.requests.post')
     def test_edit_image_success(self, mock_post, workspace, monkeypatch):
@@ -245,9 +238,24 @@ class TestEditImage:
             assert result["success"] is True
 
             call_args = mock_post.call_args
-            request_data = call_args[1]['json']
+            request_data = json.loads(call_args[1]['data'])
             assert request_data['contents'][0]['parts'][1]['inline_data']['mime_type'] == 'image/jpeg'
 
         finally:
             os.chdir(original_cwd)
             shutil.rmtree(temp_dir)
+
+
+class TestManifestConsistency:
+    """与 scripts/validate_manifest.py 相同的检查：main.py 中所有非下划线开头的函数（含嵌套函数）都要在 manifest 中声明"""
+
+    def test_no_undeclared_public_functions(self):
+        root = Path(__file__).resolve().parent.parent
+        tree = ast.parse((root / "src" / "main.py").read_text(encoding="utf-8"))
+        manifest = json.loads((root / "prefab-manifest.json").read_text(encoding="utf-8"))
+
+        public = {
+            node.name for node in ast.walk(tree) if isinstance(node, ast.FunctionDef) and not node.name.startswith("_")
+        }
+
+        assert public == {function["name"] for function in manifest["functions"]}
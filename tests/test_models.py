@@ -0,0 +1,131 @@
+"""
+模型注册表与降级策略测试
+"""
+
+import base64
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.main import edit_image, text_to_image
+from src.models import MODEL_REGISTRY, FallbackPolicy, get_model_spec, get_policy
+
+PRIMARY = "gemini-3-pro-image-preview"
+FALLBACK = "gemini-2.5-flash-image"
+
+
+class TestModelRegistry:
+    """测试模型注册表"""
+
+    def test_timeouts_per_function(self):
+        spec = get_model_spec(PRIMARY)
+
+        assert spec.timeout_for("text_to_image") == 60
+        assert spec.timeout_for("edit_image") == 90
+        assert spec.latency_target_for("text_to_image") < spec.latency_target_for("edit_image")
+
+    def test_fallback_is_cheaper_and_faster(self):
+        primary, fallback = MODEL_REGISTRY[PRIMARY], MODEL_REGISTRY[FALLBACK]
+
+        assert fallback.cost_weight < primary.cost_weight
+        for function in ("text_to_image", "edit_image"):
+            assert fallback.latency_target_for(function) < primary.latency_target_for(function)
+
+    def test_unknown_model(self):
+        with pytest.raises(ValueError):
+            get_model_spec("no-such-model")
+
+
+class TestFallbackPolicy:
+    """测试基于 p95 的降级与恢复"""
+
+    def test_degrades_when_primary_p95_over_target(self):
+        policy = FallbackPolicy(PRIMARY, [FALLBACK], min_samples=5)
+
+        for _ in range(5):
+            policy.record(PRIMARY, "text_to_image", 10.0)
+        assert policy.choose("text_to_image").name == PRIMARY
+
+        policy.record(PRIMARY, "text_to_image", 100.0)
+        assert policy.degraded == {"text_to_image"}
+        assert policy.choose("text_to_image").name == FALLBACK
+
+    def test_functions_degrade_independently(self):
+        policy = FallbackPolicy(PRIMARY, [FALLBACK], min_samples=3)
+
+        # 50 秒超过文生图目标（40），但仍在编辑目标（60）以内
+        for _ in range(3):
+            policy.record(PRIMARY, "edit_image", 50.0)
+        assert policy.degraded == set()
+
+        for _ in range(3):
+            policy.record(PRIMARY, "text_to_image", 50.0)
+        assert policy.degraded == {"text_to_image"}
+        assert policy.choose("edit_image").name == PRIMARY
+        assert policy.choose("text_to_image").name == FALLBACK
+        assert policy.p95(PRIMARY, "edit_image") == 50.0
+
+    def test_probes_and_recovers(self):
+        policy = FallbackPolicy(PRIMARY, [FALLBACK], min_samples=3, probe_every=4)
+        for _ in range(3):
+            policy.record(PRIMARY, "edit_image", 100.0)
+        assert policy.degraded == {"edit_image"}
+
+        chosen = [policy.choose("edit_image").name for _ in range(8)]
+        assert chosen.count(PRIMARY) == 2
+
+        for _ in range(3):
+            policy.record(PRIMARY, "edit_image", 5.0)
+        assert policy.degraded == set()
+        assert policy.choose("edit_image").name == PRIMARY
+
+    def test_no_fallbacks_never_degrades(self):
+        policy = FallbackPolicy(PRIMARY, [], min_samples=1)
+
+        policy.record(PRIMARY, "text_to_image", 1000.0)
+
+        assert policy.choose("text_to_image").name == PRIMARY
+        assert policy.stats()["degraded"] == []
+        assert policy.stats()["p95"]["text_to_image"][PRIMARY] == 1000.0
+
+    def test_env_configuration(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_MODEL", FALLBACK)
+        monkeypatch.setenv("GEMINI_FALLBACK_MODELS", "")
+
+        policy = get_policy()
+
+        assert policy.primary.name == FALLBACK
+        assert policy.fallbacks == []
+
+
+class TestResultReportsModel:
+    """测试结果中报告实际使用的模型"""
+
+    @pytest.fixture
+    def workspace(self, workspace):
+        os.makedirs("data/inputs/input_image")
+        with open("data/inputs/input_image/test.png", "wb") as f:
+            f.write(b"fake_input_image_content")
+        return workspace
+
+    @patch('src.main.requests.post')
+    def test_model_and_timeout_from_registry(self, mock_post, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-api-key")
+        monkeypatch.setenv("GEMINI_MODEL", FALLBACK)
+        monkeypatch.setenv("GEMINI_ADAPTIVE_TIMEOUTS", "0")
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"candidates": [{"content": {"parts": [{
+            "inlineData": {"data": base64.b64encode(b"img").decode('utf-8')}
+        }]}}]}
+        mock_post.return_value = mock_response
+
+        generated = text_to_image(prompt="测试提示词")
+        edited = edit_image(prompt="测试编辑")
+
+        assert generated["model"] == FALLBACK
+        assert edited["model"] == FALLBACK
+        urls = [c.args[0] for c in mock_post.call_args_list]
+        assert all(f"/models/{FALLBACK}:generateContent" in url for url in urls)
+        assert [c.kwargs["timeout"][1] for c in mock_post.call_args_list] == [30, 45]
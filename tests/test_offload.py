@@ -0,0 +1,108 @@
+"""
+解码进程池测试
+"""
+
+import base64
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from src.main import text_to_image
+from src.offload import DecodePool, get_decode_pool
+
+
+def _body(parts: list) -> bytes:
+    return json.dumps({"candidates": [{"content": {"parts": parts}}]}).encode('utf-8')
+
+
+def _image_part(content: bytes) -> dict:
+    return {"inlineData": {"mimeType": "image/jpeg", "data": base64.b64encode(content).decode('utf-8')}}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    decode_pool = DecodePool(1)
+    yield decode_pool
+    decode_pool.shutdown()
+
+
+class TestDecodePool:
+    """测试进程池解码"""
+
+    def test_decodes_first_image(self, pool):
+        image = os.urandom(300 * 1024)
+
+        assert pool.decode(_body([{"text": "好的"}, _image_part(image)])) == (image, "image/jpeg", None)
+
+    def test_returns_usage_metadata(self, pool):
+        body = json.loads(_body([_image_part(b"img")]))
+        body["usageMetadata"] = {"promptTokenCount": 10, "totalTokenCount": 1300}
+
+        assert pool.decode(json.dumps(body).encode('utf-8'))[2] == body["usageMetadata"]
+
+    def test_no_candidates(self, pool):
+        assert pool.decode(b'{"candidates": []}') is None
+
+    def test_missing_image_part(self, pool):
+        with pytest.raises(KeyError):
+            pool.decode(_body([{"text": "只有文本"}]))
+
+    @pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="需要 /dev/shm")
+    def test_shared_memory_released(self, pool):
+        before = set(os.listdir("/dev/shm"))
+
+        pool.decode(_body([_image_part(os.urandom(64 * 1024))]))
+        with pytest.raises(ValueError):
+            pool.decode(b"not json")
+
+        assert set(os.listdir("/dev/shm")) - before == set()
+
+
+class TestTextToImageOffload:
+    """测试 text_to_image 接入解码进程池"""
+
+    @pytest.fixture
+    def workspace_env(self):
+        return {
+            "GEMINI_API_KEY": "test-api-key",
+            "GEMINI_DECODE_PROCESSES": "1",
+            "GEMINI_DECODE_OFFLOAD_MIN_BYTES": "0",
+        }
+
+    @pytest.fixture
+    def workspace(self, workspace, monkeypatch):
+        yield workspace
+
+        monkeypatch.delenv("GEMINI_DECODE_PROCESSES")
+        assert get_decode_pool() is None
+
+    @patch('src.main.requests.post')
+    def test_decoded_in_pool(self, mock_post, workspace):
+        response = MagicMock()
+        response.status_code = 200
+        response.content = _body([_image_part(b"offloaded")])
+        response.json.side_effect = AssertionError("不应在本线程解析响应体")
+        mock_post.return_value = response
+
+        result = text_to_image(prompt="一只猫")
+
+        assert result["success"] is True
+        assert (workspace / "data" / "outputs" / "generated_image.png").read_bytes() == b"offloaded"
+
+    @pytest.mark.parametrize("min_bytes", ["0", str(1024 * 1024)])
+    @patch('src.main.requests.post')
+    def test_malformed_body_same_error_inline_and_offloaded(self, mock_post, min_bytes, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_DECODE_OFFLOAD_MIN_BYTES", min_bytes)
+        response = MagicMock()
+        response.status_code = 200
+        response.content = b"<html>bad gateway</html>"
+        response.json.side_effect = requests.exceptions.JSONDecodeError("Expecting value", "<html>", 0)
+        mock_post.return_value = response
+
+        result = text_to_image(prompt="一只猫")
+
+        assert result["success"] is False
+        assert result["error_code"] == "INVALID_RESPONSE_FORMAT"
@@ -0,0 +1,131 @@
+"""
+内容寻址输出存储测试
+"""
+
+import base64
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.main import text_to_image
+from src.output_store import OutputStore, get_output_store
+
+
+class TestOutputStore:
+    """测试去重、引用计数与垃圾回收"""
+
+    def test_identical_content_shares_one_blob(self, tmp_path):
+        store = OutputStore(tmp_path / "store")
+
+        first = store.put(b"same", tmp_path / "out" / "a.png", "req-1/a.png")
+        second = store.put(b"same", tmp_path / "out" / "b.png", "req-2/b.png")
+
+        assert first["deduplicated"] is False
+        assert second == {"sha256": first["sha256"], "deduplicated": True}
+        blob = store.lookup("req-1/a.png")
+        assert blob.suffix == ".png"
+        assert os.path.samefile(tmp_path / "out" / "a.png", blob)
+        assert os.path.samefile(tmp_path / "out" / "b.png", blob)
+        assert store.stats()["blobs"] == 1
+        assert store.stats()["refs"] == 2
+
+    def test_blob_removed_when_last_ref_released(self, tmp_path):
+        store = OutputStore(tmp_path / "store")
+        store.put(b"old", tmp_path / "out.png", "out.png")
+        old_blob = store.lookup("out.png")
+
+        # 同一引用写入新内容：旧 blob 引用计数归零被删除，输出文件指向新内容
+        store.put(b"new", tmp_path / "out.png", "out.png")
+
+        assert not old_blob.exists()
+        assert (tmp_path / "out.png").read_bytes() == b"new"
+
+        assert store.release("out.png") is True
+        assert store.stats()["blobs"] == 0
+        assert (tmp_path / "out.png").read_bytes() == b"new"
+        assert store.release("out.png") is False
+
+    def test_oldest_refs_evicted(self, tmp_path):
+        store = OutputStore(tmp_path / "store", max_refs=2)
+        for i in range(3):
+            store.put(b"img%d" % i, tmp_path / f"{i}.png", f"r{i}")
+
+        assert store.lookup("r0") is None
+        assert store.stats()["blobs"] == 2
+
+    def test_index_persists_and_gc_removes_orphans(self, tmp_path):
+        store = OutputStore(tmp_path / "store")
+        result = store.put(b"kept", tmp_path / "kept.png", "kept")
+        orphan = tmp_path / "store" / "blobs" / "ff" / ("f" * 64 + ".png")
+        orphan.parent.mkdir(parents=True)
+        orphan.write_bytes(b"orphan")
+
+        reopened = OutputStore(tmp_path / "store")
+
+        assert reopened.gc() == {"removed": 1, "freed_bytes": 6}
+        assert reopened.lookup("kept").read_bytes() == b"kept"
+        assert reopened.put(b"kept", tmp_path / "again.png", "again")["sha256"] == result["sha256"]
+
+
+class TestTextToImageOutputStore:
+    """测试 text_to_image 接入输出存储"""
+
+    @pytest.fixture
+    def workspace_env(self):
+        return {"GEMINI_API_KEY": "test-api-key", "GEMINI_OUTPUT_STORE_DIR": "{workspace}/store"}
+
+    @patch('src.main.requests.post')
+    def test_repeat_output_is_deduplicated(self, mock_post, workspace):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+            "mimeType": "image/png", "data": base64.b64encode(b"same-image").decode('utf-8')
+        }}]}}]}
+        mock_post.return_value = response
+
+        first = text_to_image(prompt="一只猫", request_id="req-1")
+        second = text_to_image(prompt="一只猫", request_id="req-2")
+
+        assert first["deduplicated"] is False
+        assert second["deduplicated"] is True
+        assert first["sha256"] == second["sha256"]
+        assert (workspace / "data" / "outputs" / "generated_image.png").read_bytes() == b"same-image"
+        assert get_output_store().stats()["blobs"] == 1
+        assert get_output_store().lookup("req-2/generated_image.png") is not None
+
+    @patch('src.main.requests.post')
+    def test_calls_without_request_id_keep_separate_refs(self, mock_post, workspace):
+        response = MagicMock()
+        response.status_code = 200
+        mock_post.return_value = response
+        for data in (b"first", b"second"):
+            response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+                "mimeType": "image/png", "data": base64.b64encode(data).decode('utf-8')
+            }}]}}]}
+            assert text_to_image(prompt="一只猫")["success"] is True
+
+        # 两次调用的引用互不覆盖，第一次的 blob 不会被第二次释放
+        assert get_output_store().stats()["refs"] == 2
+        assert get_output_store().stats()["blobs"] == 2
+
+    @patch('src.main.requests.post')
+    def test_write_without_store_does_not_touch_linked_blob(self, mock_post, workspace, monkeypatch):
+        response = MagicMock()
+        response.status_code = 200
+        mock_post.return_value = response
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+            "mimeType": "image/png", "data": base64.b64encode(b"stored").decode('utf-8')
+        }}]}}]}
+        text_to_image(prompt="一只猫", request_id="req-1")
+        blob = get_output_store().lookup("req-1/generated_image.png")
+
+        monkeypatch.delenv("GEMINI_OUTPUT_STORE_DIR")
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+            "mimeType": "image/png", "data": base64.b64encode(b"plain").decode('utf-8')
+        }}]}}]}
+        assert text_to_image(prompt="一只猫")["success"] is True
+
+        assert (workspace / "data" / "outputs" / "generated_image.png").read_bytes() == b"plain"
+        assert blob.read_bytes() == b"stored"
+        assert [path.name for path in (workspace / "data" / "outputs").iterdir()] == ["generated_image.png"]
@@ -0,0 +1,144 @@
+"""
+性能剖析测试
+"""
+
+import base64
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import profiling
+from src.main import edit_image, text_to_image
+from src.profiling import StackSampler, parse_modes
+
+
+@pytest.fixture
+def workspace_env():
+    return {"GEMINI_API_KEY": "test-api-key", "GEMINI_PROFILE_DIR": "{workspace}/profiles"}
+
+
+def _slow_response(*args, **kwargs) -> MagicMock:
+    time.sleep(0.05)
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+        "mimeType": "image/png", "data": base64.b64encode(b"x" * 200000).decode('utf-8')
+    }}]}}]}
+    return response
+
+
+def _busy_child(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def _tracked_child(seconds: float) -> None:
+    profiling.track_thread()
+    _busy_child(seconds)
+
+
+class TestStackSampler:
+    """测试调用栈采样"""
+
+    def test_samples_caller_and_tracked_threads_only(self):
+        idle = threading.Event()
+        existing = threading.Thread(target=idle.wait, name="existing", daemon=True)
+        existing.start()
+
+        sampler = StackSampler(interval=0.002)
+        sampler.start()
+        # 在调用方上下文中派生并登记的线程被采样；同时新建、但属于其他调用的线程不被采样
+        child = threading.Thread(
+            target=contextvars.copy_context().run, args=(_tracked_child, 0.1), name="child"
+        )
+        other = threading.Thread(target=_busy_child, args=(0.1,), name="other")
+        child.start()
+        other.start()
+        _busy_child(0.1)
+        child.join()
+        other.join()
+        sampler.stop()
+        idle.set()
+
+        stacks = sampler.folded()
+        assert sampler.samples >= 5
+        assert "MainThread;" in stacks and "child;" in stacks
+        assert "_busy_child (test_profiling.py:" in stacks
+        assert "existing;" not in stacks and "other;" not in stacks
+        assert profiling._active_sampler.get() is None
+
+    def test_parse_modes(self):
+        assert parse_modes("cpu, memory") == {"cpu", "memory"}
+        assert parse_modes("gpu") == frozenset()
+        assert parse_modes(None) == frozenset()
+        with pytest.raises(ValueError):
+            with profiling.profile("gpu"):
+                pass
+
+
+class TestProfiledCalls:
+    """测试调用的剖析与结果文件"""
+
+    @patch('src.main.requests.post')
+    def test_env_profiles_sampled_calls(self, mock_post, workspace, monkeypatch):
+        mock_post.side_effect = _slow_response
+        monkeypatch.setenv("GEMINI_PROFILE", "cpu,memory")
+        monkeypatch.setenv("GEMINI_PROFILE_SAMPLE_RATE", "1")
+
+        assert text_to_image(prompt="一只猫", request_id="slow/1")["success"] is True
+
+        profiles = workspace / "profiles"
+        assert sorted(p.name for p in profiles.iterdir()) == [
+            "slow_1-text_to_image.folded", "slow_1-text_to_image.json", "slow_1-text_to_image.memory.txt"
+        ]
+        summary = json.loads((profiles / "slow_1-text_to_image.json").read_text())
+        assert summary["request_id"] == "slow/1"
+        assert summary["success"] is True
+        assert summary["wall_ms"] >= 50
+        assert summary["peak_bytes"] > 200000
+        folded = (profiles / "slow_1-text_to_image.folded").read_text()
+        assert "_text_to_image (main.py:" in folded
+        # 带 request_id 的请求在可取消调用的辅助线程中发出，该线程同样被采样
+        assert "imagen-cancellable-call;" in folded and "_slow_response (test_profiling.py:" in folded
+        assert (profiles / "slow_1-text_to_image.memory.txt").read_text().startswith("traced peak:")
+        assert not tracemalloc.is_tracing()
+
+    def test_overlapping_memory_profiles_report_no_peak(self):
+        first, second, alone = profiling.MemoryProfile(), profiling.MemoryProfile(), profiling.MemoryProfile()
+        first.start()
+        second.start()
+        second.stop()
+        first.stop()
+        alone.start()
+        alone.stop()
+
+        assert first.peak is None and second.peak is None
+        assert first.report().startswith("traced peak: unavailable")
+        assert alone.peak is not None
+        assert not tracemalloc.is_tracing()
+
+    @patch('src.main.requests.post')
+    def test_sample_rate_zero_skips(self, mock_post, workspace, monkeypatch):
+        mock_post.side_effect = _slow_response
+        monkeypatch.setenv("GEMINI_PROFILE", "cpu")
+        monkeypatch.setenv("GEMINI_PROFILE_SAMPLE_RATE", "0")
+
+        text_to_image(prompt="一只猫", request_id="r1")
+
+        assert not (workspace / "profiles").exists()
+
+    def test_forced_per_call_profiles_failures_too(self, workspace):
+        with profiling.profile("cpu"):
+            result = edit_image(prompt="修改", request_id="r2")
+
+        assert result["error_code"] == "NO_INPUT_FILE"
+        names = sorted(p.name for p in (workspace / "profiles").iterdir())
+        assert names == ["r2-edit_image.folded", "r2-edit_image.json"]
+        summary = json.loads((workspace / "profiles" / "r2-edit_image.json").read_text())
+        assert summary["error_code"] == "NO_INPUT_FILE"
@@ -0,0 +1,162 @@
+"""
+局部区域编辑测试
+"""
+
+import base64
+import io
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.main import edit_image
+from src.regions import RegionEdit, parse_region
+
+from conftest import sent_json
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _gradient(width: int, height: int):
+    """每个像素颜色都不同的测试图，便于逐像素比较"""
+    image = Image.new("RGB", (width, height))
+    image.putdata([(x % 256, y % 256, (x * y) % 256) for y in range(height) for x in range(width)])
+    return image
+
+
+class TestParseRegion:
+    """测试区域参数校验"""
+
+    def test_valid(self):
+        assert parse_region([10, 20, 30, 40]) == (10, 20, 40, 60)
+
+    @pytest.mark.parametrize("region", [[1, 2, 3], [0, 0, 0, 5], [-1, 0, 5, 5], [0, 0, 5.0, 5], "0,0,5,5"])
+    def test_invalid(self, region):
+        with pytest.raises(ValueError):
+            parse_region(region)
+
+
+class TestRegionEdit:
+    """测试裁剪与混合"""
+
+    def test_crop_includes_padding_clipped_to_image(self):
+        edit = RegionEdit(_png(_gradient(200, 100)), (10, 40, 60, 70), padding=16, feather=0)
+
+        patch_bytes, mime_type = edit.crop()
+
+        assert mime_type == "image/png"
+        assert edit.crop_box == (0, 24, 76, 86)
+        assert Image.open(io.BytesIO(patch_bytes)).size == (76, 62)
+        assert edit.region == [10, 40, 50, 30]
+
+    def test_composite_keeps_outside_pixels(self):
+        original = _gradient(200, 100)
+        edit = RegionEdit(_png(original), (80, 30, 120, 60), padding=16, feather=4)
+
+        # 模型返回的局部图像分辨率与裁剪尺寸不同
+        result = Image.open(io.BytesIO(edit.composite(_png(Image.new("RGB", (256, 200), (255, 0, 0))))[0]))
+
+        assert result.size == original.size
+        for x, y in [(0, 0), (63, 45), (137, 45), (100, 13), (199, 99)]:
+            assert result.getpixel((x, y)) == original.getpixel((x, y))
+        assert result.getpixel((100, 45)) == (255, 0, 0)
+        # 羽化过渡区内介于原图和补丁之间
+        assert original.getpixel((78, 45))[0] < result.getpixel((78, 45))[0] < 255
+
+    def test_mask_limits_edit_and_sets_region(self):
+        original = _gradient(100, 100)
+        mask = Image.new("L", (100, 100), 0)
+        mask.paste(255, (40, 40, 50, 50))
+        edit = RegionEdit(_png(original), mask_bytes=_png(mask), padding=8, feather=0)
+
+        result = Image.open(io.BytesIO(edit.composite(_png(Image.new("RGB", (26, 26), (0, 0, 255))))[0]))
+
+        assert edit.region == [40, 40, 10, 10]
+        assert result.getpixel((45, 45)) == (0, 0, 255)
+        assert result.getpixel((38, 45)) == original.getpixel((38, 45))
+
+    def test_region_outside_image(self):
+        with pytest.raises(ValueError):
+            RegionEdit(_png(_gradient(50, 50)), (40, 40, 60, 60))
+
+    def test_mask_size_mismatch(self):
+        with pytest.raises(ValueError):
+            RegionEdit(_png(_gradient(50, 50)), mask_bytes=_png(Image.new("L", (20, 20), 255)))
+
+
+class TestEditImageRegion:
+    """测试 edit_image 的局部编辑模式"""
+
+    @pytest.fixture
+    def workspace_env(self):
+        return {"GEMINI_API_KEY": "test-api-key", "GEMINI_REGION_PADDING": "10"}
+
+    @pytest.fixture
+    def workspace(self, workspace):
+        inputs_dir = workspace / "data" / "inputs" / "input_image"
+        inputs_dir.mkdir(parents=True)
+        (inputs_dir / "photo.png").write_bytes(_png(_gradient(300, 200)))
+        return workspace
+
+    @patch('src.main.requests.post')
+    def test_sends_crop_and_writes_full_image(self, mock_post, workspace):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+            "mimeType": "image/png", "data": base64.b64encode(_png(Image.new("RGB", (60, 60), "white"))).decode()
+        }}]}}]}
+        mock_post.return_value = response
+
+        result = edit_image(prompt="去掉水印", region=[200, 100, 40, 40])
+
+        assert result["success"] is True
+        assert result["region"] == [200, 100, 40, 40]
+        sent = sent_json(mock_post.call_args)["contents"][-1]["parts"]
+        assert "局部区域" in sent[0]["text"]
+        assert Image.open(io.BytesIO(base64.b64decode(sent[1]["inline_data"]["data"]))).size == (60, 60)
+        output = Image.open(workspace / "data" / "outputs" / "edited_image.png")
+        assert output.size == (300, 200)
+        assert output.getpixel((220, 120)) == (255, 255, 255)
+        assert output.getpixel((10, 10)) == _gradient(300, 200).getpixel((10, 10))
+
+    @patch('src.main.requests.post')
+    def test_hidden_files_in_mask_dir_ignored(self, mock_post, workspace):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"candidates": [{"content": {"parts": [{"inlineData": {
+            "mimeType": "image/png", "data": base64.b64encode(_png(Image.new("RGB", (60, 60), "white"))).decode()
+        }}]}}]}
+        mock_post.return_value = response
+        mask_dir = workspace / "data" / "inputs" / "mask_image"
+        (mask_dir / "nested").mkdir(parents=True)
+        (mask_dir / ".DS_Store").write_bytes(b"not an image")
+
+        # 只有隐藏文件和子目录时按整图编辑
+        result = edit_image(prompt="去掉水印")
+        assert result["success"] is True and "region" not in result
+        assert "局部区域" not in sent_json(mock_post.call_args)["contents"][-1]["parts"][0]["text"]
+
+        # 指定 region 时也不会把隐藏文件当作蒙版读取
+        result = edit_image(prompt="去掉水印", region=[200, 100, 40, 40])
+        assert result["success"] is True and result["region"] == [200, 100, 40, 40]
+
+    def test_invalid_region(self, workspace):
+        result = edit_image(prompt="去掉水印", region=[280, 0, 40, 40])
+
+        assert result["error_code"] == "INVALID_REGION"
+
+    def test_region_with_session_rejected(self, workspace):
+        result = edit_image(prompt="去掉水印", region=[0, 0, 10, 10], session_id="s1")
+
+        assert result["error_code"] == "INVALID_REGION"
+
+    def test_missing_pillow(self, workspace):
+        with patch('src.main.pillow_available', return_value=False):
+            result = edit_image(prompt="去掉水印", region=[0, 0, 10, 10])
+
+        assert result["error_code"] == "MISSING_DEPENDENCY"
@@ -0,0 +1,169 @@
+"""
+多密钥、多端点路由测试
+"""
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.main import text_to_image
+from src.routing import PoolMember, Router, get_router, load_pool
+
+
+def _router(n=2, **kwargs):
+    return Router([PoolMember(f"https://gw-{i}/v1beta", f"key-{i}-abcd") for i in range(n)], **kwargs)
+
+
+class TestRouter:
+    """测试成员选择与摘除"""
+
+    def test_least_outstanding(self):
+        router = _router(3)
+
+        first = router.acquire()
+        second = router.acquire()
+        third = router.acquire()
+
+        assert len({first.endpoint, second.endpoint, third.endpoint}) == 3
+
+        router.release(second, 0.1, status_code=200)
+        assert router.acquire() is second
+
+    def test_ewma_prefers_faster_member(self):
+        router = _router(2, strategy="ewma")
+        fast, slow = router.members
+        fast.ewma_latency, slow.ewma_latency = 0.2, 2.0
+
+        picks = [router.acquire() for _ in range(3)]
+
+        # 快成员即使有 3 个在途请求（0.2 × 4 = 0.8）仍优于慢成员（2.0 × 1）
+        assert all(m is fast for m in picks)
+
+    def test_rate_limited_member_is_ejected(self):
+        router = _router(2)
+        member = router.acquire()
+
+        router.release(member, 0.1, status_code=429, retry_after=60)
+
+        assert all(router.acquire() is not member for _ in range(4))
+        stats = {s["endpoint"]: s for s in router.stats()}
+        assert stats[member.endpoint]["ejected"] is True
+        assert stats[member.endpoint]["rate_limited"] == 1
+        assert stats[member.endpoint]["ejected_for"] > 50
+
+    def test_consecutive_failures_eject(self):
+        router = _router(2, failure_threshold=2)
+        member = router.members[0]
+
+        router.release(member, 1.0, status_code=503)
+        assert not router.stats()[0]["ejected"]
+
+        router.release(member, 1.0, status_code=None)
+        assert router.stats()[0]["ejected"]
+
+    def test_all_ejected_falls_back_to_earliest_recovery(self):
+        router = _router(2)
+        a, b = router.members
+
+        router.release(a, 0.1, status_code=429, retry_after=10)
+        router.release(b, 0.1, status_code=429, retry_after=100)
+
+        assert router.acquire() is a
+
+    def test_stats_mask_api_key(self):
+        stats = _router(1).stats()
+
+        assert stats[0]["api_key"] == "...abcd"
+        assert "key-0" not in json.dumps(stats)
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError):
+            _router(1, strategy="random")
+
+
+class TestLoadPool:
+    """测试成员池配置"""
+
+    def test_pool_from_env(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_POOL", json.dumps([
+            {"endpoint": "https://gw-a/v1beta/", "api_key": "k1"},
+            {"api_key": "k2"},
+        ]))
+
+        members = load_pool("https://default/v1beta")
+
+        assert [(m.endpoint, m.api_key) for m in members] == [
+            ("https://gw-a/v1beta", "k1"),
+            ("https://default/v1beta", "k2"),
+        ]
+
+    def test_single_key_fallback(self, monkeypatch):
+        monkeypatch.delenv("GEMINI_API_POOL", raising=False)
+        monkeypatch.setenv("GEMINI_API_KEY", "k")
+
+        assert [m.api_key for m in load_pool("https://default/v1beta")] == ["k"]
+
+    def test_invalid_pool(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_POOL", "not-json")
+
+        with pytest.raises(ValueError):
+            load_pool("https://default/v1beta")
+
+    def test_router_rebuilt_when_env_changes(self, monkeypatch):
+        monkeypatch.delenv("GEMINI_API_POOL", raising=False)
+        monkeypatch.setenv("GEMINI_API_KEY", "k1")
+        first = get_router("https://default/v1beta")
+
+        assert get_router("https://default/v1beta") is first
+
+        monkeypatch.setenv("GEMINI_API_KEY", "k2")
+        assert get_router("https://default/v1beta").members[0].api_key == "k2"
+
+
+class TestTextToImageRouting:
+    """测试 text_to_image 通过成员池发送请求"""
+
+    @patch('src.main.requests.post')
+    def test_requests_spread_and_429_ejects(self, mock_post, monkeypatch):
+        temp_dir = tempfile.mkdtemp()
+        original_cwd = os.getcwd()
+        os.chdir(temp_dir)
+
+        try:
+            monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+            monkeypatch.setenv("GEMINI_API_POOL", json.dumps([
+                {"endpoint": "https://gw-a/v1beta", "api_key": "key-a"},
+                {"endpoint": "https://gw-b/v1beta", "api_key": "key-b"},
+            ]))
+
+            def fake_post(url, headers, data, timeout):
+                response = MagicMock()
+                if headers["x-goog-api-key"] == "key-a":
+                    response.status_code = 429
+                    response.text = "Too Many Requests"
+                    response.headers = {"Retry-After": "60"}
+                else:
+                    response.status_code = 200
+                    response.json.return_value = {"candidates": [{"content": {"parts": [{
+                        "inlineData": {"data": base64.b64encode(b"img").decode('utf-8')}
+                    }]}}]}
+                return response
+
+            mock_post.side_effect = fake_post
+
+            results = [text_to_image(prompt="测试提示词") for _ in range(4)]
+
+            used_urls = [c.args[0] for c in mock_post.call_args_list]
+            assert used_urls.count("https://gw-a/v1beta/models/gemini-3-pro-image-preview:generateContent") == 1
+            assert [r["success"] for r in results].count(True) == 3
+            assert (Path(temp_dir) / "data" / "outputs" / "generated_image.png").exists()
+
+        finally:
+            os.chdir(original_cwd)
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,164 @@
+"""
+优先级与截止时间感知调度器测试
+"""
+
+import threading
+import time
+
+import pytest
+
+from src import scheduler as scheduler_module
+from src.scheduler import Scheduler
+
+
+class CallLog(list):
+    """按执行顺序记录 (函数名, prompt, 其余参数)，gate 用于阻塞 worker"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """把 FUNCTIONS 换成记录调用顺序的假函数；prompt 为 "gate" 的调用会阻塞到 gate 被释放"""
+    record = CallLog()
+
+    def fake(name):
+        def function(prompt, **kwargs):
+            if prompt == "gate":
+                record.gate.wait(5)
+            record.append((name, prompt, kwargs))
+            return {"success": True, "prompt": prompt}
+        return function
+
+    monkeypatch.setitem(scheduler_module.FUNCTIONS, "text_to_image", fake("text_to_image"))
+    monkeypatch.setitem(scheduler_module.FUNCTIONS, "edit_image", fake("edit_image"))
+    return record
+
+
+def _prompts(calls):
+    return [prompt for _, prompt, _ in calls if prompt != "gate"]
+
+
+class TestScheduler:
+    """测试调度顺序"""
+
+    def test_interactive_before_bulk(self, calls):
+        scheduler = Scheduler(workers=1, reserved_interactive=0)
+        scheduler.submit("text_to_image", prompt="gate", priority="bulk")
+        time.sleep(0.05)
+        futures = [scheduler.submit("text_to_image", prompt=f"bulk-{i}", priority="bulk") for i in range(2)]
+        futures.append(scheduler.submit("edit_image", prompt="interactive", priority="interactive"))
+
+        calls.gate.set()
+        scheduler.shutdown()
+
+        assert all(f.result()["success"] for f in futures)
+        assert _prompts(calls) == ["interactive", "bulk-0", "bulk-1"]
+
+    def test_bulk_cannot_take_reserved_worker(self, calls):
+        scheduler = Scheduler(workers=2, reserved_interactive=1)
+        for i in range(3):
+            scheduler.submit("text_to_image", prompt="gate", priority="bulk")
+        time.sleep(0.05)
+
+        assert scheduler.stats()["running"]["bulk"] == 1
+
+        interactive = scheduler.submit("edit_image", prompt="interactive")
+        assert interactive.result(timeout=1)["success"] is True
+
+        calls.gate.set()
+        scheduler.shutdown()
+
+    @pytest.mark.parametrize("workers, reserved", [(1, 1), (2, 2), (3, -1)])
+    def test_reservation_must_leave_a_bulk_worker(self, workers, reserved):
+        with pytest.raises(ValueError):
+            Scheduler(workers=workers, reserved_interactive=reserved)
+
+    def test_default_reservation(self, calls):
+        scheduler = Scheduler(workers=1)
+        assert (scheduler.reserved_interactive, scheduler.bulk_limit) == (0, 1)
+        scheduler.shutdown()
+
+        scheduler = Scheduler(workers=3)
+        assert (scheduler.reserved_interactive, scheduler.bulk_limit) == (1, 2)
+        scheduler.shutdown()
+
+    def test_construction_has_no_network_side_effects(self, calls, monkeypatch):
+        monkeypatch.setenv("GEMINI_WARM_CONNECTIONS", "2")
+        monkeypatch.setattr("src.warmup.get_warm_pool", lambda: pytest.fail("构造调度器不应开始预热"))
+
+        Scheduler(workers=2).shutdown()
+
+    def test_earliest_deadline_first(self, calls):
+        scheduler = Scheduler(workers=1)
+        scheduler.submit("text_to_image", prompt="gate")
+        time.sleep(0.05)
+        scheduler.submit("text_to_image", prompt="no-deadline")
+        scheduler.submit("text_to_image", prompt="late", deadline=60)
+        scheduler.submit("text_to_image", prompt="soon", deadline=10)
+
+        calls.gate.set()
+        scheduler.shutdown()
+
+        assert _prompts(calls) == ["soon", "late", "no-deadline"]
+
+    def test_fair_share_between_tenants(self, calls):
+        scheduler = Scheduler(workers=1)
+        scheduler.submit("text_to_image", prompt="gate")
+        time.sleep(0.05)
+        for i in range(4):
+            scheduler.submit("text_to_image", prompt=f"a{i}", tenant="a")
+        for i in range(2):
+            scheduler.submit("text_to_image", prompt=f"b{i}", tenant="b")
+
+        calls.gate.set()
+        scheduler.shutdown()
+
+        assert _prompts(calls) == ["a0", "b0", "a1", "b1", "a2", "a3"]
+
+    def test_expired_job_is_dropped(self, calls):
+        scheduler = Scheduler(workers=1)
+        scheduler.submit("text_to_image", prompt="gate")
+        time.sleep(0.05)
+        expired = scheduler.submit("text_to_image", prompt="expired", deadline=0.01)
+        alive = scheduler.submit("text_to_image", prompt="alive", deadline=30)
+        time.sleep(0.05)
+
+        calls.gate.set()
+        scheduler.shutdown()
+
+        assert expired.result()["error_code"] == "REQUEST_TIMEOUT"
+        assert alive.result() == {"success": True, "prompt": "alive"}
+        assert _prompts(calls) == ["alive"]
+        # 剩余时间作为 deadline 传给函数
+        assert 0 < calls[-1][2]["deadline"] <= 30
+        assert scheduler.stats()["dropped"] == 1
+
+    def test_cancelled_job_is_dropped(self, calls):
+        scheduler = Scheduler(workers=1)
+        scheduler.submit("text_to_image", prompt="gate")
+        time.sleep(0.05)
+        cancelled = scheduler.submit("text_to_image", prompt="cancelled")
+        kept = scheduler.submit("text_to_image", prompt="kept")
+
+        assert cancelled.cancel() is True
+        calls.gate.set()
+        scheduler.shutdown()
+
+        assert kept.result()["success"] is True
+        assert _prompts(calls) == ["kept"]
+        assert scheduler.stats()["dropped"] == 1
+
+    def test_invalid_arguments(self, calls):
+        scheduler = Scheduler(workers=1)
+
+        with pytest.raises(ValueError):
+            scheduler.submit("no_such_function", prompt="x")
+        with pytest.raises(ValueError):
+            scheduler.submit("text_to_image", prompt="x", priority="urgent")
+
+        scheduler.shutdown()
+        with pytest.raises(RuntimeError):
+            scheduler.submit("text_to_image", prompt="x")
@@ -0,0 +1,189 @@
+"""
+多轮编辑会话测试
+"""
+
+import base64
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.main import edit_image
+from src.sessions import EditSession, SessionStore, get_session_store
+
+from conftest import sent_json
+
+
+def _model_content(image: bytes) -> dict:
+    return {"role": "model", "parts": [{"inlineData": {
+        "mimeType": "image/png", "data": base64.b64encode(image).decode('utf-8')
+    }}]}
+
+
+class TestEditSession:
+    """测试历史组装与裁剪"""
+
+    def test_first_turn_has_no_history(self):
+        session = EditSession("s1")
+
+        assert session.build_contents([{"text": "编辑"}]) == [{"role": "user", "parts": [{"text": "编辑"}]}]
+
+    def test_keeps_only_recent_turns(self):
+        session = EditSession("s1", max_turns=2)
+        for i in range(3):
+            session.record({"parts": [{"text": f"第 {i} 轮"}]}, _model_content(b"img%d" % i), b"img%d" % i, "image/png")
+
+        contents = session.build_contents([{"text": "新指令"}])
+
+        assert session.turn_count == 2
+        assert [c["role"] for c in contents] == ["user", "model", "user", "model", "user"]
+        assert contents[0]["parts"][0]["text"] == "第 1 轮"
+
+    def test_byte_budget_drops_oldest_turns(self):
+        session = EditSession("s1", max_history_bytes=3000)
+        session.record({"parts": [{"text": "旧"}]}, _model_content(b"a" * 2000), b"a" * 2000, "image/png")
+        session.record({"parts": [{"text": "新"}]}, _model_content(b"b" * 1000), b"b" * 1000, "image/png")
+
+        contents = session.build_contents([{"text": "继续"}])
+
+        assert len(contents) == 3
+        assert contents[0]["parts"][0]["text"] == "新"
+
+    def test_inline_last_image_when_nothing_fits(self):
+        session = EditSession("s1", max_history_bytes=100)
+        session.record({"parts": [{"text": "旧"}]}, _model_content(b"x" * 1000), b"x" * 1000, "image/png")
+
+        contents = session.build_contents([{"text": "继续"}])
+
+        assert len(contents) == 1
+        assert base64.b64decode(contents[0]["parts"][1]["inline_data"]["data"]) == b"x" * 1000
+
+    def test_save_and_load(self, tmp_path):
+        session = EditSession("s1")
+        session.record({"parts": [{"text": "一"}]}, _model_content(b"img"), b"img", "image/png")
+        session.save(tmp_path)
+
+        loaded = EditSession.load(tmp_path, "s1")
+
+        assert loaded.last_image == b"img"
+        assert loaded.build_contents([{"text": "二"}]) == session.build_contents([{"text": "二"}])
+        assert EditSession.load(tmp_path, "missing") is None
+
+
+class TestSharedSessionDirectory:
+    """测试多个 worker（各自的会话缓存）共享同一个会话目录"""
+
+    def test_cached_session_reloaded_after_other_worker_saves(self, tmp_path):
+        worker_a, worker_b = SessionStore(tmp_path), SessionStore(tmp_path)
+        cached = worker_b.get("s1")
+        session = worker_a.get("s1")
+        with session.lock:
+            session.record({"parts": [{"text": "一"}]}, _model_content(b"img-a"), b"img-a", "image/png")
+            worker_a.save(session)
+
+        with cached.lock:
+            assert cached.turn_count == 1 and cached.last_image == b"img-a"
+            cached.record({"parts": [{"text": "二"}]}, _model_content(b"img-b"), b"img-b", "image/png")
+            worker_b.save(cached)
+
+        # 后保存的 worker 基于最新历史继续，两轮都保留
+        assert worker_a.get("s1").turn_count == 2
+        history = json.loads((tmp_path / "s1" / "history.json").read_text(encoding='utf-8'))
+        assert [turn[0]["parts"][0]["text"] for turn in history["turns"]] == ["一", "二"]
+
+    def test_lock_serializes_workers(self, tmp_path):
+        first, second = SessionStore(tmp_path).get("s1"), SessionStore(tmp_path).get("s1")
+        order = []
+
+        def hold():
+            with first.lock:
+                order.append("first")
+                time.sleep(0.2)
+                order.append("first done")
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        time.sleep(0.05)
+        with second.lock:
+            order.append("second")
+        thread.join()
+
+        assert order == ["first", "first done", "second"]
+
+    def test_sessions_in_use_not_evicted(self):
+        store = SessionStore(max_sessions=1)
+
+        with store.checkout("s1") as checked_out:
+            store.get("s2")
+            assert store.get("s1") is checked_out
+
+        held = store.get("s3")
+        with held.lock:
+            store.get("s4")
+            assert store.get("s3") is held
+
+        store.get("s5")
+        assert list(store._sessions) == ["s5"]
+
+
+class TestEditImageSession:
+    """测试 edit_image 的会话模式"""
+
+    @pytest.fixture
+    def workspace_env(self):
+        return {"GEMINI_API_KEY": "test-api-key", "GEMINI_SESSION_DIR": "{workspace}/sessions"}
+
+    @pytest.fixture
+    def workspace(self, workspace):
+        os.makedirs("data/inputs/input_image")
+        Path("data/inputs/input_image/test.png").write_bytes(b"original")
+        return workspace
+
+    @staticmethod
+    def _fake_post(outputs):
+        def fake_post(url, headers, data, timeout):
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = {"candidates": [{"content": _model_content(outputs.pop(0))}]}
+            return response
+        return fake_post
+
+    @patch('src.main.requests.post')
+    def test_second_edit_chains_on_previous_output(self, mock_post, workspace):
+        mock_post.side_effect = self._fake_post([b"round-1", b"round-2"])
+
+        first = edit_image(prompt="加一只猫", session_id="chat-1")
+        shutil.rmtree(workspace / "data" / "inputs")
+        second = edit_image(prompt="让猫变成橘色", session_id="chat-1")
+
+        assert (first["turn"], second["turn"]) == (1, 2)
+        assert second["session_id"] == "chat-1"
+        contents = sent_json(mock_post.call_args_list[1])["contents"]
+        assert [c["role"] for c in contents] == ["user", "model", "user"]
+        assert base64.b64decode(contents[1]["parts"][0]["inlineData"]["data"]) == b"round-1"
+        assert contents[2]["parts"] == [{"text": "让猫变成橘色"}]
+        assert (workspace / "data" / "outputs" / "edited_image.png").read_bytes() == b"round-2"
+
+    @patch('src.main.requests.post')
+    def test_session_restored_from_disk(self, mock_post, workspace, monkeypatch):
+        mock_post.side_effect = self._fake_post([b"round-1", b"round-2"])
+        edit_image(prompt="加一只猫", session_id="chat-2")
+        history = json.loads((workspace / "sessions" / "chat-2" / "history.json").read_text(encoding='utf-8'))
+        assert len(history["turns"]) == 1
+
+        # 新的会话缓存（模拟另一个 worker）从磁盘恢复会话
+        get_session_store().drop("chat-2")
+        result = edit_image(prompt="继续", session_id="chat-2")
+
+        assert result["turn"] == 2
+
+    def test_invalid_session_id(self, workspace):
+        result = edit_image(prompt="编辑", session_id="../etc")
+
+        assert result["success"] is False
+        assert result["error_code"] == "INVALID_SESSION_ID"
@@ -0,0 +1,214 @@
+"""
+流式生成测试
+
+使用本地 SSE 桩服务器模拟 streamGenerateContent 接口。
+"""
+
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import src.main
+from src import events
+from src.main import text_to_image
+from src.streaming import _write_atomic, iter_sse_events, stream_generate_content
+from src.timeouts import Deadline
+
+
+def _image_event(content: bytes) -> dict:
+    return {"candidates": [{"content": {"parts": [{"inlineData": {
+        "mimeType": "image/png", "data": base64.b64encode(content).decode('utf-8')
+    }}]}}]}
+
+
+def _text_event(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+@pytest.fixture
+def sse_server():
+    """启动本地 SSE 桩服务器（任意路径均返回 handler.events），events 为 (延迟秒数, 事件) 列表"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        events = []
+        status = 200
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(self.status)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            try:
+                for delay, event in self.events:
+                    time.sleep(delay)
+                    body = f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8')
+                    self.wfile.write(f"{len(body):x}\r\n".encode('ascii') + body + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield Handler, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+    server.shutdown()
+    server.server_close()
+
+
+class TestIterSseEvents:
+    """测试 SSE 解析"""
+
+    def test_multiline_data_and_comments(self):
+        lines = [b": keep-alive", b"data: {\"a\":", b"data: 1}", b"", b"data: x", b""]
+
+        assert list(iter_sse_events(lines)) == ['{"a":\n1}', "x"]
+
+    def test_trailing_event_without_blank_line(self):
+        assert list(iter_sse_events(["data: last\r"])) == ["last"]
+
+
+class TestStreamGenerateContent:
+    """测试流式生成"""
+
+    def test_writes_images_and_forwards_text(self, sse_server, workspace):
+        handler, url = sse_server
+        handler.events = [
+            (0, _text_event("第一段")),
+            (0, _image_event(b"image-1")),
+            (0, _text_event("第二段")),
+            (0, _image_event(b"image-2")),
+        ]
+        texts = []
+
+        result = stream_generate_content(
+            url, {}, {"contents": []}, workspace / "out", "generated_image.png", timeout=5, on_text=texts.append
+        )
+
+        assert result["success"] is True
+        assert result["partial"] is False
+        assert result["images"] == ["generated_image.png", "generated_image_1.png"]
+        assert result["text"] == "第一段第二段"
+        assert texts == ["第一段", "第二段"]
+        assert (workspace / "out" / "generated_image.png").read_bytes() == b"image-1"
+        assert (workspace / "out" / "generated_image_1.png").read_bytes() == b"image-2"
+        assert not list((workspace / "out").glob(".*.part"))
+        assert "usage" not in result
+
+    def test_concurrent_writes_to_same_name(self, workspace):
+        path = workspace / "generated_image.png"
+        errors = []
+
+        def write(content: bytes):
+            try:
+                for _ in range(200):
+                    _write_atomic(path, content)
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(bytes([index]) * 1024,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(path.read_bytes()) == 1024
+        assert [p.name for p in workspace.iterdir()] == ["generated_image.png"]
+
+    def test_last_usage_metadata_wins(self, sse_server, workspace):
+        handler, url = sse_server
+        handler.events = [
+            (0, {**_text_event("思考"), "usageMetadata": {"promptTokenCount": 10, "totalTokenCount": 12}}),
+            (0, {**_image_event(b"image-1"), "usageMetadata": {"promptTokenCount": 10, "totalTokenCount": 1300}}),
+        ]
+
+        result = stream_generate_content(url, {}, {}, workspace, "generated_image.png", timeout=5)
+
+        assert result["usage"] == {"prompt_tokens": 10, "total_tokens": 1300}
+
+    def test_late_timeout_keeps_partial_result(self, sse_server, workspace):
+        handler, url = sse_server
+        handler.events = [(0, _image_event(b"image-1")), (2, _text_event("太迟了"))]
+
+        result = stream_generate_content(url, {}, {}, workspace, "generated_image.png", timeout=0.5)
+
+        assert result["success"] is True
+        assert result["partial"] is True
+        assert (workspace / "generated_image.png").read_bytes() == b"image-1"
+
+    def test_timeout_before_any_image_raises(self, sse_server, workspace):
+        handler, url = sse_server
+        handler.events = [(0, _text_event("思考中")), (2, _image_event(b"image-1"))]
+
+        with pytest.raises(requests.exceptions.Timeout):
+            stream_generate_content(url, {}, {}, workspace, "generated_image.png", timeout=0.5)
+
+    def test_trickling_stream_stops_at_deadline(self, sse_server, workspace):
+        handler, url = sse_server
+        # 每个分块都在读超时之内到达，但总时长超过 deadline
+        handler.events = [(0, _image_event(b"image-1"))] + [(0.1, _text_event("…"))] * 20
+
+        started = time.monotonic()
+        result = stream_generate_content(
+            url, {}, {}, workspace, "generated_image.png", timeout=1, deadline=Deadline(0.3)
+        )
+
+        assert time.monotonic() - started < 1.5
+        assert result["success"] is True and result["partial"] is True
+
+
+class TestTextToImageStream:
+    """测试 text_to_image 的流式模式"""
+
+    def test_stream_mode(self, sse_server, workspace, monkeypatch):
+        handler, url = sse_server
+        handler.events = [(0, _text_event("好的")), (0, _image_event(b"streamed"))]
+        monkeypatch.setenv("GEMINI_API_KEY", "test-api-key")
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", url)
+
+        result = text_to_image(prompt="一只可爱的猫咪", stream=True)
+
+        assert result["success"] is True
+        assert result["images"] == ["generated_image.png"]
+        assert result["text"] == "好的"
+        assert (workspace / "data" / "outputs" / "generated_image.png").read_bytes() == b"streamed"
+
+    def test_text_delivered_live_through_events(self, sse_server, workspace, monkeypatch):
+        handler, url = sse_server
+        handler.events = [(0, _text_event("好的")), (0.3, _image_event(b"streamed"))]
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", url)
+        received = []
+
+        for event in events.iter_events("text_to_image", prompt="一只可爱的猫咪", stream=True):
+            received.append((event.type, event.data.get("text"), time.monotonic()))
+
+        text, = [item for item in received if item[0] == "text"]
+        decoded, = [item for item in received if item[0] == "image_decoded"]
+        assert text[1] == "好的"
+        # 文本在图像到达之前就交给了调用方，而不是等调用结束
+        assert decoded[2] - text[2] >= 0.2
+
+    def test_stream_mode_api_error(self, sse_server, workspace, monkeypatch):
+        handler, url = sse_server
+        handler.status = 429
+        monkeypatch.setenv("GEMINI_API_KEY", "test-api-key")
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", url)
+
+        result = text_to_image(prompt="一只可爱的猫咪", stream=True)
+
+        assert result["success"] is False
+        assert result["error_code"] == "API_REQUEST_FAILED"
@@ -0,0 +1,238 @@
+"""
+分块并行编辑测试
+"""
+
+import io
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import events, tiles
+from src.admission import estimate_canvas_bytes, get_budget
+from src.main import edit_image
+from src.tiles import TiledImage, process_tiles
+
+from conftest import image_response, sent_json
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _gradient(width: int, height: int):
+    image = Image.new("RGB", (width, height))
+    image.putdata([(x % 256, y % 256, (x * y) % 256) for y in range(height) for x in range(width)])
+    return image
+
+
+class TestTiledImage:
+    """测试切分与拼接"""
+
+    def test_boxes_overlap_and_cover_image(self):
+        tiled = TiledImage(_png(_gradient(300, 200)), tile_size=128, overlap=32)
+
+        assert tiled.xs == [0, 96, 172]
+        assert tiled.ys == [0, 72]
+        assert len(tiled.boxes) == 6
+        assert tiled.boxes[-1] == (172, 72, 300, 200)
+
+    def test_small_image_is_single_tile(self):
+        tiled = TiledImage(_png(_gradient(50, 40)), tile_size=128, overlap=32)
+
+        assert tiled.boxes == [(0, 0, 50, 40)]
+
+    def test_tile_size_must_exceed_overlap(self):
+        with pytest.raises(ValueError):
+            TiledImage(_png(_gradient(50, 40)), tile_size=64, overlap=32)
+
+    def test_stitching_unchanged_tiles_reproduces_original(self):
+        original = _gradient(300, 200)
+        tiled = TiledImage(_png(original), tile_size=128, overlap=32)
+
+        stitched = tiled.stitch({i: tiled.tile(i)[0] for i in range(len(tiled.boxes))})
+
+        assert Image.open(io.BytesIO(stitched)).tobytes() == original.tobytes()
+
+    def test_seam_is_blended(self):
+        tiled = TiledImage(_png(Image.new("RGB", (224, 128))), tile_size=128, overlap=32)
+        black = _png(Image.new("RGB", (64, 64), (0, 0, 0)))
+        white = _png(Image.new("RGB", (64, 64), (255, 255, 255)))
+
+        stitched = Image.open(io.BytesIO(tiled.stitch({0: black, 1: white})))
+
+        # 重叠区 [96, 128) 内从黑渐变到白，重叠区之外保持各自分块的颜色
+        row = [stitched.getpixel((x, 64))[0] for x in range(90, 134)]
+        assert row[:6] == [0] * 6 and row[-6:] == [255] * 6
+        assert row == sorted(row)
+
+
+class TestProcessTiles:
+    """测试并发处理与单块重试"""
+
+    def test_failed_tile_retried_alone(self, monkeypatch):
+        monkeypatch.setattr(tiles, "RETRY_BACKOFF", 0)
+        calls = []
+        progress = []
+
+        def process(index):
+            calls.append(index)
+            if index == 2 and calls.count(2) == 1:
+                return {"success": False, "error_code": "API_REQUEST_FAILED", "status_code": 503}
+            return {"success": True, "index": index}
+
+        succeeded, failed = process_tiles(
+            4, process, concurrency=2, attempts=3, on_progress=lambda **data: progress.append(data)
+        )
+
+        assert sorted(succeeded) == [0, 1, 2, 3] and failed == {}
+        assert sorted(calls) == [0, 1, 2, 2, 3]
+        assert [(p["index"], p["status"]) for p in progress if p["status"] == "retry"] == [(2, "retry")]
+        assert max(p["completed"] for p in progress) == 4
+
+    def test_tile_fails_after_attempts(self, monkeypatch):
+        monkeypatch.setattr(tiles, "RETRY_BACKOFF", 0)
+
+        succeeded, failed = process_tiles(
+            2, lambda index: {"success": index == 0, "error_code": "NETWORK_ERROR"}, concurrency=2, attempts=2
+        )
+
+        assert list(succeeded) == [0]
+        assert failed[1]["error_code"] == "NETWORK_ERROR"
+
+    def test_retry_predicate_stops_retries(self, monkeypatch):
+        monkeypatch.setattr(tiles, "RETRY_BACKOFF", 0)
+        calls = []
+
+        def process(index):
+            calls.append(index)
+            return {"success": False, "error_code": "REQUEST_TIMEOUT"}
+
+        succeeded, failed = process_tiles(1, process, attempts=3, retry=lambda result: False)
+
+        assert calls == [0] and failed[0]["error_code"] == "REQUEST_TIMEOUT"
+
+    @pytest.mark.parametrize("result, retryable", [
+        ({"error_code": "REQUEST_TIMEOUT"}, True),
+        ({"error_code": "NETWORK_ERROR"}, True),
+        ({"error_code": "API_REQUEST_FAILED", "status_code": 429}, True),
+        ({"error_code": "API_REQUEST_FAILED", "status_code": 503}, True),
+        ({"error_code": "API_REQUEST_FAILED", "status_code": 400}, False),
+        ({"error_code": "API_REQUEST_FAILED", "status_code": 403}, False),
+        ({"error_code": "NO_IMAGE_DATA"}, False),
+    ])
+    def test_only_transient_failures_retried(self, result, retryable, monkeypatch):
+        monkeypatch.setattr(tiles, "RETRY_BACKOFF", 0)
+        calls = []
+
+        def process(index):
+            calls.append(index)
+            return {"success": False, **result}
+
+        process_tiles(1, process, attempts=3)
+
+        assert len(calls) == (3 if retryable else 1)
+
+
+class TestEditImageTiled:
+    """测试 edit_image 的分块模式"""
+
+    @pytest.fixture
+    def workspace_env(self):
+        return {"GEMINI_API_KEY": "test-api-key", "GEMINI_TILE_OVERLAP": "16"}
+
+    @pytest.fixture
+    def workspace(self, workspace, monkeypatch):
+        monkeypatch.setattr(tiles, "RETRY_BACKOFF", 0)
+        inputs_dir = workspace / "data" / "inputs" / "input_image"
+        inputs_dir.mkdir(parents=True)
+        (inputs_dir / "large.png").write_bytes(_png(_gradient(200, 120)))
+        return workspace
+
+    @staticmethod
+    def _image_response(color) -> MagicMock:
+        return image_response(_png(Image.new("RGB", (32, 32), color)))
+
+    @patch('src.main.requests.post')
+    def test_tiles_sent_concurrently_and_stitched(self, mock_post, workspace):
+        mock_post.return_value = self._image_response((10, 20, 30))
+
+        result = edit_image(prompt="提高清晰度", tile_size=80)
+
+        assert result["success"] is True
+        assert result["tiles"] == 6
+        assert mock_post.call_count == 6
+        prompts = [sent_json(c)["contents"][-1]["parts"][0]["text"] for c in mock_post.call_args_list]
+        assert any("第 1/6 块" in prompt for prompt in prompts)
+        output = Image.open(workspace / "data" / "outputs" / "edited_image.png")
+        assert output.size == (200, 120)
+        assert output.getpixel((0, 0)) == output.getpixel((199, 119)) == (10, 20, 30)
+        assert len(list((workspace / "data" / "outputs").iterdir())) == 1
+
+    @patch('src.main.requests.post')
+    def test_whole_image_reserved_for_the_operation(self, mock_post, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024 + 1))
+        input_bytes = (workspace / "data" / "inputs" / "input_image" / "large.png").stat().st_size
+        operation = estimate_canvas_bytes(input_bytes, 200, 120)
+        mock_post.return_value = self._image_response((10, 20, 30))
+
+        assert edit_image(prompt="提高清晰度", tile_size=80)["success"] is True
+
+        usage = get_budget().usage()
+        # 整次操作的预留之外还有各分块的预留
+        assert usage["peak"] > operation
+        assert usage["admitted"] == 7 and usage["in_use"] == 0
+
+        monkeypatch.setenv("GEMINI_ADMISSION_TIMEOUT", "0.05")
+        get_budget().acquire(64 * 1024 * 1024)
+        try:
+            result = edit_image(prompt="提高清晰度", tile_size=80)
+        finally:
+            get_budget().release(64 * 1024 * 1024)
+        assert result["error_code"] == "SERVER_BUSY"
+        assert mock_post.call_count == 6
+
+    @patch('src.main.requests.post')
+    def test_failed_tile_retried_with_progress_events(self, mock_post, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_TILE_CONCURRENCY", "1")
+        failure = MagicMock()
+        failure.status_code = 500
+        failure.text = "internal"
+        failure.headers = {}
+        mock_post.side_effect = [failure] + [self._image_response("white")] * 6
+        received = []
+
+        result = events.run("edit_image", received.append, prompt="提高清晰度", tile_size=80)
+
+        assert result["success"] is True
+        tile_events = [e.data for e in received if e.type == "tile"]
+        assert [(e["index"], e["status"]) for e in tile_events][:2] == [(0, "retry"), (0, "done")]
+        assert sum(e["status"] == "done" for e in tile_events) == 6
+        assert [e.type for e in received][-3:] == ["image_decoded", "written", "done"]
+
+    @patch('src.main.requests.post')
+    def test_tile_failure_reported(self, mock_post, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_TILE_ATTEMPTS", "1")
+        failure = MagicMock()
+        failure.status_code = 400
+        failure.text = "bad request"
+        failure.headers = {}
+        mock_post.return_value = failure
+
+        result = edit_image(prompt="提高清晰度", tile_size=80)
+
+        assert result["error_code"] == "API_REQUEST_FAILED"
+        assert result["failed_tiles"] == [0, 1, 2, 3, 4, 5]
+        assert not (workspace / "data" / "outputs").exists()
+
+    @pytest.mark.parametrize("kwargs", [
+        {"tile_size": 0}, {"tile_size": 20}, {"tile_size": 80, "region": [0, 0, 10, 10]},
+        {"tile_size": 80, "session_id": "s1"},
+    ])
+    def test_invalid_tile_size(self, workspace, kwargs):
+        result = edit_image(prompt="提高清晰度", **kwargs)
+
+        assert result["error_code"] == "INVALID_TILE_SIZE"
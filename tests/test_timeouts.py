@@ -0,0 +1,154 @@
+"""
+自适应超时测试
+"""
+
+import base64
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from src.admission import get_budget
+from src.main import GEMINI_API_BASE, edit_image, text_to_image
+from src.routing import get_router
+from src.timeouts import (
+    CONNECT_TIMEOUT,
+    AdaptiveTimeouts,
+    Deadline,
+    DeadlineExceeded,
+    get_timeouts,
+    latency_key,
+    size_bucket,
+)
+
+
+class TestAdaptiveTimeouts:
+    """测试超时推导"""
+
+    def test_uses_ceiling_until_enough_samples(self):
+        timeouts = AdaptiveTimeouts(min_samples=5)
+        for _ in range(4):
+            timeouts.record("text_to_image", 2.0)
+
+        assert timeouts.timeout_for("text_to_image", ceiling=60) == (CONNECT_TIMEOUT, 60)
+
+    def test_quantile_times_safety_factor(self):
+        timeouts = AdaptiveTimeouts(quantile=0.9, safety_factor=2.0, floor=1.0, min_samples=10)
+        for latency in range(1, 11):
+            timeouts.record("text_to_image", float(latency))
+
+        assert timeouts.read_timeout("text_to_image", ceiling=60) == 18.0
+
+    def test_floor_and_ceiling(self):
+        timeouts = AdaptiveTimeouts(floor=10.0, min_samples=1)
+        timeouts.record("fast", 0.1)
+        timeouts.record("slow", 500.0)
+
+        assert timeouts.read_timeout("fast", ceiling=60) == 10.0
+        assert timeouts.read_timeout("slow", ceiling=60) == 60
+
+    def test_deadline_overrides(self):
+        timeouts = AdaptiveTimeouts(min_samples=1)
+        timeouts.record("text_to_image", 20.0)
+
+        assert timeouts.timeout_for("text_to_image", ceiling=60, deadline=3) == (3, 3)
+        # 很长的 deadline（如批量任务的剩余时间）不会让单个请求等待超过模型超时
+        assert timeouts.timeout_for("text_to_image", ceiling=60, deadline=3600) == (CONNECT_TIMEOUT, 60)
+
+    def test_disabled_by_env(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_ADAPTIVE_TIMEOUTS", "0")
+        timeouts = AdaptiveTimeouts(min_samples=1)
+        timeouts.record("text_to_image", 1.0)
+
+        assert timeouts.timeout_for("text_to_image", ceiling=60)[1] == 60
+
+    def test_deadline_bounds_waits(self):
+        assert Deadline().remaining() is None and Deadline().bound(30) == 30
+        deadline = Deadline(2)
+        assert 0 < deadline.bound(30) <= 2 and deadline.bound(1) == 1
+        assert Deadline(0).expired() and not deadline.expired()
+
+    def test_size_buckets(self):
+        assert size_bucket(100) == "256k"
+        assert size_bucket(2 * 1024 * 1024) == "4m"
+        assert size_bucket(50 * 1024 * 1024) == "large"
+        assert latency_key("edit_image", 100) == "edit_image:256k"
+        assert latency_key("text_to_image") == "text_to_image"
+
+
+class TestDeadlineParameter:
+    """测试 deadline 参数"""
+
+    @pytest.fixture
+    def workspace(self, workspace):
+        os.makedirs("data/inputs/input_image")
+        with open("data/inputs/input_image/test.png", "wb") as f:
+            f.write(b"fake_input_image_content")
+        return workspace
+
+    @patch('src.main.requests.post')
+    def test_deadline_passed_to_request_and_latency_recorded(self, mock_post, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-api-key")
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"candidates": [{"content": {"parts": [{
+            "inlineData": {"data": base64.b64encode(b"img").decode('utf-8')}
+        }]}}]}
+        mock_post.return_value = mock_response
+        before = get_timeouts().snapshot().get("edit_image:256k", {"samples": 0})["samples"]
+
+        result = edit_image(prompt="测试编辑", deadline=7.5)
+
+        assert result["success"] is True
+        connect, read = mock_post.call_args.kwargs["timeout"]
+        assert connect == CONNECT_TIMEOUT and 7 < read <= 7.5
+        assert get_timeouts().snapshot()["edit_image:256k"]["samples"] == before + 1
+
+    @pytest.mark.parametrize("deadline", [0, -1, "10", True])
+    def test_invalid_deadline(self, deadline, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-api-key")
+
+        result = text_to_image(prompt="测试提示词", deadline=deadline)
+
+        assert result["success"] is False
+        assert result["error_code"] == "INVALID_DEADLINE"
+
+    @patch('src.main.requests.post')
+    def test_admission_wait_bounded_by_deadline(self, mock_post, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-api-key")
+        monkeypatch.setenv("GEMINI_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024))
+        monkeypatch.setenv("GEMINI_ADMISSION_TIMEOUT", "30")
+        budget = get_budget()
+        budget.acquire(60 * 1024 * 1024)
+        started = time.monotonic()
+
+        try:
+            result = text_to_image(prompt="测试提示词", deadline=0.2)
+        finally:
+            budget.release(60 * 1024 * 1024)
+
+        # 排队等待不超过 deadline，超过后按超时返回而不是等满 30 秒后返回 SERVER_BUSY
+        assert result["error_code"] == "REQUEST_TIMEOUT"
+        assert time.monotonic() - started < 5
+        mock_post.assert_not_called()
+
+    @pytest.mark.parametrize("error", [DeadlineExceeded("已超过本次调用的 deadline"), None])
+    def test_caller_deadline_does_not_eject_member(self, error, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", f"deadline-key-{error is None}")
+
+        def expire(*args, **kwargs):
+            if error is not None:
+                raise error
+            # 读超时被调用方的 deadline 截短
+            time.sleep(0.06)
+            raise requests.exceptions.Timeout("read timed out")
+
+        with patch('src.main._call_gemini', side_effect=expire):
+            results = [text_to_image(prompt="测试提示词", deadline=0.05) for _ in range(3)]
+
+        assert [result["error_code"] for result in results] == ["REQUEST_TIMEOUT"] * 3
+        member = get_router(GEMINI_API_BASE).members[0]
+        assert member.failures == 0 and member.consecutive_failures == 0
+        assert not member.is_ejected(time.monotonic())
@@ -0,0 +1,223 @@
+"""
+录制/回放传输层测试
+
+先对本地桩服务器录制真实的 HTTP 交换（多 MB 响应体），再关闭服务器从磁带回放。
+"""
+
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import src.main
+from src import transport
+from src.events import EventEmitter
+from src.main import text_to_image
+from src.transport import RecordingAdapter, ReplayAdapter, load_cassette, redact_url
+
+API_KEY = "secret-api-key-123"
+IMAGE = os.urandom(2 * 1024 * 1024)
+
+
+def _image_body(image: bytes) -> dict:
+    return {"candidates": [{"content": {"parts": [
+        {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(image).decode('utf-8')}}
+    ]}}]}
+
+
+@pytest.fixture
+def gemini_server():
+    """本地桩服务器：等待 handler.delay 秒后返回 2MB 图像；流式接口先发文本，再等 delay 秒发图像"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        delay = 0.3
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if "alt=sse" in self.path:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("Set-Cookie", "session=abc")
+                self.end_headers()
+                for delay, event in [(0, {"candidates": [{"content": {"parts": [{"text": "思考中"}]}}]}),
+                                     (self.delay, _image_body(IMAGE))]:
+                    time.sleep(delay)
+                    body = f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8')
+                    self.wfile.write(f"{len(body):x}\r\n".encode('ascii') + body + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+                return
+
+            time.sleep(self.delay)
+            body = json.dumps(_image_body(IMAGE)).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workspace_env():
+    return {"GEMINI_API_KEY": API_KEY}
+
+
+def _record(server_url, cassette, monkeypatch, **kwargs) -> dict:
+    monkeypatch.setattr(src.main, "GEMINI_API_BASE", server_url)
+    with transport.use(RecordingAdapter(cassette)):
+        return text_to_image(prompt="一只猫", **kwargs)
+
+
+class TestRecordReplay:
+    """测试录制与回放"""
+
+    def test_record_then_replay_without_network(self, gemini_server, workspace, monkeypatch):
+        server, url = gemini_server
+        cassette = workspace / "cassettes" / "t2i.cassette"
+
+        assert _record(url, cassette, monkeypatch)["success"] is True
+        server.shutdown()
+        server.server_close()
+        (workspace / "data" / "outputs" / "generated_image.png").unlink()
+
+        adapter = ReplayAdapter(cassette)
+        with transport.use(adapter):
+            result = text_to_image(prompt="一只猫")
+
+        assert result["success"] is True
+        assert adapter.served == 1
+        assert (workspace / "data" / "outputs" / "generated_image.png").read_bytes() == IMAGE
+
+    def test_one_session_per_adapter(self, gemini_server, workspace, monkeypatch):
+        server, url = gemini_server
+        cassette = workspace / "cassettes" / "t2i.cassette"
+        _record(url, cassette, monkeypatch)
+        created = []
+        real_session = requests.Session
+        monkeypatch.setattr(
+            "src.transport.requests.Session", lambda: created.append(real_session()) or created[-1]
+        )
+
+        adapter = ReplayAdapter(cassette)
+        with transport.use(adapter):
+            for _ in range(3):
+                assert text_to_image(prompt="一只猫")["success"] is True
+
+        assert adapter.served == 3 and len(created) == 1
+
+    def test_cassette_is_redacted_and_compressed(self, gemini_server, workspace, monkeypatch):
+        _, url = gemini_server
+        cassette = workspace / "t2i.cassette"
+
+        _record(url, cassette, monkeypatch, stream=True)
+
+        raw = gzip.decompress(cassette.read_bytes())
+        assert API_KEY.encode() not in raw
+        assert b"session=abc" not in raw
+        interaction = load_cassette(cassette)[0]
+        assert interaction.request["headers"]["x-goog-api-key"] == "REDACTED"
+        assert interaction.request["body_bytes"] > 0
+        # 两个 SSE 事件分两次到达，第二个在服务端等待之后
+        assert len(interaction.chunks) >= 2
+        assert interaction.chunks[-1][0] - interaction.chunks[0][0] >= 250
+
+    def test_streaming_replay_keeps_original_timing(self, gemini_server, workspace, monkeypatch):
+        _, url = gemini_server
+        cassette = workspace / "sse.cassette"
+        _record(url, cassette, monkeypatch, stream=True)
+        texts = []
+
+        with transport.use(ReplayAdapter(cassette, timing=1)):
+            started = time.monotonic()
+            result = src.main._text_to_image("一只猫", stream=True, emit=_collect_text(texts))
+            elapsed = time.monotonic() - started
+
+        assert result["success"] is True
+        assert result["text"] == "思考中"
+        assert elapsed >= 0.25
+        assert texts[0][1] < 0.2
+
+    def test_timing_scale(self, gemini_server, workspace, monkeypatch):
+        _, url = gemini_server
+        cassette = workspace / "t2i.cassette"
+        _record(url, cassette, monkeypatch)
+
+        for timing, check in [(0, lambda e: e < 0.2), (1, lambda e: e >= 0.25)]:
+            with transport.use(ReplayAdapter(cassette, timing=timing)):
+                started = time.monotonic()
+                assert text_to_image(prompt="一只猫")["success"] is True
+                assert check(time.monotonic() - started)
+
+    def test_replayed_latency_exceeding_deadline_times_out(self, gemini_server, workspace, monkeypatch):
+        _, url = gemini_server
+        cassette = workspace / "t2i.cassette"
+        _record(url, cassette, monkeypatch)
+
+        with transport.use(ReplayAdapter(cassette, timing=1)):
+            result = text_to_image(prompt="一只猫", deadline=0.1)
+
+        assert result["error_code"] == "REQUEST_TIMEOUT"
+
+    def test_miss_is_network_error(self, gemini_server, workspace, monkeypatch):
+        _, url = gemini_server
+        cassette = workspace / "t2i.cassette"
+        _record(url, cassette, monkeypatch)
+
+        with transport.use(ReplayAdapter(cassette, repeat=False)):
+            assert text_to_image(prompt="一只猫")["success"] is True
+            result = text_to_image(prompt="一只猫")
+
+        assert result["error_code"] == "NETWORK_ERROR"
+        assert "回放磁带" in result["error"]
+
+
+def _collect_text(texts: list) -> EventEmitter:
+    """收集 (文本, 距开始的秒数)"""
+    started = time.monotonic()
+
+    def on_event(event):
+        if event.type == "text":
+            texts.append((event.data["text"], time.monotonic() - started))
+
+    return EventEmitter(on_event)
+
+
+class TestConfig:
+    """测试环境变量配置"""
+
+    def test_env_selects_adapter(self, workspace, monkeypatch):
+        cassette = workspace / "empty.cassette"
+        with gzip.open(cassette, "wb"):
+            pass
+
+        monkeypatch.setenv("GEMINI_TRANSPORT", f"replay:{cassette}")
+        assert isinstance(transport.get_adapter(), ReplayAdapter)
+        monkeypatch.setenv("GEMINI_TRANSPORT", "bogus")
+        with pytest.raises(ValueError):
+            transport.get_adapter()
+        monkeypatch.delenv("GEMINI_TRANSPORT")
+        assert transport.get_adapter() is None
+
+    def test_redact_url(self):
+        assert redact_url("https://h/v1/models/m:generateContent?key=abc&alt=sse") == \
+            "https://h/v1/models/m:generateContent?key=REDACTED&alt=sse"
@@ -0,0 +1,156 @@
+"""
+用量统计与配额预控测试
+"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src import usage
+from src.main import text_to_image
+from src.scheduler import Scheduler
+from src.usage import UsageTracker, get_usage_tracker, key_fingerprint, merge_usage, parse_usage
+
+from conftest import image_response
+
+
+@pytest.fixture
+def workspace(workspace, monkeypatch):
+    """从空的用量计数开始"""
+    monkeypatch.setattr("src.usage._tracker", None)
+    return workspace
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.usage.time.monotonic", lambda: now[0])
+    return now
+
+
+def _image_response(total_tokens: int = 1300) -> MagicMock:
+    return image_response(b"image", usageMetadata={
+        "promptTokenCount": 10, "candidatesTokenCount": total_tokens - 10, "totalTokenCount": total_tokens,
+    })
+
+
+class TestParseUsage:
+    """测试 usageMetadata 的转换与累加"""
+
+    def test_parse(self):
+        assert parse_usage({"promptTokenCount": 10, "candidatesTokenCount": 1290, "totalTokenCount": 1300}) == {
+            "prompt_tokens": 10, "output_tokens": 1290, "total_tokens": 1300
+        }
+        assert parse_usage({"promptTokenCount": 10, "candidatesTokenCount": 5}) == {
+            "prompt_tokens": 10, "output_tokens": 5, "total_tokens": 15
+        }
+        assert parse_usage(None) is None
+        assert parse_usage({}) is None
+
+    def test_merge(self):
+        a = {"prompt_tokens": 1, "total_tokens": 10}
+        assert merge_usage(None, a) == a
+        assert merge_usage(a, None) == a
+        assert merge_usage(a, {"prompt_tokens": 2, "output_tokens": 3, "total_tokens": 5}) == {
+            "prompt_tokens": 3, "output_tokens": 3, "total_tokens": 15
+        }
+
+
+class TestUsageTracker:
+    """测试滑动窗口计数与超预算判断"""
+
+    def test_rejects_when_next_call_would_exceed(self, clock):
+        tracker = UsageTracker(window=60, key_budget=350)
+
+        for _ in range(2):
+            tracker.record("k", None, {"total_tokens": 100})
+        assert tracker.exceeded(api_key="k") is None
+
+        tracker.record("k", None, {"total_tokens": 100})
+        # 已用 300，平均单次 100，预计 400 > 350
+        assert tracker.exceeded(api_key="k") == pytest.approx(60.0)
+        assert tracker.exceeded(api_key="other") is None
+
+    def test_window_slides(self, clock):
+        tracker = UsageTracker(window=60, tenant_budget=250)
+        tracker.record(None, "t", {"total_tokens": 100})
+        clock[0] += 30
+        tracker.record(None, "t", {"total_tokens": 100})
+
+        # 最早的一次在第 60 秒滑出窗口，之后 100 + 100 <= 250
+        assert tracker.exceeded(tenant_name="t") == pytest.approx(30.0)
+        clock[0] += 30
+        assert tracker.exceeded(tenant_name="t") is None
+        assert tracker.snapshot()["tenants"]["t"] == {"tokens": 100, "calls": 1, "budget": 250}
+
+    def test_snapshot_hides_keys(self, clock):
+        tracker = UsageTracker()
+        tracker.record("secret-key", "t", {"total_tokens": 7})
+
+        snapshot = tracker.snapshot()
+        assert "secret-key" not in json.dumps(snapshot)
+        assert snapshot["keys"][key_fingerprint("secret-key")]["tokens"] == 7
+
+    def test_throttle_waits_within_max_wait(self):
+        tracker = UsageTracker(window=0.3, key_budget=150, max_wait=1)
+        tracker.record("k", None, {"total_tokens": 100})
+
+        assert tracker.throttle(api_key="k") is None
+        assert tracker.exceeded(api_key="k") is None
+
+
+class TestQuotaInCalls:
+    """测试调用结果中的用量与调用前的配额预控"""
+
+    @patch('src.main.requests.post')
+    def test_result_includes_usage(self, mock_post, workspace):
+        mock_post.return_value = _image_response()
+
+        result = text_to_image(prompt="一只猫")
+
+        assert result["usage"] == {"prompt_tokens": 10, "output_tokens": 1290, "total_tokens": 1300}
+        assert get_usage_tracker().snapshot()["keys"][key_fingerprint("test-api-key")]["tokens"] == 1300
+
+    @patch('src.main.requests.post')
+    def test_key_over_budget_moves_to_other_key(self, mock_post, workspace, monkeypatch):
+        monkeypatch.delenv("GEMINI_API_KEY")
+        monkeypatch.setenv("GEMINI_API_POOL", json.dumps([
+            {"endpoint": "https://gw-a/v1beta", "api_key": "quota-a"},
+            {"endpoint": "https://gw-b/v1beta", "api_key": "quota-b"},
+        ]))
+        monkeypatch.setenv("GEMINI_KEY_TOKEN_BUDGET", "2000")
+        mock_post.return_value = _image_response()
+
+        results = [text_to_image(prompt="一只猫") for _ in range(3)]
+
+        # 每个密钥用掉 1300 后预计超出 2000，第三次调用两个密钥都不再发送请求
+        keys = [c.kwargs["headers"]["x-goog-api-key"] for c in mock_post.call_args_list]
+        assert sorted(keys) == ["quota-a", "quota-b"]
+        assert [r["success"] for r in results] == [True, True, False]
+        assert results[2]["error_code"] == "QUOTA_EXCEEDED"
+
+    @patch('src.main.requests.post')
+    def test_tenant_budget(self, mock_post, workspace, monkeypatch):
+        monkeypatch.setenv("GEMINI_TENANT_TOKEN_BUDGET", "2000")
+        mock_post.return_value = _image_response()
+
+        with usage.tenant("u1"):
+            assert text_to_image(prompt="一只猫")["success"] is True
+            rejected = text_to_image(prompt="一只猫")
+        with usage.tenant("u2"):
+            assert text_to_image(prompt="一只猫")["success"] is True
+
+        assert rejected["error_code"] == "QUOTA_EXCEEDED"
+        assert "u1" in rejected["error"]
+        assert mock_post.call_count == 2
+
+    @patch('src.main.requests.post')
+    def test_scheduler_tenant_is_counted(self, mock_post, workspace):
+        mock_post.return_value = _image_response(500)
+        scheduler = Scheduler(workers=1, reserved_interactive=0)
+
+        scheduler.run("text_to_image", prompt="一只猫", tenant="backfill")
+        scheduler.shutdown()
+
+        assert get_usage_tracker().snapshot()["tenants"]["backfill"]["tokens"] == 500
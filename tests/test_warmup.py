@@ -0,0 +1,224 @@
+"""
+连接预热与 DNS 缓存测试
+
+使用本地 HTTP/1.1 桩服务器统计建立的 TCP 连接数。
+"""
+
+import base64
+import importlib
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.main
+from src import warmup
+from src.main import text_to_image
+from src.warmup import DnsCache, WarmPool, get_warm_pool
+
+
+@pytest.fixture
+def server():
+    """本地桩服务器：POST 返回一张图像，HEAD 返回 204；handler.connections 统计建立的连接数"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        connections = 0
+        heads = 0
+        close_after_head = False
+        lock = threading.Lock()
+
+        def setup(self):
+            super().setup()
+            with self.lock:
+                type(self).connections += 1
+
+        def do_HEAD(self):
+            with self.lock:
+                type(self).heads += 1
+            self.send_response(204)
+            if self.close_after_head:
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            self.end_headers()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = json.dumps({"candidates": [{"content": {"parts": [{"inlineData": {
+                "mimeType": "image/png", "data": base64.b64encode(b"image").decode('utf-8')
+            }}]}}]}).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+
+    yield Handler, http_server.server_address[1]
+
+    http_server.shutdown()
+    http_server.server_close()
+
+
+@pytest.fixture
+def workspace(workspace, monkeypatch):
+    yield workspace
+
+    for name in ("GEMINI_WARM_CONNECTIONS", "GEMINI_WARM_PING_INTERVAL"):
+        monkeypatch.delenv(name, raising=False)
+    assert get_warm_pool() is None
+
+
+def _connections(handler, expected: int) -> int:
+    """等待服务端线程处理完已建立的连接后返回连接数（客户端 connect() 返回时服务端可能尚未计数）"""
+    deadline = time.monotonic() + 2
+    while handler.connections < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    return handler.connections
+
+
+def _count_lookups(monkeypatch, host: str) -> list:
+    lookups = []
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(name, *args, **kwargs):
+        if name == host:
+            lookups.append(name)
+        return real_getaddrinfo(name, *args, **kwargs)
+
+    monkeypatch.setattr("src.warmup.socket.getaddrinfo", getaddrinfo)
+    return lookups
+
+
+class TestDnsCache:
+    """测试 DNS 缓存"""
+
+    def test_ttl_and_stale_fallback(self, monkeypatch):
+        lookups = _count_lookups(monkeypatch, "localhost")
+        cache = DnsCache(ttl=0.2)
+
+        assert cache.resolve("localhost", 80) == cache.resolve("localhost", 80)
+        assert len(lookups) == 1
+        time.sleep(0.25)
+        cache.resolve("localhost", 80)
+        assert len(lookups) == 2
+
+        def fail(*args, **kwargs):
+            raise socket.gaierror("down")
+
+        monkeypatch.setattr("src.warmup.socket.getaddrinfo", fail)
+        time.sleep(0.25)
+        assert cache.resolve("localhost", 80) in ("127.0.0.1", "::1")
+        assert cache.stats()["stale"] == 1
+        assert cache.resolve("127.0.0.1", 80) == "127.0.0.1"
+
+
+class TestWarmPool:
+    """测试预热、连接复用与保活"""
+
+    def test_warm_opens_idle_connections_that_requests_reuse(self, server, monkeypatch):
+        handler, port = server
+        lookups = _count_lookups(monkeypatch, "localhost")
+        pool = WarmPool(3, ping_interval=0)
+        endpoint = f"http://localhost:{port}/v1beta"
+
+        report = pool.warm([endpoint])
+
+        entry, = report["endpoints"]
+        assert "error" not in entry
+        assert len(entry["connect_ms"]) == 3
+        assert report["total_ms"] >= entry["dns_ms"]
+        assert _connections(handler, 3) == 3
+
+        for _ in range(5):
+            assert pool.session.post(f"{endpoint}/models/m:generateContent", json={}).status_code == 200
+        assert _connections(handler, 3) == 3
+        assert len(lookups) == 1
+        pool.close()
+
+    def test_ping_keeps_connections_and_replaces_closed_ones(self, server):
+        handler, port = server
+        pool = WarmPool(2, ping_interval=0)
+        pool.warm([f"http://127.0.0.1:{port}/v1beta"])
+
+        pool.ping()
+        assert (handler.heads, pool.pings, _connections(handler, 2)) == (2, 2, 2)
+
+        handler.close_after_head = True
+        pool.ping()
+        assert pool.reconnects == 2
+        assert _connections(handler, 4) == 4
+
+        handler.close_after_head = False
+        pool.ping()
+        assert handler.heads == 6
+        pool.close()
+
+    def test_unreachable_endpoint_reported(self):
+        pool = WarmPool(1, ping_interval=0)
+
+        report = pool.warm(["http://127.0.0.1:1/v1beta"])
+
+        assert "error" in report["endpoints"][0]
+        pool.close()
+
+
+class TestWarmCalls:
+    """测试开启预热后的调用路径"""
+
+    def test_calls_use_warm_connections(self, server, workspace, monkeypatch):
+        handler, port = server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", f"http://127.0.0.1:{port}/v1beta")
+        monkeypatch.setenv("GEMINI_WARM_CONNECTIONS", "2")
+        monkeypatch.setenv("GEMINI_WARM_PING_INTERVAL", "0")
+
+        thread = warmup.warm_at_start()
+        thread.join()
+        assert _connections(handler, 2) == 2
+
+        for _ in range(3):
+            assert text_to_image(prompt="一只猫")["success"] is True
+        assert _connections(handler, 2) == 2
+        assert get_warm_pool().stats()["report"]["endpoints"][0]["connect_ms"]
+
+    def test_disabled_by_default(self, workspace):
+        assert get_warm_pool() is None
+        assert warmup.start(["http://127.0.0.1:1/v1beta"]) is None
+        assert warmup.warm_at_start() is None
+
+    def test_pool_warms_up_when_first_built(self, server, workspace, monkeypatch):
+        handler, port = server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", f"http://127.0.0.1:{port}/v1beta")
+        monkeypatch.setenv("GEMINI_WARM_CONNECTIONS", "2")
+        monkeypatch.setenv("GEMINI_WARM_PING_INTERVAL", "0")
+
+        pool = get_warm_pool()
+        pool.warm_thread.join()
+
+        assert _connections(handler, 2) == 2
+        assert pool.stats()["endpoints"] == [f"http://127.0.0.1:{port}/v1beta"]
+        assert get_warm_pool() is pool and warmup.warm_at_start() is pool.warm_thread
+
+    def test_import_has_no_network_side_effects(self, server, workspace, monkeypatch):
+        handler, port = server
+        monkeypatch.setattr(src.main, "GEMINI_API_BASE", f"http://127.0.0.1:{port}/v1beta")
+        monkeypatch.setenv("GEMINI_WARM_CONNECTIONS", "1")
+        monkeypatch.setenv("GEMINI_WARM_PING_INTERVAL", "0")
+
+        importlib.reload(warmup)
+        time.sleep(0.1)
+        assert warmup._pool is None and _connections(handler, 0) == 0
+
+        # 在 worker 启动钩子中显式开始
+        warmup.warm_at_start().join()
+        assert _connections(handler, 1) == 1